@@ -11,11 +11,11 @@ Routes:
 
 import os
 
-from authlib.integrations.starlette_client import OAuth
 from dotenv import load_dotenv
 from fastapi import APIRouter, Request
 from fastapi.responses import RedirectResponse
-from requests import Response
+
+from scripts.util import LazyObject
 
 load_dotenv()
 
@@ -23,15 +23,30 @@ ALLOWED_USER = "fogcat5@gmail.com"
 
 router = APIRouter()
 
-# Configure OAuth using Authlib with Google as the provider
-oauth = OAuth()
-oauth.register(
-    name="google",
-    client_id=os.getenv("GOOGLE_CLIENT_ID"),
-    client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={"scope": "openid email profile"},
-)
+
+
+def _make_oauth() -> object:
+    """Configure OAuth using Authlib with Google as the provider."""
+    from authlib.integrations.starlette_client import OAuth  # noqa: PLC0415
+
+    client = OAuth()
+    client.register(
+        name="google",
+        client_id=os.getenv("GOOGLE_CLIENT_ID"),
+        client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+        server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
+        client_kwargs={"scope": "openid email profile"},
+    )
+    return client
+
+
+# Authlib is imported and the provider registered on first use
+oauth = LazyObject(_make_oauth)
+
+
+def register_oauth() -> None:
+    """Register the OAuth provider now instead of on the first login."""
+    oauth.resolve()
 
 
 @router.get("/login")
@@ -68,7 +83,7 @@ async def logout(request: Request) -> RedirectResponse:
     return RedirectResponse(url="/", status_code=302)
 
 
-def get_current_user(request: Request) -> Response:
+def get_current_user(request: Request) -> dict | None:
     """Returns the current user from the session.
 
     If the NOLOGIN environment variable is set, bypasses auth and returns the
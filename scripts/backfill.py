@@ -0,0 +1,555 @@
+"""Backfill tags for older images using the OpenAI Batch API.
+
+Finds uploads that have no summary file in GCS or no tags in the database,
+packs downscaled copies of them into JSONL batch request files, submits the
+files to the Batch API and ingests the results in bulk once the batches
+finish. Batch requests are billed at a discount compared to the synchronous
+calls made by `process_image`, and a single run can cover thousands of images.
+
+Progress is checkpointed to a JSON state file after every step, so an
+interrupted run picks up where it left off: submitted batches are polled
+again instead of being resubmitted, and ingested images are never resent.
+
+Run with `python -m scripts.backfill`. Point `OPENAI_BASE_URL` at a local fake
+batch endpoint to exercise the whole flow offline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import mimetypes
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from google.cloud import storage
+from openai import AsyncOpenAI
+from PIL import Image
+
+from scripts.db import add_images_with_tags, get_untagged_images
+from scripts.objects import (
+    RESPONSE_FORMAT,
+    VISION_PROMPT,
+    parse_objects,
+    tags_from_objects,
+)
+from scripts.util import utc_now_iso
+
+if TYPE_CHECKING:
+    from google.cloud.storage import Bucket
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+#: Directory holding batch request files and the checkpoint state
+BACKFILL_DIR = Path("uploads/backfill")
+
+#: Checkpoint file recording submitted batches and finished images
+STATE_PATH = BACKFILL_DIR / "state.json"
+
+#: Images per batch request file, kept well under the 200 MB file limit
+DEFAULT_CHUNK_SIZE = 500
+
+#: Longest side of the image sent to the model, in pixels
+MAX_IMAGE_SIDE = 768
+
+#: Number of originals downloaded and downscaled at the same time
+DOWNLOAD_CONCURRENCY = 8
+
+#: Batch statuses that will not change any more
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def load_state(state_path: Path = STATE_PATH) -> dict:
+    """Load the backfill checkpoint, or an empty one if none exists.
+
+    Args:
+        state_path (Path): Location of the checkpoint file.
+
+    Returns:
+        dict: State with `batches` keyed by batch id and a `done` list of
+        filenames that have already been ingested.
+    """
+    if not state_path.exists():
+        return {"batches": {}, "done": []}
+    return json.loads(state_path.read_text())
+
+
+def save_state(state: dict, state_path: Path = STATE_PATH) -> None:
+    """Atomically write the backfill checkpoint.
+
+    Args:
+        state (dict): State to persist.
+        state_path (Path): Location of the checkpoint file.
+    """
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state, indent=2))
+    tmp_path.replace(state_path)
+
+
+def downscale_image(data: bytes, max_side: int = MAX_IMAGE_SIDE) -> bytes:
+    """Shrink an image so its longest side is at most `max_side` pixels.
+
+    JPEG sources are reduced while decoding via `Image.draft`, which avoids
+    decoding the full-resolution pixels.
+
+    Args:
+        data (bytes): Encoded source image.
+        max_side (int): Longest side of the result, in pixels.
+
+    Returns:
+        bytes: JPEG-encoded downscaled image.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", (max_side, max_side))
+        rgb = img.convert("RGB")
+        rgb.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        rgb.save(out, "JPEG", quality=80, optimize=True)
+    return out.getvalue()
+
+
+def build_batch_request(filename: str, image_data: bytes) -> dict:
+    """Build one Batch API request line for an image.
+
+    Args:
+        filename (str): Upload filename, used as the request `custom_id`.
+        image_data (bytes): Downscaled JPEG image.
+
+    Returns:
+        dict: Request in the Batch API JSONL input format.
+    """
+    encoded = base64.b64encode(image_data).decode("utf-8")
+    return {
+        "custom_id": filename,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": "gpt-4o",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": VISION_PROMPT},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{encoded}",
+                                "detail": "low",
+                            },
+                        },
+                    ],
+                }
+            ],
+            "max_tokens": 500,
+            "response_format": RESPONSE_FORMAT,
+        },
+    }
+
+
+def parse_batch_output(text: str) -> tuple[dict[str, str], list[str]]:
+    """Split a Batch API output file into summaries and failures.
+
+    Args:
+        text (str): Contents of the JSONL output file.
+
+    Returns:
+        tuple: Mapping of filename to summary text for successful requests,
+        and the list of filenames whose requests failed.
+    """
+    summaries: dict[str, str] = {}
+    failed: list[str] = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        filename = record.get("custom_id")
+        response = record.get("response") or {}
+        try:
+            ok = not record.get("error") and response["status_code"] == 200  # noqa: PLR2004
+            content = response["body"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            ok = False
+        if ok:
+            summaries[filename] = content or ""
+        else:
+            logger.warning(f"⚠️ Batch request failed for {filename}")
+            failed.append(filename)
+    return summaries, failed
+
+
+def list_backfill_candidates(
+    bucket: Bucket, prefix: str
+) -> tuple[dict[str, str], set[str]]:
+    """List uploaded image originals and the ones with a summary file.
+
+    Args:
+        bucket (Bucket): GCS bucket holding the uploads.
+        prefix (str): Upload prefix inside the bucket.
+
+    Returns:
+        tuple: Mapping of filename to upload timestamp for every image
+        original, and the set of filenames that already have a summary.
+    """
+    originals: dict[str, str] = {}
+    summarized: set[str] = set()
+    for blob in bucket.list_blobs(prefix=f"{prefix}/"):
+        relative = blob.name[len(prefix) + 1 :]
+        if relative.startswith("summary/"):
+            summarized.add(
+                Path(relative).name.removesuffix(".summary.txt")
+            )
+            continue
+        if "/" in relative or not relative:
+            continue
+        mime, _ = mimetypes.guess_type(relative)
+        if mime and mime.startswith("image/"):
+            created = getattr(blob, "time_created", None)
+            originals[relative] = (
+                created.isoformat(timespec="seconds")
+                if created
+                else utc_now_iso()
+            )
+    return originals, summarized
+
+
+async def find_backfill_targets(
+    bucket: Bucket, prefix: str, state: dict, limit: int | None = None
+) -> dict[str, str]:
+    """Select images that still need tags and are not already in flight.
+
+    Args:
+        bucket (Bucket): GCS bucket holding the uploads.
+        prefix (str): Upload prefix inside the bucket.
+        state (dict): Current backfill checkpoint.
+        limit (int, optional): Maximum number of images to return.
+
+    Returns:
+        dict: Mapping of filename to upload timestamp, oldest first.
+    """
+    originals, summarized = await asyncio.to_thread(
+        list_backfill_candidates, bucket, prefix
+    )
+    untagged = set(await get_untagged_images())
+
+    skip = set(state["done"])
+    for batch in state["batches"].values():
+        if not batch.get("ingested"):
+            skip.update(batch["filenames"])
+
+    targets = {
+        name: ts
+        for name, ts in sorted(originals.items(), key=lambda item: item[1])
+        if (name not in summarized or name in untagged) and name not in skip
+    }
+    if limit is not None:
+        targets = dict(list(targets.items())[:limit])
+    return targets
+
+
+async def write_request_file(
+    bucket: Bucket, prefix: str, filenames: list[str], path: Path
+) -> list[str]:
+    """Download, downscale and write one JSONL batch request file.
+
+    Args:
+        bucket (Bucket): GCS bucket holding the uploads.
+        prefix (str): Upload prefix inside the bucket.
+        filenames (list[str]): Images to include.
+        path (Path): Destination of the request file.
+
+    Returns:
+        list[str]: Filenames that were written; unreadable images are skipped.
+    """
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+    async def _prepare(filename: str) -> dict | None:
+        async with semaphore:
+            try:
+                blob = bucket.blob(f"{prefix}/{filename}")
+                data = await asyncio.to_thread(blob.download_as_bytes)
+                small = await asyncio.to_thread(downscale_image, data)
+            except Exception:
+                logger.exception(f"⚠️ Skipping unreadable image {filename}")
+                return None
+            return build_batch_request(filename, small)
+
+    requests = await asyncio.gather(*(_prepare(f) for f in filenames))
+    written = []
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w") as fh:
+        for request in requests:
+            if request is None:
+                continue
+            fh.write(json.dumps(request) + "\n")
+            written.append(request["custom_id"])
+    return written
+
+
+async def submit_backfill_batches(  # noqa: PLR0913
+    client: AsyncOpenAI,
+    bucket: Bucket,
+    prefix: str,
+    state: dict,
+    *,
+    limit: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    state_path: Path = STATE_PATH,
+) -> list[str]:
+    """Build request files for untagged images and submit them as batches.
+
+    Args:
+        client (AsyncOpenAI): OpenAI client used for the Batch API.
+        bucket (Bucket): GCS bucket holding the uploads.
+        prefix (str): Upload prefix inside the bucket.
+        state (dict): Backfill checkpoint, updated in place and saved after
+            every submitted batch.
+        limit (int, optional): Maximum number of images to submit.
+        chunk_size (int): Images per batch request file.
+        state_path (Path): Location of the checkpoint file.
+
+    Returns:
+        list[str]: IDs of the newly created batches.
+    """
+    targets = await find_backfill_targets(bucket, prefix, state, limit)
+    logger.info(f"🔁 Found {len(targets)} images to backfill")
+
+    names = list(targets)
+    batch_ids = []
+    for start in range(0, len(names), chunk_size):
+        chunk = names[start : start + chunk_size]
+        stamp = utc_now_iso().replace(":", "-")
+        request_path = state_path.parent / f"requests-{stamp}-{start}.jsonl"
+        written = await write_request_file(bucket, prefix, chunk, request_path)
+        if not written:
+            continue
+
+        with request_path.open("rb") as fh:
+            uploaded = await client.files.create(
+                file=(request_path.name, fh.read()), purpose="batch"
+            )
+        batch = await client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        state["batches"][batch.id] = {
+            "filenames": written,
+            "timestamps": {name: targets[name] for name in written},
+            "request_file": str(request_path),
+            "status": batch.status,
+            "ingested": False,
+        }
+        save_state(state, state_path)
+        batch_ids.append(batch.id)
+        logger.info(f"📤 Submitted batch {batch.id} with {len(written)} images")
+    return batch_ids
+
+
+async def ingest_batch_results(
+    bucket: Bucket, prefix: str, batch: dict, output_text: str
+) -> tuple[int, list[str]]:
+    """Store summaries from a finished batch in GCS and the database.
+
+    Args:
+        bucket (Bucket): GCS bucket holding the uploads.
+        prefix (str): Upload prefix inside the bucket.
+        batch (dict): Checkpoint entry for the batch.
+        output_text (str): Contents of the batch output file.
+
+    Returns:
+        tuple: Number of images ingested and filenames that failed.
+    """
+    summaries, failed = parse_batch_output(output_text)
+
+    def _upload_summaries() -> None:
+        for filename, summary in summaries.items():
+            blob = bucket.blob(f"{prefix}/summary/{filename}.summary.txt")
+            blob.upload_from_string(summary, content_type="text/plain")
+
+    await asyncio.to_thread(_upload_summaries)
+
+    timestamps = batch.get("timestamps", {})
+    records = []
+    objects = {}
+    for filename, summary in summaries.items():
+        objects[filename] = parse_objects(summary)
+        records.append((
+            filename,
+            "",
+            timestamps.get(filename, utc_now_iso()),
+            tags_from_objects(objects[filename]),
+        ))
+    await add_images_with_tags(records, objects)
+
+    missing = set(batch["filenames"]) - set(summaries) - set(failed)
+    return len(records), failed + sorted(missing)
+
+
+async def collect_backfill_batches(  # noqa: PLR0913
+    client: AsyncOpenAI,
+    bucket: Bucket,
+    prefix: str,
+    state: dict,
+    *,
+    wait: bool = True,
+    poll_interval: float = 60.0,
+    state_path: Path = STATE_PATH,
+) -> dict[str, int]:
+    """Poll submitted batches and ingest every one that has finished.
+
+    Args:
+        client (AsyncOpenAI): OpenAI client used for the Batch API.
+        bucket (Bucket): GCS bucket holding the uploads.
+        prefix (str): Upload prefix inside the bucket.
+        state (dict): Backfill checkpoint, updated in place.
+        wait (bool): Keep polling until every batch is finished. When False,
+            poll once and leave unfinished batches for a later run.
+        poll_interval (float): Seconds between polls.
+        state_path (Path): Location of the checkpoint file.
+
+    Returns:
+        dict: Counts of `ingested` and `failed` images.
+    """
+    totals = {"ingested": 0, "failed": 0}
+    while True:
+        pending = {
+            batch_id: batch
+            for batch_id, batch in state["batches"].items()
+            if not batch.get("ingested")
+        }
+        if not pending:
+            break
+
+        for batch_id, batch in pending.items():
+            remote = await client.batches.retrieve(batch_id)
+            batch["status"] = remote.status
+            if remote.status not in TERMINAL_STATUSES:
+                continue
+
+            failed = list(batch["filenames"])
+            ingested = 0
+            if remote.status == "completed" and remote.output_file_id:
+                content = await client.files.content(remote.output_file_id)
+                ingested, failed = await ingest_batch_results(
+                    bucket, prefix, batch, content.text
+                )
+            # Failed images are left out of `done` so the next run retries
+            done = set(batch["filenames"]) - set(failed)
+            state["done"] = sorted(set(state["done"]) | done)
+            batch["ingested"] = True
+            batch["failed"] = failed
+            save_state(state, state_path)
+
+            totals["ingested"] += ingested
+            totals["failed"] += len(failed)
+            logger.info(
+                f"✅ Batch {batch_id} {remote.status}: {ingested} ingested, "
+                f"{len(failed)} failed"
+            )
+
+        if not wait:
+            break
+        if any(not b.get("ingested") for b in state["batches"].values()):
+            await asyncio.sleep(poll_interval)
+    return totals
+
+
+async def run_backfill(  # noqa: PLR0913
+    bucket_name: str,
+    prefix: str,
+    *,
+    client: AsyncOpenAI | None = None,
+    bucket: Bucket | None = None,
+    limit: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    wait: bool = True,
+    poll_interval: float = 60.0,
+    state_path: Path = STATE_PATH,
+) -> dict[str, int]:
+    """Run a full backfill: resume pending batches, submit new ones, ingest.
+
+    Args:
+        bucket_name (str): Name of the GCS bucket holding the uploads.
+        prefix (str): Upload prefix inside the bucket.
+        client (AsyncOpenAI, optional): OpenAI client; created from the
+            environment when omitted.
+        bucket (Bucket, optional): GCS bucket; created from the default
+            credentials when omitted.
+        limit (int, optional): Maximum number of new images to submit.
+        chunk_size (int): Images per batch request file.
+        wait (bool): Wait for all batches to finish before returning.
+        poll_interval (float): Seconds between batch status polls.
+        state_path (Path): Location of the checkpoint file.
+
+    Returns:
+        dict: Counts of `submitted`, `ingested` and `failed` images.
+    """
+    client = client or AsyncOpenAI()
+    bucket = bucket or storage.Client().bucket(bucket_name)
+    state = load_state(state_path)
+
+    new_batches = await submit_backfill_batches(
+        client,
+        bucket,
+        prefix,
+        state,
+        limit=limit,
+        chunk_size=chunk_size,
+        state_path=state_path,
+    )
+    submitted = sum(
+        len(state["batches"][batch_id]["filenames"])
+        for batch_id in new_batches
+    )
+    totals = await collect_backfill_batches(
+        client,
+        bucket,
+        prefix,
+        state,
+        wait=wait,
+        poll_interval=poll_interval,
+        state_path=state_path,
+    )
+    return {"submitted": submitted, **totals}
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    """Command-line entry point for the backfill job."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bucket", default="fogcat5-home")
+    parser.add_argument("--prefix", default="upload")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=60.0)
+    parser.add_argument(
+        "--no-wait",
+        action="store_true",
+        help="submit and poll once, leaving unfinished batches for later",
+    )
+    parser.add_argument("--state", type=Path, default=STATE_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    totals = asyncio.run(
+        run_backfill(
+            args.bucket,
+            args.prefix,
+            limit=args.limit,
+            chunk_size=args.chunk_size,
+            wait=not args.no_wait,
+            poll_interval=args.poll_interval,
+            state_path=args.state,
+        )
+    )
+    logger.info(f"🏁 Backfill finished: {totals}")
+    return totals
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,647 @@
+"""Benchmark harness for the ingest, search, rebuild and proxy hot paths.
+
+Generates synthetic libraries (1k/10k/100k images by default) with a Zipf-like
+tag distribution and times the code paths that grow with the library:
+
+- ingest through the per-image helpers used by `process_image` and through
+  the bulk `add_images_with_tags` path
+- `/photos`, `/search` and `/uploads/{path}` latency
+- `/search/query` (`search_by_prompt`) with a stubbed LLM
+- full and delta `rebuild_db_from_gcs` against a filesystem-backed GCS fake
+- `perform_backup`
+
+Everything runs in-process against a temporary directory; no network or GCS
+credentials are needed. Results are written as JSON so runs can be compared
+across commits:
+
+    python -m scripts.bench --sizes 1000,10000 --output bench.json
+    python -m scripts.bench --baseline bench.json
+
+Scenarios that commit once per row (per-image ingest and the full rebuild)
+are capped at `--slow-cap` items per library size; their results report the
+item count and throughput, so they stay comparable.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO
+from unittest.mock import patch
+
+import aiosqlite
+from google.cloud import storage
+from httpx import ASGITransport, AsyncClient
+
+from scripts import db as db_module
+from scripts import logger as app_module
+from scripts import rebuild as rebuild_module
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Iterator
+
+#: Library sizes benchmarked by default
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+#: Timed runs per read scenario
+DEFAULT_REPEATS = 5
+
+#: Items per library size for scenarios that commit once per row
+DEFAULT_SLOW_CAP = 2_000
+
+#: Share of summaries that are newer than the DB in the delta rebuild
+DELTA_FRACTION = 0.01
+
+SCHEMA_PATH = Path("scripts/schema.sql")
+
+BASE_TAGS = (
+    "cable", "usb", "power", "adapter", "charger", "hdmi", "ethernet",
+    "screwdriver", "hammer", "wrench", "pliers", "drill", "tape", "glue",
+    "battery", "flashlight", "lamp", "bulb", "speaker", "headphones",
+    "microphone", "camera", "lens", "tripod", "keyboard", "mouse", "monitor",
+    "laptop", "tablet", "phone", "router", "switch", "box", "bin", "shelf",
+    "drawer", "bag", "jar", "bottle", "book", "notebook", "pen", "marker",
+    "paper", "scissors", "knife", "fork", "spoon", "plate", "mug", "towel",
+    "blanket", "pillow", "shirt", "jacket", "shoe", "sock", "hat", "glove",
+    "tent", "rope", "compass", "map", "toy", "game", "puzzle", "yarn",
+    "fabric", "needle", "thread", "paint", "brush", "canvas", "frame",
+)
+
+MODIFIERS = (
+    "black", "white", "red", "blue", "green", "small", "large", "old", "new",
+    "spare", "broken", "plastic", "metal", "wooden", "travel", "kitchen",
+    "garage", "office", "camping", "craft",
+)
+
+PROMPT_STUB_TAGS = 3
+
+log = logging.getLogger(__name__)
+
+
+# Filesystem-backed GCS fake
+
+
+class FilesystemBlob:
+    """Stand-in for `storage.Blob` stored as a file under the bucket root."""
+
+    def __init__(self, bucket: FilesystemBucket, name: str) -> None:
+        """Create a blob handle; the file need not exist yet."""
+        self.bucket = bucket
+        self.name = name
+        self.path = bucket.root / name
+
+    @property
+    def updated(self) -> datetime:
+        """Last modification time, like the GCS `updated` field."""
+        return datetime.fromtimestamp(self.path.stat().st_mtime, tz=UTC)
+
+    @property
+    def content_type(self) -> str | None:
+        """MIME type guessed from the blob name."""
+        return mimetypes.guess_type(self.name)[0]
+
+    def exists(self) -> bool:
+        """Return whether the blob has been written."""
+        return self.path.exists()
+
+    def open(self, mode: str = "rb") -> BinaryIO:
+        """Open the blob for streaming."""
+        return self.path.open(mode)
+
+    def download_as_text(self) -> str:
+        """Return the blob contents as text."""
+        return self.path.read_text()
+
+    def download_as_bytes(self) -> bytes:
+        """Return the blob contents as bytes."""
+        return self.path.read_bytes()
+
+    def download_to_filename(self, filename: str | Path) -> None:
+        """Copy the blob to a local file."""
+        shutil.copyfile(self.path, filename)
+
+    def upload_from_file(
+        self, file_obj: BinaryIO, *, rewind: bool = False
+    ) -> None:
+        """Write the blob from an open binary file."""
+        if rewind:
+            file_obj.seek(0)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(file_obj.read())
+
+    def upload_from_filename(self, filename: str | Path) -> None:
+        """Write the blob from a local file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(filename, self.path)
+
+    def upload_from_string(
+        self, data: str | bytes, content_type: str = ""
+    ) -> None:
+        """Write the blob from a string."""
+        del content_type
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(data, str):
+            data = data.encode()
+        self.path.write_bytes(data)
+
+
+class FilesystemBucket:
+    """Stand-in for `storage.Bucket` backed by a local directory."""
+
+    def __init__(self, root: Path) -> None:
+        """Create a bucket rooted at `root`."""
+        self.root = root
+
+    def blob(self, name: str) -> FilesystemBlob:
+        """Return a handle for the named blob."""
+        return FilesystemBlob(self, name)
+
+    def list_blobs(self, prefix: str = "") -> Iterator[FilesystemBlob]:
+        """Yield blobs whose names start with `prefix`."""
+        base = self.root
+        if "/" in prefix:
+            base /= prefix.rsplit("/", 1)[0]
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                name = (Path(dirpath) / filename).relative_to(self.root)
+                name = name.as_posix()
+                if name.startswith(prefix):
+                    yield FilesystemBlob(self, name)
+
+
+def filesystem_client(root: Path) -> type:
+    """Build a `storage.Client` replacement whose buckets live under `root`."""
+
+    class FilesystemClient:
+        def __init__(self, *args: object, **kwargs: object) -> None:
+            del args, kwargs
+
+        @classmethod
+        def from_service_account_json(
+            cls, *args: object, **kwargs: object
+        ) -> FilesystemClient:
+            del args, kwargs
+            return cls()
+
+        def bucket(self, name: str) -> FilesystemBucket:
+            return FilesystemBucket(root / name)
+
+    return FilesystemClient
+
+
+# Synthetic libraries
+
+
+def make_vocabulary(size: int) -> list[str]:
+    """Return a tag vocabulary that grows with the library size."""
+    vocab = list(BASE_TAGS)
+    vocab += [f"{m} {t}" for m in MODIFIERS for t in BASE_TAGS]
+    return vocab[: max(len(BASE_TAGS), min(len(vocab), size // 5))]
+
+
+def make_library(
+    size: int, vocab: list[str], rng: random.Random
+) -> list[tuple[str, str, str, list[str]]]:
+    """Generate image records with a Zipf-like tag distribution.
+
+    Args:
+        size (int): Number of images.
+        vocab (list[str]): Tag vocabulary, most common first.
+        rng (random.Random): Seeded random source.
+
+    Returns:
+        list: Records of (filename, label, timestamp, tags), as taken by
+        `add_images_with_tags`.
+    """
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(vocab))]
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    step = timedelta(days=365) / size
+    records = []
+    for i in range(size):
+        ts = start + step * i
+        filename = f"{ts.strftime('%Y-%m-%dT%H-%M-%S')}_{i:06d}.jpg"
+        tags = set(rng.choices(vocab, weights, k=rng.randint(3, 12)))
+        records.append((
+            filename,
+            rng.choice(("", "", "garage", "office", "closet")),
+            ts.isoformat(timespec="seconds"),
+            sorted(tags),
+        ))
+    return records
+
+
+def write_library_db(
+    db_path: Path, vocab: list[str], records: list[tuple]
+) -> None:
+    """Create a metadata DB holding the whole library in one transaction."""
+    db_path.unlink(missing_ok=True)
+    tag_ids = {name: i for i, name in enumerate(vocab, 1)}
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(SCHEMA_PATH.read_text())
+        conn.executemany(
+            "INSERT INTO tags (id, name) VALUES (?, ?)",
+            [(i, name) for name, i in tag_ids.items()],
+        )
+        conn.executemany(
+            "INSERT INTO images (id, filename, label, timestamp, "
+            "thumb_formats, thumb_widths) VALUES (?, ?, ?, ?, 'avif,webp', "
+            "'grid:320,retina:640,preview:1280')",
+            [
+                (i, filename, label, ts)
+                for i, (filename, label, ts, _) in enumerate(records, 1)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO image_tags (image_id, tag_id) VALUES (?, ?)",
+            [
+                (i, tag_ids[tag])
+                for i, (*_, tags) in enumerate(records, 1)
+                for tag in tags
+            ],
+        )
+    conn.close()
+
+
+def write_summaries(
+    bucket_root: Path, prefix: str, records: list[tuple], mtime: float
+) -> None:
+    """Write one `summary.txt` per record, as `process_image` stores them."""
+    summary_dir = bucket_root / prefix / "summary"
+    summary_dir.mkdir(parents=True, exist_ok=True)
+    for filename, _, _, tags in records:
+        path = summary_dir / f"{filename}.summary.txt"
+        path.write_text("\n".join(tags))
+        os.utime(path, (mtime, mtime))
+
+
+# Measurement
+
+
+def summarize(samples: list[float]) -> dict:
+    """Reduce timing samples in seconds to summary statistics."""
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+    return {
+        "runs": len(ordered),
+        "min": ordered[0],
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "max": ordered[-1],
+    }
+
+
+async def measure(
+    function: Callable[[], Awaitable[object]], repeats: int
+) -> dict:
+    """Time `repeats` awaited calls of `function` after one warm-up call."""
+    await function()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await function()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def result(
+    size: int, scenario: str, stats: dict, items: int | None = None
+) -> dict:
+    """Build one result row, adding throughput when an item count is given."""
+    row = {"size": size, "scenario": scenario, "unit": "s", **stats}
+    if items is not None:
+        row["items"] = items
+        row["items_per_s"] = items / stats["mean"] if stats["mean"] else 0.0
+    return row
+
+
+@contextmanager
+def bench_environment(workdir: Path) -> Iterator[dict]:
+    """Point the app at a scratch DB, backup dir and filesystem GCS fake.
+
+    Yields:
+        dict: Paths of the `db`, `backups` dir and `bucket` root.
+    """
+    paths = {
+        "db": workdir / "metadata.db",
+        "backups": workdir / "backups",
+        "gcs": workdir / "gcs",
+        "bucket": workdir / "gcs" / app_module.GCS_BUCKET,
+    }
+    paths["backups"].mkdir(parents=True, exist_ok=True)
+    paths["bucket"].mkdir(parents=True, exist_ok=True)
+
+    async def stub_llm(prompt: str, system_prompt: str = "") -> str:
+        del prompt, system_prompt
+        return json.dumps(list(BASE_TAGS[:PROMPT_STUB_TAGS]))
+
+    with ExitStack() as stack:
+        for module, name in (
+            (db_module, "DB_PATH"),
+            (db_module, "BACKUP_DB_PATH"),
+            (rebuild_module, "DB_PATH"),
+            (app_module, "DB_PATH"),
+            (app_module, "BACKUP_DB_PATH"),
+        ):
+            stack.enter_context(patch.object(module, name, paths["db"]))
+        stack.enter_context(
+            patch.object(app_module, "DB_BACKUP_DIR", paths["backups"])
+        )
+        stack.enter_context(
+            patch.object(storage, "Client", filesystem_client(paths["gcs"]))
+        )
+        stack.enter_context(
+            patch.object(app_module, "call_openai_chat", stub_llm)
+        )
+        yield paths
+
+
+async def bench_ingest(
+    size: int, records: list[tuple], db_path: Path
+) -> list:
+    """Time per-image and bulk ingest into an empty DB."""
+    rows = []
+
+    db_path.unlink(missing_ok=True)  # noqa: ASYNC240
+    await db_module.init_db(str(SCHEMA_PATH))
+    start = time.perf_counter()
+    for filename, label, ts, tags in records:
+        await db_module.add_image(filename, label, ts)
+        for tag in tags:
+            await db_module.add_tag(tag)
+            await db_module.link_image_tag(filename, tag)
+    elapsed = time.perf_counter() - start
+    rows.append(
+        result(size, "ingest_per_image", summarize([elapsed]), len(records))
+    )
+
+    db_path.unlink(missing_ok=True)  # noqa: ASYNC240
+    await db_module.init_db(str(SCHEMA_PATH))
+    start = time.perf_counter()
+    await db_module.add_images_with_tags(records)
+    elapsed = time.perf_counter() - start
+    rows.append(result(size, "ingest_bulk", summarize([elapsed]), len(records)))
+    return rows
+
+
+async def bench_routes(
+    size: int, records: list[tuple], bucket_root: Path, repeats: int
+) -> list:
+    """Time the gallery, search and proxy routes against the library DB."""
+    thumb = f"thumb/{records[0][0]}.thumb.jpg"
+    thumb_path = bucket_root / app_module.GCS_UPLOAD_PREFIX / thumb
+    thumb_path.parent.mkdir(parents=True, exist_ok=True)
+    thumb_path.write_bytes(os.urandom(24 * 1024))
+
+    common, rare = BASE_TAGS[0], records[-1][3][-1]
+    transport = ASGITransport(app=app_module.app)
+    async with AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        def get(url: str) -> Callable[[], Awaitable[object]]:
+            async def call() -> None:
+                res = await client.get(url)
+                res.raise_for_status()
+
+            return call
+
+        async def prompt_search() -> None:
+            res = await client.post(
+                "/search/query", data={"prompt": "where are my cables?"}
+            )
+            res.raise_for_status()
+
+        scenarios = {
+            "photos": get("/photos"),
+            "search_common_tag": get(f"/search?q={common}"),
+            "search_rare_tag": get(f"/search?q={rare}"),
+            "search_by_prompt": prompt_search,
+            "gcs_proxy_thumb": get(f"/uploads/{thumb}"),
+        }
+        return [
+            result(size, name, await measure(call, repeats))
+            for name, call in scenarios.items()
+        ]
+
+
+async def bench_rebuild(  # noqa: PLR0913
+    size: int,
+    records: list[tuple],
+    paths: dict,
+    vocab: list[str],
+    *,
+    slow_cap: int,
+    repeats: int,
+) -> list:
+    """Time a full rebuild and a delta rebuild from GCS summaries."""
+    bucket_name = app_module.GCS_BUCKET
+    old = time.time() - 7 * 86400
+    rows = []
+
+    # Full rebuild of a capped library into an empty DB
+    capped = records[:slow_cap] if slow_cap else records
+    write_summaries(paths["bucket"], "full", capped, old)
+    paths["db"].unlink(missing_ok=True)
+    start = time.perf_counter()
+    await rebuild_module.rebuild_db_from_gcs(bucket_name, "full", force=True)
+    elapsed = time.perf_counter() - start
+    rows.append(result(size, "rebuild_full", summarize([elapsed]), len(capped)))
+
+    # Delta rebuild: the whole library is listed, only new summaries are read
+    delta = max(1, int(len(records) * DELTA_FRACTION))
+    write_summaries(paths["bucket"], "upload", records[:-delta], old)
+    write_summaries(paths["bucket"], "upload", records[-delta:], time.time())
+    since = datetime.fromtimestamp(old + 3600, tz=UTC).isoformat()
+    write_library_db(paths["db"], vocab, records[:-delta])
+    snapshot = paths["db"].with_suffix(".snapshot")
+    shutil.copyfile(paths["db"], snapshot)
+
+    samples = []
+    for _ in range(repeats):
+        shutil.copyfile(snapshot, paths["db"])
+        start = time.perf_counter()
+        await rebuild_module.rebuild_db_from_gcs(
+            bucket_name, "upload", since_timestamp=since
+        )
+        samples.append(time.perf_counter() - start)
+    snapshot.unlink()
+    rows.append(result(size, "rebuild_delta", summarize(samples), delta))
+    return rows
+
+
+async def bench_backup(size: int, paths: dict, repeats: int) -> list:
+    """Time `perform_backup` of the library DB."""
+
+    async def backup() -> None:
+        for old in paths["backups"].glob("backup-*.sqlite3"):
+            old.unlink()
+        await app_module.perform_backup()
+
+    return [result(size, "backup", await measure(backup, repeats))]
+
+
+async def run_size(
+    size: int, workdir: Path, *, repeats: int, slow_cap: int, seed: int
+) -> list[dict]:
+    """Run every scenario against a synthetic library of `size` images."""
+    rng = random.Random(seed)  # nosec B311  # noqa: S311
+    vocab = make_vocabulary(size)
+    records = make_library(size, vocab, rng)
+    log.info(f"🏁 Library of {size} images, {len(vocab)} tags")
+
+    root = workdir / f"library-{size}"
+    root.mkdir(parents=True, exist_ok=True)
+    rows = []
+    with bench_environment(root) as paths:
+        sample = records[:slow_cap] if slow_cap else records
+        rows += await bench_ingest(size, sample, paths["db"])
+        write_library_db(paths["db"], vocab, records)
+        async with aiosqlite.connect(paths["db"]) as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM image_tags")
+            (links,) = await cursor.fetchone()
+        log.info(f"🏁 {links} tag links")
+        rows += await bench_routes(size, records, paths["bucket"], repeats)
+        rows += await bench_backup(size, paths, repeats)
+        rows += await bench_rebuild(
+            size, records, paths, vocab, slow_cap=slow_cap, repeats=repeats
+        )
+    shutil.rmtree(root, ignore_errors=True)
+    return rows
+
+
+def git_revision() -> str | None:
+    """Return the current commit, or None outside a git checkout."""
+    try:
+        out = subprocess.run(  # nosec B603 B607
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+async def run_benchmarks(
+    sizes: tuple[int, ...] = DEFAULT_SIZES,
+    *,
+    repeats: int = DEFAULT_REPEATS,
+    slow_cap: int = DEFAULT_SLOW_CAP,
+    seed: int = 1,
+    workdir: Path | None = None,
+) -> dict:
+    """Run the benchmark suite and return a JSON-serializable report.
+
+    Args:
+        sizes (tuple): Library sizes to benchmark.
+        repeats (int): Timed runs per read scenario.
+        slow_cap (int): Item cap for per-row scenarios; 0 disables the cap.
+        seed (int): Seed for the synthetic libraries.
+        workdir (Path, optional): Scratch directory; a temporary one is
+            created and removed when omitted.
+
+    Returns:
+        dict: `meta` describing the run and a list of `results` rows.
+    """
+    meta = {
+        "commit": git_revision(),
+        "created": datetime.now(UTC).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": list(sizes),
+        "repeats": repeats,
+        "slow_cap": slow_cap,
+        "seed": seed,
+    }
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="tracker-bench-") as tmp:
+        root = workdir or Path(tmp)
+        for size in sizes:
+            rows += await run_size(
+                size, root, repeats=repeats, slow_cap=slow_cap, seed=seed
+            )
+    return {"meta": meta, "results": rows}
+
+
+def compare(report: dict, baseline: dict) -> list[str]:
+    """Describe the p50 change of each scenario against a baseline report."""
+    before = {(r["size"], r["scenario"]): r for r in baseline["results"]}
+    lines = []
+    for row in report["results"]:
+        old = before.get((row["size"], row["scenario"]))
+        if not old or not old["p50"]:
+            continue
+        change = (row["p50"] - old["p50"]) / old["p50"] * 100
+        lines.append(
+            f"{row['scenario']:<20} {row['size']:>7}  "
+            f"{old['p50'] * 1000:10.2f} ms -> {row['p50'] * 1000:10.2f} ms  "
+            f"{change:+6.1f}%"
+        )
+    return lines
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point that runs the suite and writes JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="comma-separated library sizes",
+    )
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--slow-cap", type=int, default=DEFAULT_SLOW_CAP)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", type=Path)
+    parser.add_argument("--output", type=Path, help="write JSON here")
+    parser.add_argument(
+        "--baseline", type=Path, help="earlier JSON report to compare with"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    log.setLevel(logging.INFO)
+    for noisy in ("scripts.logger", "scripts.rebuild"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+
+    sizes = tuple(int(s) for s in args.sizes.split(",") if s.strip())
+    report = asyncio.run(
+        run_benchmarks(
+            sizes,
+            repeats=args.repeats,
+            slow_cap=args.slow_cap,
+            seed=args.seed,
+            workdir=args.workdir,
+        )
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        sys.stdout.write(text + "\n")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        sys.stderr.write("\n".join(compare(report, baseline)) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""Bulk photo uploads: many files or a zip/tar archive per request.
+
+`POST /api/batches` takes any number of `files`, each a photo or an archive
+of photos. Starlette spools multipart files to disk as they arrive, and
+archives are read member by member (`tarfile` in streaming mode), so a
+large import is never held in memory.
+
+Every photo is copied into the upload directory while its SHA-256 is
+computed. Content already uploaded in any batch (`upload_hashes`) is
+dropped as a duplicate; the rest are queued in one go for the GCS upload
+and vision workers. Each batch gets an id; `GET /api/batches/{id}` reports
+how many of its files are queued, done, failed, duplicate or skipped.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import secrets
+import tarfile
+import zipfile
+from contextlib import suppress
+from os import getenv
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, BinaryIO, NamedTuple
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    import aiosqlite
+
+#: Largest single photo accepted, also after decompressing from an archive
+MAX_FILE_BYTES = int(getenv("BULK_MAX_FILE_MB", "50")) * 2**20
+
+#: Most photos accepted in one batch; later ones are skipped
+MAX_BATCH_FILES = int(getenv("BULK_MAX_FILES", "2000"))
+
+COPY_CHUNK = 2**20
+
+IMAGE_SUFFIXES = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".heif", ".tif",
+    ".tiff", ".bmp",
+}
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+STATUSES = ("queued", "done", "failed", "duplicate", "skipped")
+
+
+class Staged(NamedTuple):
+    """A file copied to a temporary path, or skipped with a reason."""
+
+    name: str
+    path: Path | None = None
+    sha256: str | None = None
+    error: str | None = None
+
+
+def iter_members(
+    fileobj: BinaryIO, name: str
+) -> Iterator[tuple[str, BinaryIO]]:
+    """Yield `(name, stream)` for an upload or each file in its archive.
+
+    Raises:
+        zipfile.BadZipFile, tarfile.TarError: For a corrupt archive.
+    """
+    lower = name.lower()
+    if lower.endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, member
+    elif lower.endswith(TAR_SUFFIXES):
+        # "r|*" reads the archive front to back without seeking
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, archive.extractfile(info)
+    else:
+        yield name, fileobj
+
+
+def _copy(stream: BinaryIO, path: Path) -> str | None:
+    """Copy a stream to `path`, returning its SHA-256 or None if too big."""
+    digest = hashlib.sha256()
+    size = 0
+    with path.open("wb") as out:
+        while chunk := stream.read(COPY_CHUNK):
+            size += len(chunk)
+            if size > MAX_FILE_BYTES:
+                return None
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def stage_upload(
+    fileobj: BinaryIO, name: str, directory: Path, limit: int = MAX_BATCH_FILES
+) -> list[Staged]:
+    """Copy the photos of one upload into `directory` under temporary names.
+
+    Blocking; the app runs it in a thread. At most `limit` photos are
+    copied, the rest are skipped.
+    """
+    staged = []
+    try:
+        for member, stream in iter_members(fileobj, name):
+            if Path(member).name.startswith("."):
+                continue  # .DS_Store, AppleDouble files
+            if Path(member).suffix.lower() not in IMAGE_SUFFIXES:
+                staged.append(Staged(member, error="not an image"))
+                continue
+            if limit <= 0:
+                staged.append(Staged(member, error="batch is full"))
+                continue
+            path = directory / f".bulk-{secrets.token_hex(8)}.part"
+            sha256 = _copy(stream, path)
+            if sha256 is None:
+                path.unlink()
+                staged.append(Staged(member, error="file too large"))
+                continue
+            staged.append(Staged(member, path, sha256))
+            limit -= 1
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        staged.append(Staged(name, error=f"unreadable archive: {e}"))
+    return staged
+
+
+def stored_name(timestamp: str, name: str, directory: Path) -> str:
+    """Upload filename in the style of `/upload`, unique in `directory`."""
+    base = PurePosixPath(name.replace("\\", "/")).name
+    prefix = timestamp.replace(":", "-")
+    filename = f"{prefix}_{base}"
+    stem, suffix = Path(base).stem, Path(base).suffix
+    n = 1
+    while (directory / filename).exists():
+        n += 1
+        filename = f"{prefix}_{stem}-{n}{suffix}"
+    return filename
+
+
+async def create_batch(
+    db: aiosqlite.Connection, label: str, created_at: str
+) -> str:
+    """Start a batch and return its id."""
+    batch_id = secrets.token_hex(8)
+    await db.execute(
+        "INSERT INTO upload_batches (id, label, created_at) VALUES (?, ?, ?)",
+        (batch_id, label, created_at),
+    )
+    await db.commit()
+    return batch_id
+
+
+async def claim_files(
+    db: aiosqlite.Connection,
+    batch_id: str,
+    staged: list[Staged],
+    directory: Path,
+    timestamp: str,
+) -> list[tuple[Path, str]]:
+    """Record staged files, keeping only content not uploaded before.
+
+    New photos are renamed to their upload filename; duplicates are
+    deleted. Claiming a hash is a single `INSERT OR IGNORE`, so concurrent
+    batches with the same photo store it once.
+
+    Returns:
+        list[tuple[Path, str]]: Path and filename of each new photo.
+    """
+    new = []
+    rows = []
+    for item in staged:
+        if item.path is None:
+            rows.append((item.name, None, None, "skipped", item.error))
+            continue
+        filename = stored_name(timestamp, item.name, directory)
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO upload_hashes (sha256, filename, "
+            "created_at) VALUES (?, ?, ?)",
+            (item.sha256, filename, timestamp),
+        )
+        if cursor.rowcount == 0:
+            item.path.unlink()
+            cursor = await db.execute(
+                "SELECT filename FROM upload_hashes WHERE sha256 = ?",
+                (item.sha256,),
+            )
+            (earlier,) = await cursor.fetchone()
+            rows.append((item.name, earlier, item.sha256, "duplicate", None))
+            continue
+        path = item.path.rename(directory / filename)
+        new.append((path, filename))
+        rows.append((item.name, filename, item.sha256, "queued", None))
+    await db.executemany(
+        "INSERT INTO batch_files (batch_id, name, filename, sha256, status, "
+        "error) VALUES (?, ?, ?, ?, ?, ?)",
+        [(batch_id, *row) for row in rows],
+    )
+    await db.commit()
+    return new
+
+
+def discard(staged: list[Staged]) -> None:
+    """Delete temporary copies, e.g. after a failed request."""
+    for item in staged:
+        if item.path is not None:
+            with suppress(FileNotFoundError):
+                item.path.unlink()
+
+
+async def mark_file(
+    db: aiosqlite.Connection,
+    batch_id: str,
+    filename: str,
+    error: str | None = None,
+) -> None:
+    """Record that a queued photo was processed, or why it failed.
+
+    A failed photo gives up its hash, so uploading it again is retried
+    rather than reported as a duplicate.
+    """
+    if error:
+        await db.execute(
+            "DELETE FROM upload_hashes WHERE filename = ?", (filename,)
+        )
+    await db.execute(
+        "UPDATE batch_files SET status = ?, error = ? "
+        "WHERE batch_id = ? AND filename = ? AND status = 'queued'",
+        ("failed" if error else "done", error, batch_id, filename),
+    )
+    await db.commit()
+
+
+async def batch_progress(
+    db: aiosqlite.Connection, batch_id: str, *, files: bool = True
+) -> dict | None:
+    """Counts per status and, optionally, every file of a batch."""
+    cursor = await db.execute(
+        "SELECT label, created_at FROM upload_batches WHERE id = ?",
+        (batch_id,),
+    )
+    batch = await cursor.fetchone()
+    if batch is None:
+        return None
+    cursor = await db.execute(
+        "SELECT status, COUNT(*) FROM batch_files WHERE batch_id = ? "
+        "GROUP BY status",
+        (batch_id,),
+    )
+    counts = dict.fromkeys(STATUSES, 0) | dict(await cursor.fetchall())
+    progress = {
+        "id": batch_id,
+        "label": batch[0],
+        "created_at": batch[1],
+        "total": sum(counts.values()),
+        "counts": counts,
+        "complete": counts["queued"] == 0,
+    }
+    if files:
+        cursor = await db.execute(
+            "SELECT name, filename, status, error FROM batch_files "
+            "WHERE batch_id = ? ORDER BY id",
+            (batch_id,),
+        )
+        progress["files"] = [
+            {"name": name, "filename": filename, "status": status,
+             "error": error}
+            for name, filename, status, error in await cursor.fetchall()
+        ]
+    return progress
@@ -4,27 +4,96 @@ Handles initialization and interaction with the local SQLite database for
 storing image metadata, tags, and associations.
 """
 
+import json
+from collections.abc import Iterable
 from pathlib import Path
 
 import aiofiles
 import aiosqlite
 
 from scripts.config import BACKUP_DB_PATH
+from scripts.metrics import DB_QUERY_SECONDS
 
 #: Path to the active application metadata database
 DB_PATH = Path("uploads/metadata.db")
 
+#: Columns added to existing tables after their first release, as
+#: (table, column, declaration). `schema.sql` only creates missing tables, so
+#: older databases get these through `migrate_db`.
+COLUMN_MIGRATIONS = [
+    ("images", "thumb_formats", "TEXT"),
+    ("images", "placeholder", "TEXT"),
+    ("images", "thumb_widths", "TEXT"),
+    ("objects", "color", "TEXT"),
+    ("objects", "brand", "TEXT"),
+]
 
+#: Indexes over columns from `COLUMN_MIGRATIONS`, created once they exist
+INDEX_MIGRATIONS = [
+    (
+        "CREATE INDEX IF NOT EXISTS idx_objects_color "
+        "ON objects (color, name, quantity)"
+    ),
+    (
+        "CREATE INDEX IF NOT EXISTS idx_objects_brand "
+        "ON objects (brand, name, quantity)"
+    ),
+]
 
-async def init_db(schema_path: str="scripts/schema.sql") -> None:
-    """Initialize the SQLite database using the provided schema file."""
-    async with aiosqlite.connect(DB_PATH) as db:
+# Databases `get_db` has brought up to the current schema
+_initialized: set[Path] = set()
+
+INSERT_OBJECT_SQL = (
+    "INSERT INTO objects "
+    "(image_id, name, quantity, color, brand, attributes, confidence) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+async def migrate_db(db: aiosqlite.Connection) -> None:
+    """Add columns from `COLUMN_MIGRATIONS` missing in an existing DB.
+
+    Indexes on those columns (`INDEX_MIGRATIONS`) are created afterwards.
+
+    Args:
+        db (aiosqlite.Connection): Open connection to the database.
+    """
+    for table, column, declaration in COLUMN_MIGRATIONS:
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        columns = {row[1] for row in await cursor.fetchall()}
+        if column not in columns:
+            await db.execute(
+                f"ALTER TABLE {table} ADD COLUMN {column} {declaration}"
+            )
+    for statement in INDEX_MIGRATIONS:
+        await db.execute(statement)
+
+
+async def init_db(
+    schema_path: str = "scripts/schema.sql",
+    derived_path: str = "scripts/derived.sql",
+    db_path: Path | str | None = None,
+) -> None:
+    """Initialize the SQLite database using the provided schema files.
+
+    Args:
+        schema_path (str): Tables and indexes, applied first.
+        derived_path (str): Summary tables and triggers using migrated
+            columns, applied after `migrate_db`.
+        db_path (Path | str, optional): Database to initialize; defaults to
+            `DB_PATH`.
+    """
+    async with aiosqlite.connect(db_path or DB_PATH) as db:
         async with aiofiles.open(schema_path) as f:
             schema = await f.read()
             await db.executescript(schema)
+        await migrate_db(db)
+        async with aiofiles.open(derived_path) as f:
+            await db.executescript(await f.read())
         await db.commit()
 
 
+@DB_QUERY_SECONDS.timed(statement="add_image")
 async def add_image(filename: str, label: str, timestamp: str) -> None:
     """Insert an image record into the database if it doesn't already exist.
 
@@ -42,6 +111,7 @@ async def add_image(filename: str, label: str, timestamp: str) -> None:
         await db.commit()
 
 
+@DB_QUERY_SECONDS.timed(statement="add_tag")
 async def add_tag(name: str) -> None:
     """Add a tag to the tags table if it doesn't already exist.
 
@@ -55,6 +125,7 @@ async def add_tag(name: str) -> None:
         await db.commit()
 
 
+@DB_QUERY_SECONDS.timed(statement="link_image_tag")
 async def link_image_tag(filename: str, tag_name: str) -> None:
     """Associate a tag with an image using their existing database IDs.
 
@@ -84,13 +155,179 @@ async def link_image_tag(filename: str, tag_name: str) -> None:
             await db.commit()
 
 
+@DB_QUERY_SECONDS.timed(statement="set_image_renditions")
+async def set_image_renditions(
+    filename: str,
+    formats: list[str],
+    placeholder: str | None = None,
+    widths: str | None = None,
+) -> None:
+    """Record the thumbnail formats and inline placeholder for an image.
+
+    Args:
+        filename (str): Filename of the image.
+        formats (list[str]): Formats written by the rendition pipeline.
+        placeholder (str, optional): LQIP data URI shown while the real
+            thumbnail loads.
+        widths (str, optional): Rendition widths as `name:width` pairs,
+            see `thumbnails.format_widths`.
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute(
+            "UPDATE images SET thumb_formats = ?, placeholder = ?, "
+            "thumb_widths = ? WHERE filename = ?",
+            (",".join(formats), placeholder, widths, filename),
+        )
+        await db.commit()
+
+
+def object_rows(image_id: int, objects: Iterable[dict]) -> list[tuple]:
+    """Rows for `INSERT_OBJECT_SQL` describing the objects of one image.
+
+    Args:
+        image_id (int): Database id of the image.
+        objects (Iterable[dict]): Objects as returned by
+            `scripts.objects.parse_objects`.
+    """
+    return [
+        (
+            image_id,
+            obj["name"],
+            obj["count"],
+            obj.get("color"),
+            obj.get("brand"),
+            json.dumps(obj["attributes"]),
+            obj["confidence"],
+        )
+        for obj in objects
+    ]
+
+
+@DB_QUERY_SECONDS.timed(statement="set_image_objects")
+async def set_image_objects(filename: str, objects: list[dict]) -> None:
+    """Replace the inventory objects recorded for an image.
+
+    Args:
+        filename (str): Filename of the image.
+        objects (list[dict]): Parsed objects from its vision summary.
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            "SELECT id FROM images WHERE filename = ?", (filename,)
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            return
+        await db.execute("DELETE FROM objects WHERE image_id = ?", row)
+        await db.executemany(INSERT_OBJECT_SQL, object_rows(row[0], objects))
+        await db.commit()
+
+
+@DB_QUERY_SECONDS.timed(statement="get_image_id")
+async def get_image_id(filename: str) -> int | None:
+    """Return the database id of an image, or None if it is unknown.
+
+    Args:
+        filename (str): Filename of the image.
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            "SELECT id FROM images WHERE filename = ?", (filename,)
+        )
+        row = await cursor.fetchone()
+    return row[0] if row else None
+
+
+@DB_QUERY_SECONDS.timed(statement="get_untagged_images")
+async def get_untagged_images() -> list[str]:
+    """Return filenames of images that have no tags linked to them.
+
+    Returns:
+        list[str]: Filenames ordered by upload timestamp, oldest first.
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            "SELECT filename FROM images "
+            "WHERE id NOT IN (SELECT image_id FROM image_tags) "
+            "ORDER BY timestamp"
+        )
+        return [row[0] for row in await cursor.fetchall()]
+
+
+@DB_QUERY_SECONDS.timed(statement="add_images_with_tags")
+async def add_images_with_tags(
+    records: list[tuple[str, str, str, list[str]]],
+    objects: dict[str, list[dict]] | None = None,
+) -> None:
+    """Insert many images and their tags in a single transaction.
+
+    Bulk counterpart of `add_image`, `add_tag`, `link_image_tag` and
+    `set_image_objects` for jobs that ingest results for many images at once.
+
+    Args:
+        records (list): Tuples of (filename, label, timestamp, tags).
+        objects (dict, optional): Parsed objects by filename; they replace
+            any objects already recorded for those images.
+    """
+    if not records:
+        return
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.executemany(
+            "INSERT OR IGNORE INTO images (filename, label, timestamp) "
+            "VALUES (?, ?, ?)",
+            [(filename, label, ts) for filename, label, ts, _ in records],
+        )
+        await db.executemany(
+            "INSERT OR IGNORE INTO tags (name) VALUES (?)",
+            [(tag,) for *_, tags in records for tag in tags],
+        )
+        await db.executemany(
+            "INSERT INTO image_tags (image_id, tag_id) "
+            "SELECT images.id, tags.id FROM images, tags "
+            "WHERE images.filename = ? AND tags.name = ? "
+            "AND NOT EXISTS (SELECT 1 FROM image_tags "
+            "WHERE image_id = images.id AND tag_id = tags.id)",
+            [
+                (filename, tag)
+                for filename, _, _, tags in records
+                for tag in tags
+            ],
+        )
+        if objects:
+            cursor = await db.execute(
+                "SELECT filename, id FROM images WHERE filename IN "
+                "(SELECT value FROM json_each(?))",
+                (json.dumps(list(objects)),),
+            )
+            image_ids = dict(await cursor.fetchall())
+            await db.executemany(
+                "DELETE FROM objects WHERE image_id = ?",
+                [(image_id,) for image_id in image_ids.values()],
+            )
+            await db.executemany(
+                INSERT_OBJECT_SQL,
+                [
+                    row
+                    for filename, image_id in image_ids.items()
+                    for row in object_rows(image_id, objects[filename])
+                ],
+            )
+        await db.commit()
+
+
 async def get_db() -> aiosqlite.Connection:
     """Yield a database connection using the backup DB path.
 
-    Used as a FastAPI dependency for injecting database access.
+    Used as a FastAPI dependency for injecting database access. The backup
+    DB may predate columns the gallery queries read, so the current schema
+    is applied to it on first use.
 
     Yields:
         aiosqlite.Connection: An async connection to the backup database.
     """
-    async with aiosqlite.connect(BACKUP_DB_PATH) as db:
+    path = Path(BACKUP_DB_PATH)
+    if path not in _initialized:
+        await init_db(db_path=path)
+        _initialized.add(path)
+    async with aiosqlite.connect(path) as db:
         yield db
@@ -0,0 +1,165 @@
+-- Summary tables and triggers reading columns added by
+-- `scripts.db.COLUMN_MIGRATIONS`, so applied after `migrate_db`.
+
+-- Per-zone signals behind `scripts.zones` scores, kept by the triggers
+-- below so scoring never aggregates images, objects or scans. A zone is an
+-- image label or a scanner location. `unknown` counts objects classified
+-- with confidence under 0.5 (or named "unknown"), `bare` ones with neither
+-- color nor brand; both, like `objects`, are quantities.
+CREATE TABLE IF NOT EXISTS zone_stats (
+    zone TEXT PRIMARY KEY,
+    images INTEGER NOT NULL DEFAULT 0,
+    objects INTEGER NOT NULL DEFAULT 0,
+    unknown INTEGER NOT NULL DEFAULT 0,
+    bare INTEGER NOT NULL DEFAULT 0,
+    tags INTEGER NOT NULL DEFAULT 0,  -- NFC tags currently in the zone
+    last_access TEXT
+);
+
+-- Tags arriving in or leaving a zone, per day, for the churn signal
+CREATE TABLE IF NOT EXISTS zone_moves (
+    zone TEXT NOT NULL,
+    day TEXT NOT NULL,
+    moves INTEGER NOT NULL,
+    PRIMARY KEY (zone, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_zone_moves_day ON zone_moves (day);
+
+-- Scores set by hand, replacing the computed one
+CREATE TABLE IF NOT EXISTS zone_overrides (
+    zone TEXT PRIMARY KEY,
+    score REAL NOT NULL,
+    note TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS images_zone_insert AFTER INSERT ON images
+WHEN NEW.label <> ''
+BEGIN
+    INSERT INTO zone_stats (zone, images, last_access)
+    VALUES (NEW.label, 1, NEW.timestamp)
+    ON CONFLICT (zone) DO UPDATE SET
+        images = images + 1,
+        last_access = CASE
+            WHEN last_access IS NULL OR excluded.last_access > last_access
+            THEN excluded.last_access ELSE last_access
+        END;
+END;
+
+CREATE TRIGGER IF NOT EXISTS objects_zone_insert AFTER INSERT ON objects
+BEGIN
+    INSERT INTO zone_stats (zone, objects, unknown, bare)
+    SELECT label, NEW.quantity,
+        CASE WHEN NEW.confidence < 0.5 OR NEW.name = 'unknown'
+            THEN NEW.quantity ELSE 0 END,
+        CASE WHEN NEW.color IS NULL AND NEW.brand IS NULL
+            THEN NEW.quantity ELSE 0 END
+    FROM images WHERE id = NEW.image_id AND label <> ''
+    ON CONFLICT (zone) DO UPDATE SET
+        objects = objects + excluded.objects,
+        unknown = unknown + excluded.unknown,
+        bare = bare + excluded.bare;
+END;
+
+CREATE TRIGGER IF NOT EXISTS objects_zone_delete AFTER DELETE ON objects
+BEGIN
+    UPDATE zone_stats SET
+        objects = objects - OLD.quantity,
+        unknown = unknown - CASE WHEN OLD.confidence < 0.5
+            OR OLD.name = 'unknown' THEN OLD.quantity ELSE 0 END,
+        bare = bare - CASE WHEN OLD.color IS NULL AND OLD.brand IS NULL
+            THEN OLD.quantity ELSE 0 END
+    WHERE zone = (SELECT label FROM images WHERE id = OLD.image_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS objects_zone_update
+AFTER UPDATE OF name, quantity, color, brand, confidence ON objects
+BEGIN
+    UPDATE zone_stats SET
+        objects = objects - OLD.quantity + NEW.quantity,
+        unknown = unknown - CASE WHEN OLD.confidence < 0.5
+            OR OLD.name = 'unknown' THEN OLD.quantity ELSE 0 END
+            + CASE WHEN NEW.confidence < 0.5
+            OR NEW.name = 'unknown' THEN NEW.quantity ELSE 0 END,
+        bare = bare - CASE WHEN OLD.color IS NULL AND OLD.brand IS NULL
+            THEN OLD.quantity ELSE 0 END
+            + CASE WHEN NEW.color IS NULL AND NEW.brand IS NULL
+            THEN NEW.quantity ELSE 0 END
+    WHERE zone = (SELECT label FROM images WHERE id = NEW.image_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS current_location_zone_insert
+AFTER INSERT ON current_location
+WHEN NEW.location <> ''
+BEGIN
+    INSERT INTO zone_stats (zone, tags, last_access)
+    VALUES (NEW.location, 1, NEW.last_seen)
+    ON CONFLICT (zone) DO UPDATE SET
+        tags = tags + 1,
+        last_access = CASE
+            WHEN last_access IS NULL OR excluded.last_access > last_access
+            THEN excluded.last_access ELSE last_access
+        END;
+    INSERT INTO zone_moves (zone, day, moves)
+    VALUES (NEW.location, substr(NEW.last_seen, 1, 10), 1)
+    ON CONFLICT (zone, day) DO UPDATE SET moves = moves + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS current_location_zone_move
+AFTER UPDATE OF location ON current_location
+WHEN OLD.location IS NOT NEW.location
+BEGIN
+    UPDATE zone_stats SET tags = tags - 1 WHERE zone = OLD.location;
+    INSERT INTO zone_moves (zone, day, moves)
+    SELECT OLD.location, substr(NEW.last_seen, 1, 10), 1
+    WHERE OLD.location <> ''
+    ON CONFLICT (zone, day) DO UPDATE SET moves = moves + 1;
+    INSERT INTO zone_stats (zone, tags, last_access)
+    SELECT NEW.location, 1, NEW.last_seen
+    WHERE NEW.location <> ''
+    ON CONFLICT (zone) DO UPDATE SET
+        tags = tags + 1,
+        last_access = CASE
+            WHEN last_access IS NULL OR excluded.last_access > last_access
+            THEN excluded.last_access ELSE last_access
+        END;
+    INSERT INTO zone_moves (zone, day, moves)
+    SELECT NEW.location, substr(NEW.last_seen, 1, 10), 1
+    WHERE NEW.location <> ''
+    ON CONFLICT (zone, day) DO UPDATE SET moves = moves + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS current_location_zone_seen
+AFTER UPDATE OF last_seen ON current_location
+WHEN NEW.location <> ''
+BEGIN
+    UPDATE zone_stats SET last_access = NEW.last_seen
+    WHERE zone = NEW.location
+        AND (last_access IS NULL OR last_access < NEW.last_seen);
+END;
+
+-- Zones that existed before the stats did
+INSERT INTO zone_stats (zone, images, objects, unknown, bare, tags, last_access)
+SELECT zone, SUM(images), SUM(objects), SUM(unknown), SUM(bare), SUM(tags),
+    MAX(last_access)
+FROM (
+    SELECT label AS zone, COUNT(*) AS images, 0 AS objects, 0 AS unknown,
+        0 AS bare, 0 AS tags, MAX(timestamp) AS last_access
+    FROM images WHERE label <> '' GROUP BY label
+    UNION ALL
+    SELECT i.label, 0, SUM(o.quantity),
+        SUM(CASE WHEN o.confidence < 0.5 OR o.name = 'unknown'
+            THEN o.quantity ELSE 0 END),
+        SUM(CASE WHEN o.color IS NULL AND o.brand IS NULL
+            THEN o.quantity ELSE 0 END),
+        0, NULL
+    FROM objects o JOIN images i ON i.id = o.image_id
+    WHERE i.label <> '' GROUP BY i.label
+    UNION ALL
+    SELECT location, 0, 0, 0, 0, COUNT(*), MAX(last_seen)
+    FROM current_location WHERE location <> '' GROUP BY location
+    UNION ALL
+    SELECT zone, 0, 0, 0, 0, 0, NULL FROM zone_moves GROUP BY zone
+)
+WHERE NOT EXISTS (SELECT 1 FROM zone_stats)
+GROUP BY zone;
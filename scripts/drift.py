@@ -0,0 +1,278 @@
+""""Return to order" reminders for tagged items left out of place.
+
+An NFC tag can be given a home zone and a grace period (`tag_homes`). When
+it is scanned anywhere else, triggers in `schema.sql` add it to
+`drift_watch` with the time a reminder falls due; scanning it at home again
+removes it and resolves its reminders.
+
+`DriftScheduler` runs in the app lifespan. It reads only the earliest
+`due_at` through `idx_drift_watch_due`, sleeps until then (or until
+`wake` is called because new scans or homes arrived), and turns due rows
+into `reminders` such as "usb-c cable has been sitting out in living room
+for 34 days". A reminded tag is due again after `REMIND_EVERY_HOURS`. Each
+wake-up costs as much as the number of due items, whatever the size of the
+inventory.
+
+    python -m scripts.drift home 04A1B2 "cable drawer" --label "usb-c cable"
+    python -m scripts.drift check
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+from datetime import UTC, datetime, timedelta
+from os import getenv
+from pathlib import Path
+
+import aiosqlite
+
+from scripts.db import DB_PATH
+from scripts.util import parse_utc_timestamp, utc_iso
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+#: Default time an item may sit outside its home before a reminder
+GRACE_HOURS = float(getenv("DRIFT_GRACE_HOURS", "72"))
+
+#: Time before a still-misplaced item is reminded about again
+REMIND_EVERY_HOURS = float(getenv("DRIFT_REMIND_EVERY_HOURS", "168"))
+
+#: Longest sleep between checks, to notice rows written by other processes
+MAX_SLEEP_SECONDS = 3600.0
+
+#: Most due items turned into reminders per pass
+BATCH_SIZE = 500
+
+REMINDER_COLUMNS = (
+    "id", "tag_id", "location", "home", "away_since", "message",
+    "created_at", "resolved_at",
+)
+
+
+def reminder_message(
+    item: str, location: str | None, home: str, away: timedelta
+) -> str:
+    """Human wording of a reminder, in days once past 48 hours."""
+    hours = away.total_seconds() / 3600
+    duration = (
+        f"{int(hours // 24)} days" if hours >= 48  # noqa: PLR2004
+        else f"{int(hours)} hours"
+    )
+    where = location or "an unknown spot"
+    return (
+        f"{item} has been sitting out in {where} for {duration} "
+        f"(belongs in {home})"
+    )
+
+
+async def set_home(
+    db: aiosqlite.Connection,
+    tag_id: str,
+    home: str,
+    *,
+    label: str | None = None,
+    grace_hours: float = GRACE_HOURS,
+) -> None:
+    """Give a tag a home zone; the triggers re-evaluate where it is now."""
+    await db.execute(
+        "INSERT INTO tag_homes (tag_id, home, label, grace_hours) "
+        "VALUES (?, ?, ?, ?) ON CONFLICT (tag_id) DO UPDATE SET "
+        "home = excluded.home, label = excluded.label, "
+        "grace_hours = excluded.grace_hours",
+        (tag_id, home, label, grace_hours),
+    )
+    await db.commit()
+
+
+async def clear_home(db: aiosqlite.Connection, tag_id: str) -> None:
+    """Stop tracking where a tag belongs."""
+    await db.execute("DELETE FROM tag_homes WHERE tag_id = ?", (tag_id,))
+    await db.commit()
+
+
+async def next_due(db: aiosqlite.Connection) -> datetime | None:
+    """When the next reminder falls due, or None if nothing is away."""
+    cursor = await db.execute("SELECT MIN(due_at) FROM drift_watch")
+    (due_at,) = await cursor.fetchone()
+    return None if due_at is None else parse_utc_timestamp(due_at)
+
+
+async def emit_due(
+    db: aiosqlite.Connection, *, now: datetime | None = None
+) -> list[dict]:
+    """Turn every item due by `now` into a reminder.
+
+    Returns:
+        list[dict]: The reminders created.
+    """
+    now = now or datetime.now(UTC)
+    cursor = await db.execute(
+        "SELECT w.tag_id, w.away_since, c.location, h.home, h.label "
+        "FROM drift_watch w "
+        "JOIN tag_homes h ON h.tag_id = w.tag_id "
+        "LEFT JOIN current_location c ON c.tag_id = w.tag_id "
+        "WHERE w.due_at <= ? ORDER BY w.due_at LIMIT ?",
+        (utc_iso(now), BATCH_SIZE),
+    )
+    due = await cursor.fetchall()
+    created = []
+    next_at = utc_iso(now + timedelta(hours=REMIND_EVERY_HOURS))
+    for tag_id, away_since, location, home, label in due:
+        away = now - parse_utc_timestamp(away_since)
+        message = reminder_message(label or tag_id, location, home, away)
+        cursor = await db.execute(
+            "INSERT INTO reminders (tag_id, location, home, away_since, "
+            "message, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (tag_id, location, home, away_since, message, utc_iso(now)),
+        )
+        await db.execute(
+            "UPDATE drift_watch SET due_at = ? WHERE tag_id = ?",
+            (next_at, tag_id),
+        )
+        created.append({
+            "id": cursor.lastrowid,
+            "tag_id": tag_id,
+            "location": location,
+            "home": home,
+            "away_since": away_since,
+            "message": message,
+            "created_at": utc_iso(now),
+            "resolved_at": None,
+        })
+    await db.commit()
+    return created
+
+
+async def list_reminders(
+    db: aiosqlite.Connection,
+    *,
+    open_only: bool = True,
+    limit: int = 100,
+) -> list[dict]:
+    """Reminders, newest first."""
+    where = "WHERE resolved_at IS NULL " if open_only else ""
+    cursor = await db.execute(
+        f"SELECT {', '.join(REMINDER_COLUMNS)} FROM reminders "  # nosec B608  # noqa: S608
+        f"{where}ORDER BY created_at DESC, id DESC LIMIT ?",
+        (limit,),
+    )
+    return [
+        dict(zip(REMINDER_COLUMNS, row, strict=True))
+        for row in await cursor.fetchall()
+    ]
+
+
+async def dismiss_reminder(db: aiosqlite.Connection, reminder_id: int) -> bool:
+    """Mark a reminder as dealt with.
+
+    Returns:
+        bool: Whether an open reminder with that id existed.
+    """
+    cursor = await db.execute(
+        "UPDATE reminders SET resolved_at = ? "
+        "WHERE id = ? AND resolved_at IS NULL",
+        (utc_iso(datetime.now(UTC)), reminder_id),
+    )
+    await db.commit()
+    return cursor.rowcount > 0
+
+
+class DriftScheduler:
+    """Background task that sleeps until the next reminder is due."""
+
+    def __init__(
+        self,
+        db_path: Path | str = DB_PATH,
+        *,
+        max_sleep: float = MAX_SLEEP_SECONDS,
+    ) -> None:
+        """Prepare the scheduler; `start` launches it."""
+        self.db_path = db_path
+        self.max_sleep = max_sleep
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def wake(self) -> None:
+        """Re-check the queue now, e.g. after scans or homes changed."""
+        self._wake.set()
+
+    async def run_once(self) -> float:
+        """Emit due reminders.
+
+        Returns:
+            float: Seconds until the next one is due, capped at
+            `max_sleep`.
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            for reminder in await emit_due(db):
+                logger.info(f"⏰ {reminder['message']}")
+            due = await next_due(db)
+        if due is None:
+            return self.max_sleep
+        wait = (due - datetime.now(UTC)).total_seconds()
+        return min(max(wait, 0.0), self.max_sleep)
+
+    async def run(self) -> None:
+        """Loop forever, waking for the next due item or `wake`."""
+        while True:
+            self._wake.clear()
+            try:
+                wait = await self.run_once()
+            except Exception:
+                logger.exception("⏰ Drift check failed")
+                wait = self.max_sleep
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), wait)
+
+    def start(self) -> None:
+        """Run the loop as a task on the current event loop."""
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the loop and wait for it to end."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+
+async def _run(args: argparse.Namespace) -> object:
+    async with aiosqlite.connect(args.db) as db:
+        if args.command == "home":
+            await set_home(
+                db, args.tag_id, args.home,
+                label=args.label, grace_hours=args.grace_hours,
+            )
+            cursor = await db.execute(
+                "SELECT due_at FROM drift_watch WHERE tag_id = ?",
+                (args.tag_id,),
+            )
+            row = await cursor.fetchone()
+            return {"tag_id": args.tag_id, "due_at": row and row[0]}
+        return await emit_due(db)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point to set homes or emit due reminders."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    home = commands.add_parser("home", help="set where a tag belongs")
+    home.add_argument("tag_id")
+    home.add_argument("home")
+    home.add_argument("--label")
+    home.add_argument("--grace-hours", type=float, default=GRACE_HOURS)
+    commands.add_parser("check", help="emit reminders that are due")
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(_run(args)), indent=2))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
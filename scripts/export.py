@@ -0,0 +1,393 @@
+"""Streaming export of images, tags and objects.
+
+Rows are read from a SQLite cursor `CHUNK_ROWS` at a time and encoded as
+they arrive, so memory use stays the same for ten photos or a million:
+
+- `csv`: a header row, then one row per record; lists are joined by `;`.
+- `ndjson`: one JSON object per line.
+- `parquet`: one row group per chunk (needs the optional `pyarrow`).
+
+With `gzip`, CSV and NDJSON output is compressed on the fly into a `.gz`
+file; Parquet instead uses gzip for its column chunks.
+
+What to export (`KINDS`):
+
+- `images`: filename, label, timestamp and tags of each photo.
+- `objects`: one row per recognized object, with its photo.
+- `tags`: tag usage - number of photos and first and last use.
+
+Filters use the `/search` query language (`scripts.query`), plus `tag`,
+`zone` (upload label), `after` and `before` shortcuts:
+
+    python -m scripts.export images --format csv --gzip -o images.csv.gz
+    python -m scripts.export objects --zone garage --after 2025-01
+    python -m scripts.export tags --q "cable OR usb" --format parquet -o t.pq
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import zlib
+from importlib.util import find_spec
+from pathlib import Path
+from typing import TYPE_CHECKING, ClassVar, NamedTuple
+
+import aiosqlite
+
+from scripts.db import DB_PATH
+from scripts.query import compile_sql, parse_query
+from scripts.util import HTTPStatusError, lazy_import
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from scripts.query import Node
+
+#: Rows fetched from SQLite and encoded at a time
+CHUNK_ROWS = 1000
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportError(HTTPStatusError):
+    """Raised for an export that cannot be produced."""
+
+
+class Column(NamedTuple):
+    """An exported column; `type` is `str`, `int`, `float` or `list`."""
+
+    name: str
+    type: str = "str"
+
+
+class Kind(NamedTuple):
+    """Columns and query of one kind of export; `{where}` filters images."""
+
+    columns: tuple[Column, ...]
+    sql: str
+
+
+KINDS = {
+    "images": Kind(
+        (
+            Column("filename"),
+            Column("label"),
+            Column("timestamp"),
+            Column("tags", "list"),
+        ),
+        "SELECT images.filename, images.label, images.timestamp, ("
+        "SELECT json_group_array(tags.name) FROM image_tags "
+        "JOIN tags ON tags.id = image_tags.tag_id "
+        "WHERE image_tags.image_id = images.id"
+        ") FROM images WHERE {where} ORDER BY images.id",
+    ),
+    "objects": Kind(
+        (
+            Column("filename"),
+            Column("label"),
+            Column("timestamp"),
+            Column("name"),
+            Column("quantity", "int"),
+            Column("color"),
+            Column("brand"),
+            Column("confidence", "float"),
+            Column("attributes", "list"),
+        ),
+        "SELECT images.filename, images.label, images.timestamp, "
+        "objects.name, objects.quantity, objects.color, objects.brand, "
+        "objects.confidence, objects.attributes "
+        "FROM objects JOIN images ON images.id = objects.image_id "
+        "WHERE {where} ORDER BY objects.id",
+    ),
+    "tags": Kind(
+        (
+            Column("tag"),
+            Column("images", "int"),
+            Column("first_used"),
+            Column("last_used"),
+        ),
+        "SELECT tags.name, COUNT(DISTINCT images.id), "
+        "MIN(images.timestamp), MAX(images.timestamp) "
+        "FROM tags JOIN image_tags ON image_tags.tag_id = tags.id "
+        "JOIN images ON images.id = image_tags.image_id "
+        "WHERE {where} GROUP BY tags.id "
+        "ORDER BY COUNT(DISTINCT images.id) DESC, tags.name",
+    ),
+}
+
+
+def build_filter(
+    q: str = "",
+    *,
+    tag: str | None = None,
+    zone: str | None = None,
+    after: str | None = None,
+    before: str | None = None,
+) -> Node | None:
+    """Combine a search query and the shortcut filters into one query.
+
+    Raises:
+        QuerySyntaxError: If any part is malformed.
+    """
+    parts = [f"({q})"] if q.strip() else []
+    for field, value in (
+        ("tag", tag), ("label", zone), ("after", after), ("before", before)
+    ):
+        if value:
+            parts.append(f'{field}:"{value}"')
+    return parse_query(" ".join(parts))
+
+
+def export_filename(kind: str, fmt: str, *, gzip: bool = False) -> str:
+    """Download name for an export."""
+    return f"{kind}.{fmt}" + (".gz" if gzip and fmt != "parquet" else "")
+
+
+def check_export(kind: str, fmt: str) -> None:
+    """Reject unknown kinds and formats, and Parquet without pyarrow.
+
+    Raises:
+        ExportError: If the export cannot be produced.
+    """
+    if kind not in KINDS:
+        msg = f"Unknown export {kind!r}; use {', '.join(KINDS)}"
+        raise ExportError(msg)
+    if fmt not in FORMATS:
+        msg = f"Unknown format {fmt!r}; use {', '.join(FORMATS)}"
+        raise ExportError(msg)
+    if fmt == "parquet" and find_spec("pyarrow") is None:
+        msg = "Parquet export needs pyarrow (pip install pyarrow)"
+        raise ExportError(msg, 501)
+
+
+def _lists(columns: tuple[Column, ...], rows: list[tuple]) -> list[list]:
+    """Decode JSON list columns of a chunk of rows."""
+    positions = [i for i, c in enumerate(columns) if c.type == "list"]
+    decoded = []
+    for row in rows:
+        values = list(row)
+        for i in positions:
+            values[i] = json.loads(values[i]) if values[i] else []
+        decoded.append(values)
+    return decoded
+
+
+class CsvEncoder:
+    """Rows to CSV text, lists joined with `;`."""
+
+    def __init__(self, columns: tuple[Column, ...]) -> None:
+        """Write the header into the first chunk."""
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._writer.writerow([c.name for c in columns])
+
+    def encode(self, rows: list[tuple]) -> bytes:
+        """Encode one chunk of rows."""
+        for row in _lists(self.columns, rows):
+            self._writer.writerow(
+                ";".join(v) if isinstance(v, list) else v for v in row
+            )
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def close(self) -> bytes:
+        """Nothing is held back."""
+        return self.encode([])
+
+
+class NdjsonEncoder:
+    """Rows to one JSON object per line."""
+
+    def __init__(self, columns: tuple[Column, ...]) -> None:
+        """Remember the column names used as keys."""
+        self.columns = columns
+        self._names = [c.name for c in columns]
+
+    def encode(self, rows: list[tuple]) -> bytes:
+        """Encode one chunk of rows."""
+        return "".join(
+            json.dumps(dict(zip(self._names, row, strict=True))) + "\n"
+            for row in _lists(self.columns, rows)
+        ).encode()
+
+    def close(self) -> bytes:
+        """Nothing is held back."""
+        return b""
+
+
+class _Drain:
+    """Write-only file collecting what pyarrow writes until drained."""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._size = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._size
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ParquetEncoder:
+    """Rows to a Parquet file written one row group per chunk."""
+
+    TYPES: ClassVar[dict[str, str]] = {
+        "str": "string", "int": "int64", "float": "float64"
+    }
+
+    def __init__(
+        self, columns: tuple[Column, ...], compression: str = "snappy"
+    ) -> None:
+        """Open a writer streaming into a drainable buffer."""
+        # Imported here: pyarrow is optional and loads numpy on import
+        self.pa = pa = lazy_import("pyarrow")
+        pq = lazy_import("pyarrow.parquet")
+        self.columns = columns
+        self.schema = pa.schema([
+            (
+                c.name,
+                pa.list_(pa.string()) if c.type == "list"
+                else pa.type_for_alias(self.TYPES[c.type]),
+            )
+            for c in columns
+        ])
+        self._sink = _Drain()
+        self._writer = pq.ParquetWriter(
+            pa.PythonFile(self._sink, mode="w"),
+            self.schema,
+            compression=compression,
+        )
+
+    def encode(self, rows: list[tuple]) -> bytes:
+        """Write one chunk of rows as a row group."""
+        if rows:
+            values = list(zip(*_lists(self.columns, rows), strict=True))
+            self._writer.write_table(self.pa.Table.from_arrays(
+                [self.pa.array(v, f.type) for v, f in zip(
+                    values, self.schema, strict=True
+                )],
+                schema=self.schema,
+            ))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """Write the footer."""
+        self._writer.close()
+        return self._sink.drain()
+
+
+async def stream_export(  # noqa: PLR0913
+    kind: str,
+    fmt: str = "csv",
+    node: Node | None = None,
+    *,
+    gzip: bool = False,
+    db_path: Path | str = DB_PATH,
+    chunk_rows: int = CHUNK_ROWS,
+) -> AsyncIterator[bytes]:
+    """Yield an export as encoded chunks.
+
+    Args:
+        kind (str): One of `KINDS`.
+        fmt (str): One of `FORMATS`.
+        node (Node, optional): Query filtering the photos exported from.
+        gzip (bool): Compress the output (Parquet: its column chunks).
+        db_path (Path | str): Database to read.
+        chunk_rows (int): Rows fetched and encoded at a time.
+
+    Raises:
+        ExportError: See `check_export`.
+    """
+    check_export(kind, fmt)
+    spec = KINDS[kind]
+    where, params = compile_sql(node) if node is not None else ("1", [])
+    if fmt == "parquet":
+        encoder = ParquetEncoder(spec.columns, "gzip" if gzip else "snappy")
+        gzip = False
+    elif fmt == "ndjson":
+        encoder = NdjsonEncoder(spec.columns)
+    else:
+        encoder = CsvEncoder(spec.columns)
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+
+    def out(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute(spec.sql.format(where=where), params)
+        while rows := await cursor.fetchmany(chunk_rows):
+            if data := out(encoder.encode(rows)):
+                yield data
+    tail = out(encoder.close())
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
+
+async def _write(args: argparse.Namespace) -> None:
+    node = build_filter(
+        args.q, tag=args.tag, zone=args.zone,
+        after=args.after, before=args.before,
+    )
+    out = args.output.open("wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in stream_export(
+            args.kind, args.format, node, gzip=args.gzip, db_path=args.db
+        ):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point writing an export to a file or stdout."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--q", default="", help="search query")
+    parser.add_argument("--tag")
+    parser.add_argument("--zone", help="upload label")
+    parser.add_argument("--after", help="YYYY[-MM[-DD]]")
+    parser.add_argument("--before", help="YYYY[-MM[-DD]]")
+    parser.add_argument("-o", "--output", type=Path)
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_write(args))
+    except ValueError as e:  # ExportError, QuerySyntaxError
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""Local stand-in for the GCS bucket, for offline development and tests.
+
+Serves just enough of Cloud Storage for the app's signed-URL flows:
+
+- `PUT` and `GET /{bucket}/{object}` through V4 signed URLs. Signatures,
+  signed headers and expiry are checked against the service account key,
+  so a URL the fake accepts is one GCS would accept.
+- The JSON API calls `google-cloud-storage` makes for metadata and
+  downloads (`/storage/v1/b/...`, `/download/storage/v1/b/...`), without
+  authentication, like other emulators.
+
+Objects are plain files under `root/<bucket>/`. Point the app at it with
+`STORAGE_EMULATOR_HOST`:
+
+    python -m scripts.fakegcs --root /tmp/gcs --key service-account-key.json
+    STORAGE_EMULATOR_HOST=http://127.0.0.1:4443 uvicorn scripts.logger:app
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import mimetypes
+import threading
+import urllib.parse
+from datetime import UTC, datetime, timedelta
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+
+
+class SignatureError(ValueError):
+    """Raised for a signed URL that GCS would reject."""
+
+
+def _quote(value: str) -> str:
+    return urllib.parse.quote(value, safe="~")
+
+
+def verify_signed_url(  # noqa: PLR0913
+    method: str,
+    target: str,
+    headers: dict[str, str],
+    public_key: object,
+    email: str,
+    *,
+    now: datetime | None = None,
+) -> None:
+    """Check a V4 (`GOOG4-RSA-SHA256`) signed request.
+
+    Args:
+        method (str): HTTP method of the request.
+        target (str): Request path and query string as sent.
+        headers (dict): Request headers; names are matched case-blind.
+        public_key: RSA public key of the signing service account.
+        email (str): Its `client_email`.
+        now (datetime, optional): Time to check expiry against.
+
+    Raises:
+        SignatureError: If the URL is malformed, expired, for another
+            account, or the signature does not match.
+    """
+    path, _, query = target.partition("?")
+    params = dict(urllib.parse.parse_qsl(query, keep_blank_values=True))
+    try:
+        signature = binascii.unhexlify(params.pop("X-Goog-Signature"))
+        timestamp = params["X-Goog-Date"]
+        credential = params["X-Goog-Credential"]
+        signed = params["X-Goog-SignedHeaders"].split(";")
+        expires = int(params["X-Goog-Expires"])
+        issued = datetime.strptime(timestamp, "%Y%m%dT%H%M%SZ").replace(
+            tzinfo=UTC
+        )
+    except (KeyError, ValueError, binascii.Error) as e:
+        msg = f"Malformed signed URL: {e}"
+        raise SignatureError(msg) from e
+    if params.get("X-Goog-Algorithm") != "GOOG4-RSA-SHA256":
+        msg = "Unsupported signing algorithm"
+        raise SignatureError(msg)
+    signer, _, scope = credential.partition("/")
+    if signer != email:
+        msg = f"Signed by unknown account {signer!r}"
+        raise SignatureError(msg)
+    if (now or datetime.now(UTC)) > issued + timedelta(seconds=expires):
+        msg = "Signed URL has expired"
+        raise SignatureError(msg)
+
+    lower = {k.lower(): " ".join(v.split()) for k, v in headers.items()}
+    if any(name not in lower for name in signed):
+        msg = "A signed header is missing from the request"
+        raise SignatureError(msg)
+    canonical_request = "\n".join([
+        method,
+        path,
+        "&".join(sorted(f"{_quote(k)}={_quote(v)}" for k, v in params.items())),
+        "".join(f"{name}:{lower[name]}\n" for name in signed),
+        ";".join(signed),
+        lower.get("x-goog-content-sha256", "UNSIGNED-PAYLOAD"),
+    ])
+    string_to_sign = "\n".join([
+        "GOOG4-RSA-SHA256",
+        timestamp,
+        scope,
+        hashlib.sha256(canonical_request.encode()).hexdigest(),
+    ])
+    try:
+        public_key.verify(
+            signature, string_to_sign.encode(), padding.PKCS1v15(),
+            hashes.SHA256(),
+        )
+    except InvalidSignature as e:
+        msg = "Signature does not match"
+        raise SignatureError(msg) from e
+
+
+class FakeGCS(ThreadingHTTPServer):
+    """HTTP server holding buckets as directories under `root`."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        root: Path,
+        key_file: Path,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+    ) -> None:
+        """Bind the server; `start` or `serve_forever` runs it.
+
+        Args:
+            root (Path): Directory holding one subdirectory per bucket.
+            key_file (Path): Service account key whose signatures are
+                accepted.
+            address (tuple): Host and port; port 0 picks a free one.
+        """
+        super().__init__(address, _Handler)
+        self.root = Path(root)
+        key = json.loads(Path(key_file).read_text())
+        self.email = key["client_email"]
+        self.public_key = serialization.load_pem_private_key(
+            key["private_key"].encode(), password=None
+        ).public_key()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """Base URL, e.g. for `STORAGE_EMULATOR_HOST`."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def object_path(self, bucket: str, name: str) -> Path:
+        """File holding an object; names may not leave the bucket."""
+        base = (self.root / bucket).resolve()
+        path = (base / name).resolve()
+        if not path.is_relative_to(base) or path == base:
+            msg = f"Bad object name {name!r}"
+            raise ValueError(msg)
+        return path
+
+    def start(self) -> None:
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeGCS
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        del format, args  # keep test output quiet
+
+    def _send(
+        self,
+        status: int,
+        body: bytes = b"",
+        content_type: str = "application/json",
+        headers: dict | None = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status: int, message: str) -> None:
+        body = json.dumps({"error": {"code": status, "message": message}})
+        self._send(status, body.encode())
+
+    def _signed_object(self) -> Path | None:
+        """Object addressed by a signed XML API request, or None if denied."""
+        try:
+            verify_signed_url(
+                self.command, self.path, dict(self.headers),
+                self.server.public_key, self.server.email,
+            )
+            path = urllib.parse.unquote(self.path.partition("?")[0])
+            bucket, _, name = path.lstrip("/").partition("/")
+            return self.server.object_path(bucket, name)
+        except (SignatureError, ValueError) as e:
+            self._error(HTTPStatus.FORBIDDEN, str(e))
+            return None
+
+    def _metadata(self, path: Path, bucket: str, name: str) -> dict:
+        meta = json.loads(path.with_name(path.name + ".meta").read_text())
+        return {
+            "kind": "storage#object",
+            "bucket": bucket,
+            "name": name,
+            "size": str(path.stat().st_size),
+            "contentType": meta["contentType"],
+            "md5Hash": meta["md5Hash"],
+            "generation": meta["generation"],
+        }
+
+    def do_PUT(self) -> None:
+        path = self._signed_object()
+        if path is None:
+            return
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        digest = hashlib.md5(data, usedforsecurity=False).digest()
+        md5 = base64.b64encode(digest).decode()
+        path.with_name(path.name + ".meta").write_text(json.dumps({
+            "contentType": self.headers.get(
+                "Content-Type", "application/octet-stream"
+            ),
+            "md5Hash": md5,
+            "generation": str(datetime.now(UTC).timestamp()).replace(".", ""),
+        }))
+        self._send(HTTPStatus.OK, headers={"ETag": f'"{md5}"'})
+
+    def do_GET(self) -> None:
+        path, _, query = self.path.partition("?")
+        for prefix, media in (
+            ("/download/storage/v1/b/", True),
+            ("/storage/v1/b/", False),
+        ):
+            if path.startswith(prefix):
+                self._json_api(path.removeprefix(prefix), query, media=media)
+                return
+        target = self._signed_object()
+        if target is None:
+            return
+        if not target.is_file():
+            self._error(HTTPStatus.NOT_FOUND, "No such object")
+            return
+        meta = target.with_name(target.name + ".meta")
+        if meta.exists():
+            content_type = json.loads(meta.read_text())["contentType"]
+        else:
+            content_type, _ = mimetypes.guess_type(target.name)
+        self._send(
+            HTTPStatus.OK, target.read_bytes(),
+            content_type or "application/octet-stream",
+        )
+
+    def _json_api(self, rest: str, query: str, *, media: bool) -> None:
+        bucket, _, name = rest.partition("/o/")
+        name = urllib.parse.unquote(name)
+        try:
+            path = self.server.object_path(bucket, name)
+        except ValueError as e:
+            self._error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        if not path.is_file():
+            self._error(HTTPStatus.NOT_FOUND, "No such object")
+            return
+        meta = self._metadata(path, bucket, name)
+        if media or "alt=media" in query:
+            self._send(
+                HTTPStatus.OK, path.read_bytes(), meta["contentType"],
+                {"x-goog-hash": f"md5={meta['md5Hash']}"},
+            )
+        else:
+            self._send(HTTPStatus.OK, json.dumps(meta).encode())
+
+    do_HEAD = do_GET  # noqa: N815
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point running the fake until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", type=Path, required=True)
+    parser.add_argument("--key", type=Path, required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4443)
+    args = parser.parse_args(argv)
+    server = FakeGCS(args.root, args.key, (args.host, args.port))
+    print(f"Fake GCS at {server.url}")  # noqa: T201
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
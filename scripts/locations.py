@@ -0,0 +1,184 @@
+"""Where every NFC tag is now, and where it has been.
+
+`scan_events` only grows, so answering "where is it?" from it means reading
+history. Triggers in `schema.sql` instead maintain two tables as each scan
+is stored, whichever way it arrives (`/api/scans` or segment ingest):
+
+- `current_location`: one row per tag with its zone, the scanner that saw
+  it, when it arrived there (`since`) and when it was last seen. Lookups by
+  tag use the primary key and lookups by zone `idx_current_location_zone`,
+  so both are single index reads however long the log grows.
+- `location_history`: one row per tag, hour and zone with first and last
+  sighting and a scan count. `downsample_history` folds hours older than
+  `HISTORY_HOURLY_DAYS` into days, so a tag sitting on a shelf for a year
+  costs about 365 rows rather than one per scan.
+
+    python -m scripts.locations where 04A1B2C3
+    python -m scripts.locations zone garage
+    python -m scripts.locations downsample --days 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from datetime import UTC, datetime, timedelta
+from os import getenv
+from pathlib import Path
+
+import aiosqlite
+
+from scripts.db import DB_PATH
+
+HOUR = 3600
+DAY = 86400
+
+#: Age in days from which hourly history is folded into daily buckets
+HISTORY_HOURLY_DAYS = int(getenv("LOCATION_HOURLY_DAYS", "30"))
+
+CURRENT_COLUMNS = "tag_id, location, node_id, since, last_seen"
+
+
+def _current(row: tuple) -> dict:
+    tag_id, location, node_id, since, last_seen = row
+    dwell = datetime.fromisoformat(last_seen) - datetime.fromisoformat(since)
+    return {
+        "tag_id": tag_id,
+        "location": location,
+        "node_id": node_id,
+        "since": since,
+        "last_seen": last_seen,
+        "dwell_seconds": dwell.total_seconds(),
+    }
+
+
+async def where_is(db: aiosqlite.Connection, tag_id: str) -> dict | None:
+    """Current zone of a tag, or None if it was never scanned.
+
+    Returns:
+        dict | None: Zone, scanner node, arrival and last-seen times and
+        the dwell time in seconds between the two.
+    """
+    cursor = await db.execute(
+        f"SELECT {CURRENT_COLUMNS} FROM current_location WHERE tag_id = ?",  # nosec B608  # noqa: S608
+        (tag_id,),
+    )
+    row = await cursor.fetchone()
+    return None if row is None else _current(row)
+
+
+async def zone_contents(
+    db: aiosqlite.Connection, location: str, *, limit: int = 100
+) -> list[dict]:
+    """Tags whose latest scan was in `location`, most recently seen first."""
+    cursor = await db.execute(
+        f"SELECT {CURRENT_COLUMNS} FROM current_location "  # nosec B608  # noqa: S608
+        "WHERE location = ? ORDER BY last_seen DESC LIMIT ?",
+        (location, limit),
+    )
+    return [_current(row) for row in await cursor.fetchall()]
+
+
+async def location_history(
+    db: aiosqlite.Connection, tag_id: str, *, limit: int = 100
+) -> list[dict]:
+    """Where a tag has been, newest bucket first.
+
+    Returns:
+        list[dict]: Bucket start, its length in seconds, zone, first and
+        last sighting in the bucket and number of scans.
+    """
+    cursor = await db.execute(
+        "SELECT bucket, span, location, first_seen, last_seen, scans "
+        "FROM location_history WHERE tag_id = ? "
+        "ORDER BY bucket DESC, first_seen DESC LIMIT ?",
+        (tag_id, limit),
+    )
+    return [
+        {
+            "bucket": bucket,
+            "span": span,
+            "location": location,
+            "first_seen": first_seen,
+            "last_seen": last_seen,
+            "scans": scans,
+        }
+        for bucket, span, location, first_seen, last_seen, scans
+        in await cursor.fetchall()
+    ]
+
+
+async def downsample_history(
+    db: aiosqlite.Connection,
+    *,
+    older_than_days: int = HISTORY_HOURLY_DAYS,
+    now: datetime | None = None,
+) -> int:
+    """Fold hourly history rows before a day boundary into daily rows.
+
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        older_than_days (int): Keep hourly rows for this many days.
+        now (datetime, optional): Reference time; defaults to now.
+
+    Returns:
+        int: Number of hourly rows folded away.
+    """
+    now = now or datetime.now(UTC)
+    cutoff = (now - timedelta(days=older_than_days)).date().isoformat()
+    await db.execute(
+        "INSERT INTO location_history "
+        "(tag_id, bucket, span, location, first_seen, last_seen, scans) "
+        "SELECT tag_id, substr(bucket, 1, 10) || 'T00:00:00+00:00', ?, "
+        "location, MIN(first_seen), MAX(last_seen), SUM(scans) "
+        "FROM location_history WHERE span = ? AND bucket < ? "
+        "GROUP BY tag_id, substr(bucket, 1, 10), location "
+        "ON CONFLICT (tag_id, bucket, span, location) DO UPDATE SET "
+        "first_seen = min(first_seen, excluded.first_seen), "
+        "last_seen = max(last_seen, excluded.last_seen), "
+        "scans = scans + excluded.scans",
+        (DAY, HOUR, cutoff),
+    )
+    cursor = await db.execute(
+        "DELETE FROM location_history WHERE span = ? AND bucket < ?",
+        (HOUR, cutoff),
+    )
+    await db.commit()
+    return cursor.rowcount
+
+
+async def _run(args: argparse.Namespace) -> object:
+    async with aiosqlite.connect(args.db) as db:
+        if args.command == "where":
+            return {
+                "current": await where_is(db, args.tag_id),
+                "history": await location_history(db, args.tag_id),
+            }
+        if args.command == "zone":
+            return await zone_contents(db, args.zone, limit=args.limit)
+        return {"folded": await downsample_history(
+            db, older_than_days=args.days
+        )}
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point for location lookups and downsampling."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    where = commands.add_parser("where", help="current zone and history")
+    where.add_argument("tag_id")
+    zone = commands.add_parser("zone", help="tags currently in a zone")
+    zone.add_argument("zone")
+    zone.add_argument("--limit", type=int, default=100)
+    downsample = commands.add_parser(
+        "downsample", help="fold old hourly history into days"
+    )
+    downsample.add_argument("--days", type=int, default=HISTORY_HOURLY_DAYS)
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(_run(args)), indent=2))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,18 @@
 
 import asyncio
 import hashlib
+import hmac
 import json
 import logging
 import mimetypes
 import os
 import shutil
-from collections.abc import AsyncGenerator
+import time
+import xml.etree.ElementTree as ET  # nosec B405  # feed output only
+from collections.abc import AsyncGenerator, Iterator
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
+from email.utils import format_datetime
 from os import getenv
 from pathlib import Path
 from typing import Annotated, BinaryIO, NoReturn
@@ -22,6 +26,7 @@ from fastapi import (
     FastAPI,
     File,
     Form,
+    Header,
     HTTPException,
     Query,
     Request,
@@ -32,24 +37,145 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import (
     HTMLResponse,
     JSONResponse,
+    PlainTextResponse,
     RedirectResponse,
+    Response,
     StreamingResponse,
 )
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from google.auth import jwt
-from google.cloud import storage
-from PIL import Image
 from starlette.middleware.sessions import SessionMiddleware
 
-from scripts.auth import get_current_user
+from scripts.auth import ALLOWED_USER, get_current_user, register_oauth
 from scripts.auth import router as auth_router
+from scripts.bulk import (
+    MAX_BATCH_FILES,
+    batch_progress,
+    claim_files,
+    create_batch,
+    discard,
+    mark_file,
+    stage_upload,
+    stored_name,
+)
 from scripts.config import BACKUP_DB_PATH, DB_BACKUP_DIR
-from scripts.db import add_image, add_tag, get_db, init_db, link_image_tag
+from scripts.db import (
+    DB_PATH,
+    add_image,
+    add_tag,
+    get_db,
+    get_image_id,
+    init_db,
+    link_image_tag,
+    set_image_objects,
+    set_image_renditions,
+)
+from scripts.drift import (
+    GRACE_HOURS,
+    DriftScheduler,
+    clear_home,
+    dismiss_reminder,
+    list_reminders,
+    set_home,
+)
+from scripts.export import (
+    FORMATS,
+    ExportError,
+    build_filter,
+    check_export,
+    export_filename,
+    stream_export,
+)
+from scripts.locations import (
+    downsample_history,
+    location_history,
+    where_is,
+    zone_contents,
+)
+from scripts.metrics import (
+    BACKUP_BYTES,
+    BACKUP_SECONDS,
+    CONTENT_TYPE,
+    DB_QUERY_SECONDS,
+    GCS_BYTES,
+    GCS_REQUEST_SECONDS,
+    QUEUE_DEPTH,
+    QUEUE_WAIT_SECONDS,
+    REGISTRY,
+    MetricsMiddleware,
+)
+from scripts.objects import (
+    inventory_totals,
+    object_rollup,
+    parse_objects,
+    tags_from_objects,
+)
+from scripts.profiling import ProfilingMiddleware, monitor, store
+from scripts.query import (
+    QuerySyntaxError,
+    facet_counts,
+    parse_query,
+    search_image_ids,
+)
 from scripts.rebuild import rebuild_db_from_gcs, restore_db_from_gcs_snapshot
-from scripts.util import clean_tag_name, utc_now_iso
+from scripts.resumable import (
+    MAX_UPLOAD_BYTES,
+    TUS_EXTENSIONS,
+    TUS_VERSION,
+    UploadSessionError,
+    append_chunk,
+    collect_expired,
+    complete_session,
+    create_session,
+    delete_session,
+    get_session,
+    parse_checksum,
+    parse_metadata,
+)
+from scripts.scanlog import (
+    MAX_BATCH_BYTES,
+    MAX_KEY_LENGTH,
+    ScanBatchError,
+    decode_batch,
+    store_scan_batch,
+)
+from scripts.signed import (
+    SERVE_MODE,
+    SignedUrlError,
+    create_direct_upload,
+    download_object,
+    finalize_direct_upload,
+    get_direct_upload,
+    object_size,
+    read_url,
+)
+from scripts.similar import MAX_QUERY_BYTES, add_embedding, find_similar
+from scripts.sprites import (
+    SPRITE_DIR,
+    SPRITE_MODE,
+    add_image_to_sprites,
+    sprite_style,
+    sync_sheet_maps,
+)
+from scripts.tagindex import get_tag_index, refresh_tag_index
+from scripts.tags import aliases, canonical_tag
+from scripts.thumbnails import (
+    format_widths,
+    picture_sources,
+    render_thumbnails,
+    shutdown_pool,
+)
+from scripts.tracing import (
+    TracingMiddleware,
+    exporter,
+    inject,
+    record_span,
+    start_span,
+    use_traceparent,
+)
+from scripts.util import LazyObject, clean_tag_name, lazy_import, utc_now_iso
 from scripts.vision import analyze_image_with_openai, call_openai_chat
+from scripts.zones import prune_moves, set_override, zone_scores
 
 load_dotenv()
 
@@ -63,29 +189,109 @@ formatter = logging.Formatter(
 handler.setFormatter(formatter)
 log.addHandler(handler)
 
-templates = Jinja2Templates(directory="scripts/templates")
+# Heavy client libraries load on first use so importing the app stays fast
+storage = lazy_import("google.cloud.storage")
+jwt = lazy_import("google.auth.jwt")
+
+
+def _make_templates() -> object:
+    from fastapi.templating import Jinja2Templates  # noqa: PLC0415
+
+    return Jinja2Templates(directory="scripts/templates")
+
+
+templates = LazyObject(_make_templates)
 
-# Global queue
+# Global queue of {"upload": (file_path, filename, label), "enqueued_at": ...,
+# "traceparent": ...}
 processing_queue = asyncio.Queue()
+QUEUE_DEPTH.set_function(processing_queue.qsize)
 
 # Background task holder (optional, for clean shutdown)
 upload_worker_task = None
 
+#: Queue items processed at once; their vision and GCS calls overlap
+UPLOAD_WORKERS = int(getenv("UPLOAD_WORKERS", "4"))
+
+# Database, index and metadata updates of concurrent items take turns
+ingest_lock = asyncio.Lock()
+
+# "Return to order" reminder scheduler, started by the lifespan
+drift_scheduler: DriftScheduler | None = None
+
 
 async def process_uploads() -> None:
-    """Continuously process items in the upload queue."""
+    """Continuously process items in the upload queue.
+
+    This task and `UPLOAD_WORKERS - 1` helpers take items from the queue,
+    so a bulk import is limited by the network and the vision API rather
+    than by waiting on each photo in turn.
+    """
+    helpers = [
+        asyncio.create_task(_work_queue()) for _ in range(UPLOAD_WORKERS - 1)
+    ]
+    try:
+        await _work_queue()
+    finally:
+        for helper in helpers:
+            helper.cancel()
+
+
+async def _work_queue() -> None:
     while True:
-        upload_info = await processing_queue.get()
-        await process_image(upload_info)
+        await process_item(await processing_queue.get())
+
+
+async def process_item(item: dict) -> None:
+    """Process one queue item and record the outcome for its batch.
+
+    Items from `/api/batches` and `/api/uploads` carry a `gcs_path`: their
+    original is sent to GCS here rather than in the request. Direct
+    uploads carry a `gcs_download` instead: the original is already in the
+    bucket and is fetched from there.
+    """
+    try:
+        waited = time.monotonic() - item["enqueued_at"]
+        QUEUE_WAIT_SECONDS.observe(waited)
+        with use_traceparent(item.get("traceparent")):
+            now = time.time_ns()
+            record_span("queue.wait", now - int(waited * 1e9), now)
+            error = None
+            if source := item.get("gcs_download"):
+                try:
+                    await asyncio.to_thread(
+                        download_path_from_gcs, source, item["upload"][0]
+                    )
+                except Exception as e:
+                    log.exception("Could not download %s", source)
+                    error = f"GCS download failed: {e}"
+            if gcs_path := item.get("gcs_path"):
+                try:
+                    await asyncio.to_thread(
+                        upload_path_to_gcs, item["upload"][0], gcs_path
+                    )
+                except Exception as e:
+                    log.exception("Could not upload %s", gcs_path)
+                    error = f"GCS upload failed: {e}"
+            if error is None and not await process_image(item["upload"]):
+                error = "processing failed"
+            if batch_id := item.get("batch"):
+                async with aiosqlite.connect(DB_PATH) as db:
+                    await mark_file(db, batch_id, item["upload"][1], error)
+    except Exception:
+        log.exception("Could not process queue item")
+    finally:
         processing_queue.task_done()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Handles startup and shutdown tasks for the FastAPI app."""
-    global upload_worker_task  # noqa: PLW0603
+    global upload_worker_task, drift_scheduler  # noqa: PLW0603
 
     del app  # unused arg
+    prepare_storage()
+    register_oauth()
     upload_worker_task = asyncio.create_task(process_uploads())
     log.info("🚀 Upload processing queue started.")
 
@@ -105,7 +311,23 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     log.info("Initialized sqlite database.")
 
     await init_db()
+    async with aiosqlite.connect(DB_PATH) as db:
+        await downsample_history(db)
+        await prune_moves(db)
+        await collect_expired(db)
+    await aliases.load()
+    await update_tag_index()
     await perform_backup()
+    monitor.start()
+    drift_scheduler = DriftScheduler(DB_PATH)
+    drift_scheduler.start()
+
+    if SPRITE_MODE:
+        try:
+            bucket = storage.Client().bucket(GCS_BUCKET)
+            await asyncio.to_thread(sync_sheet_maps, bucket, GCS_UPLOAD_PREFIX)
+        except Exception:
+            log.exception("🧩 Could not sync sprite sheets from GCS")
 
     yield
 
@@ -115,22 +337,54 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
             await upload_worker_task
         except asyncio.CancelledError:
             log.info("🛑 Upload processing queue stopped.")
+    if drift_scheduler:
+        await drift_scheduler.stop()
+    await monitor.stop()
+    shutdown_pool()
 
 
 app = FastAPI(lifespan=lifespan)
 
 
+def is_admin(user: dict | None) -> bool:
+    """Whether a logged-in user may use the admin and profiling tools."""
+    if not user:
+        return False
+    allowed = {
+        email.strip()
+        for email in os.getenv("ALLOWED_USER_EMAILS", "").split(",")
+        if email.strip()
+    }
+    return user.get("email") in (allowed | {ALLOWED_USER})
+
+
+def can_profile(scope: dict) -> bool:
+    """Allow requested profiles only for admin users."""
+    return is_admin(get_current_user(Request(scope)))
+
+
 secret_key = getenv("SESSION_SECRET", "dev-only-secret")
+# Added before the session middleware so it runs inside it and sees the user
+app.add_middleware(ProfilingMiddleware, authorize=can_profile)
 app.add_middleware(SessionMiddleware, secret_key=secret_key)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 app.include_router(auth_router)
 
 auth_scheme = HTTPBearer(auto_error=False)
 
 UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
 META_FILE = UPLOAD_DIR / "metadata.json"
-if not META_FILE.exists():
-    META_FILE.write_text("[]")
+
+
+
+def prepare_storage() -> None:
+    """Create the local upload and backup directories and metadata file."""
+    UPLOAD_DIR.mkdir(exist_ok=True)
+    DB_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+    if not META_FILE.exists():
+        META_FILE.write_text("[]")
+
 
 GCS_BUCKET = "fogcat5-home"
 GCS_UPLOAD_PREFIX = "upload"
@@ -183,53 +437,169 @@ async def health_check() -> JSONResponse:
         )
 
 
+@app.get("/debug/traces")
+async def debug_traces(
+    user: Annotated[dict, Depends(get_current_user)],
+    min_ms: Annotated[float, Query(ge=0)] = 1000,
+    limit: Annotated[int, Query(ge=1, le=200)] = 20,
+) -> JSONResponse:
+    """List recent traces slower than `min_ms`, slowest first."""
+    if not user:
+        return RedirectResponse("/login", status_code=302)
+    return {"traces": exporter.slow_traces(min_ms, limit)}
+
+
+@app.get("/debug/traces/{trace_id}")
+async def debug_trace(
+    trace_id: str, user: Annotated[dict, Depends(get_current_user)]
+) -> JSONResponse:
+    """Return every stored span of one trace in OTLP/JSON form."""
+    if not user:
+        return RedirectResponse("/login", status_code=302)
+    trace = exporter.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+
+def _require_admin(user: dict | None) -> None:
+    if not is_admin(user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+
+@app.get("/admin/profiles")
+async def list_profiles(
+    user: Annotated[dict, Depends(get_current_user)],
+) -> JSONResponse:
+    """List stored request profiles and recent event-loop stalls."""
+    _require_admin(user)
+    return {
+        "profiles": store.list(),
+        "loop_blocks": monitor.blocked_events(),
+    }
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str, user: Annotated[dict, Depends(get_current_user)]
+) -> PlainTextResponse:
+    """Download a profile in collapsed-stack (flamegraph) format."""
+    _require_admin(user)
+    profile = store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(
+        profile.collapsed(),
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="profile-{profile_id}.folded"'
+            )
+        },
+    )
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """Expose app metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 app.mount("/static", StaticFiles(directory="scripts/static"), name="static")
 
 
-async def process_image(upload_info: tuple) -> None:
+async def process_image(upload_info: tuple) -> bool:
     """Process an uploaded image file.
 
     - Generates a summary using OpenAI Vision
-    - Saves the summary and thumbnail
-    - Uploads both to GCS
+    - Saves the summary and thumbnail renditions
+    - Uploads them to GCS
     - Updates local metadata and SQLite DB with tags.
+
+    Returns:
+        bool: False if any step failed; the error is logged.
     """
     file_path, filename, label = upload_info
     log.info(f"🔧 Processing file: {filename}")
 
-    try:
-        result = analyze_image_with_openai(str(file_path))
-
-        # Save summary
-        summary_path = UPLOAD_DIR / f"{filename}.summary.txt"
-        async with aiofiles.open(summary_path, "w") as summary_file:
-            await summary_file.write(result["summary"])
-        async with aiofiles.open(summary_path, "rb") as fh:
-            upload_file_to_gcs(
-                GCS_BUCKET,
-                f"{GCS_UPLOAD_PREFIX}/summary/{filename}.summary.txt",
-                fh,
-            )
+    with start_span("process_image", filename=filename) as span:
+        try:
+            await _process_image_stages(file_path, filename, label)
+        except Exception as e:
+            span.record_exception(e)
+            log.exception("Error processing %s", filename)
+            return False
+    return True
 
-        # Create thumbnail (PIL is still sync; okay here)
-        thumb_path = UPLOAD_DIR / f"{filename}.thumb.jpg"
-        with Image.open(file_path) as img:
-            img.thumbnail((300, 300))
-            img.save(thumb_path, "JPEG")
-        async with aiofiles.open(thumb_path, "rb") as fh:
-            upload_file_to_gcs(
-                GCS_BUCKET,
-                f"{GCS_UPLOAD_PREFIX}/thumb/{filename}.thumb.jpg",
-                fh,
-            )
 
-        await add_image(filename, label, utc_now_iso())
-        for tag in result["summary"].splitlines():
-            clean_tag = clean_tag_name(tag)
-            if clean_tag:
-                await add_tag(clean_tag)
-                await link_image_tag(filename, clean_tag)
+async def _process_image_stages(
+    file_path: Path, filename: str, label: str
+) -> None:
+    """Run each step of `process_image` in its own tracing span.
 
+    Vision and GCS calls run in threads so concurrent items overlap; the
+    steps that update shared state hold `ingest_lock`.
+    """
+    with start_span("vision.analyze"):
+        result = await asyncio.to_thread(
+            analyze_image_with_openai, str(file_path)
+        )
+
+    # Save summary
+    summary_path = UPLOAD_DIR / f"{filename}.summary.txt"
+    async with aiofiles.open(summary_path, "w") as summary_file:
+        await summary_file.write(result["summary"])
+    await asyncio.to_thread(
+        upload_path_to_gcs,
+        summary_path,
+        f"{GCS_UPLOAD_PREFIX}/summary/{filename}.summary.txt",
+    )
+
+    # Create thumbnail renditions in the worker pool
+    with start_span("thumbnails.render"):
+        renditions = await render_thumbnails(file_path, filename, UPLOAD_DIR)
+    for name in renditions["files"]:
+        await asyncio.to_thread(
+            upload_path_to_gcs,
+            UPLOAD_DIR / name,
+            f"{GCS_UPLOAD_PREFIX}/thumb/{name}",
+        )
+
+    async with ingest_lock:
+        await _ingest_image(result, file_path, filename, label, renditions)
+
+
+async def _ingest_image(
+    result: dict, file_path: Path, filename: str, label: str, renditions: dict
+) -> None:
+    """Record a processed image in the database, indexes and metadata."""
+    with start_span("embeddings.add"):
+        await store_embedding(file_path, filename)
+
+    with start_span("db.add_image"):
+        await add_image(filename, label, utc_now_iso())
+        await set_image_renditions(
+            filename,
+            list(renditions["formats"]),
+            renditions["placeholder"],
+            format_widths(renditions["widths"]),
+        )
+    if SPRITE_MODE:
+        with start_span("sprites.update"):
+            await update_sprite_sheet(filename)
+    with start_span("db.tags") as span:
+        objects = parse_objects(result["summary"])
+        tags = tags_from_objects(objects)
+        for tag in tags:
+            await add_tag(tag)
+            await link_image_tag(filename, tag)
+            aliases.register(tag)
+        await set_image_objects(filename, objects)
+        span.set_attribute("objects", len(objects))
+        span.set_attribute("tags", len(tags))
+    with start_span("tagindex.update"):
+        await update_tag_index()
+
+    with start_span("metadata.write"):
         async with aiofiles.open(META_FILE) as f:
             meta_text = await f.read()
             meta = json.loads(meta_text)
@@ -242,8 +612,52 @@ async def process_image(upload_info: tuple) -> None:
         async with aiofiles.open(META_FILE, "w") as f:
             await f.write(json.dumps(meta, indent=2))
 
+
+async def update_tag_index() -> None:
+    """Fold new images and tags from `DB_PATH` into the tag index.
+
+    Failures are logged only: SQLite holds the data and the index catches up
+    on the next search.
+    """
+    try:
+        index = await refresh_tag_index()
+    except Exception:
+        log.exception("🏷️ Could not update tag index")
+    else:
+        log.info(f"🏷️ Tag index holds {len(index)} images.")
+
+
+async def store_embedding(file_path: Path, filename: str) -> None:
+    """Add an upload to the similarity index, logging any failure.
+
+    A missing embedding only hides the photo from `/api/similar`; it can be
+    added later with `python -m scripts.similar index`.
+    """
+    try:
+        await add_embedding(file_path, filename)
     except Exception:
-        log.exception("Error processing %s", filename)
+        log.exception("🧭 Could not embed %s", filename)
+
+
+async def update_sprite_sheet(filename: str) -> None:
+    """Add an ingested image to its sprite sheet and upload the sheet.
+
+    Failures are logged and do not interrupt image processing; the gallery
+    falls back to per-image thumbnails for images missing from a sheet.
+    """
+    try:
+        image_id = await get_image_id(filename)
+        written = await add_image_to_sprites(
+            image_id, filename, UPLOAD_DIR, SPRITE_DIR
+        )
+        for name in written:
+            await asyncio.to_thread(
+                upload_path_to_gcs,
+                SPRITE_DIR / name,
+                f"{GCS_UPLOAD_PREFIX}/sprites/{name}",
+            )
+    except Exception:
+        log.exception(f"🧩 Could not update sprite sheet for {filename}")
 
 
 def upload_file_to_gcs(
@@ -256,15 +670,54 @@ def upload_file_to_gcs(
         destination_blob_name (str): Name of blob in GCS,
         file_obj (file): File object to upload.
     """
-    client = storage.Client.from_service_account_json(
-        "/app/service-account-key.json"
-    )
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_file(file_obj, rewind=True)
+    with (
+        start_span("gcs.upload", blob=destination_blob_name),
+        GCS_REQUEST_SECONDS.time(operation="upload"),
+    ):
+        client = storage.Client.from_service_account_json(
+            "/app/service-account-key.json"
+        )
+        bucket = client.bucket(bucket_name)
+        blob = bucket.blob(destination_blob_name)
+        blob.upload_from_file(file_obj, rewind=True)
+    GCS_BYTES.inc(_file_size(file_obj), operation="upload")
     return destination_blob_name
 
 
+def upload_path_to_gcs(path: Path, destination_blob_name: str) -> str:
+    """Store a local file in the upload bucket; blocking."""
+    with Path(path).open("rb") as fh:
+        return upload_file_to_gcs(GCS_BUCKET, destination_blob_name, fh)
+
+
+def download_path_from_gcs(blob_name: str, path: Path) -> None:
+    """Fetch an object from the upload bucket to a local file; blocking."""
+    with (
+        start_span("gcs.download", blob=blob_name),
+        GCS_REQUEST_SECONDS.time(operation="download"),
+    ):
+        size = download_object(GCS_BUCKET, blob_name, path)
+    GCS_BYTES.inc(size, operation="download")
+
+
+def _file_size(file_obj: BinaryIO) -> int:
+    """Size of an uploaded file object, or 0 if it has no path on disk."""
+    name = getattr(file_obj, "name", None)
+    if not isinstance(name, (str, os.PathLike)):
+        return 0
+    try:
+        return Path(name).stat().st_size
+    except OSError:
+        return 0
+
+
+def _count_streamed_bytes(stream: BinaryIO) -> Iterator[bytes]:
+    """Yield chunks from a GCS stream, counting the bytes sent."""
+    for chunk in stream:
+        GCS_BYTES.inc(len(chunk), operation="proxy")
+        yield chunk
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request) -> HTMLResponse:
     """Render the home page with the file upload form."""
@@ -304,11 +757,16 @@ async def manual_rebuild(
     await rebuild_db_from_gcs(
         bucket_name=GCS_BUCKET, prefix=GCS_UPLOAD_PREFIX, force=force_flag
     )
+    await update_tag_index()
     return templates.TemplateResponse(request, "rebuild.html")
 
 
 @app.get("/uploads/{path:path}")
-async def gcs_proxy(path: str, request: Request) -> JSONResponse:
+async def gcs_proxy(
+    path: str,
+    request: Request,
+    user: Annotated[dict | None, Depends(get_current_user)],
+) -> JSONResponse:
     """Serves uploaded files from a GCS bucket via streaming.
 
     This endpoint proxies a file from GCS using the given path and returns it as
@@ -316,12 +774,18 @@ async def gcs_proxy(path: str, request: Request) -> JSONResponse:
     the file does not exist, a 404 response is returned. If an error occurs
     while accessing GCS, a 500 response is returned with error details.
 
+    With `GCS_SERVE_MODE=redirect`, a logged-in user is instead sent to a
+    cached signed URL, so the bytes come straight from GCS. Streaming stays
+    the fallback when no URL can be signed.
+
     Args:
         path (str): Path under the GCS upload prefix to the requested file.
         request (Request): The incoming FastAPI request object (unused but
             required for route context).
+        user (dict, optional): Defaults Depends(get_current_user).
 
     Returns:
+        RedirectResponse: 302 to a signed URL in redirect mode.
         StreamingResponse: Streamed file contents with correct MIME type and
             headers if found.
         JSONResponse: 404 if file not found, or 500 on internal error.
@@ -329,26 +793,37 @@ async def gcs_proxy(path: str, request: Request) -> JSONResponse:
     del request  # unused arg
 
     gcs_path = f"{GCS_UPLOAD_PREFIX}/{path}"
+    if SERVE_MODE == "redirect" and user:
+        try:
+            url, max_age = read_url(GCS_BUCKET, gcs_path)
+        except SignedUrlError:
+            log.debug("Cannot sign %s; streaming it instead", gcs_path)
+        else:
+            return RedirectResponse(url, status_code=302, headers={
+                "Cache-Control": f"private, max-age={max_age}"
+            })
     logging.info(f"📦 GCS proxy requested: {gcs_path}")
 
     try:
         key_path = "/app/service-account-key.json"
-        if Path(key_path).exists():
-            client = storage.Client.from_service_account_json(key_path)
-        else:
-            client = storage.Client()  # ADC fallback
-        bucket = client.bucket(GCS_BUCKET)
-        blob = bucket.blob(gcs_path)
-
-        if not blob.exists():
+        with GCS_REQUEST_SECONDS.time(operation="proxy"):
+            if Path(key_path).exists():
+                client = storage.Client.from_service_account_json(key_path)
+            else:
+                client = storage.Client()  # ADC fallback
+            bucket = client.bucket(GCS_BUCKET)
+            blob = bucket.blob(gcs_path)
+            exists = blob.exists()
+            if exists:
+                stream = blob.open("rb")
+
+        if not exists:
             logging.warning(f"❌ GCS file not found: {gcs_path}")
             return JSONResponse(
                 status_code=404,
                 content={"error": "File not found", "path": gcs_path},
             )
 
-        stream = blob.open("rb")
-
         content_type = blob.content_type
         if not content_type:
             content_type, _ = mimetypes.guess_type(path)
@@ -356,7 +831,7 @@ async def gcs_proxy(path: str, request: Request) -> JSONResponse:
             content_type = "application/octet-stream"  # fallback
 
         return StreamingResponse(
-            stream,
+            _count_streamed_bytes(stream),
             media_type=content_type,
             headers={"Content-Disposition": f'inline; filename="{path}"'},
         )
@@ -375,9 +850,9 @@ async def gcs_proxy(path: str, request: Request) -> JSONResponse:
 @app.post("/upload")
 async def protected_upload(
     request: Request,
+    user: Annotated[dict, Depends(get_current_user)],
     upload: Annotated[UploadFile, File()] = ...,
     label: Annotated[str, Form()] = "",
-    user: dict = Annotated[str, Depends(get_current_user)],  # noqa: B008
 ) -> JSONResponse:
     """Enqueue file uploads from authenticated users for processing."""
     if not user:
@@ -388,13 +863,20 @@ async def protected_upload(
     filename = f"{timestamp.replace(':', '-')}_{upload.filename}"
     file_path = UPLOAD_DIR / filename
 
-    with file_path.open("wb") as buffer:
+    with (
+        start_span("upload.save", filename=filename),
+        file_path.open("wb") as buffer,
+    ):
         shutil.copyfileobj(upload.file, buffer)
 
     with file_path.open("rb") as fh:
         upload_file_to_gcs(GCS_BUCKET, f"{GCS_UPLOAD_PREFIX}/{filename}", fh)
 
-    await processing_queue.put((file_path, filename, label))
+    await processing_queue.put({
+        "upload": (file_path, filename, label),
+        "enqueued_at": time.monotonic(),
+        "traceparent": inject(),
+    })
 
     return {
         "status": "ok",
@@ -408,6 +890,272 @@ async def protected_upload(
     }
 
 
+@app.post("/api/batches")
+async def batch_upload(
+    user: Annotated[dict, Depends(get_current_user)],
+    files: Annotated[list[UploadFile], File()],
+    label: Annotated[str, Form()] = "",
+) -> JSONResponse:
+    """Store many photos, or zip/tar archives of photos, as one batch.
+
+    Photos already uploaded are skipped by content hash; the rest are
+    queued together for GCS and vision processing. Answers 202 with the
+    batch id and its initial progress (see `GET /api/batches/{id}`).
+    """
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    timestamp = utc_now_iso()
+    staged = []
+    try:
+        with start_span("upload.batch", files=len(files)):
+            for upload in files:
+                room = MAX_BATCH_FILES - sum(1 for s in staged if s.path)
+                staged += await asyncio.to_thread(
+                    stage_upload,
+                    upload.file,
+                    upload.filename or "",
+                    UPLOAD_DIR,
+                    room,
+                )
+            async with aiosqlite.connect(DB_PATH) as db:
+                batch_id = await create_batch(db, label, timestamp)
+                new = await claim_files(
+                    db, batch_id, staged, UPLOAD_DIR, timestamp
+                )
+    finally:
+        discard(staged)  # claimed files were already renamed
+
+    traceparent = inject()
+    for path, filename in new:
+        processing_queue.put_nowait({
+            "upload": (path, filename, label),
+            "batch": batch_id,
+            "gcs_path": f"{GCS_UPLOAD_PREFIX}/{filename}",
+            "enqueued_at": time.monotonic(),
+            "traceparent": traceparent,
+        })
+    log.info(f"📦 Batch {batch_id}: {len(new)} of {len(staged)} files queued")
+    async with aiosqlite.connect(DB_PATH) as db:
+        progress = await batch_progress(db, batch_id)
+    return JSONResponse(progress, status_code=202)
+
+
+@app.get("/api/batches/{batch_id}")
+async def batch_progress_api(
+    batch_id: str,
+    user: Annotated[dict, Depends(get_current_user)],
+    *,
+    files: bool = True,
+) -> JSONResponse:
+    """Progress of a bulk upload: counts per status and each file."""
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    async with aiosqlite.connect(DB_PATH) as db:
+        progress = await batch_progress(db, batch_id, files=files)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown batch")
+    return JSONResponse(progress)
+
+
+def _tus_headers(session: dict | None = None) -> dict[str, str]:
+    """Headers of every tus response, with the state of a session."""
+    headers = {"Tus-Resumable": TUS_VERSION, "Cache-Control": "no-store"}
+    if session:
+        expires = datetime.fromisoformat(session["expires_at"])
+        headers |= {
+            "Upload-Offset": str(session["offset"]),
+            "Upload-Length": str(session["length"]),
+            "Upload-Expires": format_datetime(expires, usegmt=True),
+        }
+    return headers
+
+
+def _tus_error(e: UploadSessionError) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code, detail=str(e), headers=_tus_headers()
+    )
+
+
+@app.options("/api/uploads")
+async def resumable_options() -> Response:
+    """Describe the supported tus version and extensions."""
+    return Response(status_code=204, headers=_tus_headers() | {
+        "Tus-Version": TUS_VERSION,
+        "Tus-Extension": TUS_EXTENSIONS,
+        "Tus-Max-Size": str(MAX_UPLOAD_BYTES),
+        "Tus-Checksum-Algorithm": "sha256,sha1,md5",
+    })
+
+
+@app.post("/api/uploads")
+async def resumable_create(
+    user: Annotated[dict, Depends(get_current_user)],
+    upload_length: Annotated[int, Header()],
+    upload_metadata: Annotated[str | None, Header()] = None,
+) -> Response:
+    """Start a resumable upload (see `scripts.resumable`)."""
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    try:
+        metadata = parse_metadata(upload_metadata)
+        async with aiosqlite.connect(DB_PATH) as db:
+            await collect_expired(db)
+            session = await create_session(
+                db, upload_length, metadata, UPLOAD_DIR / ".resumable"
+            )
+    except UploadSessionError as e:
+        raise _tus_error(e) from e
+    return Response(status_code=201, headers=_tus_headers(session) | {
+        "Location": f"/api/uploads/{session['id']}"
+    })
+
+
+@app.head("/api/uploads/{session_id}")
+async def resumable_offset(
+    session_id: str, user: Annotated[dict, Depends(get_current_user)]
+) -> Response:
+    """Report how much of an upload the server has."""
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            session = await get_session(db, session_id)
+    except UploadSessionError as e:
+        raise _tus_error(e) from e
+    return Response(status_code=200, headers=_tus_headers(session))
+
+
+@app.patch("/api/uploads/{session_id}")
+async def resumable_append(
+    session_id: str,
+    request: Request,
+    user: Annotated[dict, Depends(get_current_user)],
+    upload_offset: Annotated[int, Header()],
+    upload_checksum: Annotated[str | None, Header()] = None,
+) -> Response:
+    """Append a chunk; the last one queues the photo like `/upload`."""
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(
+            status_code=415,
+            detail="Use Content-Type: application/offset+octet-stream",
+            headers=_tus_headers(),
+        )
+    try:
+        checksum = parse_checksum(upload_checksum)
+        async with aiosqlite.connect(DB_PATH) as db:
+            session = await get_session(db, session_id)
+            with start_span("upload.chunk", offset=upload_offset):
+                await append_chunk(
+                    db, session, upload_offset, request.stream(),
+                    checksum=checksum,
+                )
+            if session["offset"] == session["length"]:
+                filename = stored_name(
+                    utc_now_iso(), session["name"], UPLOAD_DIR
+                )
+                path = await complete_session(
+                    db, session, UPLOAD_DIR, filename
+                )
+    except UploadSessionError as e:
+        raise _tus_error(e) from e
+
+    headers = _tus_headers(session)
+    if session["filename"]:
+        await processing_queue.put({
+            "upload": (path, filename, session["label"]),
+            "gcs_path": f"{GCS_UPLOAD_PREFIX}/{filename}",
+            "enqueued_at": time.monotonic(),
+            "traceparent": inject(),
+        })
+        headers["Upload-Filename"] = filename
+    return Response(status_code=204, headers=headers)
+
+
+@app.delete("/api/uploads/{session_id}")
+async def resumable_terminate(
+    session_id: str, user: Annotated[dict, Depends(get_current_user)]
+) -> Response:
+    """Abandon an upload and delete what was received."""
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            session = await get_session(db, session_id)
+            await delete_session(db, session)
+    except UploadSessionError as e:
+        raise _tus_error(e) from e
+    return Response(status_code=204, headers=_tus_headers())
+
+
+@app.post("/api/direct-uploads")
+async def direct_upload_create(
+    user: Annotated[dict, Depends(get_current_user)],
+    filename: Annotated[str, Form()],
+    content_type: Annotated[str, Form()],
+    label: Annotated[str, Form()] = "",
+) -> JSONResponse:
+    """Reserve an upload and sign a URL to `PUT` it straight to GCS."""
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            upload = await create_direct_upload(
+                db, filename, content_type,
+                bucket=GCS_BUCKET, prefix=GCS_UPLOAD_PREFIX, label=label,
+            )
+    except SignedUrlError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e)) from e
+    upload["finalize_url"] = f"/api/direct-uploads/{upload['id']}/finalize"
+    return JSONResponse(upload, status_code=201)
+
+
+@app.post("/api/direct-uploads/{upload_id}/finalize")
+async def direct_upload_finalize(
+    upload_id: str, user: Annotated[dict, Depends(get_current_user)]
+) -> JSONResponse:
+    """Queue a direct upload once its object is in the bucket."""
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            upload = await get_direct_upload(db, upload_id)
+            filename = upload["filename"]
+            gcs_path = f"{GCS_UPLOAD_PREFIX}/{filename}"
+            with GCS_REQUEST_SECONDS.time(operation="stat"):
+                size = await asyncio.to_thread(
+                    object_size, GCS_BUCKET, gcs_path
+                )
+            if size is None:
+                raise HTTPException(
+                    status_code=409, detail="The photo has not been uploaded"
+                )
+            if not await finalize_direct_upload(db, upload_id, size):
+                raise HTTPException(
+                    status_code=409, detail="Upload was already finalized"
+                )
+    except SignedUrlError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e)) from e
+
+    await processing_queue.put({
+        "upload": (UPLOAD_DIR / filename, filename, upload["label"]),
+        "gcs_download": gcs_path,
+        "enqueued_at": time.monotonic(),
+        "traceparent": inject(),
+    })
+    return JSONResponse({
+        "status": "queued",
+        "filename": filename,
+        "label": upload["label"],
+        "size": size,
+        "gcs_path": gcs_path,
+        "proxy_url": f"/uploads/{filename}",
+        "thumb_url": f"/uploads/thumb/{filename}.thumb.jpg",
+        "summary_url": f"/uploads/summary/{filename}.summary.txt",
+    }, status_code=202)
+
+
 async def get_tags_from_prompt(prompt: str, all_tags: list[str]) -> list[str]:
     """Send OpenAI API query and return matched tags."""
     tag_str = ", ".join(sorted(set(all_tags)))
@@ -428,39 +1176,71 @@ Reply with a JSON array of tag names. For example:
     try:
         tags = json.loads(response)
         if isinstance(tags, list):
-            return [clean_tag_name(tag) for tag in tags if isinstance(tag, str)]
+            return [canonical_tag(tag) for tag in tags if isinstance(tag, str)]
     except Exception:
         log.exception(f"AI response parsing failed. raw: {response}")
     return []
 
 
+PHOTO_QUERY = """
+    SELECT images.id, images.filename, images.timestamp,
+        GROUP_CONCAT(tags.name), images.thumb_formats, images.placeholder,
+        images.thumb_widths
+    FROM images
+    LEFT JOIN image_tags ON images.id = image_tags.image_id
+    LEFT JOIN tags ON image_tags.tag_id = tags.id
+    GROUP BY images.id
+    ORDER BY images.timestamp DESC
+"""
+
+#: `PHOTO_QUERY` restricted to the image ids in a JSON array parameter
+PHOTOS_BY_ID_QUERY = """
+    SELECT images.id, images.filename, images.timestamp,
+        GROUP_CONCAT(tags.name), images.thumb_formats, images.placeholder,
+        images.thumb_widths
+    FROM images
+    LEFT JOIN image_tags ON images.id = image_tags.image_id
+    LEFT JOIN tags ON image_tags.tag_id = tags.id
+    WHERE images.id IN (SELECT value FROM json_each(?))
+    GROUP BY images.id
+    ORDER BY images.timestamp DESC
+"""
+
+
+async def fetch_photos(
+    db: aiosqlite.Connection, ids: list[int] | None = None
+) -> list[dict]:
+    """Load gallery entries for `ids`, or for every image when None."""
+    with DB_QUERY_SECONDS.time(statement="photo_query"):
+        if ids is None:
+            cursor = await db.execute(PHOTO_QUERY)
+        else:
+            cursor = await db.execute(PHOTOS_BY_ID_QUERY, (json.dumps(ids),))
+        rows = await cursor.fetchall()
+    return [photo_entry(row) for row in rows]
+
+
+def photo_entry(row: tuple) -> dict:
+    """Build the template context for one photo from a `PHOTO_QUERY` row."""
+    image_id, filename, timestamp, tags_str, formats, placeholder, widths = row
+    return {
+        "filename": filename,
+        "timestamp": timestamp,
+        "tags": tags_str.split(",") if tags_str else [],
+        "proxy_url": f"/uploads/{filename}",
+        "thumb_url": f"/uploads/thumb/{filename}.thumb.jpg",
+        "sources": picture_sources(filename, formats, widths),
+        "placeholder": placeholder,
+        "sprite": sprite_style(image_id, filename),
+    }
+
+
 @app.get("/photos", response_class=HTMLResponse)
 async def view_photos(
     request: Request, db: Annotated[aiosqlite.Connection, Depends(get_db)]
 ) -> HTMLResponse:
     """Render the photo gallery view with associated tags and timestamps."""
-    cursor = await db.execute(
-        """
-        SELECT images.filename, images.timestamp, GROUP_CONCAT(tags.name)
-        FROM images
-        LEFT JOIN image_tags ON images.id = image_tags.image_id
-        LEFT JOIN tags ON image_tags.tag_id = tags.id
-        GROUP BY images.id
-        ORDER BY images.timestamp DESC
-        """
-    )
-    rows = await cursor.fetchall()
-    photos = []
-    for row in rows:
-        filename, timestamp, tags_str = row
-        tags = tags_str.split(",") if tags_str else []
-        photos.append({
-            "filename": filename,
-            "timestamp": timestamp,
-            "tags": tags,
-            "proxy_url": f"/uploads/{filename}",
-            "thumb_url": f"/uploads/thumb/{filename}.thumb.jpg",
-        })
+    photos = await fetch_photos(db)
     return templates.TemplateResponse(
         request, "photo_gallery_template.html", {"photos": photos}
     )
@@ -468,57 +1248,402 @@ async def view_photos(
 
 @app.get("/search", response_class=HTMLResponse)
 async def search_photos(request: Request, q: str = "") -> HTMLResponse:
-    """Search photos by tags from a query string and display results."""
-    query = q.strip().lower()
-    async with aiosqlite.connect("uploads/metadata.db") as db:
-        tag_cursor = await db.execute(
-            """
-            SELECT tags.name, COUNT(image_tags.tag_id) as usage_count
-            FROM tags
-            JOIN image_tags ON tags.id = image_tags.tag_id
-            GROUP BY tags.name
-            ORDER BY usage_count DESC
-            LIMIT 50
-        """
-        )
-        tag_rows = await tag_cursor.fetchall()
+    """Search photos with the query language in `scripts.query`.
+
+    An empty query lists every photo; a malformed one shows the parse error.
+    """
+    error = ""
+    try:
+        node = parse_query(q)
+    except QuerySyntaxError as e:
+        error, node = str(e), None
+    async with aiosqlite.connect(DB_PATH) as db:
+        index = await get_tag_index(db)
         top_tags = []
 
-        for row in tag_rows:
-            clean_tag = clean_tag_name(row[0])
+        for name, _ in index.tag_counts(limit=50):
+            clean_tag = clean_tag_name(name)
             if clean_tag and clean_tag not in BLOCKED_TAGS:
                 top_tags.append(clean_tag)
             if len(top_tags) >= 10:  # noqa: PLR2004
                 break
 
-        cursor = await db.execute(
-            """
-            SELECT images.filename, images.timestamp, GROUP_CONCAT(tags.name)
-            FROM images
-            LEFT JOIN image_tags ON images.id = image_tags.image_id
-            LEFT JOIN tags ON image_tags.tag_id = tags.id
-            GROUP BY images.id
-            ORDER BY images.timestamp DESC
-            """
-        )
-        rows = await cursor.fetchall()
-        photos = []
-        for row in rows:
-            filename, timestamp, tags_str = row
-            tags = tags_str.split(",") if tags_str else []
-            if query and not any(query in tag.lower() for tag in tags):
-                continue
-            photos.append({
-                "filename": filename,
-                "timestamp": timestamp,
-                "tags": tags,
-                "proxy_url": f"/uploads/{filename}",
-                "thumb_url": f"/uploads/thumb/{filename}.thumb.jpg",
-            })
+        if error:
+            photos = []
+        elif node is None:
+            photos = await fetch_photos(db)
+        else:
+            ids = await search_image_ids(db, node, index)
+            photos = await fetch_photos(db, ids)
     return templates.TemplateResponse(
         request,
         "search.html",
-        {"photos": photos, "top_tags": top_tags, "q": q},
+        {
+            "photos": photos,
+            "top_tags": top_tags,
+            "facets": facet_counts(photos) if node else [],
+            "q": q,
+            "error": error,
+        },
+    )
+
+
+@app.get("/api/search")
+async def search_api(
+    q: str = "", limit: Annotated[int, Query(ge=1, le=1000)] = 100
+) -> JSONResponse:
+    """Run a search query and return matches with facet counts as JSON."""
+    try:
+        node = parse_query(q)
+    except QuerySyntaxError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    async with aiosqlite.connect(DB_PATH) as db:
+        index = await get_tag_index(db)
+        if node is None:
+            ids = index.newest_first(index.image_ids(), limit)
+        else:
+            ids = await search_image_ids(db, node, index, limit=limit)
+        photos = await fetch_photos(db, ids)
+    return JSONResponse({
+        "q": q,
+        "count": len(photos),
+        "results": [
+            {
+                "filename": photo["filename"],
+                "timestamp": photo["timestamp"],
+                "tags": photo["tags"],
+                "thumb_url": photo["thumb_url"],
+            }
+            for photo in photos
+        ],
+        "facets": [
+            {"tag": tag, "count": count}
+            for tag, count in facet_counts(photos)
+        ],
+    })
+
+
+@app.get("/export")
+async def export_data(  # noqa: PLR0913
+    kind: str = "images",
+    fmt: Annotated[str, Query(alias="format")] = "csv",
+    *,
+    q: str = "",
+    tag: str | None = None,
+    zone: str | None = None,
+    after: str | None = None,
+    before: str | None = None,
+    gzip: bool = False,
+) -> StreamingResponse:
+    """Stream images, objects or tag usage as CSV, NDJSON or Parquet.
+
+    Rows are read and encoded in chunks (`scripts.export`), so the export
+    starts at once and memory use does not grow with the inventory.
+    """
+    try:
+        node = build_filter(q, tag=tag, zone=zone, after=after, before=before)
+        check_export(kind, fmt)
+    except QuerySyntaxError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except ExportError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e)) from e
+    name = export_filename(kind, fmt, gzip=gzip)
+    gzipped = gzip and fmt != "parquet"
+    return StreamingResponse(
+        stream_export(kind, fmt, node, gzip=gzip, db_path=DB_PATH),
+        media_type="application/gzip" if gzipped else FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+
+@app.get("/api/inventory")
+async def inventory_api(
+    name: str | None = None,
+    color: str | None = None,
+    brand: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+) -> JSONResponse:
+    """Total quantity owned per object, optionally filtered, as JSON."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        totals = await inventory_totals(
+            db, name=name, color=color, brand=brand, limit=limit
+        )
+    return JSONResponse({"count": len(totals), "results": totals})
+
+
+@app.get("/api/inventory/{name}")
+async def inventory_item_api(name: str) -> JSONResponse:
+    """Quantities of one object by color and brand, and where it was seen."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        rollup = await object_rollup(db, name)
+    if rollup is None:
+        raise HTTPException(status_code=404, detail=f"No {name} recorded")
+    return JSONResponse(rollup)
+
+
+@app.post("/api/similar")
+async def similar_api(
+    user: Annotated[dict, Depends(get_current_user)],
+    upload: Annotated[UploadFile, File()],
+    k: Annotated[int, Query(ge=1, le=100)] = 10,
+) -> JSONResponse:
+    """Answer "do I already have one?" for a photo, without storing it.
+
+    Returns the `k` most similar stored photos with their cosine similarity
+    and whether they look like a near-duplicate.
+    """
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    started = time.perf_counter()
+    data = await upload.read(MAX_QUERY_BYTES + 1)
+    if len(data) > MAX_QUERY_BYTES:
+        raise HTTPException(status_code=413, detail="Image too large")
+    try:
+        matches = await find_similar(data, k)
+    except OSError as e:
+        raise HTTPException(
+            status_code=400, detail="Upload is not a readable image"
+        ) from e
+    for match in matches:
+        match["thumb_url"] = f"/uploads/thumb/{match['filename']}.thumb.jpg"
+    return JSONResponse({
+        "count": len(matches),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "results": matches,
+    })
+
+
+def _require_scanner(
+    credentials: HTTPAuthorizationCredentials | None,
+) -> None:
+    """Check the bearer token shared with scanner nodes."""
+    expected = getenv("SCAN_API_TOKEN")
+    if not expected:
+        raise HTTPException(
+            status_code=503, detail="SCAN_API_TOKEN is not configured"
+        )
+    token = credentials.credentials if credentials else ""
+    if not hmac.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Invalid scanner token")
+
+
+@app.post("/api/scans")
+async def scans_api(
+    request: Request,
+    credentials: Annotated[
+        HTTPAuthorizationCredentials | None, Security(auth_scheme)
+    ],
+    idempotency_key: Annotated[str, Header(min_length=1)],
+    content_encoding: Annotated[str, Header()] = "",
+) -> JSONResponse:
+    """Store a batch of tag scans uploaded by a scanner node.
+
+    The body is a gzip (or deflate) compressed JSON batch, see
+    `scripts.scanlog.decode_batch`. The `Idempotency-Key` header names the
+    batch: retrying with the same key is safe and returns the first
+    result with `duplicate` set.
+    """
+    _require_scanner(credentials)
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BATCH_BYTES:
+            raise HTTPException(status_code=413, detail="Batch too large")
+    try:
+        node_id, events = decode_batch(bytes(body), content_encoding)
+    except ScanBatchError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e)) from e
+    async with aiosqlite.connect(DB_PATH) as db:
+        result = await store_scan_batch(db, idempotency_key, node_id, events)
+    if drift_scheduler and result["added"]:
+        drift_scheduler.wake()
+    retry = " (retry)" if result["duplicate"] else ""
+    log.info(
+        f"📡 {node_id}: {result['added']}/{result['received']} scans "
+        f"stored{retry}"
+    )
+    return JSONResponse(result)
+
+
+@app.get("/api/where/{tag_id}")
+async def where_api(tag_id: str) -> JSONResponse:
+    """Current zone of an NFC tag and how long it has been there."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        current = await where_is(db, tag_id)
+    if current is None:
+        raise HTTPException(
+            status_code=404, detail=f"Tag {tag_id} was never scanned"
+        )
+    return JSONResponse(current)
+
+
+@app.get("/api/where/{tag_id}/history")
+async def where_history_api(
+    tag_id: str, limit: Annotated[int, Query(ge=1, le=1000)] = 100
+) -> JSONResponse:
+    """Hourly (and, for older scans, daily) zones of an NFC tag."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        history = await location_history(db, tag_id, limit=limit)
+    return JSONResponse({"tag_id": tag_id, "history": history})
+
+
+@app.get("/api/zones/{zone}/items")
+async def zone_items_api(
+    zone: str, limit: Annotated[int, Query(ge=1, le=1000)] = 100
+) -> JSONResponse:
+    """NFC tags whose latest scan was in `zone`."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        items = await zone_contents(db, zone, limit=limit)
+    return JSONResponse({"zone": zone, "count": len(items), "items": items})
+
+
+@app.get("/api/zones")
+async def zones_api() -> JSONResponse:
+    """Health score of every zone, worst first, for the cleanup heatmap."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        zones = await zone_scores(db)
+    return JSONResponse({
+        "generated_at": utc_now_iso(),
+        "count": len(zones),
+        "zones": zones,
+    })
+
+
+@app.get("/api/zones/{zone}")
+async def zone_api(zone: str) -> JSONResponse:
+    """Health score of one zone with the signals behind it."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        scores = await zone_scores(db, zone)
+    if not scores:
+        raise HTTPException(status_code=404, detail=f"No zone {zone}")
+    return JSONResponse(scores[0])
+
+
+@app.put("/api/zones/{zone}/override")
+async def zone_override_api(
+    zone: str,
+    score: Annotated[float, Form(ge=0, le=100)],
+    user: Annotated[dict, Depends(get_current_user)],
+    note: Annotated[str | None, Form()] = None,
+) -> JSONResponse:
+    """Pin a zone's score by hand (admin only)."""
+    _require_admin(user)
+    async with aiosqlite.connect(DB_PATH) as db:
+        await set_override(db, zone, score, note)
+        scores = await zone_scores(db, zone)
+    return JSONResponse(scores[0] if scores else {"zone": zone})
+
+
+@app.delete("/api/zones/{zone}/override")
+async def zone_override_clear_api(
+    zone: str, user: Annotated[dict, Depends(get_current_user)]
+) -> JSONResponse:
+    """Go back to the computed score of a zone (admin only)."""
+    _require_admin(user)
+    async with aiosqlite.connect(DB_PATH) as db:
+        await set_override(db, zone, None)
+    return JSONResponse({"zone": zone, "overridden": False})
+
+
+@app.get("/zones", response_class=HTMLResponse)
+async def zones_page(request: Request) -> HTMLResponse:
+    """Cleanup heatmap: one tile per zone, colored by score."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        zones = await zone_scores(db)
+    return templates.TemplateResponse(request, "zones.html", {"zones": zones})
+
+
+@app.put("/api/where/{tag_id}/home")
+async def tag_home_api(
+    tag_id: str,
+    home: Annotated[str, Form(min_length=1)],
+    user: Annotated[dict, Depends(get_current_user)],
+    label: Annotated[str | None, Form()] = None,
+    grace_hours: Annotated[float, Form(gt=0)] = GRACE_HOURS,
+) -> JSONResponse:
+    """Set where a tagged item belongs, for drift reminders (admin only)."""
+    _require_admin(user)
+    async with aiosqlite.connect(DB_PATH) as db:
+        await set_home(
+            db, tag_id, home, label=label, grace_hours=grace_hours
+        )
+    if drift_scheduler:
+        drift_scheduler.wake()
+    return JSONResponse({
+        "tag_id": tag_id, "home": home, "label": label,
+        "grace_hours": grace_hours,
+    })
+
+
+@app.delete("/api/where/{tag_id}/home")
+async def tag_home_clear_api(
+    tag_id: str, user: Annotated[dict, Depends(get_current_user)]
+) -> JSONResponse:
+    """Stop drift reminders for a tag (admin only)."""
+    _require_admin(user)
+    async with aiosqlite.connect(DB_PATH) as db:
+        await clear_home(db, tag_id)
+    return JSONResponse({"tag_id": tag_id, "home": None})
+
+
+@app.get("/api/reminders")
+async def reminders_api(
+    *,
+    include_resolved: bool = False,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+) -> JSONResponse:
+    """"Return to order" reminders, newest first."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        reminders = await list_reminders(
+            db, open_only=not include_resolved, limit=limit
+        )
+    return JSONResponse({"count": len(reminders), "reminders": reminders})
+
+
+@app.post("/api/reminders/{reminder_id}/dismiss")
+async def dismiss_reminder_api(
+    reminder_id: int, user: Annotated[dict, Depends(get_current_user)]
+) -> JSONResponse:
+    """Mark a reminder as dealt with (admin only)."""
+    if not user:
+        raise HTTPException(status_code=401, detail="Login required")
+    _require_admin(user)
+    async with aiosqlite.connect(DB_PATH) as db:
+        if not await dismiss_reminder(db, reminder_id):
+            raise HTTPException(
+                status_code=404, detail=f"No open reminder {reminder_id}"
+            )
+    return JSONResponse({"id": reminder_id, "dismissed": True})
+
+
+@app.get("/reminders/feed")
+async def reminders_feed(request: Request) -> Response:
+    """Atom feed of recent reminders, for feed readers and watch apps."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        reminders = await list_reminders(db, open_only=False, limit=50)
+    feed = ET.Element("feed", xmlns="http://www.w3.org/2005/Atom")
+    ET.SubElement(feed, "title").text = "Tracker reminders"
+    ET.SubElement(feed, "id").text = str(request.url)
+    ET.SubElement(feed, "link", href=str(request.url), rel="self")
+    ET.SubElement(feed, "updated").text = (
+        reminders[0]["created_at"] if reminders else utc_now_iso()
+    )
+    for reminder in reminders:
+        entry = ET.SubElement(feed, "entry")
+        ET.SubElement(entry, "id").text = (
+            f"{request.base_url}api/reminders/{reminder['id']}"
+        )
+        ET.SubElement(entry, "title").text = reminder["message"]
+        ET.SubElement(entry, "updated").text = reminder["created_at"]
+        ET.SubElement(entry, "summary").text = (
+            f"Resolved {reminder['resolved_at']}"
+            if reminder["resolved_at"] else "Open"
+        )
+    return Response(
+        ET.tostring(feed, encoding="utf-8", xml_declaration=True),
+        media_type="application/atom+xml",
     )
 
 
@@ -540,35 +1665,16 @@ async def search_by_prompt(
 
     cursor = await db.execute("SELECT DISTINCT name FROM tags")
     tag_rows = await cursor.fetchall()
-    all_tags = [clean_tag_name(row[0]) for row in tag_rows]
+    # Variants share one canonical name, which keeps the prompt short
+    all_tags = sorted({canonical_tag(row[0]) for row in tag_rows} - {""})
 
     matched_tags = await get_tags_from_prompt(prompt, all_tags)
 
-    cursor = await db.execute(
-        """
-        SELECT images.filename, images.timestamp, GROUP_CONCAT(tags.name)
-        FROM images
-        LEFT JOIN image_tags ON images.id = image_tags.image_id
-        LEFT JOIN tags ON image_tags.tag_id = tags.id
-        GROUP BY images.id
-        ORDER BY images.timestamp DESC
-        """
-    )
-    rows = await cursor.fetchall()
-    photos = []
-    for row in rows:
-        filename, timestamp, tags_str = row
-        tags = tags_str.split(",") if tags_str else []
-        normalized_tags = [clean_tag_name(t) for t in tags]
-        if not any(tag in matched_tags for tag in normalized_tags):
-            continue
-        photos.append({
-            "filename": filename,
-            "timestamp": timestamp,
-            "tags": tags,
-            "proxy_url": f"/uploads/{filename}",
-            "thumb_url": f"/uploads/thumb/{filename}.thumb.jpg",
-        })
+    index = await get_tag_index(db)
+    matching = [
+        t for t in index.tag_names() if canonical_tag(t) in matched_tags
+    ]
+    photos = await fetch_photos(db, index.query(any_of=matching))
 
     return templates.TemplateResponse(
         request,
@@ -673,9 +1779,11 @@ async def perform_backup() -> str:
     if not BACKUP_DB_PATH.exists():
         raise HTTPException(status_code=500, detail="No DB to back up")
 
+    start = time.perf_counter()
     async with (aiosqlite.connect(BACKUP_DB_PATH) as src_db,
         aiosqlite.connect(backup_path) as dest_db):
         await src_db.backup(dest_db)
+    BACKUP_BYTES.set(backup_path.stat().st_size)
 
     if backup_path.exists():
         with Path.open(BACKUP_DB_PATH, "rb") as f:
@@ -684,12 +1792,16 @@ async def perform_backup() -> str:
             backup_hash = hashlib.md5(f.read()).hexdigest()  # nosec B324  # noqa: S324
         if current_hash == backup_hash:
             log.info("📦 No DB changes since last backup. Skipping upload.")
+            BACKUP_SECONDS.observe(
+                time.perf_counter() - start, status="skipped"
+            )
             return {"status": "skipped", "reason": "No changes detected."}
 
     log.info(f"📦 DB backup created: {backup_filename}")
     with Path.open(backup_path, "rb") as f:
         gcs_path = f"db-backups/{backup_filename}"
         upload_file_to_gcs(GCS_BUCKET, gcs_path, f)
+    BACKUP_SECONDS.observe(time.perf_counter() - start, status="ok")
     return {"status": "ok", "path": gcs_path}
 
 
@@ -1,34 +1,260 @@
-"""logger.py — Read and log NFC tag scans."""
+"""logger_nfc.py — Read NFC tag scans and log them on the scanner node.
+
+Scans are buffered by a `ScanWriter` and group-committed to binary
+segments under `LOG_DIR` (see `scripts.scanlog`). With `SCAN_API_URL` set,
+a `ScanSpooler` thread uploads those segments to the server's `/api/scans`
+in compressed batches, so the segments double as the offline buffer. On a
+node without network, `python -m scripts.scanlog ingest` loads copied
+segments into the `scan_events` table instead.
+"""
+
 import json
-from datetime import datetime, timezone
+import logging
+import socket
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from os import getenv
 from pathlib import Path
 
-LOG_PATH = Path("data/log.json")
+from scripts.reader import TagReader, open_reader
+from scripts.scanlog import (
+    ScanEvent,
+    ScanWriter,
+    encode_batch,
+    read_segment,
+)
 
+log = logging.getLogger(__name__)
 
-def log_tag(tag_id: str, location: str="unknown") -> None:
-    """Save the location of a tag.
+#: Directory the scan segments of this node are written to
+LOG_DIR = Path(getenv("SCAN_LOG_DIR", "data/scans"))
 
-    Args:
-        tag_id (_type_): _description_
-        location (str, optional): _description_. Defaults to "unknown".
+#: Name of this scanner node, stored with every event
+NODE_ID = getenv("NODE_ID") or socket.gethostname()
+
+#: Where this scanner is mounted
+LOCATION = getenv("SCANNER_LOCATION", "unknown")
+
+#: Scan upload endpoint, e.g. https://tracker.example.com/api/scans
+SCAN_API_URL = getenv("SCAN_API_URL", "")
+
+#: Bearer token the server expects in `SCAN_API_TOKEN`
+SCAN_API_TOKEN = getenv("SCAN_API_TOKEN", "")
+
+#: Events per uploaded batch (a batch ends on a commit boundary)
+SPOOL_BATCH_EVENTS = int(getenv("SCAN_SPOOL_BATCH", "1000"))
+
+#: Seconds between uploads while the server is reachable
+SPOOL_INTERVAL_SECONDS = float(getenv("SCAN_SPOOL_SECONDS", "5"))
+
+#: Longest wait between retries while it is not
+SPOOL_MAX_BACKOFF_SECONDS = 300.0
+
+# Rejections that no retry can fix: the batch is skipped
+PERMANENT_HTTP_ERRORS = {400, 413, 415}
+
+_writer: ScanWriter | None = None
+
+
+def get_writer() -> ScanWriter:
+    """Return this node's writer, creating it on first use."""
+    global _writer  # noqa: PLW0603
+    if _writer is None:
+        _writer = ScanWriter(LOG_DIR, NODE_ID)
+    return _writer
+
+
+class ScanSpooler:
+    """Uploads committed scan segments to `/api/scans` in batches.
+
+    `spool.json` in the segment directory records how far each segment has
+    been sent, so nothing is lost while the server is unreachable or the
+    node restarts. A batch's idempotency key is its segment and byte range,
+    so a retried batch is stored once. Fully sent segments are deleted,
+    except the newest, which the writer may still be appending to.
     """
-    now = datetime.now(timezone.utc).isoformat()
-    entry = {"tag": tag_id, "timestamp": now, "location": location}
-    LOG_PATH.parent.mkdir(exist_ok=True)
-    with LOG_PATH.open("a") as f:
-        f.write(json.dumps(entry) + "\n")
 
+    def __init__(
+        self,
+        directory: Path,
+        url: str,
+        token: str | None = None,
+        *,
+        batch_events: int = SPOOL_BATCH_EVENTS,
+        interval: float = SPOOL_INTERVAL_SECONDS,
+    ) -> None:
+        """Load the upload positions saved by an earlier run.
+
+        Raises:
+            ValueError: If `url` is not an http or https URL.
+        """
+        if urllib.parse.urlsplit(url).scheme not in {"http", "https"}:
+            msg = f"Scan API URL must be http or https, not {url!r}"
+            raise ValueError(msg)
+        self.directory = directory
+        self.url = url
+        self.token = token
+        self.batch_events = batch_events
+        self.interval = interval
+        self.state_path = directory / "spool.json"
+        self.failures = 0
+        self._sent: dict[str, int] = {}
+        if self.state_path.exists():
+            self._sent = json.loads(self.state_path.read_text())
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _save(self) -> None:
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._sent))
+        tmp.replace(self.state_path)
 
-# Placeholder
-def read_tag() -> None:
-    """Read and return tag UID."""
-    return None  # noqa: RET501
+    def _post(self, body: bytes, key: str) -> None:
+        headers = {
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "Idempotency-Key": key,
+        }
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        request = urllib.request.Request(  # noqa: S310
+            self.url, data=body, headers=headers, method="POST"
+        )
+        # The scheme was checked in __init__
+        with urllib.request.urlopen(request, timeout=30) as response:  # nosec B310  # noqa: S310
+            response.read()
 
+    def send_pending(self) -> int:
+        """Upload every committed event not sent yet.
 
-def run() -> None:
-    """Executive loop reading and logging tags."""
-    while True:
-        tag = read_tag()
-        if tag:
-            log_tag(tag)
+        Returns:
+            int: Number of events sent.
+
+        Raises:
+            OSError: If the server cannot be reached or fails; what was
+                sent before stays recorded.
+        """
+        sent = 0
+        segments = sorted(self.directory.glob("*.seg"))
+        for path in segments:
+            while True:
+                start = self._sent.get(path.name, 0)
+                node_id, events, end = read_segment(
+                    path, start, self.batch_events
+                )
+                if not events:
+                    break
+                try:
+                    self._post(
+                        encode_batch(node_id, events),
+                        f"{path.name}@{start}-{end}",
+                    )
+                except urllib.error.HTTPError as e:
+                    if e.code not in PERMANENT_HTTP_ERRORS:
+                        raise
+                    log.error(  # noqa: TRY400
+                        f"❌ Server rejected {path.name}@{start}-{end}, "
+                        f"skipping {len(events)} scans: {e}"
+                    )
+                else:
+                    sent += len(events)
+                self._sent[path.name] = end
+                self._save()
+            if path != segments[-1]:  # closed and fully sent
+                path.unlink()
+                self._sent.pop(path.name, None)
+                self._save()
+        return sent
+
+    def flush(self) -> int:
+        """Upload pending events, backing off while that fails.
+
+        Returns:
+            int: Number of events sent.
+        """
+        try:
+            sent = self.send_pending()
+        except OSError as e:
+            self.failures += 1
+            log.warning(f"⚠️ Scan upload failed ({self.failures}x): {e}")
+            return 0
+        self.failures = 0
+        return sent
+
+    def seconds_until_retry(self) -> float:
+        """Wait before the next upload, doubling with each failure."""
+        return min(
+            self.interval * 2 ** min(self.failures, 16),
+            SPOOL_MAX_BACKOFF_SECONDS,
+        )
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.seconds_until_retry()):
+            self.flush()
+
+    def start(self) -> None:
+        """Upload in a background thread until `stop`."""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread and make a last upload attempt."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+def log_tag(
+    tag_id: str, location: str = "unknown", writer: ScanWriter | None = None
+) -> ScanEvent:
+    """Record that a tag was seen at a location.
+
+    The event is buffered; it reaches disk with the next group commit.
+
+    Args:
+        tag_id (str): UID of the scanned tag.
+        location (str, optional): Where it was seen. Defaults to "unknown".
+        writer (ScanWriter, optional): Writer to use instead of this node's.
+
+    Returns:
+        ScanEvent: The buffered event.
+    """
+    if writer is None:
+        writer = get_writer()
+    return writer.append(tag_id, location)
+
+
+def run(
+    reader: TagReader | None = None,
+    writer: ScanWriter | None = None,
+    location: str = LOCATION,
+    spooler: ScanSpooler | None = None,
+) -> None:
+    """Executive loop reading and logging tags.
+
+    Blocks on the reader between scans, waking only when a buffered commit
+    is due; buffered events are committed when the loop stops. Committed
+    events are uploaded by `spooler`, or one for `SCAN_API_URL` if set.
+    """
+    if reader is None:
+        reader = open_reader()
+    if writer is None:
+        writer = get_writer()
+    if spooler is None and SCAN_API_URL:
+        spooler = ScanSpooler(writer.directory, SCAN_API_URL, SCAN_API_TOKEN)
+    if spooler is not None:
+        spooler.start()
+    try:
+        while not reader.closed:
+            tag = reader.read(timeout=writer.seconds_until_flush())
+            if tag:
+                log_tag(tag, location, writer)
+            writer.flush_if_due()
+    finally:
+        writer.close()
+        if spooler is not None:
+            spooler.stop()
+        reader.close()
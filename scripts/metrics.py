@@ -0,0 +1,427 @@
+"""In-process Prometheus-style metrics for the tracker app.
+
+A deliberately small implementation of counters, gauges and histograms with
+labels, rendered in the Prometheus text exposition format by the `/metrics`
+endpoint. Recording a sample is a dict lookup and an add under an
+uncontended lock; all formatting work happens only when someone scrapes.
+
+The metrics for the app's hot paths are defined at the bottom of this module
+so every instrumented module shares one registry.
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+#: Default histogram buckets in seconds, from 1 ms to 60 s
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+#: Buckets for payload sizes in bytes, from 1 KB to 1 GB
+BYTE_BUCKETS = tuple(float(1024 * 4**i) for i in range(11))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"'
+        for name, value in zip(names, values, strict=True)
+    )
+    return "{" + pairs + "}"
+
+
+class Registry:
+    """Collection of metrics rendered together by `/metrics`."""
+
+    def __init__(self) -> None:
+        """Create an empty registry."""
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        """Add a metric; names must be unique within the registry."""
+        if metric.name in self._metrics:
+            msg = f"Duplicate metric name: {metric.name}"
+            raise ValueError(msg)
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> _Metric | None:
+        """Return a registered metric by name."""
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: Registry | None = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple:
+        try:
+            if len(labels) == len(self.labelnames):
+                return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError:
+            pass
+        msg = f"{self.name} expects labels {self.labelnames}"
+        raise ValueError(msg)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """Exposition lines for every label set of this metric."""
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. requests or bytes sent."""
+
+    kind = "counter"
+
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        """Create a counter; see `_Metric` for the arguments."""
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increase the counter for the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Return the current count for the given label values."""
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        """Yield one exposition line per label set."""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_total{labels} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a callback on scrape."""
+
+    kind = "gauge"
+
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        """Create a gauge; see `_Metric` for the arguments."""
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+        self._function: Callable[[], float] | None = None
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge for the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increase the gauge for the given label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        """Decrease the gauge for the given label values."""
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the (unlabelled) gauge from `function` at scrape time."""
+        self._function = function
+
+    def value(self, **labels: str) -> float:
+        """Return the current value for the given label values."""
+        if self._function is not None:
+            return float(self._function())
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        """Yield one exposition line per label set."""
+        if self._function is not None:
+            yield f"{self.name} {_format_value(self._function())}"
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. latencies or payload sizes."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        *args: object,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        **kwargs: object,
+    ) -> None:
+        """Create a histogram with the given upper bucket bounds."""
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (+Inf last), sum, count]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation for the given label values."""
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall-clock duration of the `with` block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels: str) -> Callable[[Callable], Callable]:
+        """Decorate a function or coroutine function to time each call."""
+
+        def decorator(function: Callable) -> Callable:
+            if inspect.iscoroutinefunction(function):
+
+                @functools.wraps(function)
+                async def async_wrapper(*args: object, **kwargs: object):  # noqa: ANN202
+                    with self.time(**labels):
+                        return await function(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args: object, **kwargs: object):  # noqa: ANN202
+                with self.time(**labels):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, **labels: str) -> int:
+        """Return the number of observations for the given label values."""
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self) -> Iterator[str]:
+        """Yield cumulative bucket, sum and count lines per label set."""
+        with self._lock:
+            items = [
+                (key, list(state[0]), state[1], state[2])
+                for key, state in self._values.items()
+            ]
+        names = (*self.labelnames, "le")
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(
+                (*self.buckets, math.inf), counts, strict=True
+            ):
+                cumulative += bucket_count
+                labels = _format_labels(names, (*key, _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+# Hot-path metrics shared by the app modules
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "tracker_http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ("method", "route", "status"),
+)
+
+QUEUE_DEPTH = Gauge(
+    "tracker_processing_queue_depth",
+    "Uploads waiting in the processing queue.",
+)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "tracker_processing_queue_wait_seconds",
+    "Time uploads spend in the processing queue before work starts.",
+)
+
+OPENAI_REQUEST_SECONDS = Histogram(
+    "tracker_openai_request_duration_seconds",
+    "OpenAI API call latency.",
+    ("operation", "model"),
+)
+
+OPENAI_TOKENS = Counter(
+    "tracker_openai_tokens",
+    "OpenAI tokens used.",
+    ("operation", "model", "kind"),
+)
+
+GCS_REQUEST_SECONDS = Histogram(
+    "tracker_gcs_request_duration_seconds",
+    "GCS call latency by operation.",
+    ("operation",),
+)
+
+GCS_BYTES = Counter(
+    "tracker_gcs_bytes",
+    "Bytes transferred to or from GCS by operation.",
+    ("operation",),
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "tracker_db_query_duration_seconds",
+    "SQLite statement latency by statement name.",
+    ("statement",),
+)
+
+CACHE_REQUESTS = Counter(
+    "tracker_cache_requests",
+    "Cache lookups by cache and result (hit or miss).",
+    ("cache", "result"),
+)
+
+BACKUP_SECONDS = Histogram(
+    "tracker_backup_duration_seconds",
+    "Duration of DB backups.",
+    ("status",),
+)
+
+BACKUP_BYTES = Gauge(
+    "tracker_backup_size_bytes",
+    "Size of the most recent DB backup file.",
+)
+
+LOOP_BLOCK_SECONDS = Histogram(
+    "tracker_event_loop_blocked_seconds",
+    "Stretches where one coroutine step held the event loop.",
+)
+
+
+def record_cache(cache: str, *, hit: bool) -> None:
+    """Count a cache lookup as a hit or a miss."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_openai_usage(operation: str, model: str, usage: object) -> None:
+    """Count prompt and completion tokens from an OpenAI `usage` object."""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if isinstance(tokens, int):
+            OPENAI_TOKENS.inc(
+                tokens, operation=operation, model=model, kind=kind
+            )
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template.
+
+    Routes are labelled by their path template (e.g. `/uploads/{path:path}`)
+    rather than the raw URL, which keeps label cardinality bounded.
+    """
+
+    def __init__(self, app: Callable) -> None:
+        """Wrap an ASGI application."""
+        self.app = app
+
+    async def __call__(
+        self, scope: dict, receive: Callable, send: Callable
+    ) -> None:
+        """Time the request and record it once the response has started."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status["code"]),
+            )
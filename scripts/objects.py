@@ -0,0 +1,591 @@
+"""Structured inventory objects extracted from vision model output.
+
+The vision model is asked for JSON matching `OBJECTS_SCHEMA`:
+
+    {"objects": [{"name": "usb cable", "count": 2,
+                  "attributes": ["black", "braided"], "confidence": 0.9}]}
+
+Older summaries are free-form: fenced ```json blocks, bare lists, objects
+keyed by "item" or "quantity", output cut off at the token limit, or plain
+lines of text. Splitting those into lines is what used to leak tags like
+"quantity 1" or "```json" into the tag tables. `ObjectStream` instead scans
+the text incrementally, pulls out every complete JSON object that names
+something and normalizes it; plain text is only split into lines when no
+JSON object is found at all. The same parser serves live ingest, the batch
+backfill and the re-parse job over stored summaries:
+
+    python -m scripts.objects reparse --dry-run
+    python -m scripts.objects reparse --summaries uploads
+    python -m scripts.objects reparse --bucket my-bucket --prefix upload
+
+Each object becomes an `objects` row (name, quantity, color, brand and
+other attributes as JSON). Triggers keep per-name totals in `object_rollup`,
+so `inventory_totals` and `object_rollup` answer "how many HDMI cables do I
+own" with indexed SQL.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import aiosqlite
+
+from scripts.db import DB_PATH, INSERT_OBJECT_SQL, object_rows
+from scripts.tags import aliases, canonical_tag
+from scripts.util import lazy_import
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+VISION_PROMPT = (
+    "List the objects in this image for inventory. Give one entry per kind "
+    "of object with a short singular name, how many are visible, its main "
+    "color and brand when you can tell (otherwise null), a few other short "
+    "attributes (material, size, condition) and your confidence from 0 to 1."
+)
+
+#: JSON schema the vision model's answer must follow
+OBJECTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "objects": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "count": {"type": "integer"},
+                    "color": {"type": ["string", "null"]},
+                    "brand": {"type": ["string", "null"]},
+                    "attributes": {
+                        "type": "array", "items": {"type": "string"}
+                    },
+                    "confidence": {"type": "number"},
+                },
+                "required": [
+                    "name", "count", "color", "brand", "attributes",
+                    "confidence",
+                ],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["objects"],
+    "additionalProperties": False,
+}
+
+#: `response_format` argument for chat completions using `OBJECTS_SCHEMA`
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "inventory",
+        "strict": True,
+        "schema": OBJECTS_SCHEMA,
+    },
+}
+
+#: Keys naming the object, in order of preference
+NAME_KEYS = ("name", "object", "item", "label", "type")
+
+#: Keys holding how many of the object there are
+COUNT_KEYS = ("count", "quantity", "qty", "number", "amount")
+
+#: Keys stored in their own `objects` columns rather than as attributes
+COLUMN_KEYS = ("color", "brand")
+
+#: Keys that are not attributes of the object
+RESERVED_KEYS = {
+    *NAME_KEYS, *COUNT_KEYS, *COLUMN_KEYS, "confidence", "attributes"
+}
+
+#: Words that only ever appear as JSON structure or filler, never as objects
+JUNK_WORDS = {
+    "object", "element", "item", "quantity", "count", "name", "json",
+    "true", "false", "yes", "no", "null", "none", "attribute", "confidence",
+}
+
+#: Longest attribute kept; longer strings are descriptions, not attributes
+MAX_ATTRIBUTE_LENGTH = 40
+
+BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+JSON_LINE_RE = re.compile(r'[{}]|"\s*:')
+LINE_COUNT_RE = re.compile(r"^(?P<name>.+?)\s*(?::|\(?x)\s*(?P<count>\d+)\)?$")
+
+
+def is_junk(name: str) -> bool:
+    """Whether a canonical tag is JSON structure or filler, not an object."""
+    words = name.split()
+    return not words or all(w in JUNK_WORDS or w.isdigit() for w in words)
+
+
+def _count(value: Any) -> int:  # noqa: ANN401
+    try:
+        return max(1, int(float(value)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _confidence(value: Any) -> float | None:  # noqa: ANN401
+    try:
+        confidence = float(value)
+    except (TypeError, ValueError):
+        return None
+    if 1 < confidence <= 100:  # noqa: PLR2004
+        confidence /= 100  # given as a percentage
+    return min(max(confidence, 0.0), 1.0)
+
+
+def _column(item: dict, key: str) -> str | None:
+    """`color` or `brand` from the object itself or its attribute dict."""
+    value = item.get(key)
+    attributes = item.get("attributes")
+    if value is None and isinstance(attributes, dict):
+        value = attributes.get(key)
+    if isinstance(value, list):  # "color": ["black", "red"]
+        value = next((v for v in value if isinstance(v, str)), None)
+    if not isinstance(value, str):
+        return None
+    text = _clean(value)
+    return text if text not in JUNK_WORDS else None
+
+
+def _clean(value: str) -> str:
+    return re.sub(r"\s+", " ", value).strip().lower()
+
+
+def _attributes(item: dict) -> list[str]:
+    raw = item.get("attributes")
+    if isinstance(raw, dict):
+        values = [v for k, v in raw.items() if k not in COLUMN_KEYS]
+    elif isinstance(raw, list):
+        values = raw
+    else:
+        values = [raw]
+    values += [v for k, v in item.items() if k not in RESERVED_KEYS]
+    attributes: list[str] = []
+    for value in values:
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            text = str(value).strip().lower()
+            if (text and len(text) <= MAX_ATTRIBUTE_LENGTH
+                    and text not in attributes):
+                attributes.append(text)
+    return attributes
+
+
+def normalize_object(item: dict) -> dict | None:
+    """Turn one parsed JSON object into an inventory object.
+
+    Args:
+        item (dict): Object from the model output, in the schema's shape or
+            a looser one (`item`/`quantity` keys, attribute dicts).
+
+    Returns:
+        dict | None: `{"name", "count", "color", "brand", "attributes",
+        "confidence"}` with a canonical name, or None if the object names
+        nothing usable.
+    """
+    raw_name = next(
+        (item[k] for k in NAME_KEYS if isinstance(item.get(k), str)), None
+    )
+    if raw_name is None:
+        return None
+    name = canonical_tag(raw_name)
+    if is_junk(name):
+        return None
+    return {
+        "name": name,
+        "count": _count(next((item[k] for k in COUNT_KEYS if k in item), 1)),
+        "color": _column(item, "color"),
+        "brand": _column(item, "brand"),
+        "attributes": _attributes(item),
+        "confidence": _confidence(item.get("confidence")),
+    }
+
+
+def _objects_from_value(value: Any) -> Iterator[dict]:  # noqa: ANN401
+    """Objects in a complete JSON value that holds no named objects."""
+    if isinstance(value, list):
+        for element in value:
+            if isinstance(element, str):
+                obj = normalize_object({"name": element})
+                if obj:
+                    yield obj
+            else:
+                yield from _objects_from_value(element)
+    elif isinstance(value, dict):
+        if value and all(
+            isinstance(v, int) and not isinstance(v, bool)
+            for v in value.values()
+        ):  # {"usb cable": 2, "mouse": 1}
+            for name, count in value.items():
+                obj = normalize_object({"name": name, "count": count})
+                if obj:
+                    yield obj
+        else:
+            for element in value.values():
+                yield from _objects_from_value(element)
+
+
+def _objects_from_lines(text: str) -> Iterator[dict]:
+    """Objects in plain text, one per line, as in pre-JSON summaries."""
+    for raw in text.splitlines():
+        line = BULLET_RE.sub("", raw).strip()
+        if not line or line.startswith("```") or JSON_LINE_RE.search(line):
+            continue
+        match = LINE_COUNT_RE.match(line)
+        item = {"name": line}
+        if match:
+            item = {"name": match["name"], "count": match["count"]}
+        obj = normalize_object(item)
+        if obj:
+            yield obj
+
+
+class ObjectStream:
+    """Incremental parser pulling inventory objects out of model output.
+
+    Feed text as it arrives (a streamed response, or a whole summary at
+    once); each JSON object naming something is returned as soon as its
+    closing brace is seen. Code fences and prose around the JSON are
+    skipped, and output truncated mid-object keeps every object completed
+    before the cut.
+    """
+
+    def __init__(self) -> None:
+        """Start with an empty buffer."""
+        self._text = ""
+        self._pos = 0
+        # Open containers as [bracket, start offset, holds an object]
+        self._stack: list[list] = []
+        self._in_string = False
+        self._escaped = False
+        self._found = 0
+        self._values: list[Any] = []  # complete top-level JSON values
+        self._saw_json = False
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Add text and return the objects completed by it."""
+        self._text += chunk
+        found: list[dict] = []
+        text = self._text
+        for pos in range(self._pos, len(text)):
+            self._scan(text, pos, found)
+        self._pos = len(text)
+        if self._saw_json and not self._stack:  # drop the consumed text
+            self._text = ""
+            self._pos = 0
+        self._found += len(found)
+        return found
+
+    def _scan(self, text: str, pos: int, found: list[dict]) -> None:
+        char = text[pos]
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+        elif char == '"':
+            self._in_string = bool(self._stack)
+            # A key inside braces: JSON, even if it never completes
+            self._saw_json |= self._in_string and self._stack[-1][0] == "{"
+        elif char in "{[":
+            self._stack.append([char, pos, False])
+        elif char in "}]" and self._stack:
+            self._close(text, pos, found)
+
+    def _close(self, text: str, pos: int, found: list[dict]) -> None:
+        bracket, start, holds_object = self._stack.pop()
+        if (bracket == "{") != (text[pos] == "}"):
+            self._stack.clear()  # unbalanced: not JSON after all
+            return
+        try:
+            value = json.loads(text[start:pos + 1])
+        except ValueError:
+            return
+        self._saw_json = True
+        if isinstance(value, dict) and not holds_object:
+            obj = normalize_object(value)
+            if obj:
+                found.append(obj)
+                holds_object = True
+        if self._stack:
+            self._stack[-1][2] |= holds_object
+        elif not holds_object:
+            self._values.append(value)
+
+    def close(self) -> list[dict]:
+        """Finish parsing and return objects found only at the end.
+
+        JSON without named objects (lists of strings, name -> count maps)
+        is interpreted once complete, and text without any JSON falls back
+        to one object per line.
+        """
+        if self._found:
+            return []
+        if self._saw_json:
+            found = [o for v in self._values for o in _objects_from_value(v)]
+        else:
+            found = list(_objects_from_lines(self._text))
+        self._found += len(found)
+        return found
+
+
+def parse_objects(text: str | None) -> list[dict]:
+    """Extract inventory objects from a vision summary.
+
+    Args:
+        text (str | None): Raw model output or stored summary file.
+
+    Returns:
+        list[dict]: Normalized objects in the order they appear.
+    """
+    stream = ObjectStream()
+    return stream.feed(text or "") + stream.close()
+
+
+def tags_from_objects(objects: Iterable[dict]) -> list[str]:
+    """Distinct object names, in order, as tags for the image."""
+    return list(dict.fromkeys(obj["name"] for obj in objects))
+
+
+async def inventory_totals(
+    db: aiosqlite.Connection,
+    *,
+    name: str | None = None,
+    color: str | None = None,
+    brand: str | None = None,
+    limit: int | None = None,
+) -> list[dict]:
+    """Total quantity owned per object, largest first.
+
+    Unfiltered totals come straight from the `object_rollup` table; color
+    and brand filters aggregate `objects` through its covering indexes.
+
+    Args:
+        db (aiosqlite.Connection): Connection to the metadata database.
+        name (str, optional): Only this object; canonicalized like tags.
+        color (str, optional): Only objects of this color.
+        brand (str, optional): Only objects of this brand.
+        limit (int, optional): Maximum number of rows.
+
+    Returns:
+        list[dict]: `{"name", "quantity", "entries"}` where `entries` is the
+        number of times the object was recorded.
+    """
+    where, params = [], []
+    if name is not None:
+        where.append("name = ?")
+        params.append(canonical_tag(name))
+    filters = {"color": color, "brand": brand}
+    for column, value in filters.items():
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(_clean(value))
+    if any(v is not None for v in filters.values()):
+        sql = (
+            "SELECT name, SUM(quantity), COUNT(*) FROM objects "  # nosec B608  # noqa: S608
+            f"WHERE {' AND '.join(where)} GROUP BY name"
+        )
+    else:
+        sql = "SELECT name, quantity, entries FROM object_rollup"
+        if where:
+            sql += f" WHERE {where[0]}"
+    sql += " ORDER BY 2 DESC, name LIMIT ?"
+    params.append(-1 if limit is None else limit)
+    cursor = await db.execute(sql, params)
+    return [
+        {"name": row[0], "quantity": row[1], "entries": row[2]}
+        for row in await cursor.fetchall()
+    ]
+
+
+async def object_rollup(db: aiosqlite.Connection, name: str) -> dict | None:
+    """Everything recorded about one kind of object.
+
+    Args:
+        db (aiosqlite.Connection): Connection to the metadata database.
+        name (str): Object name; canonicalized like tags.
+
+    Returns:
+        dict | None: Total quantity, number of images, quantities by color
+        and brand, and when it was last photographed; None if the object
+        was never seen.
+    """
+    name = canonical_tag(name)
+    cursor = await db.execute(
+        "SELECT quantity, entries FROM object_rollup WHERE name = ?", (name,)
+    )
+    total = await cursor.fetchone()
+    if total is None:
+        return None
+    cursor = await db.execute(
+        "SELECT COUNT(DISTINCT image_id), MAX(images.timestamp) FROM objects "
+        "JOIN images ON images.id = objects.image_id WHERE objects.name = ?",
+        (name,),
+    )
+    images, last_seen = await cursor.fetchone()
+    breakdown = {}
+    for column in COLUMN_KEYS:
+        cursor = await db.execute(
+            f"SELECT {column}, SUM(quantity) FROM objects "  # nosec B608  # noqa: S608
+            f"WHERE name = ? GROUP BY {column} ORDER BY 2 DESC, {column}",
+            (name,),
+        )
+        breakdown[column] = [
+            {column: value, "quantity": quantity}
+            for value, quantity in await cursor.fetchall()
+        ]
+    return {
+        "name": name,
+        "quantity": total[0],
+        "entries": total[1],
+        "images": images,
+        "last_seen": last_seen,
+        "by_color": breakdown["color"],
+        "by_brand": breakdown["brand"],
+    }
+
+
+async def _replace_image(
+    db: aiosqlite.Connection, image_id: int, objects: list[dict]
+) -> tuple[int, int]:
+    """Rewrite the objects and tag links of one image.
+
+    Returns:
+        tuple: Number of links removed and added.
+    """
+    await db.execute("DELETE FROM objects WHERE image_id = ?", (image_id,))
+    await db.executemany(INSERT_OBJECT_SQL, object_rows(image_id, objects))
+
+    cursor = await db.execute(
+        "SELECT tags.name FROM image_tags JOIN tags "
+        "ON tags.id = image_tags.tag_id WHERE image_tags.image_id = ?",
+        (image_id,),
+    )
+    current = {row[0] for row in await cursor.fetchall()}
+    wanted = set(tags_from_objects(objects))
+    if current == wanted:
+        return 0, 0  # leave the links alone so the tag index stays warm
+
+    await db.execute("DELETE FROM image_tags WHERE image_id = ?", (image_id,))
+    await db.executemany(
+        "INSERT OR IGNORE INTO tags (name) VALUES (?)",
+        [(tag,) for tag in wanted],
+    )
+    await db.executemany(
+        "INSERT INTO image_tags (image_id, tag_id) "
+        "SELECT ?, id FROM tags WHERE name = ?",
+        [(image_id, tag) for tag in wanted],
+    )
+    return len(current), len(wanted)
+
+
+async def reparse_summaries(
+    summaries: Iterable[tuple[str, str]],
+    db_path: Path | str = DB_PATH,
+    *,
+    dry_run: bool = False,
+) -> dict[str, int]:
+    """Re-extract objects and tags from stored summaries.
+
+    Each known image gets its `objects` rows rebuilt and its tag links
+    replaced by the parsed object names; tags left without any image (the
+    junk the line-based ingest created) are deleted. Runs in a single
+    transaction.
+
+    Args:
+        summaries (Iterable): `(filename, summary text)` pairs.
+        db_path (Path | str): Database to rewrite.
+        dry_run (bool): Parse and count, but roll back instead of committing.
+
+    Returns:
+        dict: Counts of images, objects, links and tags changed, and of
+        summaries whose image is not in the database.
+    """
+    stats = dict.fromkeys(
+        ("images", "objects", "links_removed", "links_added", "tags_removed",
+         "missing"),
+        0,
+    )
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute("SELECT filename, id FROM images")
+        image_ids = dict(await cursor.fetchall())
+        for filename, text in summaries:
+            image_id = image_ids.get(filename)
+            if image_id is None:
+                stats["missing"] += 1
+                continue
+            objects = parse_objects(text)
+            removed, added = await _replace_image(db, image_id, objects)
+            stats["images"] += 1
+            stats["objects"] += len(objects)
+            stats["links_removed"] += removed
+            stats["links_added"] += added
+        cursor = await db.execute(
+            "DELETE FROM tags WHERE NOT EXISTS "
+            "(SELECT 1 FROM image_tags WHERE image_tags.tag_id = tags.id)"
+        )
+        stats["tags_removed"] = cursor.rowcount
+        if dry_run:
+            await db.rollback()
+        else:
+            await db.commit()
+    if not dry_run:
+        await aliases.load(db_path)
+    return stats
+
+
+def local_summaries(directory: Path) -> Iterator[tuple[str, str]]:
+    """`(filename, text)` for every `*.summary.txt` in a directory."""
+    for path in sorted(directory.glob("*.summary.txt")):
+        yield path.name.removesuffix(".summary.txt"), path.read_text()
+
+
+def gcs_summaries(bucket_name: str, prefix: str) -> Iterator[tuple[str, str]]:
+    """`(filename, text)` for every summary file stored in GCS."""
+    bucket = storage.Client().bucket(bucket_name)
+    for blob in bucket.list_blobs(prefix=f"{prefix}/summary/"):
+        name = Path(blob.name).name.removesuffix(".summary.txt")
+        yield name, blob.download_as_text()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point for the re-parse job."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    reparse = commands.add_parser(
+        "reparse", help="rebuild objects and tags from stored summaries"
+    )
+    reparse.add_argument("--summaries", type=Path, default=Path("uploads"))
+    reparse.add_argument("--bucket", help="read summaries from this bucket")
+    reparse.add_argument("--prefix", default="upload")
+    reparse.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    summaries = (
+        gcs_summaries(args.bucket, args.prefix) if args.bucket
+        else local_summaries(args.summaries)
+    )
+    stats = asyncio.run(
+        reparse_summaries(summaries, args.db, dry_run=args.dry_run)
+    )
+    logger.info(f"🧾 Re-parsed summaries: {stats}")
+
+
+if __name__ == "__main__":
+    main()
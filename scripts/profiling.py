@@ -0,0 +1,397 @@
+"""Opt-in sampling profiler, slow-request capture and event-loop watchdog.
+
+Everything here is off unless asked for:
+
+- A request with an `X-Profile: 1` header or `?profile=1` query flag from an
+  authorized user is profiled for its whole duration. The response carries
+  an `X-Profile-Id` header naming the stored profile.
+- With `PROFILE_SLOW_MS` set, a watchdog thread starts sampling any request
+  still running after that many milliseconds, so slow requests that cannot
+  be reproduced leave a profile behind.
+- With `LOOP_BLOCK_MS` set, a heartbeat task on the event loop and the same
+  watchdog thread flag every stretch where a coroutine step holds the loop
+  longer than that. The loop thread's stack is captured while it is blocked,
+  which points at the sync call responsible.
+
+Profiles are wall-clock stack samples of the event loop thread taken from
+`sys._current_frames()`. Because the loop is shared, a profile also shows
+whatever else ran on the loop at the time. Profiles are stored in
+collapsed-stack format (`frame;frame;frame count`), which flamegraph.pl and
+speedscope read directly, and served from the `/admin/profiles` routes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import UTC, datetime
+from os import getenv
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qs
+
+from scripts.metrics import LOOP_BLOCK_SECONDS
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from types import FrameType
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+#: Milliseconds between stack samples
+PROFILE_INTERVAL_MS = float(getenv("PROFILE_INTERVAL_MS", "5"))
+
+#: Requests running longer than this are sampled automatically; 0 disables
+PROFILE_SLOW_MS = float(getenv("PROFILE_SLOW_MS", "0"))
+
+#: Loop stalls longer than this are recorded; 0 disables the detector
+LOOP_BLOCK_MS = float(getenv("LOOP_BLOCK_MS", "0"))
+
+#: Number of profiles and loop-block events kept in memory
+PROFILE_BUFFER_SIZE = 50
+
+#: Frames kept per sampled stack, innermost first
+MAX_STACK_DEPTH = 64
+
+#: Paths that are never profiled
+UNPROFILED_PREFIXES = ("/static", "/metrics", "/admin/profiles")
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    path = Path(code.co_filename)
+    return f"{code.co_name} ({path.parent.name}/{path.name}:{frame.f_lineno})"
+
+
+def capture_stack(thread_id: int) -> tuple[str, ...] | None:
+    """Return the current stack of a thread, outermost frame first."""
+    frame = sys._current_frames().get(thread_id)  # noqa: SLF001
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    if not stack:
+        return None
+    return tuple(reversed(stack))
+
+
+class Profile:
+    """Aggregated stack samples for one request."""
+
+    def __init__(self, reason: str, method: str = "", path: str = "") -> None:
+        """Start an empty profile; `reason` is `requested` or `slow`."""
+        self.id = secrets.token_hex(6)
+        self.reason = reason
+        self.method = method
+        self.path = path
+        self.started = datetime.now(UTC).isoformat(timespec="seconds")
+        self.duration_ms = 0.0
+        self.samples: Counter[tuple[str, ...]] = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, stack: tuple[str, ...] | None) -> None:
+        """Record one sampled stack."""
+        if stack:
+            with self._lock:
+                self.samples[stack] += 1
+
+    @property
+    def sample_count(self) -> int:
+        """Number of samples taken."""
+        return sum(self.samples.values())
+
+    def collapsed(self) -> str:
+        """Render the samples in collapsed-stack format."""
+        with self._lock:
+            items = self.samples.most_common()
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in items)
+
+    def summary(self, top: int = 5) -> dict:
+        """Describe the profile, with the frames most often on top."""
+        leaves: Counter[str] = Counter()
+        with self._lock:
+            for stack, count in self.samples.items():
+                leaves[stack[-1]] += count
+        return {
+            "id": self.id,
+            "reason": self.reason,
+            "method": self.method,
+            "path": self.path,
+            "started": self.started,
+            "duration_ms": round(self.duration_ms, 1),
+            "samples": self.sample_count,
+            "top_frames": leaves.most_common(top),
+        }
+
+
+class ProfileStore:
+    """Bounded in-memory store of recent profiles."""
+
+    def __init__(self, max_profiles: int = PROFILE_BUFFER_SIZE) -> None:
+        """Create a store holding up to `max_profiles` profiles."""
+        self.max_profiles = max_profiles
+        self._profiles: OrderedDict[str, Profile] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Profile) -> None:
+        """Keep a finished profile, evicting the oldest when full."""
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Profile | None:
+        """Return a stored profile by id."""
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list[dict]:
+        """Summaries of stored profiles, newest first."""
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [p.summary() for p in reversed(profiles)]
+
+    def clear(self) -> None:
+        """Forget every stored profile."""
+        with self._lock:
+            self._profiles.clear()
+
+
+store = ProfileStore()
+
+
+class StackSampler(threading.Thread):
+    """Background thread sampling one thread's stack into a profile."""
+
+    def __init__(
+        self,
+        thread_id: int,
+        profile: Profile,
+        interval_ms: float = PROFILE_INTERVAL_MS,
+    ) -> None:
+        """Prepare to sample `thread_id` every `interval_ms` milliseconds."""
+        super().__init__(name="stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.profile = profile
+        self.interval = interval_ms / 1000
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        """Sample until stopped."""
+        while not self._stopped.wait(self.interval):
+            self.profile.add(capture_stack(self.thread_id))
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the thread to exit."""
+        self._stopped.set()
+        self.join()
+
+
+class LoopMonitor:
+    """Watchdog for slow requests and event-loop blocking.
+
+    A heartbeat task stamps the time on every loop iteration it gets. The
+    watchdog thread samples the loop thread's stack into the profile of every
+    request running past `slow_ms`, and records a block event whenever the
+    heartbeat is late by more than `block_ms`.
+    """
+
+    def __init__(
+        self,
+        slow_ms: float = PROFILE_SLOW_MS,
+        block_ms: float = LOOP_BLOCK_MS,
+        interval_ms: float = PROFILE_INTERVAL_MS,
+    ) -> None:
+        """Configure thresholds; a zero threshold disables that check."""
+        self.slow_ms = slow_ms
+        self.block_ms = block_ms
+        self.interval = interval_ms / 1000
+        self.beat_interval = max(0.01, block_ms / 4000)
+        self.loop_thread_id: int | None = None
+        self.last_beat = time.monotonic()
+        self.blocks: deque[dict] = deque(maxlen=PROFILE_BUFFER_SIZE)
+        self._active: dict[str, tuple[float, Profile]] = {}
+        self._block: dict | None = None
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._heartbeat: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any check is configured."""
+        return bool(self.slow_ms or self.block_ms)
+
+    @property
+    def running(self) -> bool:
+        """Whether the watchdog has been started."""
+        return self._thread is not None
+
+    def start(self) -> None:
+        """Start the heartbeat and watchdog; call from the event loop."""
+        if not self.enabled or self.running:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._stopped.clear()
+        if self.block_ms:
+            self._heartbeat = asyncio.get_running_loop().create_task(
+                self._beat()
+            )
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"🩺 Loop monitor started (slow={self.slow_ms}ms, "
+            f"block={self.block_ms}ms)"
+        )
+
+    async def stop(self) -> None:
+        """Stop the heartbeat and watchdog."""
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._heartbeat
+            self._heartbeat = None
+        if self._thread:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    async def _beat(self) -> None:
+        while True:
+            self.last_beat = time.monotonic()
+            await asyncio.sleep(self.beat_interval)
+
+    def track(self, profile: Profile) -> str:
+        """Register a running request for slow-request sampling."""
+        key = secrets.token_hex(4)
+        self._active[key] = (time.monotonic(), profile)
+        return key
+
+    def untrack(self, key: str) -> Profile:
+        """Unregister a request and return its (possibly empty) profile."""
+        return self._active.pop(key)[1]
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            now = time.monotonic()
+            stack = None
+            if self.slow_ms:
+                cutoff = now - self.slow_ms / 1000
+                for started, profile in list(self._active.values()):
+                    if started <= cutoff:
+                        stack = stack or capture_stack(self.loop_thread_id)
+                        profile.add(stack)
+            if self.block_ms:
+                self._check_block(now, stack)
+
+    def _check_block(self, now: float, stack: tuple[str, ...] | None) -> None:
+        late = now - self.last_beat - self.beat_interval
+        if late * 1000 >= self.block_ms:
+            if self._block is None:
+                self._block = {
+                    "started": datetime.now(UTC).isoformat(
+                        timespec="milliseconds"
+                    ),
+                    "stack": stack or capture_stack(self.loop_thread_id),
+                }
+            self._block["duration_ms"] = round(late * 1000, 1)
+        elif self._block is not None:
+            block, self._block = self._block, None
+            self.blocks.append(block)
+            LOOP_BLOCK_SECONDS.observe(block["duration_ms"] / 1000)
+            where = block["stack"][-1] if block["stack"] else "unknown"
+            logger.warning(
+                f"🐢 Event loop blocked for {block['duration_ms']}ms in {where}"
+            )
+
+    def blocked_events(self) -> list[dict]:
+        """Recorded loop stalls, newest first."""
+        return list(reversed(self.blocks))
+
+
+monitor = LoopMonitor()
+
+
+def profile_requested(scope: dict) -> bool:
+    """Whether a request asks to be profiled via header or query flag."""
+    for key, value in scope.get("headers") or ():
+        if key == b"x-profile":
+            return value not in {b"", b"0", b"false"}
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("profile", ["0"])[-1] not in {"", "0", "false"}
+
+
+class ProfilingMiddleware:
+    """ASGI middleware running requested and slow-request profiles.
+
+    Must sit inside the session middleware so `authorize` can see the
+    logged-in user.
+    """
+
+    def __init__(
+        self, app: Callable, authorize: Callable[[dict], bool]
+    ) -> None:
+        """Wrap an ASGI app; `authorize(scope)` gates requested profiles."""
+        self.app = app
+        self.authorize = authorize
+
+    async def __call__(
+        self, scope: dict, receive: Callable, send: Callable
+    ) -> None:
+        """Profile the request when asked to or when it runs slow."""
+        if scope["type"] != "http" or scope["path"].startswith(
+            UNPROFILED_PREFIXES
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        requested = profile_requested(scope) and self.authorize(scope)
+        watch_slow = monitor.slow_ms and monitor.running
+        if not requested and not watch_slow:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(
+            "requested" if requested else "slow",
+            scope["method"],
+            scope["path"],
+        )
+
+        async def send_wrapper(message: dict) -> None:
+            if requested and message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = [
+                    *message["headers"],
+                    (b"x-profile-id", profile.id.encode()),
+                ]
+            await send(message)
+
+        start = time.perf_counter()
+        if requested:
+            sampler = StackSampler(threading.get_ident(), profile)
+            sampler.start()
+        else:
+            key = monitor.track(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            if requested:
+                sampler.stop()
+            else:
+                monitor.untrack(key)
+            if requested or profile.sample_count:
+                store.add(profile)
+                logger.info(
+                    f"🔬 Stored {profile.reason} profile {profile.id} for "
+                    f"{profile.method} {profile.path} "
+                    f"({profile.duration_ms:.0f}ms)"
+                )
@@ -0,0 +1,405 @@
+"""Boolean and faceted query language for `/search`.
+
+Queries are parsed into a small AST and compiled to SQL over the indexed
+`images`, `tags` and `image_tags` tables. Queries that only use tag terms
+are answered from the in-memory tag index instead, without touching SQLite.
+
+Syntax:
+- `cable` - a tag equal to or containing the word `cable` (`usb cable`)
+- `cab*` - a tag with a word starting with `cab`
+- `"usb cable"`, `tag:usb-c` - exactly this tag
+- `cable usb`, `cable AND usb` - both must match (AND is implied)
+- `cable OR usb` - either matches; binds looser than AND
+- `NOT broken`, `-broken` - must not match
+- `( ... )` - grouping
+- `label:garage`, `label:gar*` - the upload label (case-insensitive)
+- `date:2025`, `date:2025-05`, `date:2025-05-07`,
+  `date:2025-01..2025-03` - uploaded within that year, month, day or range
+- `after:2025-01-01`, `before:2025-02` - on/after or strictly before a date
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+from typing import TYPE_CHECKING, NamedTuple
+
+from scripts.tags import canonical_tag
+from scripts.util import clean_tag_name
+
+if TYPE_CHECKING:
+    import aiosqlite
+
+    from scripts.tagindex import TagIndex
+
+
+class QuerySyntaxError(ValueError):
+    """Raised for a search query that cannot be parsed."""
+
+
+class Tag(NamedTuple):
+    """A tag term; `mode` is `word`, `prefix` or `exact`."""
+
+    mode: str
+    value: str
+
+
+class Label(NamedTuple):
+    """An upload label filter, optionally a prefix match."""
+
+    value: str
+    prefix: bool = False
+
+
+class DateRange(NamedTuple):
+    """Half-open `[start, end)` range of ISO timestamp prefixes."""
+
+    start: str | None
+    end: str | None
+
+
+class Not(NamedTuple):
+    """Negation of a sub-query."""
+
+    child: Node
+
+
+class And(NamedTuple):
+    """All sub-queries must match."""
+
+    children: tuple[Node, ...]
+
+
+class Or(NamedTuple):
+    """At least one sub-query must match."""
+
+    children: tuple[Node, ...]
+
+
+Node = Tag | Label | DateRange | Not | And | Or
+
+TOKEN_RE = re.compile(
+    r"""
+    \s*(?:
+        (?P<lparen>\() | (?P<rparen>\)) |
+        (?P<field>[a-z]+):(?P<value>"[^"]*"|[^\s()"]+) |
+        "(?P<quoted>[^"]*)" |
+        (?P<neg>-)(?=[^\s)]) |
+        (?P<word>[^\s()"]+)
+    )
+    """,
+    re.VERBOSE | re.IGNORECASE,
+)
+
+DATE_RE = re.compile(r"^\d{4}(?:-\d{2}(?:-\d{2})?)?$")
+
+OPERATORS = {"AND", "OR", "NOT"}
+
+
+def tokenize(text: str) -> list[tuple[str, str]]:
+    """Split a query into `(kind, value)` tokens.
+
+    Raises:
+        QuerySyntaxError: On an unterminated quote.
+    """
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            msg = f"Unexpected character at position {pos}: {text[pos]!r}"
+            raise QuerySyntaxError(msg)
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == "value":
+            value = match["value"].strip('"')
+            tokens.append(("field", f"{match['field'].lower()}:{value}"))
+        elif kind == "word" and match["word"] in OPERATORS:
+            tokens.append(("op", match["word"]))
+        else:
+            tokens.append((kind, match[kind]))
+    return tokens
+
+
+class _Parser:
+    """Recursive descent parser: or := and (OR and)*; and := unary+."""
+
+    def __init__(self, tokens: list[tuple[str, str]]) -> None:
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> tuple[str, str]:
+        token = self.peek()
+        if token is None:
+            msg = "Query ends unexpectedly"
+            raise QuerySyntaxError(msg)
+        self.pos += 1
+        return token
+
+    def parse_or(self) -> Node:
+        children = [self.parse_and()]
+        while self.peek() == ("op", "OR"):
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(tuple(children))
+
+    def parse_and(self) -> Node:
+        children = [self.parse_unary()]
+        while (token := self.peek()) and token not in {
+            ("rparen", ")"),
+            ("op", "OR"),
+        }:
+            if token == ("op", "AND"):
+                self.take()
+            children.append(self.parse_unary())
+        return children[0] if len(children) == 1 else And(tuple(children))
+
+    def parse_unary(self) -> Node:
+        token = self.take()
+        if token in {("op", "NOT"), ("neg", "-")}:
+            return Not(self.parse_unary())
+        kind, value = token
+        if kind == "lparen":
+            node = self.parse_or()
+            if self.peek() != ("rparen", ")"):
+                msg = "Missing closing parenthesis"
+                raise QuerySyntaxError(msg)
+            self.take()
+            return node
+        if kind == "field":
+            return _field(*value.split(":", 1))
+        if kind == "quoted":
+            return _tag("exact", value)
+        if kind == "word":
+            if value.endswith("*"):
+                return _tag("prefix", value.rstrip("*"))
+            return _tag("word", value)
+        msg = f"Unexpected {value!r}"
+        raise QuerySyntaxError(msg)
+
+
+def _tag(mode: str, value: str) -> Tag:
+    # Prefixes stay as typed; whole terms use the same canonical form as
+    # stored tags, so "cables" finds "usb cable"
+    tag = clean_tag_name(value) if mode == "prefix" else canonical_tag(value)
+    if not tag:
+        msg = f"Empty tag term {value!r}"
+        raise QuerySyntaxError(msg)
+    return Tag(mode, tag)
+
+
+def _field(field: str, value: str) -> Node:
+    if field == "tag":
+        if value.endswith("*"):
+            return _tag("prefix", value.rstrip("*"))
+        return _tag("exact", value)
+    if field == "label":
+        return Label(value.rstrip("*").lower(), prefix=value.endswith("*"))
+    if field == "date":
+        first, _, last = value.partition("..")
+        return DateRange(_date(first), _period_end(_date(last or first)))
+    if field == "after":
+        return DateRange(_date(value), None)
+    if field == "before":
+        return DateRange(None, _date(value))
+    msg = f"Unknown field {field!r}; use tag, label, date, after or before"
+    raise QuerySyntaxError(msg)
+
+
+def _date(value: str) -> str:
+    if not DATE_RE.match(value):
+        msg = f"Bad date {value!r}; use YYYY, YYYY-MM or YYYY-MM-DD"
+        raise QuerySyntaxError(msg)
+    return value
+
+
+def _period_end(value: str) -> str:
+    """First timestamp prefix after the year, month or day in `value`."""
+    parts = [int(p) for p in value.split("-")]
+    if len(parts) == 1:
+        return f"{parts[0] + 1:04d}"
+    if len(parts) == 2:  # noqa: PLR2004
+        year, month = parts
+        return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+    # Days compare as strings, so the next prefix is simply day + 1, even
+    # past the end of the month: "2025-01-31" < "2025-01-32" < "2025-02-01"
+    year, month, day = parts
+    return f"{year:04d}-{month:02d}-{day + 1:02d}"
+
+
+def parse_query(text: str) -> Node | None:
+    """Parse a search query; returns None for an empty query.
+
+    Raises:
+        QuerySyntaxError: If the query is malformed.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return None
+    parser = _Parser(tokens)
+    node = parser.parse_or()
+    if parser.peek() is not None:
+        msg = f"Unexpected {parser.peek()[1]!r}"
+        raise QuerySyntaxError(msg)
+    return node
+
+
+def uses_only_tags(node: Node) -> bool:
+    """Whether the tag index alone can answer `node`."""
+    if isinstance(node, Tag):
+        return True
+    if isinstance(node, Not):
+        return uses_only_tags(node.child)
+    if isinstance(node, And | Or):
+        return all(uses_only_tags(child) for child in node.children)
+    return False
+
+
+def _words(name: str) -> list[str]:
+    return name.replace("-", " ").replace("_", " ").split()
+
+
+def tag_matches(term: Tag, name: str) -> bool:
+    """Whether the tag `name` satisfies a tag term (mirrors the SQL)."""
+    if name == term.value:
+        return True
+    if term.mode == "exact":
+        return False
+    words = " ".join(_words(term.value))
+    padded = f" {' '.join(_words(name))} "
+    if term.mode == "prefix":
+        return name.startswith(term.value) or f" {words}" in padded
+    return f" {words} " in padded
+
+
+def _like_escape(value: str) -> str:
+    return re.sub(r"([\\%_])", r"\\\1", value)
+
+
+#: Tag name with `-` and `_` turned into spaces and padded for word matching
+_TAG_WORDS_SQL = "' ' || replace(replace(tags.name, '-', ' '), '_', ' ') || ' '"
+
+_TAGGED_SQL = (
+    "images.id IN (SELECT image_tags.image_id FROM image_tags "
+    "JOIN tags ON tags.id = image_tags.tag_id WHERE {})"
+)
+
+
+def _tag_sql(node: Tag) -> tuple[str, list[str]]:
+    words = _like_escape(" ".join(_words(node.value)))
+    if node.mode == "exact":
+        return _TAGGED_SQL.format("tags.name = ?"), [node.value]
+    if node.mode == "prefix":
+        return _TAGGED_SQL.format(
+            f"tags.name LIKE ? ESCAPE '\\' "
+            f"OR {_TAG_WORDS_SQL} LIKE ? ESCAPE '\\'"
+        ), [f"{_like_escape(node.value)}%", f"% {words}%"]
+    return _TAGGED_SQL.format(
+        f"tags.name = ? OR {_TAG_WORDS_SQL} LIKE ? ESCAPE '\\'"
+    ), [node.value, f"% {words} %"]
+
+
+def _label_sql(node: Label) -> tuple[str, list[str]]:
+    if node.prefix:
+        return "images.label LIKE ? ESCAPE '\\'", [
+            f"{_like_escape(node.value)}%"
+        ]
+    return "images.label = ? COLLATE NOCASE", [node.value]
+
+
+def _date_sql(node: DateRange) -> tuple[str, list[str]]:
+    clauses, params = [], []
+    if node.start:
+        clauses.append("images.timestamp >= ?")
+        params.append(node.start)
+    if node.end:
+        clauses.append("images.timestamp < ?")
+        params.append(node.end)
+    return f"({' AND '.join(clauses)})", params
+
+
+def compile_sql(node: Node) -> tuple[str, list[str]]:
+    """Compile a query to a SQL condition on `images` and its parameters."""
+    if isinstance(node, Tag):
+        return _tag_sql(node)
+    if isinstance(node, Label):
+        return _label_sql(node)
+    if isinstance(node, DateRange):
+        return _date_sql(node)
+    if isinstance(node, Not):
+        sql, params = compile_sql(node.child)
+        return f"NOT ({sql})", params
+    joiner = " AND " if isinstance(node, And) else " OR "
+    parts = [compile_sql(child) for child in node.children]
+    sql = joiner.join(f"({part})" for part, _ in parts)
+    return f"({sql})", [param for _, params in parts for param in params]
+
+
+def evaluate(node: Node, index: TagIndex) -> set[int]:
+    """Evaluate a tag-only query against the in-memory tag index."""
+    if isinstance(node, Tag):
+        ids: set[int] = set()
+        for name in index.tag_names():
+            if tag_matches(node, name):
+                ids.update(index.ids(name))
+        return ids
+    if isinstance(node, Not):
+        return index.image_ids() - evaluate(node.child, index)
+    if isinstance(node, And):
+        return _evaluate_and(node, index)
+    if isinstance(node, Or):
+        result = set()
+        for child in node.children:
+            result |= evaluate(child, index)
+        return result
+    msg = f"{type(node).__name__} needs SQL; check uses_only_tags first"
+    raise TypeError(msg)
+
+
+def _evaluate_and(node: And, index: TagIndex) -> set[int]:
+    # Positive terms first so negations subtract from a small set
+    ordered = sorted(node.children, key=lambda c: isinstance(c, Not))
+    result = evaluate(ordered[0], index)
+    for child in ordered[1:]:
+        if not result:
+            break
+        if isinstance(child, Not):
+            result -= evaluate(child.child, index)
+        else:
+            result &= evaluate(child, index)
+    return result
+
+
+async def search_image_ids(
+    db: aiosqlite.Connection,
+    node: Node,
+    index: TagIndex | None = None,
+    limit: int | None = None,
+) -> list[int]:
+    """Image ids matching `node`, newest first.
+
+    Tag-only queries use `index` when given; everything else runs as SQL.
+    """
+    if index is not None and uses_only_tags(node):
+        return index.newest_first(evaluate(node, index), limit)
+    where, params = compile_sql(node)
+    # `where` holds only SQL from compile_sql; values are `?` placeholders
+    sql = (
+        f"SELECT images.id FROM images WHERE {where} "  # nosec B608  # noqa: S608
+        "ORDER BY images.timestamp DESC, images.id DESC"
+    )
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = [*params, limit]
+    cursor = await db.execute(sql, params)
+    return [row[0] for row in await cursor.fetchall()]
+
+
+def facet_counts(photos: list[dict], limit: int = 20) -> list[tuple[str, int]]:
+    """Counts of the tags that co-occur on the matched photos."""
+    counts = Counter(tag for photo in photos for tag in set(photo["tags"]))
+    return counts.most_common(limit)
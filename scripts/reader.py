@@ -1,6 +1,187 @@
-"""placeholder for NFC tag reader script."""
+"""NFC tag readers with blocking and async interfaces.
 
+Scanner loops wait on `TagReader.read(timeout)` instead of polling: the
+call blocks until a tag is seen or the timeout passes, so an idle scanner
+uses no CPU. `async for tag in reader` does the same from asyncio code by
+running the blocking call in a thread.
 
-def read_tag() -> None:
-    """Read and return tag UID."""
+Readers report a tag held against the antenna over and over. `read`
+debounces those repeats: a tag seen again within `DEBOUNCE_SECONDS` of its
+last sighting is not returned again.
 
+Implementations:
+
+- `PN532Reader` reads a PN532 board over I2C (Raspberry Pi scanner nodes;
+  needs `adafruit-circuitpython-pn532`, imported on first use).
+- `LineReader` reads one UID per line from a stream, for USB readers that
+  type UIDs like a keyboard, or `nfc-list` style output piped to stdin.
+- `QueueReader` is fed from code, for tests and simulated scanners.
+
+`open_reader` picks one from `NFC_READER` (`pn532` or `stdin`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import queue
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from os import getenv
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterator
+    from typing import TextIO
+
+#: Seconds during which repeated reads of the same tag are ignored
+DEBOUNCE_SECONDS = float(getenv("NFC_DEBOUNCE_SECONDS", "2"))
+
+#: Longest single wait on the hardware, so `close` is noticed promptly
+MAX_WAIT_SECONDS = 1.0
+
+
+class TagReader(ABC):
+    """Base class: blocking, debounced reads of tag UIDs."""
+
+    def __init__(self, debounce: float = DEBOUNCE_SECONDS) -> None:
+        """Set up debouncing; subclasses open their device."""
+        self.debounce = debounce
+        self.closed = False
+        self._last_seen: dict[str, float] = {}
+
+    @abstractmethod
+    def _read(self, timeout: float) -> str | None:
+        """Wait up to `timeout` seconds for one raw read of a UID."""
+
+    def read(self, timeout: float | None = None) -> str | None:
+        """Wait for a new tag.
+
+        Args:
+            timeout (float, optional): Seconds to wait; None waits until a
+                tag is seen or the reader is closed.
+
+        Returns:
+            str | None: The tag UID, or None on timeout or close.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.closed:
+            left = MAX_WAIT_SECONDS
+            if deadline is not None:
+                left = min(left, deadline - time.monotonic())
+                if left <= 0:
+                    return None
+            tag = self._read(left)
+            if tag and self._is_new(tag):
+                return tag
+        return None
+
+    def _is_new(self, tag: str) -> bool:
+        now = time.monotonic()
+        last = self._last_seen.get(tag)
+        self._last_seen[tag] = now
+        if len(self._last_seen) > 1024:  # noqa: PLR2004
+            cutoff = now - self.debounce
+            self._last_seen = {
+                t: seen for t, seen in self._last_seen.items() if seen > cutoff
+            }
+        return last is None or now - last >= self.debounce
+
+    def __iter__(self) -> Iterator[str]:
+        """Yield tags as they are seen, until the reader is closed."""
+        while not self.closed:
+            tag = self.read()
+            if tag:
+                yield tag
+
+    async def aread(self, timeout: float | None = None) -> str | None:  # noqa: ASYNC109
+        """Async `read`, blocking a worker thread instead of the loop."""
+        return await asyncio.to_thread(self.read, timeout)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        """Async counterpart of `__iter__`."""
+        while not self.closed:
+            tag = await self.aread(MAX_WAIT_SECONDS)
+            if tag:
+                yield tag
+
+    def close(self) -> None:
+        """Stop waiting; pending and later reads return None."""
+        self.closed = True
+
+
+class QueueReader(TagReader):
+    """Reader fed from code with `put`."""
+
+    def __init__(self, debounce: float = DEBOUNCE_SECONDS) -> None:
+        """Create a reader with an empty queue."""
+        super().__init__(debounce)
+        self._queue: queue.Queue[str] = queue.Queue()
+
+    def put(self, tag: str) -> None:
+        """Report `tag` as if it had been scanned."""
+        self._queue.put(tag)
+
+    def _read(self, timeout: float) -> str | None:
+        try:
+            return self._queue.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        """Stop waiting, waking a blocked `read` right away."""
+        super().close()
+        self._queue.put("")
+
+
+class LineReader(QueueReader):
+    """Reader taking one UID per line from a text stream."""
+
+    def __init__(
+        self, stream: TextIO | None = None, debounce: float = DEBOUNCE_SECONDS
+    ) -> None:
+        """Start a daemon thread reading lines from `stream` (stdin)."""
+        super().__init__(debounce)
+        self._stream = stream or sys.stdin
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def _pump(self) -> None:
+        for line in self._stream:
+            tag = line.strip()
+            if tag:
+                self.put(tag)
+
+
+class PN532Reader(TagReader):
+    """PN532 NFC board on the I2C bus of a Raspberry Pi."""
+
+    def __init__(self, debounce: float = DEBOUNCE_SECONDS) -> None:
+        """Open the board; requires the Adafruit PN532 driver."""
+        super().__init__(debounce)
+        import board  # noqa: PLC0415
+        import busio  # noqa: PLC0415
+        from adafruit_pn532.i2c import PN532_I2C  # noqa: PLC0415
+
+        self._pn532 = PN532_I2C(busio.I2C(board.SCL, board.SDA))
+        self._pn532.SAM_configuration()
+
+    def _read(self, timeout: float) -> str | None:
+        # Blocks in the driver until a card answers or the timeout passes
+        uid = self._pn532.read_passive_target(timeout=timeout)
+        return uid.hex().upper() if uid else None
+
+
+def open_reader(kind: str | None = None) -> TagReader:
+    """Open the reader named by `kind` or the `NFC_READER` variable.
+
+    Raises:
+        ValueError: For an unknown reader kind.
+    """
+    kind = kind or getenv("NFC_READER", "pn532")
+    if kind == "pn532":
+        return PN532Reader()
+    if kind == "stdin":
+        return LineReader()
+    msg = f"Unknown NFC reader {kind!r}; use 'pn532' or 'stdin'"
+    raise ValueError(msg)
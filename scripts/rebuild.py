@@ -5,18 +5,32 @@ from __future__ import annotations
 import logging
 import os
 import re
+import time
 from datetime import UTC, datetime, timezone
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 import aiosqlite
-from google.cloud import storage
 
-from scripts.db import DB_PATH, add_image, add_tag, init_db, link_image_tag
-from scripts.util import clean_tag_name, parse_utc_timestamp, utc_now_iso
+from scripts.db import (
+    DB_PATH,
+    add_image,
+    add_tag,
+    init_db,
+    link_image_tag,
+    set_image_objects,
+)
+from scripts.metrics import GCS_BYTES, GCS_REQUEST_SECONDS
+from scripts.objects import parse_objects, tags_from_objects
+from scripts.tracing import start_span
+from scripts.util import lazy_import, parse_utc_timestamp, utc_now_iso
 
 if TYPE_CHECKING:
     from google.cloud.storage import Blob
+
+    from scripts.tracing import Span
+storage = lazy_import("google.cloud.storage")
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -68,16 +82,30 @@ async def rebuild_db_from_gcs(
     if not since_timestamp and not should_rebuild_db(force=force):
         return
 
+    with start_span(
+        "rebuild_db_from_gcs", prefix=prefix, delta=bool(since_timestamp)
+    ) as span:
+        await _rebuild_stages(bucket_name, prefix, since_timestamp, span)
+
+
+async def _rebuild_stages(
+    bucket_name: str, prefix: str, since_timestamp: str | None, span: Span
+) -> None:
+    """Run the list, filter and ingest stages of a rebuild in spans."""
     logger.info("🔁 Starting rebuild from GCS...")
 
-    if not Path.exists(DB_PATH):
-        logger.info("DB file does not exist, creating: {DB_PATH}")
-        await init_db()
+    # Also for an existing file: a restored snapshot may predate tables
+    # and columns that the ingest below writes to
+    await init_db()
 
     try:
         client = storage.Client()
         bucket = client.bucket(bucket_name)
-        blobs = list(bucket.list_blobs(prefix=f"{prefix}/summary"))
+        with (
+            start_span("gcs.list"),
+            GCS_REQUEST_SECONDS.time(operation="list"),
+        ):
+            blobs = list(bucket.list_blobs(prefix=f"{prefix}/summary"))
         logger.info(f"🔁 Found {len(blobs)} summary files in GCS")
 
         # Optional time filtering
@@ -85,9 +113,11 @@ async def rebuild_db_from_gcs(
             try:
                 cutoff_dt = parse_utc_timestamp(since_timestamp)
 
-                blobs = [
-                    b for b in blobs if b.updated.astimezone(UTC) > cutoff_dt
-                ]
+                with start_span("rebuild.filter", listed=len(blobs)):
+                    blobs = [
+                        b for b in blobs
+                        if b.updated.astimezone(UTC) > cutoff_dt
+                    ]
                 logging.info(
                     f"🔍 Filtered to {len(blobs)} summary files "
                     "after {since_timestamp}"
@@ -97,20 +127,32 @@ async def rebuild_db_from_gcs(
                     f"⚠️ Failed to parse since_timestamp '{since_timestamp}'"
                 )
 
-        for blob in blobs:
-            filename = Path(blob.name).name.replace(".summary.txt", "")
-            logging.info(f"🔁 Processing {filename}")
-            contents = blob.download_as_text()
-
-            await add_image(filename, label="", timestamp=utc_now_iso())
-            for line in contents.splitlines():
-                tag = clean_tag_name(line)
-                if tag:
+        # One span for the whole loop; per-file spans would flood the buffer
+        download_s = db_s = 0.0
+        with start_span("rebuild.ingest", files=len(blobs)) as ingest:
+            for blob in blobs:
+                filename = Path(blob.name).name.replace(".summary.txt", "")
+                logging.info(f"🔁 Processing {filename}")
+                started = time.perf_counter()
+                with GCS_REQUEST_SECONDS.time(operation="download"):
+                    contents = blob.download_as_text()
+                GCS_BYTES.inc(len(contents.encode()), operation="download")
+                downloaded = time.perf_counter()
+                download_s += downloaded - started
+
+                await add_image(filename, label="", timestamp=utc_now_iso())
+                objects = parse_objects(contents)
+                for tag in tags_from_objects(objects):
                     await add_tag(tag)
                     await link_image_tag(filename, tag)
+                await set_image_objects(filename, objects)
+                db_s += time.perf_counter() - downloaded
+            ingest.set_attribute("download_ms", round(download_s * 1000, 1))
+            ingest.set_attribute("db_ms", round(db_s * 1000, 1))
 
         logging.info("✅ DB rebuilt from GCS summaries")
-    except Exception:
+    except Exception as e:
+        span.record_exception(e)
         logging.exception("🔥 Failed to rebuild DB from GCS")
 
 
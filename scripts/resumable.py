@@ -0,0 +1,314 @@
+"""Resumable chunked uploads following the tus 1.0 protocol.
+
+A phone on a flaky connection uploads an original in pieces and resumes
+from the last byte the server has, instead of restarting the whole body:
+
+1. `POST /api/uploads` with `Upload-Length` (and `Upload-Metadata` with a
+   base64 `filename` and `label`) creates a session; `Location` names it.
+2. `HEAD /api/uploads/{id}` returns the `Upload-Offset` received so far.
+3. `PATCH /api/uploads/{id}` with `Upload-Offset` and a body of
+   `application/offset+octet-stream` appends a chunk. With
+   `Upload-Checksum: sha256 <base64 digest>` the chunk is verified and
+   dropped on mismatch (status 460); without one, the bytes received
+   before a dropped connection are kept.
+4. When the offset reaches the length, the file moves into the upload
+   directory and goes through the same queue as `/upload`.
+
+Sessions live until `SESSION_HOURS` after their last chunk; expired ones
+and their partial files are removed by `collect_expired`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import contextlib
+import hashlib
+import secrets
+from datetime import UTC, datetime, timedelta
+from os import getenv
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import aiofiles
+from starlette.requests import ClientDisconnect
+
+from scripts.util import HTTPStatusError, utc_iso
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    import aiosqlite
+
+TUS_VERSION = "1.0.0"
+
+TUS_EXTENSIONS = "creation,checksum,termination,expiration"
+
+#: Largest upload accepted
+MAX_UPLOAD_BYTES = int(getenv("RESUMABLE_MAX_MB", "500")) * 2**20
+
+#: Hours a session is kept after its last chunk
+SESSION_HOURS = float(getenv("RESUMABLE_SESSION_HOURS", "24"))
+
+CHECKSUM_ALGORITHMS = ("sha256", "sha1", "md5")
+
+# Sessions with a chunk being appended in this process
+_appending: set[str] = set()
+
+SESSION_COLUMNS = (
+    "id", "name", "label", "length", "offset", "path", "created_at",
+    "expires_at", "filename",
+)
+
+
+class UploadSessionError(HTTPStatusError):
+    """Raised for a request the upload session cannot accept."""
+
+
+def parse_metadata(header: str | None) -> dict[str, str]:
+    """Decode `Upload-Metadata`: comma-separated `key base64value` pairs.
+
+    Raises:
+        UploadSessionError: If a value is not valid base64 UTF-8.
+    """
+    metadata = {}
+    for pair in (header or "").split(","):
+        key, _, value = pair.strip().partition(" ")
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError) as e:
+            msg = f"Bad Upload-Metadata value for {key!r}"
+            raise UploadSessionError(msg) from e
+    return metadata
+
+
+def parse_checksum(header: str | None) -> tuple[str, bytes] | None:
+    """Decode `Upload-Checksum: <algorithm> <base64 digest>`.
+
+    Raises:
+        UploadSessionError: For an unsupported algorithm or bad digest.
+    """
+    if not header:
+        return None
+    algorithm, _, digest = header.strip().partition(" ")
+    if algorithm.lower() not in CHECKSUM_ALGORITHMS:
+        msg = f"Unsupported checksum {algorithm!r}; use sha256, sha1 or md5"
+        raise UploadSessionError(msg)
+    try:
+        return algorithm.lower(), base64.b64decode(digest, validate=True)
+    except binascii.Error as e:
+        msg = "Upload-Checksum digest is not base64"
+        raise UploadSessionError(msg) from e
+
+
+async def create_session(
+    db: aiosqlite.Connection,
+    length: int,
+    metadata: dict[str, str],
+    directory: Path,
+    *,
+    now: datetime | None = None,
+) -> dict:
+    """Start a session and its empty partial file under `directory`.
+
+    Raises:
+        UploadSessionError: For a missing name or an unacceptable length.
+    """
+    if length <= 0:
+        msg = "Upload-Length must be a positive number of bytes"
+        raise UploadSessionError(msg)
+    if length > MAX_UPLOAD_BYTES:
+        msg = f"Uploads are limited to {MAX_UPLOAD_BYTES} bytes"
+        raise UploadSessionError(msg, 413)
+    name = Path(metadata.get("filename", "").replace("\\", "/")).name
+    if not name:
+        msg = "Upload-Metadata needs a filename"
+        raise UploadSessionError(msg)
+    now = now or datetime.now(UTC)
+    await asyncio.to_thread(directory.mkdir, parents=True, exist_ok=True)
+    session = {
+        "id": secrets.token_hex(16),
+        "name": name,
+        "label": metadata.get("label", ""),
+        "length": length,
+        "offset": 0,
+        "created_at": utc_iso(now),
+        "expires_at": utc_iso(now + timedelta(hours=SESSION_HOURS)),
+        "filename": None,
+    }
+    session["path"] = str(directory / f"{session['id']}.part")
+    await asyncio.to_thread(Path(session["path"]).touch)
+    await db.execute(
+        f"INSERT INTO upload_sessions ({', '.join(SESSION_COLUMNS)}) "  # nosec B608  # noqa: S608
+        f"VALUES ({', '.join('?' * len(SESSION_COLUMNS))})",
+        [session[c] for c in SESSION_COLUMNS],
+    )
+    await db.commit()
+    return session
+
+
+async def get_session(
+    db: aiosqlite.Connection, session_id: str, *, now: datetime | None = None
+) -> dict:
+    """A live session.
+
+    Raises:
+        UploadSessionError: 404 if unknown, 410 once expired.
+    """
+    cursor = await db.execute(
+        f"SELECT {', '.join(SESSION_COLUMNS)} FROM upload_sessions "  # nosec B608  # noqa: S608
+        "WHERE id = ?",
+        (session_id,),
+    )
+    row = await cursor.fetchone()
+    if row is None:
+        msg = "Unknown upload"
+        raise UploadSessionError(msg, 404)
+    session = dict(zip(SESSION_COLUMNS, row, strict=True))
+    if session["expires_at"] <= utc_iso(now or datetime.now(UTC)):
+        msg = "Upload has expired"
+        raise UploadSessionError(msg, 410)
+    return session
+
+
+async def append_chunk(  # noqa: PLR0913
+    db: aiosqlite.Connection,
+    session: dict,
+    offset: int,
+    chunks: AsyncIterator[bytes],
+    *,
+    checksum: tuple[str, bytes] | None = None,
+    now: datetime | None = None,
+) -> int:
+    """Append a chunk at `offset` and return the new offset.
+
+    Anything past the recorded offset (from a chunk that failed halfway)
+    is overwritten.
+
+    Raises:
+        UploadSessionError: 409 on an offset mismatch or a finished
+            upload, 413 past `length`, 423 while another chunk is being
+            appended, 460 on a checksum mismatch.
+    """
+    if session["id"] in _appending:
+        msg = "Another chunk is being received"
+        raise UploadSessionError(msg, 423)
+    _appending.add(session["id"])
+    try:
+        return await _append(db, session, offset, chunks, checksum, now)
+    finally:
+        _appending.discard(session["id"])
+
+
+async def _append(  # noqa: PLR0913, PLR0917
+    db: aiosqlite.Connection,
+    session: dict,
+    offset: int,
+    chunks: AsyncIterator[bytes],
+    checksum: tuple[str, bytes] | None,
+    now: datetime | None,
+) -> int:
+    # Re-read: the session may have moved on since the caller loaded it
+    cursor = await db.execute(
+        "SELECT offset, filename FROM upload_sessions WHERE id = ?",
+        (session["id"],),
+    )
+    session["offset"], session["filename"] = await cursor.fetchone()
+    if session["filename"] is not None or offset != session["offset"]:
+        msg = f"Upload-Offset {offset} does not match {session['offset']}"
+        raise UploadSessionError(msg, 409)
+    digest = hashlib.new(checksum[0]) if checksum else None
+    end = offset
+    error = None
+    async with aiofiles.open(session["path"], "r+b") as f:
+        await f.seek(offset)
+        await f.truncate()
+        try:
+            async for chunk in chunks:
+                end += len(chunk)
+                if end > session["length"]:
+                    msg = "Chunk runs past Upload-Length"
+                    raise UploadSessionError(msg, 413)  # noqa: TRY301
+                if digest:
+                    digest.update(chunk)
+                await f.write(chunk)
+        except UploadSessionError as e:
+            error = e
+        except ClientDisconnect:
+            # Keep what arrived unless it cannot be verified
+            if digest:
+                error = UploadSessionError("Client disconnected")
+        if error is None and digest and digest.digest() != checksum[1]:
+            error = UploadSessionError("Checksum mismatch", 460)
+        if error is not None:
+            await f.truncate(offset)
+            raise error
+    expires_at = utc_iso(
+        (now or datetime.now(UTC)) + timedelta(hours=SESSION_HOURS)
+    )
+    await db.execute(
+        "UPDATE upload_sessions SET offset = ?, expires_at = ? WHERE id = ?",
+        (end, expires_at, session["id"]),
+    )
+    await db.commit()
+    session.update(offset=end, expires_at=expires_at)
+    return end
+
+
+async def complete_session(
+    db: aiosqlite.Connection, session: dict, directory: Path, filename: str
+) -> Path:
+    """Move a fully received file into `directory` as `filename`."""
+    path = await asyncio.to_thread(
+        Path(session["path"]).rename, directory / filename
+    )
+    await db.execute(
+        "UPDATE upload_sessions SET filename = ? WHERE id = ?",
+        (filename, session["id"]),
+    )
+    await db.commit()
+    session["filename"] = filename
+    return path
+
+
+async def delete_session(db: aiosqlite.Connection, session: dict) -> None:
+    """Terminate a session and delete its partial file."""
+    if session["filename"] is None:
+        await asyncio.to_thread(Path(session["path"]).unlink, missing_ok=True)
+    await db.execute(
+        "DELETE FROM upload_sessions WHERE id = ?", (session["id"],)
+    )
+    await db.commit()
+
+
+def _remove_parts(paths: list[str]) -> None:
+    for path in paths:
+        with contextlib.suppress(OSError):
+            Path(path).unlink()
+
+
+async def collect_expired(
+    db: aiosqlite.Connection, *, now: datetime | None = None
+) -> int:
+    """Delete expired sessions and their partial files.
+
+    Returns:
+        int: Number of sessions removed.
+    """
+    cutoff = utc_iso(now or datetime.now(UTC))
+    cursor = await db.execute(
+        "SELECT path, filename FROM upload_sessions WHERE expires_at <= ?",
+        (cutoff,),
+    )
+    expired = await cursor.fetchall()
+    await asyncio.to_thread(
+        _remove_parts, [path for path, filename in expired if filename is None]
+    )
+    await db.execute(
+        "DELETE FROM upload_sessions WHERE expires_at <= ?", (cutoff,)
+    )
+    await db.commit()
+    return len(expired)
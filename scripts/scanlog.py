@@ -0,0 +1,539 @@
+"""Buffered, segmented binary log of NFC scan events.
+
+Scanner nodes used to append one JSON line per scan, opening and syncing
+the file every time. `ScanWriter` instead buffers events and group-commits
+them when `GROUP_COMMIT_EVENTS` are waiting or the oldest has waited
+`GROUP_COMMIT_SECONDS`. Each commit is one checksummed frame written with a
+single `write` and `fsync`.
+
+Frames go into segment files that rotate by size (`SEGMENT_BYTES`) or age
+(`SEGMENT_SECONDS`). A segment starts with a small header naming the node.
+Then come frames of `<payload length, crc32>` followed by packed records:
+
+    int64 timestamp (µs since epoch) | uint8 len | tag id | uint8 len | location
+
+That is about 10 bytes plus the two strings per scan, against 80 or so for
+the old JSON lines. A frame cut short by a crash fails its length or
+checksum, and reading stops there.
+
+`ingest_segments` copies events into the `scan_events` table, remembering
+how far it read each segment in `scan_segments`. It can be re-run at any
+time, including on the segment still being written:
+
+    python -m scripts.scanlog ingest --dir data/scans
+    python -m scripts.scanlog dump data/scans/pi-kitchen-0001745000000000000.seg
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import struct
+import time
+import zlib
+from datetime import UTC, datetime, timedelta
+from os import getenv
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+
+import aiosqlite
+
+from scripts.db import DB_PATH
+from scripts.util import HTTPStatusError
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+    from types import TracebackType
+    from typing import BinaryIO, Self
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+#: Buffered events that trigger a commit
+GROUP_COMMIT_EVENTS = int(getenv("SCAN_COMMIT_EVENTS", "256"))
+
+#: Longest time an event waits in the buffer, in seconds
+GROUP_COMMIT_SECONDS = float(getenv("SCAN_COMMIT_SECONDS", "2"))
+
+#: Size from which a new segment is started
+SEGMENT_BYTES = int(getenv("SCAN_SEGMENT_BYTES", str(1 << 20)))
+
+#: Age from which a new segment is started, in seconds
+SEGMENT_SECONDS = float(getenv("SCAN_SEGMENT_SECONDS", "3600"))
+
+SEGMENT_MAGIC = b"TSCN"
+SEGMENT_VERSION = 1
+HEADER = struct.Struct("<4sBB")  # magic, version, node id length
+FRAME = struct.Struct("<II")  # payload length, crc32
+TIMESTAMP = struct.Struct("<q")  # µs since the epoch
+
+#: Longest tag id or location stored, in UTF-8 bytes
+MAX_FIELD_BYTES = 255
+
+SAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+#: Most events accepted in one uploaded batch
+MAX_BATCH_EVENTS = int(getenv("SCAN_BATCH_MAX_EVENTS", "5000"))
+
+#: Largest uploaded batch accepted once decompressed, in bytes
+MAX_BATCH_BYTES = 4 << 20
+
+#: Longest idempotency key accepted
+MAX_KEY_LENGTH = 200
+
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+# zlib window bits accepting either a gzip or a zlib header
+GZIP_OR_ZLIB = 32 + zlib.MAX_WBITS
+
+
+class ScanBatchError(HTTPStatusError):
+    """Raised for an uploaded batch that cannot be accepted."""
+
+
+class ScanEvent(NamedTuple):
+    """One tag seen by one scanner."""
+
+    tag_id: str
+    location: str
+    timestamp: int  # µs since the epoch, UTC
+    node_id: str = ""
+
+    @property
+    def iso_timestamp(self) -> str:
+        """The scan time as an ISO 8601 UTC string."""
+        return datetime.fromtimestamp(self.timestamp / 1e6, UTC).isoformat()
+
+
+def now_us() -> int:
+    """Current time in µs since the epoch."""
+    return time.time_ns() // 1000
+
+
+def timestamp_us(value: str) -> int:
+    """Parse an ISO 8601 time, UTC unless it says otherwise, to µs."""
+    when = datetime.fromisoformat(value)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=UTC)
+    return (when - EPOCH) // timedelta(microseconds=1)
+
+
+def _field(text: str) -> bytes:
+    data = text.encode()
+    if len(data) > MAX_FIELD_BYTES:
+        data = data[:MAX_FIELD_BYTES].decode(errors="ignore").encode()
+    return bytes([len(data)]) + data
+
+
+def encode_events(events: Iterable[ScanEvent]) -> bytes:
+    """Pack events into one checksummed frame."""
+    payload = b"".join(
+        TIMESTAMP.pack(event.timestamp)
+        + _field(event.tag_id)
+        + _field(event.location)
+        for event in events
+    )
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_frame(payload: bytes, node_id: str) -> list[ScanEvent]:
+    """Unpack the records of one frame payload."""
+    events = []
+    pos = 0
+    while pos < len(payload):
+        (timestamp,) = TIMESTAMP.unpack_from(payload, pos)
+        pos += TIMESTAMP.size
+        fields = []
+        for _ in range(2):  # tag id, location
+            end = pos + 1 + payload[pos]
+            fields.append(payload[pos + 1:end].decode())
+            pos = end
+        events.append(ScanEvent(*fields, timestamp, node_id))
+    return events
+
+
+def read_segment(
+    path: Path, offset: int = 0, max_events: int | None = None
+) -> tuple[str, list[ScanEvent], int]:
+    """Read the complete frames of a segment from `offset` on.
+
+    Args:
+        path (Path): Segment file.
+        offset (int): Position of the first unread frame, as returned by an
+            earlier call; 0 reads from the start.
+        max_events (int, optional): Stop after the frame that reaches this
+            many events.
+
+    Returns:
+        tuple: Node id from the header, the events read and the offset just
+        after the last complete frame.
+
+    Raises:
+        ValueError: If the file is not a scan segment.
+    """
+    with path.open("rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return "", [], offset  # still being created
+        magic, version, node_len = HEADER.unpack(header)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            msg = f"{path} is not a version {SEGMENT_VERSION} scan segment"
+            raise ValueError(msg)
+        node_id = f.read(node_len).decode()
+        offset = max(offset, HEADER.size + node_len)
+        f.seek(offset)
+        events: list[ScanEvent] = []
+        while header := f.read(FRAME.size):
+            if len(header) < FRAME.size:
+                break
+            length, crc = FRAME.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                logger.warning(f"⚠️ Torn frame at {offset} in {path.name}")
+                break
+            events.extend(decode_frame(payload, node_id))
+            offset += FRAME.size + length
+            if max_events is not None and len(events) >= max_events:
+                break
+    return node_id, events, offset
+
+
+class ScanWriter:
+    """Group-committing writer of scan events to rotating segments.
+
+    Not thread-safe: one scanner loop owns a writer. Call `flush_if_due`
+    (or wait at most `seconds_until_flush` between calls) so that
+    time-based commits happen without a background thread.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        directory: Path,
+        node_id: str,
+        *,
+        max_events: int = GROUP_COMMIT_EVENTS,
+        max_delay: float = GROUP_COMMIT_SECONDS,
+        segment_bytes: int = SEGMENT_BYTES,
+        segment_seconds: float = SEGMENT_SECONDS,
+        fsync: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Prepare a writer; the first segment is created on first commit."""
+        self.directory = directory
+        self.node_id = node_id
+        self.max_events = max_events
+        self.max_delay = max_delay
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.fsync = fsync
+        self.clock = clock
+        self._buffer: list[ScanEvent] = []
+        self._first_at = 0.0
+        self._file: BinaryIO | None = None
+        self._opened_at = 0.0
+        self.segment: Path | None = None
+
+    def __enter__(self) -> Self:
+        """Use the writer as a context manager that flushes on exit."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        """Commit buffered events and close the segment."""
+        self.close()
+
+    def __len__(self) -> int:
+        """Number of buffered, uncommitted events."""
+        return len(self._buffer)
+
+    def append(
+        self, tag_id: str, location: str, timestamp: int | None = None
+    ) -> ScanEvent:
+        """Buffer one scan, committing if the buffer is full.
+
+        Args:
+            tag_id (str): Tag UID.
+            location (str): Where the scanner is.
+            timestamp (int, optional): µs since the epoch; defaults to now.
+
+        Returns:
+            ScanEvent: The buffered event.
+        """
+        event = ScanEvent(
+            tag_id, location, timestamp or now_us(), self.node_id
+        )
+        if not self._buffer:
+            self._first_at = self.clock()
+        self._buffer.append(event)
+        if len(self._buffer) >= self.max_events:
+            self.flush()
+        return event
+
+    def seconds_until_flush(self) -> float | None:
+        """Time left before buffered events are due, or None if empty."""
+        if not self._buffer:
+            return None
+        return max(0.0, self._first_at + self.max_delay - self.clock())
+
+    def flush_if_due(self) -> None:
+        """Commit if the oldest buffered event has waited `max_delay`."""
+        if self._buffer and self.seconds_until_flush() == 0:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write every buffered event as one frame and sync it to disk."""
+        if not self._buffer:
+            return
+        frame = encode_events(self._buffer)
+        segment = self._segment_for(len(frame))
+        segment.write(frame)
+        segment.flush()
+        if self.fsync:
+            os.fsync(segment.fileno())
+        self._buffer.clear()
+
+    def close(self) -> None:
+        """Commit buffered events and close the current segment."""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _segment_for(self, frame_size: int) -> BinaryIO:
+        """The open segment, rotated first if it is too big or too old."""
+        if self._file is not None and (
+            self._file.tell() + frame_size > self.segment_bytes
+            or self.clock() - self._opened_at >= self.segment_seconds
+        ):
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            node = SAFE_NAME_RE.sub("_", self.node_id) or "node"
+            self.segment = self.directory / f"{node}-{now_us():020d}.seg"
+            node_id = self.node_id.encode()[:MAX_FIELD_BYTES]
+            self._file = self.segment.open("xb")
+            self._file.write(
+                HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, len(node_id))
+                + node_id
+            )
+            self._opened_at = self.clock()
+        return self._file
+
+
+async def store_scan_events(
+    db: aiosqlite.Connection, events: Iterable[ScanEvent]
+) -> int:
+    """Insert scan events, ignoring ones already stored.
+
+    Returns:
+        int: Number of new rows.
+    """
+    cursor = await db.executemany(
+        "INSERT OR IGNORE INTO scan_events "
+        "(node_id, tag_id, location, timestamp) VALUES (?, ?, ?, ?)",
+        [
+            (e.node_id, e.tag_id, e.location, e.iso_timestamp)
+            for e in events
+        ],
+    )
+    return cursor.rowcount  # rows changed by triggers are not counted
+
+
+def encode_batch(node_id: str, events: Iterable[ScanEvent]) -> bytes:
+    """Gzip events into a batch body for `POST /api/scans`."""
+    body = {
+        "node_id": node_id,
+        "events": [
+            {
+                "tag_id": e.tag_id,
+                "location": e.location,
+                "timestamp": e.iso_timestamp,
+            }
+            for e in events
+        ],
+    }
+    return gzip.compress(json.dumps(body, separators=(",", ":")).encode())
+
+
+def _inflate(body: bytes, encoding: str) -> bytes:
+    if encoding in {"", "identity"}:
+        data = body
+    elif encoding in {"gzip", "deflate"}:
+        inflater = zlib.decompressobj(GZIP_OR_ZLIB)
+        try:
+            data = inflater.decompress(body, MAX_BATCH_BYTES + 1)
+        except zlib.error as e:
+            msg = f"Body is not valid {encoding} data"
+            raise ScanBatchError(msg) from e
+    else:
+        msg = f"Unsupported Content-Encoding {encoding!r}"
+        raise ScanBatchError(msg, 415)
+    if len(data) > MAX_BATCH_BYTES:
+        msg = f"Batch is larger than {MAX_BATCH_BYTES} bytes"
+        raise ScanBatchError(msg, 413)
+    return data
+
+
+def decode_batch(
+    body: bytes, encoding: str = ""
+) -> tuple[str, list[ScanEvent]]:
+    """Decode a batch uploaded by a scanner node.
+
+    The body is JSON, optionally gzip or deflate compressed::
+
+        {"node_id": "pi-kitchen", "events": [
+            {"tag_id": "04A1B2", "location": "pantry",
+             "timestamp": "2025-04-01T12:00:00.250000+00:00"}]}
+
+    Args:
+        body (bytes): Request body.
+        encoding (str): Its `Content-Encoding`.
+
+    Returns:
+        tuple: Node id and events.
+
+    Raises:
+        ScanBatchError: If the batch is malformed, too large or uses an
+            unknown encoding; `status_code` says which.
+    """
+    data = _inflate(body, encoding.strip().lower())
+    try:
+        batch = json.loads(data)
+        node_id = batch["node_id"]
+        events = [
+            ScanEvent(
+                str(item["tag_id"]),
+                str(item.get("location") or "unknown"),
+                timestamp_us(item["timestamp"]),
+                node_id,
+            )
+            for item in batch["events"]
+        ]
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        msg = f"Malformed scan batch: {e!r}"
+        raise ScanBatchError(msg) from e
+    if not isinstance(node_id, str) or not node_id.strip():
+        msg = "node_id must be a non-empty string"
+        raise ScanBatchError(msg)
+    if len(events) > MAX_BATCH_EVENTS:
+        msg = f"Batch has more than {MAX_BATCH_EVENTS} events"
+        raise ScanBatchError(msg, 413)
+    return node_id, events
+
+
+async def store_scan_batch(
+    db: aiosqlite.Connection,
+    key: str,
+    node_id: str,
+    events: list[ScanEvent],
+) -> dict:
+    """Store an uploaded batch at most once per idempotency key.
+
+    The events and the key are written in one transaction, so a retried
+    upload either finds the key and changes nothing, or finds neither.
+
+    Returns:
+        dict: Key, events received and added, and whether the key had
+        been seen before (the stored counts are then returned).
+    """
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = await db.execute(
+            "SELECT received, added FROM scan_batches WHERE key = ?", (key,)
+        )
+        seen = await cursor.fetchone()
+        if seen is None:
+            added = await store_scan_events(db, events)
+            await db.execute(
+                "INSERT INTO scan_batches "
+                "(key, node_id, received, added, received_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, node_id, len(events), added,
+                 datetime.now(UTC).isoformat()),
+            )
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    received, added = seen or (len(events), added)
+    return {
+        "key": key,
+        "received": received,
+        "added": added,
+        "duplicate": seen is not None,
+    }
+
+
+async def ingest_segments(
+    directory: Path, db_path: Path | str = DB_PATH
+) -> int:
+    """Copy new events from every segment in `directory` into the database.
+
+    Args:
+        directory (Path): Directory of `.seg` files, possibly from several
+            nodes.
+        db_path (Path | str): Database holding `scan_events`.
+
+    Returns:
+        int: Number of events added.
+    """
+    added = 0
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute("SELECT name, offset FROM scan_segments")
+        offsets = dict(await cursor.fetchall())
+        segments = await asyncio.to_thread(
+            lambda: sorted(directory.glob("*.seg"))
+        )
+        for path in segments:
+            start = offsets.get(path.name, 0)
+            _, events, end = await asyncio.to_thread(
+                read_segment, path, start
+            )
+            if end == start:
+                continue
+            added += await store_scan_events(db, events)
+            await db.execute(
+                "INSERT OR REPLACE INTO scan_segments (name, offset) "
+                "VALUES (?, ?)",
+                (path.name, end),
+            )
+            await db.commit()  # one transaction per segment
+    return added
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point to ingest or inspect segments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="load segments into the DB")
+    ingest.add_argument("--dir", type=Path, default=Path("data/scans"))
+    dump = commands.add_parser("dump", help="print the events of a segment")
+    dump.add_argument("segment", type=Path)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "ingest":
+        added = asyncio.run(ingest_segments(args.dir, args.db))
+        logger.info(f"📡 Ingested {added} scan events")
+        return
+    _, events, _ = read_segment(args.segment)
+    for event in events:
+        print(  # noqa: T201
+            f"{event.iso_timestamp}\t{event.node_id}\t{event.location}\t"
+            f"{event.tag_id}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,10 @@ CREATE TABLE IF NOT EXISTS images (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     filename TEXT UNIQUE,
     label TEXT,
-    timestamp TEXT
+    timestamp TEXT,
+    thumb_formats TEXT,
+    placeholder TEXT,
+    thumb_widths TEXT
 );
 
 CREATE TABLE IF NOT EXISTS tags (
@@ -17,3 +20,345 @@ CREATE TABLE IF NOT EXISTS image_tags (
     FOREIGN KEY(image_id) REFERENCES images(id),
     FOREIGN KEY(tag_id) REFERENCES tags(id)
 );
+
+CREATE INDEX IF NOT EXISTS idx_image_tags_image
+    ON image_tags (image_id, tag_id);
+
+CREATE INDEX IF NOT EXISTS idx_image_tags_tag ON image_tags (tag_id);
+
+CREATE INDEX IF NOT EXISTS idx_images_timestamp ON images (timestamp);
+
+CREATE TABLE IF NOT EXISTS tag_aliases (
+    alias TEXT PRIMARY KEY,
+    canonical TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS objects (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    image_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 1,
+    color TEXT,
+    brand TEXT,
+    attributes TEXT,
+    confidence REAL,
+    FOREIGN KEY(image_id) REFERENCES images(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_objects_image ON objects (image_id);
+
+CREATE INDEX IF NOT EXISTS idx_objects_name ON objects (name, quantity);
+
+-- Per-object totals kept current by the triggers below, so inventory
+-- counts are a primary key lookup instead of an aggregate over `objects`
+CREATE TABLE IF NOT EXISTS object_rollup (
+    name TEXT PRIMARY KEY,
+    quantity INTEGER NOT NULL,
+    entries INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS objects_rollup_insert AFTER INSERT ON objects
+BEGIN
+    INSERT INTO object_rollup (name, quantity, entries)
+    VALUES (NEW.name, NEW.quantity, 1)
+    ON CONFLICT (name) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        entries = entries + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS objects_rollup_delete AFTER DELETE ON objects
+BEGIN
+    UPDATE object_rollup
+    SET quantity = quantity - OLD.quantity, entries = entries - 1
+    WHERE name = OLD.name;
+    DELETE FROM object_rollup WHERE name = OLD.name AND entries <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS objects_rollup_update
+AFTER UPDATE OF name, quantity ON objects
+BEGIN
+    UPDATE object_rollup
+    SET quantity = quantity - OLD.quantity, entries = entries - 1
+    WHERE name = OLD.name;
+    DELETE FROM object_rollup WHERE name = OLD.name AND entries <= 0;
+    INSERT INTO object_rollup (name, quantity, entries)
+    VALUES (NEW.name, NEW.quantity, 1)
+    ON CONFLICT (name) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        entries = entries + 1;
+END;
+
+-- Objects stored before the rollup existed
+INSERT INTO object_rollup (name, quantity, entries)
+SELECT name, SUM(quantity), COUNT(*) FROM objects
+WHERE NOT EXISTS (SELECT 1 FROM object_rollup)
+GROUP BY name;
+
+CREATE TABLE IF NOT EXISTS scan_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id TEXT NOT NULL,
+    tag_id TEXT NOT NULL,
+    location TEXT,
+    timestamp TEXT NOT NULL
+);
+
+-- Also makes re-ingesting a segment or retrying an upload a no-op
+CREATE UNIQUE INDEX IF NOT EXISTS idx_scan_events_node_time
+    ON scan_events (node_id, timestamp, tag_id);
+
+CREATE INDEX IF NOT EXISTS idx_scan_events_tag
+    ON scan_events (tag_id, timestamp);
+
+CREATE INDEX IF NOT EXISTS idx_scan_events_location
+    ON scan_events (location, timestamp);
+
+-- How far `scripts.scanlog.ingest_segments` has read each segment file
+CREATE TABLE IF NOT EXISTS scan_segments (
+    name TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+
+-- Idempotency keys of batches uploaded to /api/scans
+CREATE TABLE IF NOT EXISTS scan_batches (
+    key TEXT PRIMARY KEY,
+    node_id TEXT NOT NULL,
+    received INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    received_at TEXT NOT NULL
+);
+
+-- Latest zone of every tag, kept current by the trigger below, so "where
+-- is it" and "what is in this zone" never scan `scan_events`
+CREATE TABLE IF NOT EXISTS current_location (
+    tag_id TEXT PRIMARY KEY,
+    location TEXT,
+    node_id TEXT NOT NULL,
+    since TEXT NOT NULL,  -- first scan of the current stay in `location`
+    last_seen TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_current_location_zone
+    ON current_location (location, last_seen);
+
+-- Where each tag was, one row per tag, time bucket and zone. Buckets are
+-- hours (span 3600) until `scripts.locations` folds old ones into days.
+CREATE TABLE IF NOT EXISTS location_history (
+    tag_id TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    span INTEGER NOT NULL,
+    location TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    scans INTEGER NOT NULL,
+    PRIMARY KEY (tag_id, bucket, span, location)
+);
+
+CREATE TRIGGER IF NOT EXISTS scan_events_locate AFTER INSERT ON scan_events
+BEGIN
+    -- Late events (older than the last sighting) only reach the history
+    INSERT INTO current_location (tag_id, location, node_id, since, last_seen)
+    VALUES (
+        NEW.tag_id, NEW.location, NEW.node_id, NEW.timestamp, NEW.timestamp
+    )
+    ON CONFLICT (tag_id) DO UPDATE SET
+        since = CASE
+            WHEN location IS excluded.location THEN since
+            ELSE excluded.since
+        END,
+        location = excluded.location,
+        node_id = excluded.node_id,
+        last_seen = excluded.last_seen
+    WHERE excluded.last_seen >= last_seen;
+    INSERT INTO location_history
+        (tag_id, bucket, span, location, first_seen, last_seen, scans)
+    VALUES (
+        NEW.tag_id, substr(NEW.timestamp, 1, 13) || ':00:00+00:00', 3600,
+        NEW.location, NEW.timestamp, NEW.timestamp, 1
+    )
+    ON CONFLICT (tag_id, bucket, span, location) DO UPDATE SET
+        first_seen = min(first_seen, excluded.first_seen),
+        last_seen = max(last_seen, excluded.last_seen),
+        scans = scans + 1;
+END;
+
+-- Scans stored before the location tables existed
+INSERT INTO current_location (tag_id, location, node_id, since, last_seen)
+SELECT e.tag_id, e.location, e.node_id,
+    (
+        SELECT MIN(s.timestamp) FROM scan_events s
+        WHERE s.tag_id = e.tag_id AND s.timestamp > coalesce((
+            SELECT MAX(o.timestamp) FROM scan_events o
+            WHERE o.tag_id = e.tag_id AND o.location IS NOT e.location
+        ), '')
+    ),
+    e.timestamp
+FROM scan_events e
+WHERE NOT EXISTS (SELECT 1 FROM current_location)
+    AND e.timestamp = (
+        SELECT MAX(timestamp) FROM scan_events WHERE tag_id = e.tag_id
+    )
+ON CONFLICT (tag_id) DO NOTHING;
+
+INSERT INTO location_history
+    (tag_id, bucket, span, location, first_seen, last_seen, scans)
+SELECT tag_id, substr(timestamp, 1, 13) || ':00:00+00:00', 3600, location,
+    MIN(timestamp), MAX(timestamp), COUNT(*)
+FROM scan_events
+WHERE NOT EXISTS (SELECT 1 FROM location_history)
+GROUP BY tag_id, substr(timestamp, 1, 13), location;
+
+
+-- Where a tagged item belongs, for "return to order" reminders
+CREATE TABLE IF NOT EXISTS tag_homes (
+    tag_id TEXT PRIMARY KEY,
+    home TEXT NOT NULL,
+    label TEXT,  -- what the tag is stuck on, for reminder text
+    grace_hours REAL NOT NULL DEFAULT 72
+);
+
+-- Tags away from home, by when a reminder is due. Kept by the triggers
+-- below; `scripts.drift` only ever reads the earliest rows.
+CREATE TABLE IF NOT EXISTS drift_watch (
+    tag_id TEXT PRIMARY KEY,
+    away_since TEXT NOT NULL,
+    due_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_drift_watch_due ON drift_watch (due_at);
+
+CREATE TABLE IF NOT EXISTS reminders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tag_id TEXT NOT NULL,
+    location TEXT,
+    home TEXT NOT NULL,
+    away_since TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    resolved_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_reminders_created ON reminders (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_reminders_open
+    ON reminders (tag_id) WHERE resolved_at IS NULL;
+
+CREATE TRIGGER IF NOT EXISTS current_location_drift_insert
+AFTER INSERT ON current_location
+BEGIN
+    INSERT INTO drift_watch (tag_id, away_since, due_at)
+    SELECT NEW.tag_id, NEW.since, strftime(
+        '%Y-%m-%dT%H:%M:%S+00:00', NEW.since, '+' || grace_hours || ' hours'
+    )
+    FROM tag_homes WHERE tag_id = NEW.tag_id AND home IS NOT NEW.location
+    ON CONFLICT (tag_id) DO NOTHING;
+END;
+
+CREATE TRIGGER IF NOT EXISTS current_location_drift_move
+AFTER UPDATE OF location ON current_location
+WHEN OLD.location IS NOT NEW.location
+BEGIN
+    -- Back home: nothing to remind about any more
+    DELETE FROM drift_watch WHERE tag_id = NEW.tag_id AND NEW.location IS (
+        SELECT home FROM tag_homes WHERE tag_id = NEW.tag_id
+    );
+    UPDATE reminders SET resolved_at = NEW.last_seen
+    WHERE tag_id = NEW.tag_id AND resolved_at IS NULL AND NEW.location IS (
+        SELECT home FROM tag_homes WHERE tag_id = NEW.tag_id
+    );
+    -- Left home: the clock starts (moving between other zones keeps it)
+    INSERT INTO drift_watch (tag_id, away_since, due_at)
+    SELECT NEW.tag_id, NEW.since, strftime(
+        '%Y-%m-%dT%H:%M:%S+00:00', NEW.since, '+' || grace_hours || ' hours'
+    )
+    FROM tag_homes WHERE tag_id = NEW.tag_id AND home IS NOT NEW.location
+    ON CONFLICT (tag_id) DO NOTHING;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tag_homes_drift_insert AFTER INSERT ON tag_homes
+BEGIN
+    INSERT INTO drift_watch (tag_id, away_since, due_at)
+    SELECT tag_id, since, strftime(
+        '%Y-%m-%dT%H:%M:%S+00:00', since, '+' || NEW.grace_hours || ' hours'
+    )
+    FROM current_location
+    WHERE tag_id = NEW.tag_id AND location IS NOT NEW.home
+    ON CONFLICT (tag_id) DO NOTHING;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tag_homes_drift_update
+AFTER UPDATE OF home, grace_hours ON tag_homes
+BEGIN
+    DELETE FROM drift_watch WHERE tag_id = NEW.tag_id;
+    UPDATE reminders SET resolved_at = strftime('%Y-%m-%dT%H:%M:%S+00:00')
+    WHERE tag_id = NEW.tag_id AND resolved_at IS NULL;
+    INSERT INTO drift_watch (tag_id, away_since, due_at)
+    SELECT tag_id, since, strftime(
+        '%Y-%m-%dT%H:%M:%S+00:00', since, '+' || NEW.grace_hours || ' hours'
+    )
+    FROM current_location
+    WHERE tag_id = NEW.tag_id AND location IS NOT NEW.home
+    ON CONFLICT (tag_id) DO NOTHING;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tag_homes_drift_delete AFTER DELETE ON tag_homes
+BEGIN
+    DELETE FROM drift_watch WHERE tag_id = OLD.tag_id;
+    UPDATE reminders SET resolved_at = strftime('%Y-%m-%dT%H:%M:%S+00:00')
+    WHERE tag_id = OLD.tag_id AND resolved_at IS NULL;
+END;
+
+-- Bulk uploads (`scripts.bulk`): one row per batch and per file in it
+CREATE TABLE IF NOT EXISTS upload_batches (
+    id TEXT PRIMARY KEY,
+    label TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS batch_files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL REFERENCES upload_batches(id),
+    name TEXT NOT NULL,  -- as sent, or the path inside an archive
+    filename TEXT,  -- stored upload, or the earlier one for a duplicate
+    sha256 TEXT,
+    status TEXT NOT NULL,  -- queued, done, failed, duplicate or skipped
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_batch_files_batch
+    ON batch_files (batch_id, status);
+
+-- Content hash of every bulk-uploaded file, to skip sending one twice
+CREATE TABLE IF NOT EXISTS upload_hashes (
+    sha256 TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+-- Resumable uploads (`scripts.resumable`), deleted once `expires_at` passes
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,  -- filename given by the client
+    label TEXT NOT NULL DEFAULT '',
+    length INTEGER NOT NULL,
+    offset INTEGER NOT NULL DEFAULT 0,
+    path TEXT NOT NULL,  -- partial file
+    created_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    filename TEXT  -- stored upload, set when complete
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_expiry
+    ON upload_sessions (expires_at);
+
+-- Uploads sent by the client straight to GCS through a signed URL
+-- (`scripts.signed`); `finalized_at` is set once the object is queued
+CREATE TABLE IF NOT EXISTS direct_uploads (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    label TEXT NOT NULL DEFAULT '',
+    content_type TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    finalized_at TEXT,
+    size INTEGER
+);
@@ -0,0 +1,283 @@
+"""Signed GCS URLs, so photo bytes travel between the client and the bucket.
+
+Direct uploads skip the app server for the original: `POST
+/api/direct-uploads` reserves an upload filename and returns a short-lived
+V4 signed `PUT` URL for `upload/<filename>`. The client sends the photo
+there with the signed `Content-Type`, then calls `POST
+/api/direct-uploads/{id}/finalize`; the app checks that the object
+arrived and queues it, and the worker downloads it from the bucket
+instead of receiving it twice.
+
+With `GCS_SERVE_MODE=redirect`, logged-in requests under `/uploads/` get a
+302 to a signed `GET` URL instead of having the object streamed through
+the app. Each path's URL is reused until `SIGNED_URL_REFRESH_SECONDS`
+before it expires, so browsers can keep caching both the redirect and
+the image it points to.
+
+URLs are signed locally with the service account key; no IAM call is
+made. With `STORAGE_EMULATOR_HOST` set, URLs and API calls go to that
+server instead of GCS, e.g. the fake bucket in `scripts.fakegcs`.
+"""
+
+from __future__ import annotations
+
+import functools
+import secrets
+import time
+from datetime import UTC, datetime, timedelta
+from os import getenv
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING
+
+from scripts.metrics import record_cache
+from scripts.util import HTTPStatusError, lazy_import, utc_iso
+
+if TYPE_CHECKING:
+    import aiosqlite
+
+storage = lazy_import("google.cloud.storage")
+service_account = lazy_import("google.oauth2.service_account")
+auth_credentials = lazy_import("google.auth.credentials")
+
+#: Key of the service account that signs URLs
+SERVICE_ACCOUNT_KEY = Path(
+    getenv("GCS_SERVICE_ACCOUNT_KEY", "/app/service-account-key.json")
+)
+
+#: Fake bucket server to use instead of GCS, e.g. `http://127.0.0.1:4443`
+EMULATOR_HOST = getenv("STORAGE_EMULATOR_HOST")
+
+GCS_ENDPOINT = "https://storage.googleapis.com"
+
+#: How long a direct-upload URL stays valid
+UPLOAD_URL_SECONDS = int(getenv("DIRECT_UPLOAD_URL_SECONDS", "900"))
+
+#: How `/uploads/...` serves objects: `proxy` streams them through the app,
+#: `redirect` answers with a signed URL
+SERVE_MODE = getenv("GCS_SERVE_MODE", "proxy").strip().lower()
+
+#: How long a signed URL for reading stays valid
+READ_URL_SECONDS = int(getenv("SIGNED_URL_SECONDS", "3600"))
+
+#: A cached read URL is signed again once it has less than this left
+REFRESH_SECONDS = int(getenv("SIGNED_URL_REFRESH_SECONDS", "300"))
+
+#: Most read URLs kept in memory
+MAX_READ_URLS = 8192
+
+# (bucket, object) -> (expiry as a Unix time, signed URL)
+_read_urls: dict[tuple[str, str], tuple[float, str]] = {}
+
+DIRECT_COLUMNS = (
+    "id", "filename", "label", "content_type", "created_at", "expires_at",
+    "finalized_at", "size",
+)
+
+
+class SignedUrlError(HTTPStatusError):
+    """Raised for a signed-URL request that cannot be served."""
+
+
+@functools.cache
+def signing_client() -> object:
+    """Client whose service account credentials sign URLs locally.
+
+    Raises:
+        SignedUrlError: 503 if there is no service account key.
+    """
+    if not SERVICE_ACCOUNT_KEY.exists():
+        msg = "Signed URLs need a service account key"
+        raise SignedUrlError(msg, 503)
+    credentials = service_account.Credentials.from_service_account_file(
+        str(SERVICE_ACCOUNT_KEY)
+    )
+    return storage.Client(
+        project=credentials.project_id, credentials=credentials
+    )
+
+
+def storage_client() -> object:
+    """GCS client for the emulator, the service account key or ADC."""
+    if EMULATOR_HOST:
+        return storage.Client(
+            project="local",
+            credentials=auth_credentials.AnonymousCredentials(),
+            client_options={"api_endpoint": EMULATOR_HOST},
+        )
+    if SERVICE_ACCOUNT_KEY.exists():
+        return storage.Client.from_service_account_json(
+            str(SERVICE_ACCOUNT_KEY)
+        )
+    return storage.Client()  # ADC fallback
+
+
+def sign_url(
+    bucket: str,
+    blob_name: str,
+    method: str = "GET",
+    *,
+    seconds: int,
+    content_type: str | None = None,
+) -> str:
+    """V4 signed URL for one object; a `content_type` must then be sent.
+
+    Raises:
+        SignedUrlError: 503 if there is no service account key.
+    """
+    blob = signing_client().bucket(bucket).blob(blob_name)
+    return blob.generate_signed_url(
+        version="v4",
+        expiration=timedelta(seconds=seconds),
+        method=method,
+        content_type=content_type,
+        api_access_endpoint=EMULATOR_HOST or GCS_ENDPOINT,
+    )
+
+
+def read_url(
+    bucket: str, blob_name: str, *, now: float | None = None
+) -> tuple[str, int]:
+    """Signed `GET` URL for an object, reused until it is close to expiry.
+
+    Returns:
+        tuple: The URL and the seconds it may be cached for.
+
+    Raises:
+        SignedUrlError: 503 if there is no service account key.
+    """
+    now = time.time() if now is None else now
+    key = (bucket, blob_name)
+    cached = _read_urls.get(key)
+    hit = cached is not None and cached[0] - now > REFRESH_SECONDS
+    record_cache("signed_url", hit=hit)
+    if not hit:
+        url = sign_url(bucket, blob_name, seconds=READ_URL_SECONDS)
+        _read_urls.pop(key, None)
+        if len(_read_urls) >= MAX_READ_URLS:
+            _drop_read_urls(now)
+        cached = _read_urls[key] = (now + READ_URL_SECONDS, url)
+    return cached[1], int(cached[0] - now - REFRESH_SECONDS)
+
+
+def _drop_read_urls(now: float) -> None:
+    """Forget stale URLs, then the oldest ones, to make room for one more."""
+    for key, (expires, _) in list(_read_urls.items()):
+        if expires - now <= REFRESH_SECONDS:
+            del _read_urls[key]
+    while len(_read_urls) >= MAX_READ_URLS:
+        del _read_urls[next(iter(_read_urls))]
+
+
+async def create_direct_upload(  # noqa: PLR0913
+    db: aiosqlite.Connection,
+    name: str,
+    content_type: str,
+    *,
+    bucket: str,
+    prefix: str,
+    label: str = "",
+    now: datetime | None = None,
+) -> dict:
+    """Reserve an upload filename and sign a `PUT` URL for it.
+
+    Raises:
+        SignedUrlError: For a missing name, a type other than an image,
+            or 503 without a service account key.
+    """
+    base = PurePosixPath(name.replace("\\", "/")).name
+    if not base:
+        msg = "A filename is required"
+        raise SignedUrlError(msg)
+    if not content_type.startswith("image/"):
+        msg = "Only images can be uploaded"
+        raise SignedUrlError(msg, 415)
+    now = now or datetime.now(UTC)
+    stamp = utc_iso(now).replace(":", "-")
+    filename = f"{stamp}_{base}"
+    n = 1
+    while await (await db.execute(
+        "SELECT 1 FROM direct_uploads WHERE filename = ?", (filename,)
+    )).fetchone():
+        n += 1
+        filename = f"{stamp}_{Path(base).stem}-{n}{Path(base).suffix}"
+
+    upload_url = sign_url(
+        bucket,
+        f"{prefix}/{filename}",
+        "PUT",
+        seconds=UPLOAD_URL_SECONDS,
+        content_type=content_type,
+    )
+    upload = {
+        "id": secrets.token_hex(16),
+        "filename": filename,
+        "label": label,
+        "content_type": content_type,
+        "created_at": utc_iso(now),
+        "expires_at": utc_iso(now + timedelta(seconds=UPLOAD_URL_SECONDS)),
+        "finalized_at": None,
+        "size": None,
+    }
+    await db.execute(
+        f"INSERT INTO direct_uploads ({', '.join(DIRECT_COLUMNS)}) "  # nosec B608  # noqa: S608
+        f"VALUES ({', '.join('?' * len(DIRECT_COLUMNS))})",
+        [upload[c] for c in DIRECT_COLUMNS],
+    )
+    await db.commit()
+    return upload | {
+        "upload_url": upload_url,
+        "method": "PUT",
+        "headers": {"Content-Type": content_type},
+    }
+
+
+async def get_direct_upload(db: aiosqlite.Connection, upload_id: str) -> dict:
+    """A reserved direct upload.
+
+    Raises:
+        SignedUrlError: 404 if unknown.
+    """
+    cursor = await db.execute(
+        f"SELECT {', '.join(DIRECT_COLUMNS)} FROM direct_uploads "  # nosec B608  # noqa: S608
+        "WHERE id = ?",
+        (upload_id,),
+    )
+    row = await cursor.fetchone()
+    if row is None:
+        msg = "Unknown upload"
+        raise SignedUrlError(msg, 404)
+    return dict(zip(DIRECT_COLUMNS, row, strict=True))
+
+
+async def finalize_direct_upload(
+    db: aiosqlite.Connection,
+    upload_id: str,
+    size: int,
+    *,
+    now: datetime | None = None,
+) -> bool:
+    """Mark an upload as received, once.
+
+    Returns:
+        bool: False if it was already finalized.
+    """
+    cursor = await db.execute(
+        "UPDATE direct_uploads SET finalized_at = ?, size = ? "
+        "WHERE id = ? AND finalized_at IS NULL",
+        (utc_iso(now or datetime.now(UTC)), size, upload_id),
+    )
+    await db.commit()
+    return cursor.rowcount > 0
+
+
+def object_size(bucket: str, blob_name: str) -> int | None:
+    """Size of an object in the bucket, or None if it does not exist."""
+    blob = storage_client().bucket(bucket).get_blob(blob_name)
+    return None if blob is None else blob.size
+
+
+def download_object(bucket: str, blob_name: str, path: Path) -> int:
+    """Copy an object to a local file and return its size."""
+    blob = storage_client().bucket(bucket).blob(blob_name)
+    blob.download_to_filename(str(path))
+    return Path(path).stat().st_size
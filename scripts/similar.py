@@ -0,0 +1,536 @@
+"""Image similarity search for "do I already have one?".
+
+Every ingested photo gets a small embedding computed locally on the CPU
+with Pillow and NumPy. No model download or API call is needed. The vector
+concatenates a color histogram, a coarse grayscale and color layout, and a
+grid of edge-orientation histograms, each L2-normalized. The dot product
+of two embeddings is therefore their cosine similarity. Re-encoded,
+resized or lightly cropped copies of a photo score close to 1. Shots of
+similar-looking objects rank above unrelated ones.
+
+Embeddings live in one contiguous float32 matrix on disk
+(`EMBEDDING_DIR/vectors.f32`, one row per image, rows listed in
+`filenames.txt`) that is memory-mapped for search, so the collection does
+not need to fit in the Python heap and a restart costs no rebuild. Queries
+are batched matrix-vector products over chunks of the mapped matrix. Once
+the collection passes `IVF_MIN_ROWS` an inverted-file index, trained in a
+background thread, clusters the rows with spherical k-means. Queries then
+only score the closest `IVF_PROBES` clusters plus rows added since
+training:
+
+    python -m scripts.similar index            # embed existing uploads
+    python -m scripts.similar query photo.jpg -k 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import logging
+import math
+import threading
+import time
+from os import getenv
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import aiosqlite
+
+from scripts.db import DB_PATH
+from scripts.util import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import("numpy")
+
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+#: Directory holding the embedding matrix and its row -> filename list
+EMBEDDING_DIR = Path(getenv("EMBEDDING_DIR", "uploads/embeddings"))
+
+#: Side of the square the image is reduced to before feature extraction
+WORK_SIZE = 64
+
+#: Hue, saturation and value bins of the color histogram
+HSV_BINS = (8, 3, 3)
+
+#: Cells per side and orientation bins of the edge histogram grid
+EDGE_CELLS = 4
+EDGE_BINS = 8
+
+#: Relative weight of each feature block in the final vector
+FEATURE_WEIGHTS = {"color": 1.0, "layout": 1.0, "tint": 0.5, "edges": 1.0}
+
+#: Length of an embedding vector
+EMBEDDING_DIM = (
+    math.prod(HSV_BINS) + 8 * 8 + 4 * 4 * 3 + EDGE_CELLS**2 * EDGE_BINS
+)
+
+#: Similarity from which a match is reported as a near-duplicate
+DUPLICATE_SCORE = float(getenv("DUPLICATE_SCORE", "0.95"))
+
+#: Rows scored per matrix product, bounding temporary memory
+CHUNK_ROWS = 65536
+
+#: Collection size from which queries go through the IVF index
+IVF_MIN_ROWS = int(getenv("IVF_MIN_ROWS", "50000"))
+
+#: Number of IVF clusters searched per query
+IVF_PROBES = int(getenv("IVF_PROBES", "10"))
+
+#: k-means iterations when training the IVF index
+IVF_ITERATIONS = 10
+
+#: Largest query image `/api/similar` accepts
+MAX_QUERY_BYTES = int(getenv("SIMILAR_MAX_MB", "25")) * 2**20
+
+#: Seconds to wait after a failed IVF training run before trying again
+IVF_RETRY_SECONDS = float(getenv("IVF_RETRY_SECONDS", "600"))
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def embed_image(source: Path | str | bytes) -> np.ndarray:
+    """Compute the embedding of an image file or encoded image bytes.
+
+    Args:
+        source (Path | str | bytes): Path to the image, or its contents.
+
+    Returns:
+        np.ndarray: Unit-length float32 vector of `EMBEDDING_DIM` values.
+
+    Raises:
+        PIL.UnidentifiedImageError: If the data is not a readable image.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        image.draft("RGB", (WORK_SIZE * 4, WORK_SIZE * 4))
+        rgb = ImageOps.exif_transpose(image).convert("RGB")
+    small = rgb.resize((WORK_SIZE, WORK_SIZE), Image.Resampling.BOX)
+
+    hsv = np.asarray(small.convert("HSV"), dtype=np.int64).reshape(-1, 3)
+    h_bins, s_bins, v_bins = HSV_BINS
+    bins = (
+        (hsv[:, 0] * h_bins // 256) * s_bins * v_bins
+        + (hsv[:, 1] * s_bins // 256) * v_bins
+        + hsv[:, 2] * v_bins // 256
+    )
+    color = np.sqrt(np.bincount(bins, minlength=math.prod(HSV_BINS)))
+
+    gray = np.asarray(small.convert("L"), dtype=np.float32)
+    layout = np.asarray(
+        small.convert("L").resize((8, 8), Image.Resampling.BOX),
+        dtype=np.float32,
+    ).ravel()
+    tint = np.asarray(
+        small.resize((4, 4), Image.Resampling.BOX), dtype=np.float32
+    ).ravel()
+
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    orientation = (np.arctan2(gy, gx) % np.pi) * (EDGE_BINS / np.pi)
+    cell = np.arange(WORK_SIZE) * EDGE_CELLS // WORK_SIZE
+    slot = (
+        (cell[:, None] * EDGE_CELLS + cell[None, :]) * EDGE_BINS
+        + orientation.astype(np.int64) % EDGE_BINS
+    )
+    edges = np.bincount(
+        slot.ravel(),
+        weights=np.hypot(gx, gy).ravel(),
+        minlength=EDGE_CELLS**2 * EDGE_BINS,
+    )
+
+    blocks = {
+        "color": color,
+        "layout": layout - layout.mean(),
+        "tint": tint - tint.mean(),
+        "edges": edges,
+    }
+    vector = np.concatenate([
+        _unit(np.asarray(block, dtype=np.float32)) * FEATURE_WEIGHTS[name]
+        for name, block in blocks.items()
+    ])
+    return _unit(vector).astype(np.float32)
+
+
+def _top_k(
+    scores: np.ndarray, rows: np.ndarray, k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """The `k` best `(scores, rows)`, best first."""
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+        scores, rows = scores[best], rows[best]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], rows[order]
+
+
+class IVFIndex:
+    """Inverted-file index: rows grouped by their nearest k-means centroid."""
+
+    def __init__(
+        self, centroids: np.ndarray, rows: np.ndarray, offsets: np.ndarray
+    ) -> None:
+        """Wrap trained centroids and the rows of each cluster.
+
+        Args:
+            centroids (np.ndarray): `(clusters, dim)` unit vectors.
+            rows (np.ndarray): Row numbers sorted by cluster.
+            offsets (np.ndarray): Start of each cluster in `rows`, plus the
+                end of the last one.
+        """
+        self.centroids = centroids
+        self.rows = rows
+        self.offsets = offsets
+
+    @property
+    def trained_rows(self) -> int:
+        """Number of matrix rows covered by the index."""
+        return len(self.rows)
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, seed: int = 0) -> IVFIndex:
+        """Cluster the rows of `matrix` with spherical k-means."""
+        count = len(matrix)
+        clusters = max(1, min(4096, math.isqrt(count)))
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, 64 * clusters)
+        sample = np.asarray(
+            matrix[np.sort(rng.choice(count, sample_size, replace=False))]
+        )
+        centroids = sample[rng.choice(sample_size, clusters, replace=False)]
+        for _ in range(IVF_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            used, starts = np.unique(assignment[order], return_index=True)
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            # Clusters that lost every member keep their old centroid
+            centroids[used] = sums / np.linalg.norm(
+                sums, axis=1, keepdims=True
+            ).clip(min=1e-12)
+        assignment = np.concatenate([
+            np.argmax(matrix[start:start + CHUNK_ROWS] @ centroids.T, axis=1)
+            for start in range(0, count, CHUNK_ROWS)
+        ])
+        rows = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(
+            assignment[rows], np.arange(clusters + 1)
+        )
+        return cls(centroids.astype(np.float32), rows, offsets)
+
+    def candidates(self, query: np.ndarray, probes: int) -> np.ndarray:
+        """Rows in the `probes` clusters closest to `query`, sorted."""
+        probes = min(probes, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), probes - 1)
+        return np.sort(np.concatenate([
+            self.rows[self.offsets[c]:self.offsets[c + 1]]
+            for c in nearest[:probes]
+        ]))
+
+    def save(self, path: Path) -> None:
+        """Write the index next to the matrix it was trained on."""
+        with path.open("wb") as f:
+            np.savez(
+                f, centroids=self.centroids, rows=self.rows,
+                offsets=self.offsets,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> IVFIndex:
+        """Read an index written by `save`."""
+        with np.load(path) as data:
+            return cls(data["centroids"], data["rows"], data["offsets"])
+
+
+class EmbeddingStore:
+    """Append-only, memory-mapped matrix of image embeddings.
+
+    Re-adding a filename appends a new row that replaces the old one;
+    replaced rows stay in the file but are masked out of results.
+    """
+
+    def __init__(self, directory: Path = EMBEDDING_DIR) -> None:
+        """Open (or prepare to create) the store in `directory`."""
+        self.directory = directory
+        self.vectors_path = directory / "vectors.f32"
+        self.names_path = directory / "filenames.txt"
+        self.ivf_path = directory / "ivf.npz"
+        self._names: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._matrix: np.ndarray | None = None
+        self._live = np.zeros(0, dtype=bool)
+        self._ivf: IVFIndex | None = None
+        self._training: threading.Thread | None = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        """Number of images with an embedding."""
+        return len(self._rows)
+
+    def __contains__(self, filename: object) -> bool:
+        """Whether `filename` has an embedding."""
+        return filename in self._rows
+
+    def _load(self) -> None:
+        names = []
+        if self.names_path.exists():
+            names = self.names_path.read_text().splitlines()
+        size = (
+            self.vectors_path.stat().st_size
+            if self.vectors_path.exists() else 0
+        )
+        # A crash between the two appends leaves one file a row ahead
+        count = min(len(names), size // (EMBEDDING_DIM * 4))
+        self._names = names[:count]
+        self._rows = {name: row for row, name in enumerate(self._names)}
+        self._live = np.zeros(count, dtype=bool)
+        self._live[list(self._rows.values())] = True
+        self._matrix = None
+        if self.ivf_path.exists():
+            self._ivf = IVFIndex.load(self.ivf_path)
+            if self._ivf.trained_rows > count:
+                self._ivf = None
+
+    def matrix(self) -> np.ndarray:
+        """The stored rows as a read-only memory map."""
+        if self._matrix is None or len(self._matrix) != len(self._names):
+            if not self._names:
+                return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+            self._matrix = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r",
+                shape=(len(self._names), EMBEDDING_DIM),
+            )
+        return self._matrix
+
+    def add(self, filename: str, vector: np.ndarray) -> None:
+        """Append the embedding of `filename`, replacing any earlier one."""
+        row = np.ascontiguousarray(vector, dtype=np.float32)
+        if row.shape != (EMBEDDING_DIM,):
+            msg = f"Expected {EMBEDDING_DIM} values, got {row.shape}"
+            raise ValueError(msg)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with self.vectors_path.open("ab") as f:
+                f.write(row.tobytes())
+            with self.names_path.open("a") as f:
+                f.write(f"{filename}\n")
+            previous = self._rows.get(filename)
+            self._rows[filename] = len(self._names)
+            self._names.append(filename)
+            self._live = np.append(self._live, True)
+            if previous is not None:
+                self._live[previous] = False
+
+    def search(
+        self, query: np.ndarray, k: int = 10, probes: int = IVF_PROBES
+    ) -> list[tuple[str, float]]:
+        """The `k` stored images most similar to `query`.
+
+        Args:
+            query (np.ndarray): Embedding from `embed_image`.
+            k (int): Number of results.
+            probes (int): IVF clusters to score, when the index is used.
+
+        Returns:
+            list: `(filename, cosine similarity)` pairs, most similar first.
+        """
+        with self._lock:
+            matrix = self.matrix()
+            live = self._live
+            names = self._names
+            ivf = self._ivf_for(matrix)
+        query = np.asarray(query, dtype=np.float32)
+        if ivf is None:
+            scores, rows = self._scan(matrix, live, query, k, 0)
+        else:
+            candidates = ivf.candidates(query, probes)
+            candidates = candidates[live[candidates]]
+            scores, rows = _top_k(matrix[candidates] @ query, candidates, k)
+            tail = self._scan(matrix, live, query, k, ivf.trained_rows)
+            scores, rows = _top_k(
+                np.concatenate([scores, tail[0]]),
+                np.concatenate([rows, tail[1]]),
+                k,
+            )
+        return [
+            (names[row], float(score))
+            for score, row in zip(scores, rows, strict=True)
+        ]
+
+    @staticmethod
+    def _scan(
+        matrix: np.ndarray,
+        live: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        start: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Exact top-k over rows from `start`, one chunk at a time."""
+        best_scores = np.zeros(0, dtype=np.float32)
+        best_rows = np.zeros(0, dtype=np.int64)
+        for offset in range(start, len(matrix), CHUNK_ROWS):
+            scores = matrix[offset:offset + CHUNK_ROWS] @ query
+            rows = np.arange(offset, offset + len(scores))
+            mask = live[offset:offset + len(scores)]
+            best_scores, best_rows = _top_k(
+                np.concatenate([best_scores, scores[mask]]),
+                np.concatenate([best_rows, rows[mask]]),
+                k,
+            )
+        return best_scores, best_rows
+
+    def _ivf_for(self, matrix: np.ndarray) -> IVFIndex | None:
+        """The IVF index to use, starting a retrain in the background.
+
+        Training takes seconds, so queries keep using the previous index
+        (or an exact scan) until the new one is ready. After a failed run
+        no new one starts for `IVF_RETRY_SECONDS`.
+        """
+        if len(matrix) < IVF_MIN_ROWS:
+            return None
+        # Retrain once as many rows were added as the index covers
+        stale = self._ivf is None or len(matrix) >= 2 * self._ivf.trained_rows
+        backing_off = time.monotonic() < self._retry_at
+        if stale and self._training is None and not backing_off:
+            self._training = threading.Thread(
+                target=self._train, args=(matrix,), daemon=True
+            )
+            self._training.start()
+        return self._ivf
+
+    def _train(self, matrix: np.ndarray) -> None:
+        logger.info(f"🧭 Training IVF index over {len(matrix)} rows")
+        try:
+            ivf = IVFIndex.train(matrix)
+            ivf.save(self.ivf_path)
+        except Exception:
+            logger.exception("🧭 IVF training failed")
+            ivf = self._ivf
+            self._retry_at = time.monotonic() + IVF_RETRY_SECONDS
+        with self._lock:
+            self._ivf = ivf
+            self._training = None
+
+    def wait_for_training(self) -> None:
+        """Block until a background IVF training run has finished."""
+        training = self._training
+        if training is not None:
+            training.join()
+
+
+_store: EmbeddingStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> EmbeddingStore:
+    """Return the shared store in `EMBEDDING_DIR`, opening it on first use."""
+    global _store  # noqa: PLW0603
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddingStore(EMBEDDING_DIR)
+        return _store
+
+
+def reset_store() -> None:
+    """Forget the shared store, e.g. after `EMBEDDING_DIR` changed."""
+    global _store  # noqa: PLW0603
+    with _store_lock:
+        _store = None
+
+
+async def add_embedding(file_path: Path, filename: str) -> None:
+    """Embed an uploaded image off the event loop and store the vector."""
+    store = get_store()
+    vector = await asyncio.to_thread(embed_image, file_path)
+    await asyncio.to_thread(store.add, filename, vector)
+
+
+async def find_similar(data: bytes, k: int = 10) -> list[dict]:
+    """Stored images most similar to an encoded image.
+
+    Args:
+        data (bytes): Contents of an image file.
+        k (int): Number of results.
+
+    Returns:
+        list[dict]: `filename`, `score` and `duplicate` (score at least
+        `DUPLICATE_SCORE`) for each match, most similar first.
+    """
+    store = get_store()
+    vector = await asyncio.to_thread(embed_image, data)
+    matches = await asyncio.to_thread(store.search, vector, k)
+    return [
+        {
+            "filename": filename,
+            "score": round(score, 4),
+            "duplicate": score >= DUPLICATE_SCORE,
+        }
+        for filename, score in matches
+    ]
+
+
+async def index_uploads(
+    upload_dir: Path, db_path: Path | str = DB_PATH
+) -> int:
+    """Embed every known image whose original is in `upload_dir`.
+
+    Images that already have an embedding are skipped.
+
+    Returns:
+        int: Number of images embedded.
+    """
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute("SELECT filename FROM images ORDER BY id")
+        filenames = [row[0] for row in await cursor.fetchall()]
+    store = get_store()
+    added = 0
+    for filename in filenames:
+        path = upload_dir / filename
+        if filename in store or not path.is_file():
+            continue
+        try:
+            await add_embedding(path, filename)
+        except OSError:
+            logger.warning(f"⚠️ Could not embed {filename}")
+            continue
+        added += 1
+    return added
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point for indexing and ad-hoc queries."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="embed existing uploads")
+    index.add_argument("--uploads", type=Path, default=Path("uploads"))
+    query = commands.add_parser("query", help="find photos like an image")
+    query.add_argument("image", type=Path)
+    query.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "index":
+        added = asyncio.run(index_uploads(args.uploads, args.db))
+        logger.info(f"🧭 Embedded {added} images")
+        return
+    matches = asyncio.run(find_similar(args.image.read_bytes(), args.k))
+    for match in matches:
+        logger.info(f"🧭 {match['score']:.3f} {match['filename']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""Thumbnail sprite sheets for the gallery grid.
+
+When `SPRITE_MODE` is enabled, grid thumbnails are also packed into sprite
+atlases so a gallery page needs a handful of sheet requests instead of one
+proxied GCS read per photo. Images are assigned to sheets by database id
+(`SHEET_SIZE` consecutive ids per sheet), so upload order keeps a gallery
+page on one or two sheets and a sheet only changes while it is filling up.
+
+Each sheet is a WebP atlas plus a JSON coordinate map, cached locally under
+`uploads/sprites` and stored in GCS next to the other renditions. A sheet is
+updated incrementally as each image is ingested; `python -m scripts.sprites`
+rebuilds every sheet from the thumbnails already in GCS.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import shutil
+from os import getenv
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import aiosqlite
+
+from scripts.db import DB_PATH
+from scripts.metrics import record_cache
+from scripts.thumbnails import get_pool, legacy_thumb_name, shutdown_pool
+from scripts.util import lazy_import
+
+if TYPE_CHECKING:
+    from google.cloud.storage import Bucket
+
+storage = lazy_import("google.cloud.storage")
+Image = lazy_import("PIL.Image")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+#: Enables sprite sheet generation and rendering
+SPRITE_MODE = getenv("SPRITE_MODE", "").strip().lower() not in (
+    "",
+    "0",
+    "false",
+    "no",
+    "off",
+)
+
+#: Local cache directory for sprite sheets and coordinate maps
+SPRITE_DIR = Path("uploads/sprites")
+
+#: Images per sheet
+SHEET_SIZE = 64
+
+#: Cells per row in a sheet
+SHEET_COLUMNS = 8
+
+#: Size of one cell in atlas pixels
+CELL_SIZE = 320
+
+#: Atlas pixels per CSS pixel; cells are drawn at half size for HiDPI
+SPRITE_SCALE = 2
+
+_map_cache: dict[Path, tuple[float, dict]] = {}
+
+
+def sheet_for(image_id: int) -> int:
+    """Return the sheet number holding the image with the given DB id."""
+    return (image_id - 1) // SHEET_SIZE
+
+
+def sheet_names(sheet: int) -> tuple[str, str]:
+    """Return the atlas and coordinate map filenames for a sheet."""
+    return f"sheet-{sheet}.webp", f"sheet-{sheet}.json"
+
+
+def _open_master(out: Path, sheet: int) -> Image.Image | None:
+    """Open the lossless local master of a sheet, or its served WebP copy."""
+    for name in (f"sheet-{sheet}.png", sheet_names(sheet)[0]):
+        if (out / name).exists():
+            with Image.open(out / name) as existing:
+                return existing.convert("RGB")
+    return None
+
+
+def add_to_sheet(
+    sprite_dir: str, sheet: int, tiles: list[tuple[int, str, str]]
+) -> list[str]:
+    """Paste thumbnails into a sheet and update its coordinate map.
+
+    Runs inside a worker process. The sheet is created when it does not
+    exist yet, and is encoded once no matter how many tiles are added.
+
+    Args:
+        sprite_dir (str): Directory holding the sheets.
+        sheet (int): Sheet number.
+        tiles (list): Tuples of (cell index, upload filename, path to the
+            grid thumbnail) to paste.
+
+    Returns:
+        list[str]: Names of the atlas and map files written.
+    """
+    out = Path(sprite_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    atlas_name, map_name = sheet_names(sheet)
+    atlas_path = out / atlas_name
+    map_path = out / map_name
+
+    rows = SHEET_SIZE // SHEET_COLUMNS
+    atlas = _open_master(out, sheet) if map_path.exists() else None
+    if atlas is not None:
+        coords = json.loads(map_path.read_text())
+    else:
+        atlas = Image.new(
+            "RGB", (SHEET_COLUMNS * CELL_SIZE, rows * CELL_SIZE), "#111"
+        )
+        coords = {
+            "sheet": sheet,
+            "cell": CELL_SIZE,
+            "columns": SHEET_COLUMNS,
+            "scale": SPRITE_SCALE,
+            "version": 0,
+            "images": {},
+        }
+
+    for slot, filename, thumb_path in tiles:
+        with Image.open(thumb_path) as thumb:
+            tile = thumb.convert("RGB")
+            tile.thumbnail((CELL_SIZE, CELL_SIZE), Image.Resampling.LANCZOS)
+        x = (slot % SHEET_COLUMNS) * CELL_SIZE + (CELL_SIZE - tile.width) // 2
+        y = (slot // SHEET_COLUMNS) * CELL_SIZE + (CELL_SIZE - tile.height) // 2
+        atlas.paste(tile, (x, y))
+        coords["images"][filename] = [x, y, tile.width, tile.height]
+    coords["version"] += 1
+
+    # Keep a lossless master so cells don't degrade as the sheet is re-encoded
+    atlas.save(out / f"sheet-{sheet}.png", "PNG")
+    tmp_path = atlas_path.with_suffix(".tmp")
+    atlas.save(tmp_path, "WEBP", quality=75, method=4)
+    tmp_path.replace(atlas_path)
+    map_path.write_text(json.dumps(coords))
+    return [atlas_name, map_name]
+
+
+async def add_image_to_sprites(
+    image_id: int, filename: str, thumb_dir: Path, sprite_dir: Path = SPRITE_DIR
+) -> list[str]:
+    """Add a freshly ingested image to its sprite sheet in the worker pool.
+
+    Args:
+        image_id (int): Database id of the image.
+        filename (str): Upload filename.
+        thumb_dir (Path): Directory holding the image's grid thumbnail.
+        sprite_dir (Path): Directory holding the sheets.
+
+    Returns:
+        list[str]: Names of the sheet files written, relative to `sprite_dir`.
+    """
+    slot = (image_id - 1) % SHEET_SIZE
+    thumb_path = str(thumb_dir / legacy_thumb_name(filename))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_pool(),
+        add_to_sheet,
+        str(sprite_dir),
+        sheet_for(image_id),
+        [(slot, filename, thumb_path)],
+    )
+
+
+def load_sheet_map(sheet: int, sprite_dir: Path = SPRITE_DIR) -> dict | None:
+    """Return the coordinate map of a sheet, cached until the file changes.
+
+    Args:
+        sheet (int): Sheet number.
+        sprite_dir (Path): Directory holding the sheets.
+
+    Returns:
+        dict | None: The coordinate map, or None if the sheet is not cached
+        locally.
+    """
+    map_path = sprite_dir / sheet_names(sheet)[1]
+    try:
+        mtime = map_path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    cached = _map_cache.get(map_path)
+    hit = bool(cached) and cached[0] == mtime
+    record_cache("sprite_map", hit=hit)
+    if hit:
+        return cached[1]
+    coords = json.loads(map_path.read_text())
+    _map_cache[map_path] = (mtime, coords)
+    return coords
+
+
+def sprite_style(
+    image_id: int, filename: str, sprite_dir: Path = SPRITE_DIR
+) -> str | None:
+    """Build the inline CSS that shows an image from its sprite sheet.
+
+    Args:
+        image_id (int): Database id of the image.
+        filename (str): Upload filename.
+        sprite_dir (Path): Directory holding the sheets.
+
+    Returns:
+        str | None: CSS declarations for the tile, or None when sprite mode
+        is off or the image is not on a sheet yet.
+    """
+    if not SPRITE_MODE:
+        return None
+    sheet = sheet_for(image_id)
+    coords = load_sheet_map(sheet, sprite_dir)
+    if not coords or filename not in coords["images"]:
+        return None
+
+    scale = coords["scale"]
+    x, y, w, h = (v / scale for v in coords["images"][filename])
+    sheet_width = coords["columns"] * coords["cell"] / scale
+    url = f"/uploads/sprites/{sheet_names(sheet)[0]}?v={coords['version']}"
+    return (
+        f"width: {w:g}px; height: {h:g}px; "
+        f"background-image: url('{url}'); "
+        f"background-position: -{x:g}px -{y:g}px; "
+        f"background-size: {sheet_width:g}px auto"
+    )
+
+
+def sync_sheet_maps(
+    bucket: Bucket, prefix: str, sprite_dir: Path = SPRITE_DIR
+) -> int:
+    """Download every sheet and coordinate map missing from the local cache.
+
+    Args:
+        bucket (Bucket): GCS bucket holding the uploads.
+        prefix (str): Upload prefix inside the bucket.
+        sprite_dir (Path): Directory holding the sheets.
+
+    Returns:
+        int: Number of files downloaded.
+    """
+    sprite_dir.mkdir(parents=True, exist_ok=True)
+    downloaded = 0
+    for blob in bucket.list_blobs(prefix=f"{prefix}/sprites/"):
+        local = sprite_dir / Path(blob.name).name
+        if not local.exists():
+            blob.download_to_filename(str(local))
+            downloaded += 1
+    return downloaded
+
+
+async def rebuild_sprite_sheets(
+    bucket_name: str, prefix: str, sprite_dir: Path = SPRITE_DIR
+) -> int:
+    """Rebuild every sprite sheet from the grid thumbnails stored in GCS.
+
+    Args:
+        bucket_name (str): Name of the GCS bucket holding the uploads.
+        prefix (str): Upload prefix inside the bucket.
+        sprite_dir (Path): Directory the sheets are written to.
+
+    Returns:
+        int: Number of images placed on sheets.
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute("SELECT id, filename FROM images ORDER BY id")
+        images = await cursor.fetchall()
+
+    bucket = storage.Client().bucket(bucket_name)
+    thumb_dir = sprite_dir / "thumbs"
+
+    def _download_sheet(
+        entries: list[tuple[int, str]],
+    ) -> list[tuple[int, str, str]]:
+        thumb_dir.mkdir(parents=True, exist_ok=True)
+        tiles = []
+        for image_id, filename in entries:
+            name = legacy_thumb_name(filename)
+            local = thumb_dir / name
+            try:
+                bucket.blob(f"{prefix}/thumb/{name}").download_to_filename(
+                    str(local)
+                )
+            except Exception:  # noqa: BLE001
+                logger.warning(f"⚠️ No thumbnail for {filename}, skipping")
+                continue
+            tiles.append(((image_id - 1) % SHEET_SIZE, filename, str(local)))
+        return tiles
+
+    def _publish(names: list[str]) -> None:
+        for name in names:
+            bucket.blob(f"{prefix}/sprites/{name}").upload_from_filename(
+                str(sprite_dir / name)
+            )
+        shutil.rmtree(thumb_dir, ignore_errors=True)
+
+    sheets: dict[int, list[tuple[int, str]]] = {}
+    for image_id, filename in images:
+        sheets.setdefault(sheet_for(image_id), []).append((image_id, filename))
+
+    loop = asyncio.get_running_loop()
+    placed = 0
+    for sheet, entries in sorted(sheets.items()):
+        tiles = await asyncio.to_thread(_download_sheet, entries)
+        if not tiles:
+            continue
+        await asyncio.to_thread(_remove_sheet, sprite_dir, sheet)
+        written = await loop.run_in_executor(
+            get_pool(), add_to_sheet, str(sprite_dir), sheet, tiles
+        )
+        await asyncio.to_thread(_publish, written)
+        placed += len(tiles)
+    logger.info(f"🧩 Rebuilt {len(sheets)} sprite sheets with {placed} images")
+    return placed
+
+
+def _remove_sheet(sprite_dir: Path, sheet: int) -> None:
+    """Delete the cached files of a sheet so it is rebuilt from scratch."""
+    for name in (*sheet_names(sheet), f"sheet-{sheet}.png"):
+        (sprite_dir / name).unlink(missing_ok=True)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point that rebuilds all sprite sheets."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bucket", default="fogcat5-home")
+    parser.add_argument("--prefix", default="upload")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(rebuild_sprite_sheets(args.bucket, args.prefix))
+    finally:
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""In-memory inverted index from tags to images.
+
+SQLite stays the source of truth; the index is a read-optimized copy of the
+`image_tags` links that answers tag filters without joins. Each tag maps to a
+sorted `array` of image ids (4 bytes per entry) and queries combine those
+posting lists with AND/OR/NOT before ordering the matches newest first.
+
+The index is built from the database on first use and then caught up
+incrementally: `images` and `image_tags` are append-only in this app, so the
+highest row ids seen so far act as high-water marks and only newer rows are
+read. A database whose links were rewritten (fewer rows than indexed, as
+after the tag merge job) or that was swapped for another file is reloaded in
+full. One index is kept per database file, since the gallery reads the
+backup copy while ingest writes to `DB_PATH`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+from array import array
+from bisect import bisect_left
+from typing import TYPE_CHECKING
+
+import aiosqlite
+
+from scripts.db import DB_PATH
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+#: Posting lists larger than this many times the running result are probed
+#: with binary search instead of being scanned
+GALLOP_RATIO = 8
+
+STATE_QUERY = """
+    SELECT
+        (SELECT file FROM pragma_database_list WHERE name = 'main'),
+        (SELECT MAX(id) FROM images),
+        (SELECT MAX(id) FROM image_tags),
+        (SELECT COUNT(*) FROM image_tags)
+"""
+
+
+def _contains(postings: array, image_id: int) -> bool:
+    pos = bisect_left(postings, image_id)
+    return pos < len(postings) and postings[pos] == image_id
+
+
+class TagIndex:
+    """Tag name -> sorted image id posting lists for one database."""
+
+    def __init__(self) -> None:
+        """Create an empty index; `catch_up` fills it from a database."""
+        self._tag_ids: dict[str, int] = {}
+        self._postings: dict[int, array] = {}
+        self._timestamps: dict[int, str] = {}
+        self._image_mark = 0
+        self._link_mark = 0
+        self._link_rows = 0
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        """Number of images known to the index."""
+        return len(self._timestamps)
+
+    def clear(self) -> None:
+        """Forget every image, tag and high-water mark."""
+        self._tag_ids.clear()
+        self._postings.clear()
+        self._timestamps.clear()
+        self._image_mark = self._link_mark = self._link_rows = 0
+
+    def add_image(self, image_id: int, timestamp: str | None) -> None:
+        """Record an image and the timestamp used to order results."""
+        self._timestamps[image_id] = timestamp or ""
+
+    def add_link(self, image_id: int, tag_id: int, tag_name: str) -> None:
+        """Add `image_id` to the posting list of a tag, once."""
+        self._tag_ids[tag_name] = tag_id
+        postings = self._postings.setdefault(tag_id, array("I"))
+        if not postings or postings[-1] < image_id:
+            postings.append(image_id)  # ids mostly arrive in order
+        elif not _contains(postings, image_id):
+            postings.insert(bisect_left(postings, image_id), image_id)
+
+    def tag_names(self) -> list[str]:
+        """Names of all tags linked to at least one image."""
+        return [name for name, tag_id in self._tag_ids.items()
+                if self._postings.get(tag_id)]
+
+    def ids(self, tag: str) -> array:
+        """Sorted ids of the images carrying `tag`."""
+        tag_id = self._tag_ids.get(tag)
+        return self._postings.get(tag_id, array("I"))
+
+    def count(self, tag: str) -> int:
+        """Number of images carrying `tag`."""
+        return len(self.ids(tag))
+
+    def tag_counts(self, limit: int | None = None) -> list[tuple[str, int]]:
+        """Tags with their image counts, most used first."""
+        counts = [(name, self.count(name)) for name in self.tag_names()]
+        if limit is None:
+            return sorted(counts, key=lambda item: (-item[1], item[0]))
+        return heapq.nsmallest(limit, counts, key=lambda i: (-i[1], i[0]))
+
+    def query(
+        self,
+        all_of: Iterable[str] = (),
+        any_of: Iterable[str] = (),
+        none_of: Iterable[str] = (),
+        limit: int | None = None,
+    ) -> list[int]:
+        """Image ids matching a tag filter, newest first.
+
+        Args:
+            all_of (Iterable[str]): Tags every match must carry (AND).
+            any_of (Iterable[str]): Tags of which a match carries at least
+                one (OR). Ignored when empty.
+            none_of (Iterable[str]): Tags no match may carry (NOT).
+            limit (int, optional): Maximum number of ids to return.
+
+        Returns:
+            list[int]: Matching image ids ordered by timestamp, newest first.
+        """
+        required = [self.ids(tag) for tag in all_of]
+        optional = list(any_of)
+        if required:
+            matches = self._intersect(required)
+            if optional:
+                matches &= self._union(optional)
+        elif optional:
+            matches = self._union(optional)
+        else:
+            matches = self.image_ids()
+        excluded = list(none_of)
+        if excluded and matches:
+            matches -= self._union(excluded)
+        return self.newest_first(matches, limit)
+
+    def _intersect(self, postings: list[array]) -> set[int]:
+        postings = sorted(postings, key=len)
+        result = set(postings[0])
+        for other in postings[1:]:
+            if not result:
+                break
+            if len(other) > GALLOP_RATIO * len(result):
+                result = {i for i in result if _contains(other, i)}
+            else:
+                result.intersection_update(other)
+        return result
+
+    def _union(self, tags: list[str]) -> set[int]:
+        result: set[int] = set()
+        for tag in tags:
+            result.update(self.ids(tag))
+        return result
+
+    def image_ids(self) -> set[int]:
+        """Ids of every image known to the index."""
+        return set(self._timestamps)
+
+    def newest_first(
+        self, ids: Iterable[int], limit: int | None = None
+    ) -> list[int]:
+        """Order image ids by timestamp, newest first."""
+        def key(image_id: int) -> tuple[str, int]:
+            return self._timestamps.get(image_id, ""), image_id
+
+        if limit is not None:
+            return heapq.nlargest(limit, ids, key=key)
+        return sorted(ids, key=key, reverse=True)
+
+    async def catch_up(
+        self,
+        db: aiosqlite.Connection,
+        max_image: int,
+        max_link: int,
+        link_rows: int,
+    ) -> None:
+        """Read rows added since the last call, reloading if rows vanished.
+
+        Args:
+            db (aiosqlite.Connection): Connection to the indexed database.
+            max_image (int): Current highest `images.id`.
+            max_link (int): Current highest `image_tags.id`.
+            link_rows (int): Current number of `image_tags` rows.
+        """
+        async with self._lock:
+            await self._read_new_rows(db, max_image, max_link)
+            if self._link_rows != link_rows:
+                logger.info("🏷️ Tag links were rewritten, reloading index")
+                self.clear()
+                await self._read_new_rows(db, max_image, max_link)
+
+    async def _read_new_rows(
+        self, db: aiosqlite.Connection, max_image: int, max_link: int
+    ) -> None:
+        if max_image < self._image_mark or max_link < self._link_mark:
+            self.clear()
+        if max_image > self._image_mark:
+            cursor = await db.execute(
+                "SELECT id, timestamp FROM images WHERE id > ? AND id <= ?",
+                (self._image_mark, max_image),
+            )
+            for image_id, timestamp in await cursor.fetchall():
+                self.add_image(image_id, timestamp)
+            self._image_mark = max_image
+        if max_link > self._link_mark:
+            cursor = await db.execute(
+                "SELECT image_tags.image_id, tags.id, tags.name "
+                "FROM image_tags LEFT JOIN tags ON tags.id = image_tags.tag_id "
+                "WHERE image_tags.id > ? AND image_tags.id <= ? "
+                "ORDER BY image_tags.image_id",
+                (self._link_mark, max_link),
+            )
+            rows = await cursor.fetchall()
+            for image_id, tag_id, name in rows:
+                if name is not None:  # links to deleted tags are skipped
+                    self.add_link(image_id, tag_id, name)
+            self._link_mark = max_link
+            self._link_rows += len(rows)
+
+
+#: One index per database file, keyed by its absolute path
+_indexes: dict[str, TagIndex] = {}
+
+
+async def get_tag_index(db: aiosqlite.Connection) -> TagIndex:
+    """Return the up-to-date index for the database `db` is connected to.
+
+    Costs one small query when nothing changed; new rows are folded in
+    before returning.
+    """
+    cursor = await db.execute(STATE_QUERY)
+    source, max_image, max_link, link_rows = await cursor.fetchone()
+    index = _indexes.setdefault(source or "", TagIndex())
+    await index.catch_up(db, max_image or 0, max_link or 0, link_rows)
+    return index
+
+
+async def refresh_tag_index(db_path: Path | str = DB_PATH) -> TagIndex:
+    """Build or catch up the index for the database at `db_path`."""
+    async with aiosqlite.connect(db_path) as db:
+        return await get_tag_index(db)
+
+
+def reset_tag_indexes() -> None:
+    """Drop every index, e.g. after the database was replaced."""
+    _indexes.clear()
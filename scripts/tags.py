@@ -0,0 +1,387 @@
+"""Tag canonicalization: singular forms, spelling variants and aliases.
+
+The vision model names the same thing many ways ("usb cable", "usb cables",
+"usb-c cable", "usb c cable"). Every tag written or searched goes through
+`canonical_tag`, which:
+
+1. cleans the tag with `clean_tag_name` and singularizes its last word,
+2. maps it through the alias table (`tag_aliases` in the database plus the
+   seed file `TAG_ALIAS_FILE`), and
+3. folds separator variants onto the spelling already in use, by comparing
+   tags with spaces, dashes and underscores removed.
+
+Lookups use the in-memory `aliases` map, loaded at startup and refreshed
+after changes. Tags stored before canonicalization are folded by the merge
+job, which rewrites `image_tags` onto canonical tag ids and records each
+merged name as an alias:
+
+    python -m scripts.tags merge --dry-run
+    python -m scripts.tags merge
+    python -m scripts.tags alias "cell phone" phone
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+from functools import lru_cache
+from os import getenv
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import aiosqlite
+
+from scripts.db import DB_PATH
+from scripts.util import clean_tag_name
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+#: JSON object of alias -> canonical tag applied before the database table
+TAG_ALIAS_FILE = Path(getenv("TAG_ALIAS_FILE", "scripts/tag_aliases.json"))
+
+#: Plural words that do not follow the suffix rules
+IRREGULAR_PLURALS = {
+    "people": "person",
+    "children": "child",
+    "men": "man",
+    "women": "woman",
+    "feet": "foot",
+    "teeth": "tooth",
+    "mice": "mouse",
+    "geese": "goose",
+    "dice": "die",
+    "knives": "knife",
+    "wives": "wife",
+    "lives": "life",
+    "leaves": "leaf",
+    "shelves": "shelf",
+    "halves": "half",
+    "loaves": "loaf",
+    "scarves": "scarf",
+    "wolves": "wolf",
+    "buses": "bus",
+    "potatoes": "potato",
+    "tomatoes": "tomato",
+    "heroes": "hero",
+    "echoes": "echo",
+    "indices": "index",
+    "matrices": "matrix",
+    "vertices": "vertex",
+    "appendices": "appendix",
+    "cacti": "cactus",
+    "fungi": "fungus",
+}
+
+#: Words that end in "s" but are already singular or have no singular
+INVARIANT_WORDS = {
+    "series", "species", "news", "lens", "canvas", "atlas", "alias",
+    "bias", "chaos", "gas", "plus", "bonus", "corpus", "virus", "status",
+    "campus", "cactus", "octopus", "walrus", "apparatus", "chassis",
+    "glasses", "sunglasses", "eyeglasses", "goggles", "scissors", "pliers",
+    "tongs", "tweezers", "clippers", "binoculars", "pants", "jeans",
+    "shorts", "trousers", "pajamas", "clothes", "electronics", "physics",
+    "mathematics", "headquarters", "means", "thanks", "cds", "dvds",
+    "always", "various", "previous", "us", "its", "this", "yes",
+}
+
+#: Singulars ending in "ie", so "-ies" only drops the "s"
+IE_WORDS = {
+    "movie", "cookie", "hoodie", "selfie", "zombie", "brownie", "rookie",
+    "calorie", "smoothie", "pie", "tie", "lie", "die", "genie", "beanie",
+    "birdie", "walkie", "talkie", "goodie", "veggie", "sortie",
+}
+
+#: Singulars ending in "che"/"xe"/"she"/"sse" that only drop the "s"
+E_WORDS = {
+    "cache", "ache", "headache", "niche", "avalanche", "moustache",
+    "mustache", "panache", "axe", "pickaxe", "posse",
+    "finesse", "crevasse", "lacrosse", "impasse",
+}
+
+SEPARATORS_RE = re.compile(r"[\s_-]+")
+
+
+@lru_cache(maxsize=8192)
+def singularize(word: str) -> str:  # noqa: PLR0911
+    """Return the singular form of an English noun (rule based).
+
+    Args:
+        word (str): A single lowercase word.
+
+    Returns:
+        str: The singular form, or `word` if it does not look plural.
+    """
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if (
+        len(word) <= 3  # noqa: PLR2004
+        or word in INVARIANT_WORDS
+        or not word.isalpha()
+        or not word.endswith("s")
+        or word.endswith(("ss", "us", "is", "ous"))
+    ):
+        return word
+    if word.endswith("ies"):
+        if len(word) <= 4 or word[:-1] in IE_WORDS:  # noqa: PLR2004
+            return word[:-1]
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "sses", "zzes")):
+        if word[:-1] in E_WORDS:
+            return word[:-1]
+        return word[:-2]
+    return word[:-1]
+
+
+def normalize_tag(tag: str) -> str:
+    """Clean a tag and singularize its last word ("USB Cables" -> "usb cable").
+
+    Underscores become spaces; dashes are kept ("usb-c").
+    """
+    tag = clean_tag_name(tag.replace("_", " "))
+    if not tag:
+        return ""
+    head, _, last = tag.rpartition(" ")
+    singular = singularize(last)
+    return f"{head} {singular}" if head else singular
+
+
+def tag_key(tag: str) -> str:
+    """Spelling-insensitive key: "usb c cable" and "usb-c cable" share one."""
+    return SEPARATORS_RE.sub("", tag)
+
+
+class AliasMap:
+    """Cached alias -> canonical map plus the spelling keys of known tags."""
+
+    def __init__(self) -> None:
+        """Create a map holding only the seed file aliases."""
+        self._aliases: dict[str, str] = {}
+        self._keys: dict[str, str] = {}
+        self._cache: dict[str, str] = {}
+        self._seeded = False
+
+    def _seed(self) -> None:
+        if self._seeded:
+            return
+        self._seeded = True
+        if TAG_ALIAS_FILE.exists():
+            try:
+                pairs = json.loads(TAG_ALIAS_FILE.read_text())
+            except (OSError, ValueError):
+                logger.exception(f"🏷️ Could not read {TAG_ALIAS_FILE}")
+            else:
+                self.update(pairs.items())
+
+    def update(self, pairs: Iterable[tuple[str, str]]) -> None:
+        """Add `(alias, canonical)` pairs, resolving chains of aliases."""
+        for alias, canonical in pairs:
+            key = normalize_tag(alias)
+            target = normalize_tag(canonical)
+            if key and target and key != target:
+                self._aliases[key] = target
+        for key, direct in self._aliases.items():
+            target, seen = direct, {key}
+            while target in self._aliases and target not in seen:
+                seen.add(target)
+                target = self._aliases[target]
+            self._aliases[key] = target
+        self._cache.clear()
+
+    def register(self, name: str) -> None:
+        """Remember a canonical tag so spelling variants fold onto it."""
+        self._keys.setdefault(tag_key(name), name)
+
+    def canonical(self, tag: str) -> str:
+        """Return the canonical form of a raw tag, or "" if nothing is left."""
+        self._seed()
+        cached = self._cache.get(tag)
+        if cached is not None:
+            return cached
+        name = normalize_tag(tag)
+        result = self._aliases.get(name) or self._keys.get(tag_key(name), name)
+        if len(self._cache) < 65536:  # noqa: PLR2004
+            self._cache[tag] = result
+        return result
+
+    def clear(self) -> None:
+        """Forget every alias and known tag, including the seed file."""
+        self._aliases.clear()
+        self._keys.clear()
+        self._cache.clear()
+        self._seeded = False
+
+    async def load(self, db_path: Path | str = DB_PATH) -> None:
+        """Reload aliases and known canonical tags from the database."""
+        self.clear()
+        self._seed()
+        try:
+            async with aiosqlite.connect(db_path) as db:
+                cursor = await db.execute(
+                    "SELECT alias, canonical FROM tag_aliases"
+                )
+                self.update(await cursor.fetchall())
+                cursor = await db.execute(
+                    "SELECT tags.name FROM tags "
+                    "JOIN image_tags ON image_tags.tag_id = tags.id "
+                    "GROUP BY tags.id ORDER BY COUNT(*) DESC"
+                )
+                names = [row[0] for row in await cursor.fetchall()]
+        except aiosqlite.OperationalError:
+            logger.exception(f"🏷️ Could not load tag aliases from {db_path}")
+            return
+        # Most used spelling first, so it wins its key
+        for name in names:
+            if self.canonical(name) == name:
+                self.register(name)
+        self._cache.clear()
+        logger.info(
+            f"🏷️ Loaded {len(self._aliases)} tag aliases, "
+            f"{len(self._keys)} canonical tags"
+        )
+
+
+aliases = AliasMap()
+
+
+def canonical_tag(tag: str) -> str:
+    """Canonical form of a raw tag through the shared alias map."""
+    return aliases.canonical(tag)
+
+
+async def add_alias(
+    alias: str, canonical: str, db_path: Path | str = DB_PATH
+) -> None:
+    """Store an alias in the database and the shared map."""
+    alias, canonical = normalize_tag(alias), canonical_tag(canonical)
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO tag_aliases (alias, canonical) "
+            "VALUES (?, ?)",
+            (alias, canonical),
+        )
+        await db.commit()
+    aliases.update([(alias, canonical)])
+
+
+def plan_merges(
+    tags: list[tuple[int, str, int]], alias_map: AliasMap
+) -> dict[int, str]:
+    """Choose the canonical name for every tag that should be merged.
+
+    Args:
+        tags (list): `(id, name, usage_count)` for every tag.
+        alias_map (AliasMap): Aliases to apply before grouping variants.
+
+    Returns:
+        dict: Tag id -> canonical name, for tags whose name changes.
+    """
+    groups: dict[str, list[tuple[int, str, int]]] = {}
+    for tag_id, name, uses in tags:
+        target = alias_map.canonical(name) or name
+        groups.setdefault(tag_key(target), []).append((tag_id, target, uses))
+
+    plan = {}
+    names = {tag_id: name for tag_id, name, _ in tags}
+    for members in groups.values():
+        # The spelling with the most images wins; ties go to the shortest
+        _, canonical, _ = min(
+            members, key=lambda m: (-m[2], len(m[1]), m[1])
+        )
+        for tag_id, _, _ in members:
+            if names[tag_id] != canonical:
+                plan[tag_id] = canonical
+    return plan
+
+
+async def merge_tags(
+    db_path: Path | str = DB_PATH, *, dry_run: bool = False
+) -> list[tuple[str, str]]:
+    """Fold variant tags onto canonical ones in a single transaction.
+
+    Links of each variant move to the canonical tag (skipping images that
+    already have it), the variant row is deleted and its name is recorded
+    in `tag_aliases` so later ingests map it directly.
+
+    Args:
+        db_path (Path | str): Database to rewrite.
+        dry_run (bool): Only report what would change.
+
+    Returns:
+        list: `(old_name, canonical_name)` for every merged tag.
+    """
+    await aliases.load(db_path)
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute(
+            "SELECT tags.id, tags.name, COUNT(image_tags.id) FROM tags "
+            "LEFT JOIN image_tags ON image_tags.tag_id = tags.id "
+            "GROUP BY tags.id"
+        )
+        tags = await cursor.fetchall()
+        names = {tag_id: name for tag_id, name, _ in tags}
+        plan = plan_merges(tags, aliases)
+        merged = [
+            (names[tag_id], canonical) for tag_id, canonical in plan.items()
+        ]
+        if dry_run or not plan:
+            return merged
+
+        for tag_id, canonical in plan.items():
+            await db.execute(
+                "INSERT OR IGNORE INTO tags (name) VALUES (?)", (canonical,)
+            )
+            cursor = await db.execute(
+                "SELECT id FROM tags WHERE name = ?", (canonical,)
+            )
+            (canonical_id,) = await cursor.fetchone()
+            await db.execute(
+                "INSERT INTO image_tags (image_id, tag_id) "
+                "SELECT DISTINCT image_id, ? FROM image_tags "
+                "WHERE tag_id = ? AND image_id NOT IN "
+                "(SELECT image_id FROM image_tags WHERE tag_id = ?)",
+                (canonical_id, tag_id, canonical_id),
+            )
+            await db.execute(
+                "DELETE FROM image_tags WHERE tag_id = ?", (tag_id,)
+            )
+            await db.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
+            await db.execute(
+                "INSERT OR REPLACE INTO tag_aliases (alias, canonical) "
+                "VALUES (?, ?)",
+                (names[tag_id], canonical),
+            )
+        await db.commit()
+    await aliases.load(db_path)
+    logger.info(f"🏷️ Merged {len(merged)} tags into canonical forms")
+    return merged
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point for the merge job and alias edits."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge = commands.add_parser("merge", help="fold variant tags")
+    merge.add_argument("--dry-run", action="store_true")
+    alias = commands.add_parser("alias", help="map ALIAS onto CANONICAL")
+    alias.add_argument("alias")
+    alias.add_argument("canonical")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "alias":
+        asyncio.run(add_alias(args.alias, args.canonical, args.db))
+        return
+    merged = asyncio.run(merge_tags(args.db, dry_run=args.dry_run))
+    for old, new in sorted(merged):
+        logger.info(f"🏷️ {old} -> {new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Thumbnail rendition pipeline for uploaded photos.
+
+Each upload is decoded once and written out at several sizes in modern
+formats (AVIF and WebP where Pillow supports them), plus the legacy
+`.thumb.jpg` JPEG that older clients and templates fall back to. The work is
+CPU-bound, so it runs in a process pool instead of on the event loop.
+
+JPEG sources are reduced while decoding with `Image.draft`, so a 12 MP phone
+photo is never fully decoded just to produce a few hundred pixel thumbnail.
+
+The same pass also produces a tiny low-quality image placeholder (LQIP): a
+data URI of a few hundred bytes that is stored on the `images` row and
+inlined by the gallery templates, so tiles show a blurred preview before
+the real thumbnail arrives.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from os import getenv
+from pathlib import Path
+
+from scripts.util import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+features = lazy_import("PIL.features")
+
+#: Rendition name -> longest side in pixels, smallest first
+RENDITION_SIZES = {"grid": 320, "retina": 640, "preview": 1280}
+
+#: Modern formats written for every rendition, in order of preference
+MODERN_FORMATS = ("avif", "webp")
+
+#: Encoder settings per output format
+SAVE_OPTIONS = {
+    "avif": {"quality": 50, "speed": 8},
+    "webp": {"quality": 75, "method": 4},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+}
+
+MIME_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+#: Longest side of the inline placeholder image, in pixels
+PLACEHOLDER_SIZE = 16
+
+#: Number of worker processes used for thumbnail generation
+THUMBNAIL_WORKERS = int(getenv("THUMBNAIL_WORKERS", "2"))
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def available_formats() -> tuple[str, ...]:
+    """Return the modern formats this Pillow build can encode."""
+    return tuple(fmt for fmt in MODERN_FORMATS if features.check(fmt))
+
+
+def rendition_name(filename: str, rendition: str, fmt: str) -> str:
+    """Name of a rendition file, relative to the thumbnail prefix."""
+    return f"{filename}.{rendition}.{fmt}"
+
+
+def legacy_thumb_name(filename: str) -> str:
+    """Name of the JPEG fallback thumbnail, relative to the thumb prefix."""
+    return f"{filename}.thumb.jpg"
+
+
+def make_placeholder(img: Image.Image) -> str:
+    """Encode a tiny blurred preview of an image as a data URI.
+
+    Args:
+        img (Image.Image): Decoded RGB image, usually the smallest rendition.
+
+    Returns:
+        str: `data:` URI of a WebP (or PNG, without WebP support) image no
+        larger than `PLACEHOLDER_SIZE` pixels on its longest side.
+    """
+    tiny = img.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BOX)
+    out = io.BytesIO()
+    if features.check("webp"):
+        tiny.save(out, "WEBP", quality=40)
+        mime = MIME_TYPES["webp"]
+    else:
+        tiny.save(out, "PNG", optimize=True)
+        mime = "image/png"
+    encoded = base64.b64encode(out.getvalue()).decode("ascii")
+    return f"data:{mime};base64,{encoded}"
+
+
+def generate_renditions(
+    source_path: str, out_dir: str, filename: str, formats: tuple[str, ...]
+) -> tuple[list[str], str, dict[str, int]]:
+    """Write every rendition of an image to `out_dir`.
+
+    Runs inside a worker process. The image is decoded once at roughly the
+    largest rendition size and then reduced step by step, so each smaller
+    rendition is resampled from the previous one instead of the original.
+
+    Args:
+        source_path (str): Path to the uploaded original.
+        out_dir (str): Directory the renditions are written to.
+        filename (str): Upload filename used to name the renditions.
+        formats (tuple): Modern formats to write for each size.
+
+    Returns:
+        tuple: Names of the files written, relative to `out_dir`, the
+        placeholder data URI and the pixel width of each rendition.
+    """
+    out = Path(out_dir)
+    largest = max(RENDITION_SIZES.values())
+    with Image.open(source_path) as img:
+        img.draft("RGB", (largest, largest))
+        current = ImageOps.exif_transpose(img).convert("RGB")
+
+    written = []
+    widths = {}
+    for rendition, side in sorted(
+        RENDITION_SIZES.items(), key=lambda item: item[1], reverse=True
+    ):
+        current.thumbnail((side, side), Image.Resampling.LANCZOS)
+        widths[rendition] = current.width
+        for fmt in formats:
+            name = rendition_name(filename, rendition, fmt)
+            current.save(out / name, fmt.upper(), **SAVE_OPTIONS[fmt])
+            written.append(name)
+
+    # The loop ends on the smallest size, which doubles as the JPEG fallback
+    name = legacy_thumb_name(filename)
+    current.save(out / name, "JPEG", **SAVE_OPTIONS["jpeg"])
+    written.append(name)
+    return written, make_placeholder(current), widths
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return the shared thumbnail worker pool, creating it on first use."""
+    global _pool  # noqa: PLW0603
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """Stop the thumbnail worker pool if it was started."""
+    global _pool  # noqa: PLW0603
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def render_thumbnails(
+    file_path: Path, filename: str, out_dir: Path
+) -> dict:
+    """Generate all renditions of an upload in the worker pool.
+
+    Args:
+        file_path (Path): Path to the uploaded original.
+        filename (str): Upload filename used to name the renditions.
+        out_dir (Path): Directory the renditions are written to.
+
+    Returns:
+        dict: `files` written, modern `formats` produced, the
+        `placeholder` data URI and the `widths` of the renditions.
+    """
+    formats = available_formats()
+    loop = asyncio.get_running_loop()
+    written, placeholder, widths = await loop.run_in_executor(
+        get_pool(),
+        generate_renditions,
+        str(file_path),
+        str(out_dir),
+        filename,
+        formats,
+    )
+    return {
+        "files": written,
+        "formats": formats,
+        "placeholder": placeholder,
+        "widths": widths,
+    }
+
+
+def format_widths(widths: dict[str, int]) -> str:
+    """Encode rendition widths for the `thumb_widths` column."""
+    return ",".join(f"{name}:{width}" for name, width in widths.items())
+
+
+def picture_sources(
+    filename: str, formats: str | None, widths: str | None = None
+) -> list[dict]:
+    """Build `<source>` entries with a `srcset` for each stored format.
+
+    Each candidate is described by its real width, so portrait photos and
+    originals smaller than a rendition are not overstated. A rendition as
+    wide as a smaller one (from a small original) is left out.
+
+    Args:
+        filename (str): Upload filename.
+        formats (str, optional): Comma-separated formats recorded for the
+            image; images processed before renditions existed have none.
+        widths (str, optional): `name:width` pairs recorded with the
+            formats. Without them only the grid rendition is offered.
+
+    Returns:
+        list[dict]: One dict per format with `type` and `srcset` keys.
+    """
+    if not formats:
+        return []
+    if widths:
+        known = dict(pair.split(":") for pair in widths.split(","))
+        by_width: dict[int, str] = {}
+        for rendition in RENDITION_SIZES:
+            if rendition in known:
+                by_width.setdefault(int(known[rendition]), rendition)
+        candidates = [(name, f" {width}w") for width, name in by_width.items()]
+    else:
+        candidates = [("grid", "")]
+    sources = []
+    for fmt in formats.split(","):
+        srcset = ", ".join(
+            f"/uploads/thumb/{rendition_name(filename, rendition, fmt)}{size}"
+            for rendition, size in candidates
+        )
+        sources.append({"type": MIME_TYPES[fmt], "srcset": srcset})
+    return sources
@@ -0,0 +1,371 @@
+"""In-process request tracing with OpenTelemetry-compatible spans.
+
+Spans follow the OpenTelemetry data model (128-bit trace ids, 64-bit span
+ids, parent links, nanosecond timestamps, attributes and status) and are
+exported in the OTLP/JSON span shape, so they can be loaded into any OTel
+tooling later. Context propagates through `contextvars` within a task and
+through a W3C `traceparent` string across the processing queue, so one
+upload produces a single trace covering the request, the queue wait and
+every stage of `process_image`.
+
+Finished spans go to a bounded in-memory exporter that backs the
+`/debug/traces` endpoint. Setting `TRACE_EXPORT_PATH` additionally appends
+every span to that file as one JSON object per line.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+#: Number of recent traces kept in memory for the debug endpoint
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+
+#: Spans kept per trace; later spans are counted but dropped
+MAX_SPANS_PER_TRACE = 500
+
+#: Optional JSON-lines file every finished span is appended to
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+
+STATUS_UNSET = "STATUS_CODE_UNSET"
+STATUS_OK = "STATUS_CODE_OK"
+STATUS_ERROR = "STATUS_CODE_ERROR"
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_span_id: str | None = None,
+        attributes: dict | None = None,
+        start_ns: int | None = None,
+    ) -> None:
+        """Start a span now, or at `start_ns` when recording after the fact."""
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: int | None = None
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    @property
+    def duration_ms(self) -> float:
+        """Duration in milliseconds, up to now while the span is open."""
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: object) -> None:
+        """Attach a key/value attribute to the span."""
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        """Mark the span as failed because of `exc`."""
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def end(self, end_ns: int | None = None) -> None:
+        """Finish the span and hand it to the exporter."""
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        exporter.export(self)
+
+    def to_otlp(self) -> dict:
+        """Serialize the span in the OTLP/JSON span shape."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or 0),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": self.status, "message": self.status_message},
+        }
+
+
+def _otlp_value(value: object) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class TraceExporter:
+    """Keeps finished spans of the most recent traces in memory."""
+
+    def __init__(self, max_traces: int = TRACE_BUFFER_SIZE) -> None:
+        """Create an exporter holding up to `max_traces` traces."""
+        self.max_traces = max_traces
+        self._traces: OrderedDict[str, list[Span]] = OrderedDict()
+        self._dropped: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        """Store a finished span, evicting the oldest trace when full."""
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    evicted, _ = self._traces.popitem(last=False)
+                    self._dropped.pop(evicted, None)
+            else:
+                self._traces.move_to_end(span.trace_id)
+            if len(spans) < MAX_SPANS_PER_TRACE:
+                spans.append(span)
+            else:
+                self._dropped[span.trace_id] = (
+                    self._dropped.get(span.trace_id, 0) + 1
+                )
+        if TRACE_EXPORT_PATH:
+            _append_to_file(span)
+
+    def clear(self) -> None:
+        """Forget every stored trace."""
+        with self._lock:
+            self._traces.clear()
+            self._dropped.clear()
+
+    def get_trace(self, trace_id: str) -> dict | None:
+        """Return one trace with its spans, or None if it is not stored."""
+        with self._lock:
+            spans = list(self._traces.get(trace_id, ()))
+            dropped = self._dropped.get(trace_id, 0)
+        if not spans:
+            return None
+        return _trace_summary(trace_id, spans, dropped, with_spans=True)
+
+    def slow_traces(self, min_ms: float = 0, limit: int = 20) -> list[dict]:
+        """Return stored traces at least `min_ms` long, slowest first."""
+        with self._lock:
+            traces = [
+                (trace_id, list(spans), self._dropped.get(trace_id, 0))
+                for trace_id, spans in self._traces.items()
+            ]
+        summaries = [
+            _trace_summary(trace_id, spans, dropped, with_spans=False)
+            for trace_id, spans, dropped in traces
+        ]
+        slow = [s for s in summaries if s["duration_ms"] >= min_ms]
+        slow.sort(key=lambda s: s["duration_ms"], reverse=True)
+        return slow[:limit]
+
+
+def _trace_summary(
+    trace_id: str, spans: list[Span], dropped: int, *, with_spans: bool
+) -> dict:
+    start = min(s.start_ns for s in spans)
+    end = max(s.end_ns or s.start_ns for s in spans)
+    ids = {s.span_id for s in spans}
+    roots = [s for s in spans if s.parent_span_id not in ids]
+    root = min(roots or spans, key=lambda s: s.start_ns)
+    summary = {
+        "trace_id": trace_id,
+        "root": root.name,
+        "duration_ms": (end - start) / 1e6,
+        "span_count": len(spans),
+        "dropped_spans": dropped,
+        "error": any(s.status == STATUS_ERROR for s in spans),
+        "stages": _stage_totals(spans),
+    }
+    if with_spans:
+        summary["spans"] = [
+            s.to_otlp() for s in sorted(spans, key=lambda s: s.start_ns)
+        ]
+    return summary
+
+
+def _stage_totals(spans: list[Span]) -> dict[str, float]:
+    """Total milliseconds per span name, to see where a trace spent time."""
+    totals: dict[str, float] = {}
+    for span in spans:
+        totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def _append_to_file(span: Span) -> None:
+    try:
+        with open(TRACE_EXPORT_PATH, "a") as fh:  # noqa: PTH123
+            fh.write(json.dumps(span.to_otlp()) + "\n")
+    except OSError:
+        logger.exception(f"Could not write span to {TRACE_EXPORT_PATH}")
+
+
+exporter = TraceExporter()
+
+
+def current_span() -> Span | None:
+    """Return the active span in this context, if any."""
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name: str, **attributes: object) -> Iterator[Span]:
+    """Run the `with` block inside a new child of the current span.
+
+    A new trace is started when no span is active. Exceptions raised in the
+    block mark the span as failed and propagate.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        span = Span(name, secrets.token_hex(16), attributes=attributes)
+    else:
+        span = Span(
+            name, parent.trace_id, parent.span_id, attributes=attributes
+        )
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.record_exception(exc)
+        raise
+    else:
+        if span.status == STATUS_UNSET:
+            span.status = STATUS_OK
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def record_span(
+    name: str, start_ns: int, end_ns: int, **attributes: object
+) -> Span:
+    """Record an already finished operation as a child of the current span.
+
+    Used for time that passes outside any running code, such as the wait
+    between enqueuing an upload and a worker picking it up.
+    """
+    parent = _current_span.get()
+    span = Span(
+        name,
+        parent.trace_id if parent else secrets.token_hex(16),
+        parent.span_id if parent else None,
+        attributes=attributes,
+        start_ns=start_ns,
+    )
+    span.status = STATUS_OK
+    span.end(end_ns)
+    return span
+
+
+def inject() -> str | None:
+    """Return a W3C `traceparent` for the current span, or None."""
+    span = _current_span.get()
+    if span is None:
+        return None
+    return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+def _parse_traceparent(traceparent: str | None) -> tuple[str, str] | None:
+    try:
+        version, trace_id, span_id, _flags = (traceparent or "").split("-")
+        int(trace_id, 16)
+        int(span_id, 16)
+    except ValueError:
+        return None
+    if version != "00" or len(trace_id) != 32 or len(span_id) != 16:  # noqa: PLR2004
+        return None
+    return trace_id, span_id
+
+
+@contextmanager
+def use_traceparent(traceparent: str | None) -> Iterator[None]:
+    """Continue the trace described by a `traceparent` in the `with` block.
+
+    Spans started inside the block become children of the remote span. An
+    empty or malformed value leaves the context unchanged, so new spans start
+    their own trace.
+    """
+    parsed = _parse_traceparent(traceparent)
+    if parsed is None:
+        yield
+        return
+    # A placeholder parent that is never exported
+    remote = Span("remote", parsed[0], start_ns=0)
+    remote.span_id = parsed[1]
+    token = _current_span.set(remote)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+#: Path prefixes that are not traced (static assets, scrapes, debug views)
+UNTRACED_PREFIXES = ("/static", "/metrics", "/debug/")
+
+
+class TracingMiddleware:
+    """ASGI middleware that opens a root span for each HTTP request.
+
+    An incoming W3C `traceparent` header is honored, so callers that trace
+    their own requests see the app's spans in the same trace.
+    """
+
+    def __init__(self, app: Callable) -> None:
+        """Wrap an ASGI application."""
+        self.app = app
+
+    async def __call__(
+        self, scope: dict, receive: Callable, send: Callable
+    ) -> None:
+        """Run the request inside a span named after its route template."""
+        if scope["type"] != "http" or scope["path"].startswith(
+            UNTRACED_PREFIXES
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or ())
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1")
+
+        async def send_wrapper(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+            await send(message)
+
+        with (
+            use_traceparent(traceparent),
+            start_span(
+                scope["method"],
+                **{
+                    "http.method": scope["method"],
+                    "http.target": scope["path"],
+                },
+            ) as span,
+        ):
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", scope["path"])
+                span.name = f"{scope['method']} {route}"
+                span.set_attribute("http.route", route)
@@ -1,12 +1,37 @@
 """General utility functions."""
 
+import importlib.util
 import re
+import sys
+import threading
+from collections.abc import Callable
 from datetime import UTC, datetime
+from types import ModuleType
+
+
+class HTTPStatusError(ValueError):
+    """Base for request errors that map onto an HTTP status.
+
+    Routes turn these into `HTTPException(e.status_code, str(e))`.
+    """
+
+    def __init__(self, message: str, status_code: int = 400) -> None:
+        """Keep the HTTP status that describes the problem."""
+        super().__init__(message)
+        self.status_code = status_code
 
 
 def utc_now_iso() -> str:
     """Datetime now in UTC."""
-    return datetime.now(UTC).isoformat(timespec="seconds")
+    return utc_iso(datetime.now(UTC))
+
+
+def utc_iso(when: datetime) -> str:
+    """Format an aware datetime as a UTC ISO timestamp, to the second.
+
+    Stored timestamps use this form so they compare correctly as strings.
+    """
+    return when.astimezone(UTC).isoformat(timespec="seconds")
 
 
 def parse_utc_timestamp(ts: str) -> datetime:
@@ -36,3 +61,77 @@ def clean_tag_name(tag: str) -> str:
     tag = re.sub(r"[^\w\- ]", "", tag)  # remove unwanted symbols
     tag = re.sub(r"\s+", " ", tag)  # collapse multiple spaces
     return tag.strip()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a module lazily, deferring its execution to first use.
+
+    The returned module is registered in `sys.modules` (and on its parent
+    package) like a normal import, so `from pkg import mod` elsewhere and
+    `unittest.mock.patch("...mod.attr")` both see the same object. Its code
+    only runs the first time an attribute is read or set.
+
+    Args:
+        name (str): Fully qualified module name, e.g. `google.cloud.storage`.
+
+    Returns:
+        ModuleType: The module, possibly not yet executed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        msg = f"No module named {name!r}"
+        raise ModuleNotFoundError(msg, name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+class LazyObject:
+    """Proxy that builds an object on first use and forwards to it.
+
+    Used for module-level singletons that are expensive to create or import,
+    such as the Jinja environment, the OAuth registry and SDK client classes.
+    Attribute access and calls are forwarded to the object returned by
+    `factory`, which runs at most once.
+    """
+
+    def __init__(self, factory: Callable[[], object]) -> None:
+        """Wrap a zero-argument factory."""
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "_target", None)
+
+    def resolve(self) -> object:
+        """Return the wrapped object, creating it if needed."""
+        target = object.__getattribute__(self, "_target")
+        if target is None:
+            with object.__getattribute__(self, "_lock"):
+                target = object.__getattribute__(self, "_target")
+                if target is None:
+                    target = object.__getattribute__(self, "_factory")()
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    def __getattr__(self, name: str) -> object:
+        """Forward attribute reads to the wrapped object."""
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name: str, value: object) -> None:
+        """Forward attribute writes to the wrapped object."""
+        setattr(self.resolve(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        """Forward attribute deletes to the wrapped object."""
+        delattr(self.resolve(), name)
+
+    def __call__(self, *args: object, **kwargs: object) -> object:
+        """Call the wrapped object."""
+        return self.resolve()(*args, **kwargs)
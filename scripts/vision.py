@@ -4,12 +4,25 @@ It encodes images in base64, sends them to the model, and extracts object tags
 to support image-based inventory search in the application.
 """
 
+from __future__ import annotations
+
 import base64
 import logging
 import os
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+from scripts.metrics import OPENAI_REQUEST_SECONDS, record_openai_usage
+from scripts.objects import RESPONSE_FORMAT, VISION_PROMPT
+from scripts.util import LazyObject, lazy_import
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
-from openai import AsyncOpenAI, OpenAI
+# The SDK takes a few hundred milliseconds to import; defer it to first call
+openai = lazy_import("openai")
+OpenAI = LazyObject(lambda: openai.OpenAI)
+AsyncOpenAI = LazyObject(lambda: openai.AsyncOpenAI)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -35,35 +48,32 @@ def analyze_image_with_openai(image_path: str) -> dict:
         image_path (str): Path to the local image file.
 
     Returns:
-        dict: Dictionary containing a "summary" field with raw model output
-        (typically JSON-formatted).
+        dict: Dictionary containing a "summary" field with raw model output,
+        JSON following `scripts.objects.OBJECTS_SCHEMA`.
     """
     image_data = encode_image_to_base64(image_path)
     client = OpenAI()
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": (
-                            "List the objects in this image for inventory "
-                            "as JSON."
-                        ),
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_data}"
+    with OPENAI_REQUEST_SECONDS.time(operation="vision", model="gpt-4o"):
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": VISION_PROMPT},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{image_data}"
+                            },
                         },
-                    },
-                ],
-            }
-        ],
-        max_tokens=500,
-    )
+                    ],
+                }
+            ],
+            max_tokens=500,
+            response_format=RESPONSE_FORMAT,
+        )
+    record_openai_usage("vision", "gpt-4o", response.usage)
 
     content = response.choices[0].message.content
     return {"summary": content}
@@ -89,15 +99,18 @@ async def call_openai_chat(user_prompt: str, system_prompt: str = "") -> str:
         str: The assistant's response text, or an empty string on error.
     """
     client = get_async_client()
+    model = "gpt-3.5-turbo"
     try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.2,
-        )
+        with OPENAI_REQUEST_SECONDS.time(operation="chat", model=model):
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.2,
+            )
+        record_openai_usage("chat", model, response.usage)
         return response.choices[0].message.content.strip()
     except Exception:
         logger.exception("OpenAI API error")
@@ -0,0 +1,221 @@
+"""Zone health scores for the cleanup heatmap.
+
+A zone is an image label ("garage shelf") or a scanner location. Each gets
+a score from 0 (needs attention) to 100 (tidy), made of five penalties,
+each between 0 and 1 and weighted by `WEIGHTS`:
+
+- `density`: items in the zone (object quantities plus NFC tags present),
+  reaching 0.5 at `DENSITY_HALF_ITEMS`.
+- `stale`: days since the zone was last photographed or scanned, reaching
+  0.5 at `STALE_HALF_DAYS`.
+- `unknown`: share of objects the vision model was unsure about
+  (confidence under 0.5).
+- `bare`: share of objects recorded with neither color nor brand.
+- `churn`: tags moving in or out over the last `CHURN_WINDOW_DAYS`,
+  reaching 0.5 at `CHURN_HALF_MOVES`.
+
+A score set by hand in `zone_overrides` replaces the computed one.
+
+The counts come from `zone_stats` and `zone_moves`, which triggers in
+`derived.sql` update as images, objects and scans are stored. Scoring reads
+one row per zone plus the recent move counts, so every zone can be
+rescored on each request, however many items the house holds.
+
+    python -m scripts.zones
+    python -m scripts.zones override garage 90 --note "cleaned out"
+    python -m scripts.zones override garage --clear
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import aiosqlite
+
+from scripts.db import DB_PATH
+from scripts.util import parse_utc_timestamp
+
+#: Points each penalty can take off a perfect score
+WEIGHTS = {
+    "density": 25.0,
+    "stale": 25.0,
+    "unknown": 20.0,
+    "bare": 10.0,
+    "churn": 20.0,
+}
+
+DENSITY_HALF_ITEMS = 50
+STALE_HALF_DAYS = 30.0
+CHURN_HALF_MOVES = 10
+CHURN_WINDOW_DAYS = 28
+
+STATS_COLUMNS = ("zone", "images", "objects", "unknown", "bare", "tags",
+                 "last_access")
+
+
+def _saturate(value: float, half: float) -> float:
+    """Map 0..inf onto 0..1, reaching 0.5 at `half`."""
+    return value / (value + half) if value > 0 else 0.0
+
+
+def score_zone(stats: dict, moves: int, now: datetime) -> dict:
+    """Score one zone from its counts.
+
+    Args:
+        stats (dict): A `zone_stats` row.
+        moves (int): Tag moves in or out during the churn window.
+        now (datetime): Reference time for staleness.
+
+    Returns:
+        dict: Zone, score, the penalties and the counts they came from.
+    """
+    objects = max(stats["objects"], 0)
+    idle_days = None
+    if stats["last_access"]:
+        last = parse_utc_timestamp(stats["last_access"])
+        idle_days = max((now - last).total_seconds() / 86400, 0.0)
+    penalties = {
+        "density": _saturate(objects + stats["tags"], DENSITY_HALF_ITEMS),
+        "stale": _saturate(idle_days or 0.0, STALE_HALF_DAYS),
+        "unknown": stats["unknown"] / objects if objects else 0.0,
+        "bare": stats["bare"] / objects if objects else 0.0,
+        "churn": _saturate(moves, CHURN_HALF_MOVES),
+    }
+    score = 100 - sum(WEIGHTS[name] * p for name, p in penalties.items())
+    return {
+        "zone": stats["zone"],
+        "score": round(score, 1),
+        "overridden": False,
+        "penalties": {name: round(p, 3) for name, p in penalties.items()},
+        "counts": {
+            "images": stats["images"],
+            "objects": objects,
+            "unknown": stats["unknown"],
+            "bare": stats["bare"],
+            "tags": stats["tags"],
+            "moves": moves,
+            "last_access": stats["last_access"],
+            "idle_days": None if idle_days is None else round(idle_days, 1),
+        },
+    }
+
+
+async def zone_scores(
+    db: aiosqlite.Connection,
+    zone: str | None = None,
+    *,
+    now: datetime | None = None,
+) -> list[dict]:
+    """Score every zone, or just `zone`, worst first.
+
+    Args:
+        db (aiosqlite.Connection): Database connection.
+        zone (str, optional): Only score this zone.
+        now (datetime, optional): Reference time; defaults to now.
+
+    Returns:
+        list[dict]: One `score_zone` result per zone, with `note` set for
+        overridden zones.
+    """
+    now = now or datetime.now(UTC)
+    where, params = ("WHERE zone = ?", (zone,)) if zone else ("", ())
+    cursor = await db.execute(
+        f"SELECT {', '.join(STATS_COLUMNS)} FROM zone_stats {where}",  # nosec B608  # noqa: S608
+        params,
+    )
+    stats = [dict(zip(STATS_COLUMNS, row, strict=True))
+             for row in await cursor.fetchall()]
+
+    since = (now - timedelta(days=CHURN_WINDOW_DAYS)).date().isoformat()
+    cursor = await db.execute(
+        "SELECT zone, SUM(moves) FROM zone_moves WHERE day >= ? "
+        "GROUP BY zone",
+        (since,),
+    )
+    moves = dict(await cursor.fetchall())
+    cursor = await db.execute("SELECT zone, score, note FROM zone_overrides")
+    overrides = {z: (score, note) for z, score, note in await cursor.fetchall()}
+
+    results = []
+    for row in stats:
+        result = score_zone(row, moves.get(row["zone"], 0), now)
+        if row["zone"] in overrides:
+            result["score"], result["note"] = overrides[row["zone"]]
+            result["overridden"] = True
+        results.append(result)
+    results.sort(key=lambda r: (r["score"], r["zone"]))
+    return results
+
+
+async def set_override(
+    db: aiosqlite.Connection,
+    zone: str,
+    score: float | None,
+    note: str | None = None,
+) -> None:
+    """Pin the score of a zone, or clear the pin with `score=None`.
+
+    Raises:
+        ValueError: If the score is not between 0 and 100.
+    """
+    if score is None:
+        await db.execute("DELETE FROM zone_overrides WHERE zone = ?", (zone,))
+    elif not 0 <= score <= 100:  # noqa: PLR2004
+        msg = f"Zone score must be between 0 and 100, not {score}"
+        raise ValueError(msg)
+    else:
+        await db.execute(
+            "INSERT OR REPLACE INTO zone_overrides (zone, score, note) "
+            "VALUES (?, ?, ?)",
+            (zone, score, note),
+        )
+    await db.commit()
+
+
+async def prune_moves(
+    db: aiosqlite.Connection, *, now: datetime | None = None
+) -> int:
+    """Drop move counts older than the churn window.
+
+    Returns:
+        int: Number of rows deleted.
+    """
+    now = now or datetime.now(UTC)
+    since = (now - timedelta(days=CHURN_WINDOW_DAYS)).date().isoformat()
+    cursor = await db.execute("DELETE FROM zone_moves WHERE day < ?", (since,))
+    await db.commit()
+    return cursor.rowcount
+
+
+async def _run(args: argparse.Namespace) -> object:
+    async with aiosqlite.connect(args.db) as db:
+        if args.command == "override":
+            await set_override(
+                db, args.zone, None if args.clear else args.score, args.note
+            )
+            return await zone_scores(db, args.zone)
+        return await zone_scores(db)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command-line entry point to list scores or override one."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    commands = parser.add_subparsers(dest="command")
+    override = commands.add_parser("override", help="pin a zone's score")
+    override.add_argument("zone")
+    override.add_argument("score", type=float, nargs="?")
+    override.add_argument("--note")
+    override.add_argument("--clear", action="store_true")
+    args = parser.parse_args(argv)
+    if args.command == "override" and args.score is None and not args.clear:
+        parser.error("give a score or --clear")
+    print(json.dumps(asyncio.run(_run(args)), indent=2))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+
+from scripts import db as db_module
+from scripts import logger
+
+
+@pytest_asyncio.fixture
+async def db_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Point the app at a fresh, fully migrated database in `tmp_path`."""
+    path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", path)
+    monkeypatch.setattr(logger, "DB_PATH", path)
+    await db_module.init_db()
+    return path
@@ -0,0 +1,278 @@
+import asyncio
+import io
+import json
+import socket
+import threading
+import time
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Annotated
+
+import aiosqlite
+import pytest
+import pytest_asyncio
+import uvicorn
+from fastapi import FastAPI, Form, Request, UploadFile
+from fastapi.responses import PlainTextResponse
+from openai import AsyncOpenAI
+from PIL import Image
+
+from scripts import backfill
+from scripts import db as db_module
+
+
+class FakeBlob:
+    """GCS blob stand-in backed by its bucket's `objects` dict."""
+
+    def __init__(self, bucket: "FakeBucket", name: str) -> None:
+        """Refer to object `name` in `bucket`."""
+        self.bucket = bucket
+        self.name = name
+        self.time_created = datetime(2025, 1, 1, tzinfo=UTC)
+
+    def download_as_bytes(self) -> bytes:
+        """Return the stored contents."""
+        return self.bucket.objects[self.name]
+
+    def upload_from_string(self, data: str, content_type: str = "") -> None:
+        """Store `data` encoded as UTF-8."""
+        del content_type
+        self.bucket.objects[self.name] = data.encode()
+
+
+class FakeBucket:
+    """GCS bucket stand-in holding objects in memory."""
+
+    def __init__(self, objects: dict[str, bytes]) -> None:
+        """Serve `objects`, a name -> contents mapping."""
+        self.objects = objects
+
+    def blob(self, name: str) -> FakeBlob:
+        """Return a handle on object `name`."""
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix: str) -> list[FakeBlob]:
+        """Return the blobs whose names start with `prefix`."""
+        return [FakeBlob(self, n) for n in self.objects if n.startswith(prefix)]
+
+
+def make_fake_batch_app() -> FastAPI:
+    """Minimal local stand-in for the OpenAI Files and Batches endpoints."""
+    app = FastAPI()
+    files: dict[str, bytes] = {}
+    batches: dict[str, dict] = {}
+
+    def file_object(file_id: str, name: str) -> dict:
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(files[file_id]),
+            "created_at": 0,
+            "filename": name,
+            "purpose": "batch",
+            "status": "processed",
+        }
+
+    @app.post("/v1/files")
+    async def create_file(
+        file: UploadFile, purpose: Annotated[str, Form()]
+    ) -> dict:
+        del purpose
+        file_id = f"file-{len(files)}"
+        files[file_id] = await file.read()
+        return file_object(file_id, file.filename)
+
+    @app.post("/v1/batches")
+    async def create_batch(request: Request) -> dict:
+        body = await request.json()
+        batch_id = f"batch-{len(batches)}"
+        batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "created_at": 0,
+            "status": "validating",
+            "output_file_id": None,
+        }
+        return batches[batch_id]
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str) -> dict:
+        batch = batches[batch_id]
+        if batch["status"] == "validating":
+            batch["status"] = "in_progress"
+            return batch
+        if batch["status"] == "in_progress":
+            lines = []
+            requests = files[batch["input_file_id"]].decode().splitlines()
+            for line in requests:
+                req = json.loads(line)
+                if req["custom_id"].startswith("bad"):
+                    response = {"status_code": 500, "body": {}}
+                else:
+                    content = "Cable\nPower Strip\n{"
+                    response = {
+                        "status_code": 200,
+                        "body": {
+                            "choices": [{"message": {"content": content}}]
+                        },
+                    }
+                lines.append(
+                    json.dumps({"custom_id": req["custom_id"],
+                                "response": response})
+                )
+            output_id = f"file-{len(files)}"
+            files[output_id] = "\n".join(lines).encode()
+            batch["output_file_id"] = output_id
+            batch["status"] = "completed"
+        return batch
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str) -> PlainTextResponse:
+        return PlainTextResponse(files[file_id].decode())
+
+    return app
+
+
+@pytest.fixture
+def fake_batch_url() -> Iterator[str]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(
+        make_fake_batch_app(), host="127.0.0.1", port=port, log_level="error"
+    )
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+    thread.join()
+
+
+@pytest_asyncio.fixture
+async def temp_db(tmp_path, monkeypatch) -> Path:
+    path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", path)
+    await db_module.init_db("scripts/schema.sql")
+    return path
+
+
+def jpeg_bytes(size: tuple[int, int] = (1600, 1200)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, "red").save(out, "JPEG")
+    return out.getvalue()
+
+
+def test_downscale_image_limits_longest_side() -> None:
+    small = backfill.downscale_image(jpeg_bytes(), max_side=256)
+    with Image.open(io.BytesIO(small)) as img:
+        assert max(img.size) == 256  # noqa: PLR2004
+        assert img.format == "JPEG"
+
+
+def test_parse_batch_output_splits_failures() -> None:
+    text = "\n".join([
+        json.dumps({
+            "custom_id": "a.jpg",
+            "response": {
+                "status_code": 200,
+                "body": {"choices": [{"message": {"content": "usb"}}]},
+            },
+        }),
+        json.dumps({"custom_id": "b.jpg", "error": {"code": "x"}}),
+    ])
+    summaries, failed = backfill.parse_batch_output(text)
+    assert summaries == {"a.jpg": "usb"}
+    assert failed == ["b.jpg"]
+
+
+@pytest.mark.asyncio
+async def test_run_backfill_against_fake_endpoint(
+    temp_db, tmp_path, fake_batch_url
+) -> None:
+    bucket = FakeBucket({
+        "upload/old1.jpg": jpeg_bytes(),
+        "upload/old2.jpg": jpeg_bytes(),
+        "upload/bad.jpg": jpeg_bytes(),
+        "upload/done.jpg": jpeg_bytes(),
+        "upload/summary/done.jpg.summary.txt": b"lamp",
+        "upload/thumb/old1.jpg.thumb.jpg": jpeg_bytes((10, 10)),
+    })
+    await db_module.add_image("done.jpg", "", "2025-01-01T00:00:00+00:00")
+    await db_module.add_tag("lamp")
+    await db_module.link_image_tag("done.jpg", "lamp")
+
+    client = AsyncOpenAI(api_key="test", base_url=fake_batch_url)
+    state_path = tmp_path / "backfill" / "state.json"
+
+    totals = await backfill.run_backfill(
+        "bucket",
+        "upload",
+        client=client,
+        bucket=bucket,
+        chunk_size=2,
+        poll_interval=0,
+        state_path=state_path,
+    )
+
+    assert totals == {"submitted": 3, "ingested": 2, "failed": 1}
+    assert bucket.objects["upload/summary/old1.jpg.summary.txt"].startswith(
+        b"Cable"
+    )
+
+    async with aiosqlite.connect(temp_db) as db:
+        cursor = await db.execute(
+            "SELECT images.filename, tags.name FROM images "
+            "JOIN image_tags ON images.id = image_tags.image_id "
+            "JOIN tags ON tags.id = image_tags.tag_id ORDER BY 1, 2"
+        )
+        rows = await cursor.fetchall()
+    assert ("old1.jpg", "cable") in rows
+    assert ("old2.jpg", "power strip") in rows
+    assert not any(name == "bad.jpg" for name, _ in rows)
+
+    state = json.loads(state_path.read_text())
+    assert state["done"] == ["old1.jpg", "old2.jpg"]
+    assert all(batch["ingested"] for batch in state["batches"].values())
+
+    # A second run only retries the failed image
+    totals = await backfill.run_backfill(
+        "bucket",
+        "upload",
+        client=client,
+        bucket=bucket,
+        poll_interval=0,
+        state_path=state_path,
+    )
+    assert totals["submitted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_resume_polls_pending_batch_without_resubmitting(
+    temp_db, tmp_path, fake_batch_url
+) -> None:
+    del temp_db
+    bucket = FakeBucket({"upload/a.jpg": jpeg_bytes()})
+    client = AsyncOpenAI(api_key="test", base_url=fake_batch_url)
+    state_path = tmp_path / "state.json"
+
+    first = await backfill.run_backfill(
+        "bucket", "upload", client=client, bucket=bucket, wait=False,
+        state_path=state_path,
+    )
+    assert first == {"submitted": 1, "ingested": 0, "failed": 0}
+
+    second = await asyncio.wait_for(
+        backfill.run_backfill(
+            "bucket", "upload", client=client, bucket=bucket,
+            poll_interval=0, state_path=state_path,
+        ),
+        timeout=10,
+    )
+    assert second == {"submitted": 0, "ingested": 1, "failed": 0}
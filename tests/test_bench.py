@@ -0,0 +1,61 @@
+import io
+import random
+from pathlib import Path
+
+import pytest
+
+from scripts import bench
+
+
+def test_make_library_is_deterministic() -> None:
+    vocab = bench.make_vocabulary(1000)
+
+    first = bench.make_library(50, vocab, random.Random(7))  # noqa: S311
+    second = bench.make_library(50, vocab, random.Random(7))  # noqa: S311
+
+    assert first == second
+    assert len({r[0] for r in first}) == 50  # noqa: PLR2004
+    assert all(1 <= len(r[3]) <= 12 for r in first)  # noqa: PLR2004
+    # Zipf-like: the most common tag shows up far more than a rare one
+    counts = [sum(vocab[i] in r[3] for r in first) for i in (0, 150)]
+    assert counts[0] > counts[1]
+
+
+def test_filesystem_bucket_round_trip(tmp_path: Path) -> None:
+    client = bench.filesystem_client(tmp_path).from_service_account_json("k")
+    bucket = client.bucket("b")
+    bucket.blob("upload/summary/a.jpg.summary.txt").upload_from_string("x")
+    bucket.blob("upload/b.jpg").upload_from_file(io.BytesIO(b"jpg"))
+
+    names = sorted(b.name for b in bucket.list_blobs(prefix="upload/summary"))
+
+    assert names == ["upload/summary/a.jpg.summary.txt"]
+    assert bucket.blob("upload/b.jpg").download_as_bytes() == b"jpg"
+    assert bucket.blob("upload/b.jpg").content_type == "image/jpeg"
+
+
+@pytest.mark.asyncio
+async def test_run_benchmarks_reports_every_scenario(tmp_path: Path) -> None:
+    report = await bench.run_benchmarks(
+        (40,), repeats=1, slow_cap=10, workdir=tmp_path
+    )
+
+    scenarios = {row["scenario"] for row in report["results"]}
+    assert scenarios == {
+        "ingest_per_image",
+        "ingest_bulk",
+        "photos",
+        "search_common_tag",
+        "search_rare_tag",
+        "search_by_prompt",
+        "gcs_proxy_thumb",
+        "backup",
+        "rebuild_full",
+        "rebuild_delta",
+    }
+    rebuild = next(
+        r for r in report["results"] if r["scenario"] == "rebuild_full"
+    )
+    assert rebuild["items"] == 10  # noqa: PLR2004
+    assert report["meta"]["sizes"] == [40]
+    assert bench.compare(report, report)
@@ -0,0 +1,134 @@
+import io
+import tarfile
+import zipfile
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import aiosqlite
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from scripts import bulk, logger
+
+TS = "2025-05-01T12:00:00+00:00"
+
+
+def zip_bytes(files: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_bytes(files: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_stage_and_claim(db_path: Path, tmp_path: Path) -> None:
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    archive = tar_bytes({
+        "trip/a.jpg": b"aaa", "trip/b.jpg": b"bbb", "trip/notes.txt": b"x",
+        "other/a.jpg": b"aaa", "._a.jpg": b"mac",
+    })
+    staged = bulk.stage_upload(io.BytesIO(archive), "trip.tgz", uploads, 2)
+    assert [(s.name, s.error) for s in staged] == [
+        ("trip/a.jpg", None),
+        ("trip/b.jpg", None),
+        ("trip/notes.txt", "not an image"),
+        ("other/a.jpg", "batch is full"),
+    ]
+    broken = bulk.stage_upload(io.BytesIO(b"nope"), "x.zip", uploads)
+    assert broken[0].error.startswith("unreadable archive")
+
+    async with aiosqlite.connect(db_path) as db:
+        first = await bulk.create_batch(db, "garage", TS)
+        new = await bulk.claim_files(db, first, staged, uploads, TS)
+        again = bulk.stage_upload(
+            io.BytesIO(zip_bytes({"b.jpg": b"bbb", "c.jpg": b"ccc"})),
+            "more.zip",
+            uploads,
+        )
+        second = await bulk.create_batch(db, "", TS)
+        newer = await bulk.claim_files(db, second, again, uploads, TS)
+        await bulk.mark_file(db, first, new[0][1])
+        await bulk.mark_file(db, first, new[1][1], "vision down")
+        progress = await bulk.batch_progress(db, first)
+        retry = await bulk.batch_progress(db, second, files=False)
+
+    assert [filename for _, filename in new] == [
+        "2025-05-01T12-00-00+00-00_a.jpg", "2025-05-01T12-00-00+00-00_b.jpg"
+    ]
+    assert [filename for _, filename in newer] == [
+        "2025-05-01T12-00-00+00-00_c.jpg"
+    ]
+    assert sorted(p.name for p in uploads.iterdir()) == [
+        filename for _, filename in new + newer
+    ]
+    assert progress["counts"] == {
+        "queued": 0, "done": 1, "failed": 1, "duplicate": 0, "skipped": 2
+    }
+    assert progress["complete"]
+    assert progress["files"][1]["error"] == "vision down"
+    assert retry["counts"]["duplicate"] == 1
+    assert "files" not in retry
+
+
+@pytest.mark.asyncio
+@patch("scripts.logger.process_image", new_callable=AsyncMock)
+@patch("scripts.logger.upload_path_to_gcs")
+async def test_batch_api(
+    mock_gcs, mock_process: AsyncMock, db_path: Path, tmp_path: Path
+) -> None:
+    mock_process.side_effect = [True, False]
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        denied = await ac.post(
+            "/api/batches", files={"files": ("a.jpg", b"a", "image/jpeg")}
+        )
+        logger.app.dependency_overrides[logger.get_current_user] = lambda: {
+            "email": "me@example.com"
+        }
+        try:
+            with patch("scripts.logger.UPLOAD_DIR", tmp_path):
+                res = await ac.post(
+                    "/api/batches",
+                    data={"label": "attic"},
+                    files=[
+                        ("files", ("a.jpg", b"aaa", "image/jpeg")),
+                        ("files", ("box.zip", zip_bytes({
+                            "1.jpg": b"111", "2.jpg": b"aaa",
+                        }), "application/zip")),
+                    ],
+                )
+                batch_id = res.json()["id"]
+                queued = [
+                    logger.processing_queue.get_nowait() for _ in range(2)
+                ]
+                for item in queued:
+                    await logger.process_item(item)
+                done = await ac.get(f"/api/batches/{batch_id}")
+                missing = await ac.get("/api/batches/nope")
+        finally:
+            logger.app.dependency_overrides.clear()
+
+    assert denied.status_code == 401  # noqa: PLR2004
+    assert res.status_code == 202  # noqa: PLR2004
+    assert res.json()["counts"]["queued"] == 2  # noqa: PLR2004
+    assert res.json()["counts"]["duplicate"] == 1
+    assert queued[0]["upload"][2] == "attic"
+    assert queued[0]["gcs_path"] == f"upload/{queued[0]['upload'][1]}"
+    assert mock_gcs.call_count == 2  # noqa: PLR2004
+    assert done.json()["counts"] == {
+        "queued": 0, "done": 1, "failed": 1, "duplicate": 1, "skipped": 0
+    }
+    assert done.json()["files"][2]["filename"] == queued[0]["upload"][1]
+    assert missing.status_code == 404  # noqa: PLR2004
@@ -121,3 +121,50 @@ async def test_get_db_yields_connection(tmp_path) -> None:
             async with db.execute("SELECT value FROM test") as cursor:
                 row = await cursor.fetchone()
                 assert row[0] == "hello"
+
+
+@pytest.mark.asyncio
+async def test_add_images_with_tags_bulk(temp_db) -> None:
+    await db_module.add_image("old.jpg", "", "2025-01-01")
+    await db_module.add_images_with_tags([
+        ("old.jpg", "", "2025-05-07", ["usb", "cable"]),
+        ("new.jpg", "Desk", "2025-05-08", ["usb"]),
+    ])
+    await db_module.add_images_with_tags([("new.jpg", "", "x", ["usb"])])
+
+    async with aiosqlite.connect(temp_db) as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM image_tags")
+        assert (await cursor.fetchone())[0] == 3  # noqa: PLR2004
+        cursor = await db.execute(
+            "SELECT timestamp FROM images WHERE filename = 'old.jpg'"
+        )
+        assert (await cursor.fetchone())[0] == "2025-01-01"
+
+
+@pytest.mark.asyncio
+async def test_get_untagged_images(temp_db) -> None:
+    await db_module.add_image("tagged.jpg", "", "2025-05-07")
+    await db_module.add_image("bare.jpg", "", "2025-05-06")
+    await db_module.add_tag("lamp")
+    await db_module.link_image_tag("tagged.jpg", "lamp")
+
+    assert await db_module.get_untagged_images() == ["bare.jpg"]
+
+
+@pytest.mark.asyncio
+async def test_get_db_migrates_old_backup(tmp_path) -> None:
+    backup = tmp_path / "backup.db"
+    async with aiosqlite.connect(backup) as db:
+        await db.execute(
+            "CREATE TABLE images (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "filename TEXT UNIQUE, label TEXT, timestamp TEXT)"
+        )
+        await db.execute("INSERT INTO images (filename) VALUES ('old.jpg')")
+        await db.commit()
+
+    with patch("scripts.db.BACKUP_DB_PATH", backup):
+        async for db in get_db():
+            cursor = await db.execute(
+                "SELECT filename, thumb_formats, placeholder FROM images"
+            )
+            assert await cursor.fetchall() == [("old.jpg", None, None)]
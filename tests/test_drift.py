@@ -0,0 +1,125 @@
+import asyncio
+import xml.etree.ElementTree as ET
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import aiosqlite
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from scripts import drift, logger
+from scripts.auth import ALLOWED_USER
+from scripts.scanlog import ScanEvent, store_scan_events, timestamp_us
+
+
+async def scan(db_path: Path, tag_id: str, location: str, when: str) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        await store_scan_events(
+            db, [ScanEvent(tag_id, location, timestamp_us(when), "pi-1")]
+        )
+        await db.commit()
+
+
+async def watch(db_path: Path) -> list[tuple]:
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute(
+            "SELECT tag_id, away_since, due_at FROM drift_watch"
+        )
+        return await cursor.fetchall()
+
+
+@pytest_asyncio.fixture
+async def db_path(db_path: Path) -> Path:
+    await scan(db_path, "cable", "living room", "2025-03-01T09:00:00")
+    async with aiosqlite.connect(db_path) as db:
+        await drift.set_home(
+            db, "cable", "drawer", label="usb-c cable", grace_hours=24
+        )
+    return db_path
+
+
+@pytest.mark.asyncio
+async def test_watch_follows_moves(db_path: Path) -> None:
+    assert await watch(db_path) == [
+        ("cable", "2025-03-01T09:00:00+00:00", "2025-03-02T09:00:00+00:00")
+    ]
+    await scan(db_path, "cable", "desk", "2025-03-01T12:00:00")
+    assert (await watch(db_path))[0][1] == "2025-03-01T09:00:00+00:00"
+
+    async with aiosqlite.connect(db_path) as db:
+        reminders = await drift.emit_due(
+            db, now=datetime(2025, 4, 4, 9, tzinfo=UTC)
+        )
+    assert [r["message"] for r in reminders] == [(
+        "usb-c cable has been sitting out in desk for 34 days "
+        "(belongs in drawer)"
+    )]
+    assert (await watch(db_path))[0][2] == "2025-04-11T09:00:00+00:00"
+
+    await scan(db_path, "cable", "drawer", "2025-04-04T10:00:00")
+    assert await watch(db_path) == []
+    async with aiosqlite.connect(db_path) as db:
+        assert await drift.list_reminders(db) == []
+        assert await drift.next_due(db) is None
+        resolved = await drift.list_reminders(db, open_only=False)
+    assert resolved[0]["resolved_at"] == "2025-04-04T10:00:00+00:00"
+
+
+@pytest.mark.asyncio
+async def test_scheduler_wakes_for_due_items(db_path: Path) -> None:
+    scheduler = drift.DriftScheduler(db_path, max_sleep=60)
+    scheduler.start()
+    try:
+        for _ in range(100):
+            async with aiosqlite.connect(db_path) as db:
+                if await drift.list_reminders(db):
+                    break
+            await asyncio.sleep(0.01)
+        async with aiosqlite.connect(db_path) as db:
+            assert len(await drift.list_reminders(db)) == 1
+            due = await drift.next_due(db)
+        assert due > datetime.now(UTC) + timedelta(days=6)
+        assert await scheduler.run_once() == 60  # noqa: PLR2004
+    finally:
+        await scheduler.stop()
+
+
+@pytest.mark.asyncio
+async def test_reminder_api_and_feed(db_path: Path) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        (reminder,) = await drift.emit_due(db)
+
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        listed = await ac.get("/api/reminders")
+        feed = await ac.get("/reminders/feed")
+        dismiss = f"/api/reminders/{reminder['id']}/dismiss"
+        anonymous = await ac.post(dismiss)
+        try:
+            logger.app.dependency_overrides[logger.get_current_user] = (
+                lambda: {"email": "guest@example.com"}
+            )
+            guest = await ac.post(dismiss)
+            logger.app.dependency_overrides[logger.get_current_user] = (
+                lambda: {"email": ALLOWED_USER}
+            )
+            dismissed = await ac.post(dismiss)
+            again = await ac.post(dismiss)
+        finally:
+            logger.app.dependency_overrides.clear()
+        after = await ac.get("/api/reminders")
+        home = await ac.put("/api/where/cable/home", data={"home": "shelf"})
+
+    assert listed.json()["reminders"][0]["tag_id"] == "cable"
+    assert feed.headers["content-type"] == "application/atom+xml"
+    titles = ET.fromstring(feed.content).iter(  # noqa: S314
+        "{http://www.w3.org/2005/Atom}title"
+    )
+    assert reminder["message"] in [t.text for t in titles]
+    assert anonymous.status_code == 401  # noqa: PLR2004
+    assert guest.status_code == 403  # noqa: PLR2004
+    assert dismissed.status_code == 200  # noqa: PLR2004
+    assert again.status_code == 404  # noqa: PLR2004
+    assert after.json()["count"] == 0
+    assert home.status_code == 403  # noqa: PLR2004
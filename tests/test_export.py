@@ -0,0 +1,98 @@
+import csv
+import gzip
+import io
+import json
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from scripts import db as db_module
+from scripts import export, logger
+
+
+def obj(name: str, count: int) -> dict:
+    return {"name": name, "count": count, "color": "red", "brand": None,
+            "attributes": ["cordless"], "confidence": 0.9}
+
+
+async def collect(*args: object, **kwargs: object) -> bytes:
+    return b"".join([chunk async for chunk in export.stream_export(
+        *args, **kwargs
+    )])
+
+
+@pytest_asyncio.fixture
+async def db_path(db_path: Path) -> Path:
+    await db_module.add_images_with_tags(
+        [
+            (f"{i}.jpg", "garage" if i % 2 else "attic",
+             f"2025-0{1 + i % 3}-01T00:00:00+00:00",
+             ["drill", "tools"] if i % 2 else ["box"])
+            for i in range(25)
+        ],
+        {"1.jpg": [obj("drill", 1), obj("battery", 2)]},
+    )
+    return db_path
+
+
+@pytest.mark.asyncio
+async def test_formats_and_filters(db_path: Path) -> None:
+    node = export.build_filter(zone="garage", after="2025-02")
+    rows = list(csv.reader(io.StringIO(
+        (await collect("images", "csv", node, db_path=db_path,
+                       chunk_rows=4)).decode()
+    )))
+    assert rows[0] == ["filename", "label", "timestamp", "tags"]
+    assert rows[1] == [
+        "1.jpg", "garage", "2025-02-01T00:00:00+00:00", "drill;tools"
+    ]
+    assert len(rows) == 1 + 8  # odd i with i % 3 != 0
+
+    lines = gzip.decompress(await collect(
+        "objects", "ndjson", export.build_filter(tag="drill"),
+        gzip=True, db_path=db_path, chunk_rows=1,
+    )).splitlines()
+    assert [json.loads(line)["name"] for line in lines] == [
+        "drill", "battery"
+    ]
+    assert json.loads(lines[0])["attributes"] == ["cordless"]
+
+    tags = await collect("tags", "ndjson", db_path=db_path)
+    assert json.loads(tags.splitlines()[0]) == {
+        "tag": "box", "images": 13, "first_used": "2025-01-01T00:00:00+00:00",
+        "last_used": "2025-03-01T00:00:00+00:00",
+    }
+
+
+@pytest.mark.asyncio
+async def test_parquet_row_groups(db_path: Path) -> None:
+    pq = pytest.importorskip("pyarrow.parquet")
+    data = await collect(
+        "images", "parquet", gzip=True, db_path=db_path, chunk_rows=10
+    )
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_row_groups == 3  # noqa: PLR2004
+    table = parquet.read()
+    assert table.num_rows == 25  # noqa: PLR2004
+    assert table.column("tags")[1].as_py() == ["drill", "tools"]
+
+
+@pytest.mark.asyncio
+async def test_export_endpoint(db_path: Path) -> None:
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get(
+            "/export", params={"kind": "tags", "tag": "box", "gzip": "true"}
+        )
+        bad_query = await ac.get("/export", params={"after": "soon"})
+        bad_kind = await ac.get("/export", params={"kind": "users"})
+
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="tags.csv.gz"' in response.headers["content-disposition"]
+    assert gzip.decompress(response.content).decode().splitlines()[1] == (
+        "box,13,2025-01-01T00:00:00+00:00,2025-03-01T00:00:00+00:00"
+    )
+    assert bad_query.status_code == 400  # noqa: PLR2004
+    assert bad_kind.status_code == 400  # noqa: PLR2004
@@ -1,6 +1,10 @@
 """Check syntax of all python code by importing all modules."""
 import importlib
+import json
+import os
 import pathlib
+import subprocess
+import sys
 
 
 def test_all_scripts_import() -> None:
@@ -8,3 +12,41 @@ def test_all_scripts_import() -> None:
     for path in scripts:
         mod = f"scripts.{path.stem}"
         importlib.import_module(mod)
+
+
+#: Modules that must stay unloaded until the app first uses them
+DEFERRED_MODULES = (
+    "openai._client",
+    "google.cloud.storage.client",
+    "google.auth.jwt",
+    "jinja2",
+    "authlib.integrations.starlette_client",
+    "PIL.ImageFile",
+    "numpy",
+)
+
+#: Wall-clock budget for `import scripts.logger` in a fresh interpreter
+IMPORT_BUDGET_S = float(os.getenv("IMPORT_BUDGET_S", "1.5"))
+
+
+def test_app_import_is_lazy_and_fast() -> None:
+    probe = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import scripts.logger\n"
+        "elapsed = time.perf_counter() - start\n"
+        # Lazy placeholders are `_LazyModule` until an attribute is used
+        f"loaded = [m for m in {DEFERRED_MODULES!r}\n"
+        "          if type(sys.modules.get(m)).__name__ == 'module']\n"
+        "print(json.dumps({'elapsed': elapsed, 'loaded': loaded}))\n"
+    )
+    out = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", probe],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+
+    assert result["loaded"] == []
+    assert result["elapsed"] < IMPORT_BUDGET_S
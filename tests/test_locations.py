@@ -0,0 +1,92 @@
+from datetime import UTC, datetime
+from pathlib import Path
+
+import aiosqlite
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from scripts import db as db_module
+from scripts import locations, logger
+from scripts.scanlog import ScanEvent, store_scan_events, timestamp_us
+
+
+def scan(tag_id: str, location: str, when: str) -> ScanEvent:
+    return ScanEvent(tag_id, location, timestamp_us(when), "pi-1")
+
+
+@pytest.mark.asyncio
+async def test_current_location_follows_scans(db_path: Path) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        await store_scan_events(db, [
+            scan("cat", "kitchen", "2025-04-01T10:00:00"),
+            scan("cat", "kitchen", "2025-04-01T10:20:00"),
+            scan("drill", "garage", "2025-04-01T10:30:00"),
+            scan("cat", "garage", "2025-04-01T11:05:00"),
+            scan("cat", "garage", "2025-04-01T11:35:00"),
+            scan("cat", "attic", "2025-04-01T09:00:00"),  # arrives late
+        ])
+        await db.commit()
+        cat = await locations.where_is(db, "cat")
+        garage = await locations.zone_contents(db, "garage")
+        kitchen = await locations.zone_contents(db, "kitchen")
+        history = await locations.location_history(db, "cat")
+        missing = await locations.where_is(db, "dog")
+
+    assert cat["location"] == "garage"
+    assert cat["since"] == "2025-04-01T11:05:00+00:00"
+    assert cat["dwell_seconds"] == 1800  # noqa: PLR2004
+    assert [item["tag_id"] for item in garage] == ["cat", "drill"]
+    assert kitchen == []
+    assert missing is None
+    assert [(h["bucket"][11:13], h["location"], h["scans"])
+            for h in history] == [
+        ("11", "garage", 2), ("10", "kitchen", 2), ("09", "attic", 1)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_backfill_and_downsample(db_path: Path) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("DROP TRIGGER scan_events_locate")
+        await store_scan_events(db, [
+            scan("keys", "hall", f"2025-01-01T{hour:02}:15:00")
+            for hour in range(5)
+        ] + [scan("keys", "desk", "2025-03-01T08:00:00")])
+        await db.commit()
+    await db_module.init_db()  # recreates the trigger and fills the tables
+
+    async with aiosqlite.connect(db_path) as db:
+        assert (await locations.where_is(db, "keys"))["location"] == "desk"
+        assert len(await locations.location_history(db, "keys")) == 6  # noqa: PLR2004
+        folded = await locations.downsample_history(
+            db, older_than_days=30, now=datetime(2025, 3, 2, tzinfo=UTC)
+        )
+        history = await locations.location_history(db, "keys")
+
+    assert folded == 5  # noqa: PLR2004
+    assert [(h["span"], h["location"], h["scans"]) for h in history] == [
+        (3600, "desk", 1), (86400, "hall", 5)
+    ]
+    assert history[1]["first_seen"] == "2025-01-01T00:15:00+00:00"
+    assert history[1]["last_seen"] == "2025-01-01T04:15:00+00:00"
+
+
+@pytest.mark.asyncio
+async def test_where_api(db_path: Path) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        await store_scan_events(
+            db, [scan("04A1", "garage", "2025-04-01T10:00:00")]
+        )
+        await db.commit()
+
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        where = await ac.get("/api/where/04A1")
+        history = await ac.get("/api/where/04A1/history")
+        zone = await ac.get("/api/zones/garage/items")
+        missing = await ac.get("/api/where/nope")
+
+    assert where.json()["location"] == "garage"
+    assert history.json()["history"][0]["scans"] == 1
+    assert zone.json()["count"] == 1
+    assert missing.status_code == 404  # noqa: PLR2004
@@ -15,10 +15,12 @@ def app() -> FastAPI:
 
 
 @pytest.mark.asyncio
-async def test_healthz_ok(tmp_path: Path) -> None:
+async def test_healthz_ok(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
     db_path = tmp_path / "metadata.db"
     db_path.write_text("")  # touch file
-    logger.BACKUP_DB_PATH = db_path
+    monkeypatch.setattr(logger, "BACKUP_DB_PATH", db_path)
 
     async with logger.aiosqlite.connect(db_path) as db:
         await db.execute(
@@ -50,7 +52,8 @@ async def test_root_returns_template() -> None:
         assert "html" in res.headers["content-type"]
 
 
-@patch("scripts.logger.Image.open")
+@patch("scripts.logger.render_thumbnails", new_callable=AsyncMock)
+@patch("scripts.logger.set_image_renditions", new_callable=AsyncMock)
 @patch("scripts.logger.upload_file_to_gcs")
 @patch("scripts.logger.analyze_image_with_openai")
 @patch("scripts.logger.add_image", new_callable=AsyncMock)
@@ -63,7 +66,8 @@ async def test_process_image_success(  # noqa: PLR0913
     mock_add,
     mock_ai,
     mock_upload,
-    mock_open,
+    mock_renditions,
+    mock_render,
     tmp_path: Path,
 ) -> None:
     file_path = tmp_path / "test_image.jpg"
@@ -71,11 +75,33 @@ async def test_process_image_success(  # noqa: PLR0913
     thumb_path = file_path.parent / "test_image.jpg.thumb.jpg"
     thumb_path.write_bytes(b"\x89PNG\r\n\x1a\n")  # Fake PNG thumbnail
     mock_ai.return_value = {"summary": "cable\npower\nswitch"}
-    mock_open.return_value.__enter__.return_value = MagicMock()
-
-    with patch("scripts.logger.UPLOAD_DIR", new_callable=lambda: tmp_path):
+    mock_render.return_value = {
+        "files": ["test_image.jpg.thumb.jpg"],
+        "formats": ("webp",),
+        "placeholder": "data:image/webp;base64,AAAA",
+        "widths": {"grid": 320},
+    }
+
+    with (
+        patch("scripts.logger.UPLOAD_DIR", new_callable=lambda: tmp_path),
+        patch(
+            "scripts.logger.set_image_objects", new_callable=AsyncMock
+        ) as mock_objects,
+    ):
         await logger.process_image((file_path, "test_image.jpg", "Test"))
     assert mock_add.called
+    mock_tag.assert_any_call("switch")
+    assert [o["name"] for o in mock_objects.await_args.args[1]] == [
+        "cable", "power", "switch"
+    ]
+    mock_renditions.assert_awaited_once_with(
+        "test_image.jpg",
+        ["webp"],
+        "data:image/webp;base64,AAAA",
+        "grid:320",
+    )
+    uploaded = [c.args[1] for c in mock_upload.call_args_list]
+    assert "upload/thumb/test_image.jpg.thumb.jpg" in uploaded
 
 
 def test_upload_file_to_gcs_mocked(tmp_path: Path) -> None:
@@ -121,7 +147,8 @@ async def test_get_photos_route_runs(tmp_path: Path) -> None:
         async with aiosqlite.connect(db_path) as db:
             await db.execute(
                 "CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, "
-                "filename TEXT, timestamp TEXT)"
+                "filename TEXT, timestamp TEXT, thumb_formats TEXT, "
+                "placeholder TEXT, thumb_widths TEXT)"
             )
             await db.execute(
                 "CREATE TABLE IF NOT EXISTS tags "
@@ -132,8 +159,9 @@ async def test_get_photos_route_runs(tmp_path: Path) -> None:
                 "(id INTEGER PRIMARY KEY, image_id INTEGER, tag_id INTEGER)"
             )
             await db.execute(
-                "INSERT INTO images (filename, timestamp) "
-                "VALUES ('file1.jpg', '2025-05-07T12:00:00')"
+                "INSERT INTO images (filename, timestamp, placeholder) "
+                "VALUES ('file1.jpg', '2025-05-07T12:00:00', "
+                "'data:image/webp;base64,UklGR')"
             )
             await db.commit()
             yield db
@@ -149,6 +177,8 @@ async def test_get_photos_route_runs(tmp_path: Path) -> None:
         res = await client.get("/photos")
         assert res.status_code == 200  # noqa: PLR2004
         assert "file1.jpg" in res.text
+        assert "data:image/webp;base64,UklGR" in res.text
+        assert 'loading="lazy"' in res.text
 
     # Cleanup
     logger.app.dependency_overrides.clear()
@@ -104,14 +104,17 @@ def override_get_db(db_path: str) -> callable:
 
 @pytest.mark.asyncio
 @patch("scripts.logger.call_openai_chat", new_callable=AsyncMock)
-async def test_search_query_response(mock_call, tmp_path) -> None:
+async def test_search_query_response(
+    mock_call, tmp_path, monkeypatch: pytest.MonkeyPatch
+) -> None:
     db_path = tmp_path / "test.db"
     db_path = db_path.resolve()
 
     async with aiosqlite.connect(db_path) as db:
         await db.execute(
-            "CREATE TABLE IF NOT EXISTS images "
-            "(id INTEGER PRIMARY KEY, filename TEXT, timestamp TEXT)"
+            "CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, "
+            "filename TEXT, timestamp TEXT, thumb_formats TEXT, "
+            "placeholder TEXT, thumb_widths TEXT)"
         )
         await db.execute(
             "CREATE TABLE IF NOT EXISTS tags "
@@ -127,7 +130,7 @@ async def test_search_query_response(mock_call, tmp_path) -> None:
         )
         await db.commit()
 
-    db_module.DB_PATH = db_path
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
 
     logger.app.dependency_overrides.clear()
     logger.app.dependency_overrides[logger_get_db] = override_get_db(db_path)
@@ -166,7 +169,7 @@ async def test_backup_now_success(mock_getenv, mock_upload, tmp_path) -> None:
     }
 
     test_db_path = tmp_path / "test.db"
-    with patch("scripts.config.BACKUP_DB_PATH", test_db_path):
+    with patch("scripts.db.BACKUP_DB_PATH", test_db_path):
         async for db in get_db():
             await db.commit()
 
@@ -89,18 +89,21 @@ async def test_gcs_proxy_internal_error(mock_client, mock_exists) -> None:
 
 
 @pytest.mark.asyncio
-async def test_search_query_logic(tmp_path: logger.Path) -> None:
+async def test_search_query_logic(
+    tmp_path: logger.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
     # Create dummy image and thumbnail files
     (tmp_path / "test.jpg").write_bytes(b"\xff\xd8\xff")
     (tmp_path / "test.jpg.thumb.jpg").write_bytes(b"\xff\xd8\xff")
 
     # Set up the test DB
     db_path = tmp_path / "metadata.db"
-    logger.BACKUP_DB_PATH = db_path
+    monkeypatch.setattr(logger, "BACKUP_DB_PATH", db_path)
     async with _real_connect(db_path) as db:
         await db.execute(
-            "CREATE TABLE images "
-            "(id INTEGER PRIMARY KEY, filename TEXT, timestamp TEXT)"
+            "CREATE TABLE images (id INTEGER PRIMARY KEY, "
+            "filename TEXT, timestamp TEXT, thumb_formats TEXT, "
+            "placeholder TEXT, thumb_widths TEXT)"
         )
         await db.execute(
             "CREATE TABLE tags (id INTEGER PRIMARY KEY, name TEXT)"
@@ -110,7 +113,8 @@ async def test_search_query_logic(tmp_path: logger.Path) -> None:
             "(id INTEGER PRIMARY KEY, image_id INTEGER, tag_id INTEGER)"
         )
         await db.execute(
-            "INSERT INTO images VALUES (1, 'test.jpg', '2025-05-07T01:00:00')"
+            "INSERT INTO images (id, filename, timestamp) "
+            "VALUES (1, 'test.jpg', '2025-05-07T01:00:00')"
         )
         await db.execute("INSERT INTO tags VALUES (1, 'power')")
         await db.execute("INSERT INTO image_tags VALUES (1, 1, 1)")
@@ -150,7 +154,9 @@ async def test_search_query_logic(tmp_path: logger.Path) -> None:
 
 
 @pytest.mark.asyncio
-async def test_cleanup_old_backups(tmp_path: logger.Path) -> None:
+async def test_cleanup_old_backups(
+    tmp_path: logger.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
     old_file = tmp_path / "backup-2000-01-01.sqlite3"
     old_file.write_text("x")
     old_time = datetime.now(timezone.utc) - timedelta(days=365)
@@ -160,7 +166,7 @@ async def test_cleanup_old_backups(tmp_path: logger.Path) -> None:
         path = tmp_path / f"backup-2025-05-{i + 1:02d}.sqlite3"
         path.write_text("ok")
 
-    logger.DB_BACKUP_DIR = tmp_path
+    monkeypatch.setattr(logger, "DB_BACKUP_DIR", tmp_path)
     await logger.cleanup_old_backups()
 
     assert not old_file.exists()
@@ -1,63 +1,120 @@
 import contextlib
-import json
+import threading
+import urllib.error
+from pathlib import Path
 from typing import NoReturn
 
-from scripts import logger_nfc
+import pytest
 
+from scripts import logger_nfc, scanlog
+from scripts.reader import QueueReader
 
-def test_log_tag_creates_entry(tmp_path, monkeypatch) -> None:
-    log_path = tmp_path / "log.json"
 
-    # Patch the module-level LOG_PATH
-    monkeypatch.setattr(logger_nfc, "LOG_PATH", log_path)
+@pytest.fixture
+def writer(tmp_path: Path) -> scanlog.ScanWriter:
+    return scanlog.ScanWriter(tmp_path, "pi-garage", fsync=False)
 
-    logger_nfc.log_tag("abc123", location="garage")
 
-    assert log_path.exists()
-    lines = log_path.read_text().splitlines()
-    assert len(lines) == 1
+def test_log_tag_creates_entry(writer: scanlog.ScanWriter) -> None:
+    logger_nfc.log_tag("abc123", location="garage", writer=writer)
+    writer.flush()
 
-    entry = json.loads(lines[0])
-    assert entry["tag"] == "abc123"
-    assert entry["location"] == "garage"
-    assert "timestamp" in entry
+    _, events, _ = scanlog.read_segment(writer.segment)
+    assert len(events) == 1
+    assert events[0].tag_id == "abc123"
+    assert events[0].location == "garage"
+    assert events[0].node_id == "pi-garage"
+    assert events[0].iso_timestamp.startswith("20")
 
 
-def test_log_tag_appends_multiple_entries(tmp_path, monkeypatch) -> None:
-    log_path = tmp_path / "log.json"
-    monkeypatch.setattr(logger_nfc, "LOG_PATH", log_path)
+def test_log_tag_appends_multiple_entries(
+    writer: scanlog.ScanWriter,
+) -> None:
+    logger_nfc.log_tag("tag1", writer=writer)
+    logger_nfc.log_tag("tag2", location="desk", writer=writer)
+    assert not writer.segment  # buffered, nothing written yet
+    writer.close()
 
-    logger_nfc.log_tag("tag1")
-    logger_nfc.log_tag("tag2", location="desk")
+    _, events, _ = scanlog.read_segment(writer.segment)
+    assert [(e.tag_id, e.location) for e in events] == [
+        ("tag1", "unknown"), ("tag2", "desk")
+    ]
 
-    lines = log_path.read_text().splitlines()
-    assert len(lines) == 2  # noqa: PLR2004
 
-    entry1 = json.loads(lines[0])
-    entry2 = json.loads(lines[1])
-    assert entry1["tag"] == "tag1"
-    assert entry2["tag"] == "tag2"
-    assert entry2["location"] == "desk"
-
-
-def test_read_tag_is_placeholder() -> None:
-    assert logger_nfc.read_tag() is None
-
-
-def test_run_logs_tag_once(monkeypatch, tmp_path) -> None:
-    monkeypatch.setattr(logger_nfc, "LOG_PATH", tmp_path / "log.json")
-    monkeypatch.setattr(logger_nfc, "read_tag", lambda: "abc123")
+def test_run_logs_tag_once(
+    monkeypatch: pytest.MonkeyPatch, writer: scanlog.ScanWriter
+) -> None:
+    reader = QueueReader()
+    reader.put("abc123")
 
     # Patch log_tag to only run once then break
     calls = []
 
-    def fake_log_tag(tag_id, location="unknown") -> NoReturn:
+    def fake_log_tag(tag_id, location="unknown", writer=None) -> NoReturn:
         calls.append(tag_id)
         raise KeyboardInterrupt  # simulate stopping the loop
 
     monkeypatch.setattr(logger_nfc, "log_tag", fake_log_tag)
 
     with contextlib.suppress(KeyboardInterrupt):
-        logger_nfc.run()
+        logger_nfc.run(reader, writer)
 
     assert calls == ["abc123"]
+    assert reader.closed
+
+
+def test_run_commits_when_due(writer: scanlog.ScanWriter) -> None:
+    writer.max_delay = 0.05
+    reader = QueueReader()
+    reader.put("abc123")
+    threading.Timer(0.3, reader.close).start()
+
+    logger_nfc.run(reader, writer, location="hall")
+
+    _, events, _ = scanlog.read_segment(writer.segment)
+    assert [(e.tag_id, e.location) for e in events] == [("abc123", "hall")]
+
+
+def test_spooler_batches_retries_and_prunes(tmp_path: Path) -> None:
+    writer = scanlog.ScanWriter(
+        tmp_path, "pi-1", max_events=2, segment_bytes=80, fsync=False
+    )
+    for i in range(8):
+        writer.append(f"tag{i}", "hall", timestamp=i + 1)
+    writer.flush()
+
+    spooler = logger_nfc.ScanSpooler(tmp_path, "http://test", batch_events=2)
+    posts = []
+    down = True
+
+    def fake_post(body: bytes, key: str) -> None:
+        if down:
+            msg = "offline"
+            raise urllib.error.URLError(msg)
+        posts.append((key, scanlog.decode_batch(body, "gzip")))
+
+    spooler._post = fake_post  # noqa: SLF001
+    assert spooler.flush() == 0
+    assert spooler.failures == 1
+    assert spooler.seconds_until_retry() == 2 * spooler.interval
+
+    down = False
+    assert spooler.flush() == 8  # noqa: PLR2004
+    assert spooler.failures == 0
+    sent = [e.tag_id for _, (_, events) in posts for e in events]
+    assert sent == [f"tag{i}" for i in range(8)]
+    assert all(len(events) == 2 for _, (_, events) in posts)  # noqa: PLR2004
+    assert len({key for key, _ in posts}) == len(posts)
+    assert list(tmp_path.glob("*.seg")) == [writer.segment]
+
+    # A restarted spooler resumes where the last one stopped
+    writer.append("tag8", "hall", timestamp=9)
+    writer.close()
+    posts.clear()
+    restarted = logger_nfc.ScanSpooler(tmp_path, "http://test")
+    restarted._post = fake_post  # noqa: SLF001
+    assert restarted.send_pending() == 1
+    assert [e.tag_id for e in posts[0][1][1]] == ["tag8"]
+
+    with pytest.raises(ValueError, match="http or https"):
+        logger_nfc.ScanSpooler(tmp_path, "file:///etc/passwd")
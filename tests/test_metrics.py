@@ -0,0 +1,118 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from scripts import logger, metrics
+
+
+def test_counter_and_gauge_render() -> None:
+    registry = metrics.Registry()
+    counter = metrics.Counter(
+        "jobs", "Jobs run.", ("kind",), registry=registry
+    )
+    gauge = metrics.Gauge("depth", "Queue depth.", registry=registry)
+    counter.inc(kind="a")
+    counter.inc(2, kind='b"x')
+    gauge.set_function(lambda: 3)
+
+    text = registry.render()
+
+    assert "# TYPE jobs counter" in text
+    assert 'jobs_total{kind="a"} 1.0' in text
+    assert 'jobs_total{kind="b\\"x"} 2.0' in text
+    assert "depth 3.0" in text
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    registry = metrics.Registry()
+    hist = metrics.Histogram(
+        "lat", "Latency.", ("op",), buckets=(0.1, 1.0), registry=registry
+    )
+    for value in (0.05, 0.5, 5.0):
+        hist.observe(value, op="x")
+
+    text = registry.render()
+
+    assert 'lat_bucket{op="x",le="0.1"} 1' in text
+    assert 'lat_bucket{op="x",le="1.0"} 2' in text
+    assert 'lat_bucket{op="x",le="+Inf"} 3' in text
+    assert 'lat_count{op="x"} 3' in text
+    assert 'lat_sum{op="x"} 5.55' in text
+
+
+@pytest.mark.asyncio
+async def test_histogram_timed_decorator() -> None:
+    hist = metrics.Histogram("t", "T.", ("fn",), registry=None)
+
+    @hist.timed(fn="work")
+    async def work() -> int:
+        return 42
+
+    assert await work() == 42  # noqa: PLR2004
+    assert hist.count(fn="work") == 1
+
+
+def test_labels_must_match() -> None:
+    counter = metrics.Counter("c", "C.", ("a",), registry=None)
+    with pytest.raises(ValueError, match="expects labels"):
+        counter.inc(b="x")
+
+
+def test_duplicate_names_rejected() -> None:
+    registry = metrics.Registry()
+    metrics.Counter("dup", "D.", registry=registry)
+    with pytest.raises(ValueError, match="Duplicate"):
+        metrics.Counter("dup", "D.", registry=registry)
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_route_latency() -> None:
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        await client.get("/unauthorized")
+        res = await client.get("/metrics")
+
+    assert res.status_code == 200  # noqa: PLR2004
+    assert res.headers["content-type"].startswith("text/plain")
+    assert (
+        "tracker_http_request_duration_seconds_count"
+        '{method="GET",route="/unauthorized",status="200"}'
+    ) in res.text
+    assert "tracker_processing_queue_depth 0.0" in res.text
+
+
+@pytest.mark.asyncio
+@patch("scripts.logger.process_image", new_callable=AsyncMock)
+async def test_process_uploads_records_queue_wait(
+    mock_process: AsyncMock,
+) -> None:
+    before = metrics.QUEUE_WAIT_SECONDS.count()
+    upload = ("path", "file.jpg", "")
+    await logger.processing_queue.put(
+        {"upload": upload, "enqueued_at": time.monotonic()}
+    )
+
+    worker = asyncio.create_task(logger.process_uploads())
+    await asyncio.wait_for(logger.processing_queue.join(), timeout=5)
+    worker.cancel()
+
+    mock_process.assert_awaited_once_with(upload)
+    assert metrics.QUEUE_WAIT_SECONDS.count() == before + 1
+
+
+def test_record_openai_usage_counts_tokens() -> None:
+    usage = MagicMock(prompt_tokens=10, completion_tokens=5)
+    before = metrics.OPENAI_TOKENS.value(
+        operation="test", model="m", kind="prompt_tokens"
+    )
+
+    metrics.record_openai_usage("test", "m", usage)
+
+    assert metrics.OPENAI_TOKENS.value(
+        operation="test", model="m", kind="prompt_tokens"
+    ) == before + 10
@@ -0,0 +1,204 @@
+import json
+from collections.abc import Iterator
+from pathlib import Path
+
+import aiosqlite
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from scripts import db as db_module
+from scripts import logger, objects, tags
+
+STRUCTURED = json.dumps({
+    "objects": [
+        {"name": "USB Cables", "count": 2, "attributes": ["Black"],
+         "confidence": 0.9},
+        {"name": "mouse", "count": 1, "attributes": [], "confidence": 85},
+    ]
+})
+
+LEGACY = """```json
+{
+  "objects": [
+    {"item": "hdmi cable", "quantity": "3", "color": "grey"},
+    {"item": "power strip", "quantity": 1}
+  ]
+}
+```"""
+
+
+@pytest.fixture(autouse=True)
+def fresh_aliases() -> Iterator[None]:
+    tags.aliases.clear()
+    yield
+    tags.aliases.clear()
+
+
+def test_parse_structured_output() -> None:
+    assert objects.parse_objects(STRUCTURED) == [
+        {"name": "usb cable", "count": 2, "color": None, "brand": None,
+         "attributes": ["black"], "confidence": 0.9},
+        {"name": "mouse", "count": 1, "color": None, "brand": None,
+         "attributes": [], "confidence": 0.85},
+    ]
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        (LEGACY, [("hdmi cable", 3), ("power strip", 1)]),
+        (STRUCTURED[:70], []),  # cut off inside the first object
+        (STRUCTURED[:110], [("usb cable", 2)]),
+        ('Here you go: ["lamps", "Desk"]', [("lamp", 1), ("desk", 1)]),
+        ('{"usb cable": 2, "mouse": 1}', [("usb cable", 2), ("mouse", 1)]),
+        ("- cable: 2\n* power\nswitch x3\n", [
+            ("cable", 2), ("power", 1), ("switch", 3)
+        ]),
+        ('{"objects": [{"name": "quantity 1"}, {"name": "json"}]}', []),
+        ("", []),
+    ],
+)
+def test_parse_loose_output(
+    text: str, expected: list[tuple[str, int]]
+) -> None:
+    parsed = objects.parse_objects(text)
+    assert [(o["name"], o["count"]) for o in parsed] == expected
+
+
+def test_stream_yields_objects_as_they_close() -> None:
+    stream = objects.ObjectStream()
+    seen = [
+        [o["name"] for o in stream.feed(STRUCTURED[i:i + 16])]
+        for i in range(0, len(STRUCTURED), 16)
+    ]
+    assert [names for names in seen if names] == [["usb cable"], ["mouse"]]
+    assert stream.close() == []
+
+
+@pytest.mark.asyncio
+async def test_reparse_replaces_junk_tags(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    await db_module.init_db()
+    # What line-by-line ingest made of LEGACY
+    await db_module.add_images_with_tags([
+        ("a.jpg", "", "2025-01-01", ["json", "objects", "quantity 1"]),
+        ("b.jpg", "", "2025-01-02", ["mouse"]),
+    ])
+    summaries = [("a.jpg", LEGACY), ("b.jpg", '["mouse"]'), ("z.jpg", "")]
+
+    dry = await objects.reparse_summaries(summaries, db_path, dry_run=True)
+    stats = await objects.reparse_summaries(summaries, db_path)
+
+    assert dry == stats
+    assert stats["images"] == 2  # noqa: PLR2004
+    assert stats["tags_removed"] == 3  # noqa: PLR2004
+    assert stats["missing"] == 1
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute("SELECT name FROM tags ORDER BY name")
+        names = [row[0] for row in await cursor.fetchall()]
+        cursor = await db.execute(
+            "SELECT name, quantity, color, attributes FROM objects "
+            "ORDER BY id"
+        )
+        rows = await cursor.fetchall()
+    assert names == ["hdmi cable", "mouse", "power strip"]
+    assert rows == [
+        ("hdmi cable", 3, "grey", "[]"),
+        ("power strip", 1, None, "[]"),
+        ("mouse", 1, None, "[]"),
+    ]
+
+
+def _obj(name: str, count: int, color: str | None, brand: str | None) -> dict:
+    return {"name": name, "count": count, "color": color, "brand": brand,
+            "attributes": [], "confidence": None}
+
+
+@pytest.mark.asyncio
+async def test_inventory_aggregates(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    monkeypatch.setattr(logger, "DB_PATH", db_path)
+    await db_module.init_db()
+    await db_module.add_images_with_tags(
+        [
+            ("a.jpg", "", "2025-01-01", ["hdmi cable"]),
+            ("b.jpg", "", "2025-03-01", ["hdmi cable", "mouse"]),
+        ],
+        {
+            "a.jpg": [_obj("hdmi cable", 2, "black", "anker")],
+            "b.jpg": [
+                _obj("hdmi cable", 3, "grey", None),
+                _obj("mouse", 1, "black", "logitech"),
+            ],
+        },
+    )
+    # Re-ingesting an image replaces its objects and their totals
+    await db_module.set_image_objects(
+        "b.jpg",
+        [_obj("hdmi cable", 1, "grey", None), _obj("mouse", 1, None, None)],
+    )
+
+    async with aiosqlite.connect(db_path) as db:
+        totals = await objects.inventory_totals(db)
+        black = await objects.inventory_totals(db, color="Black")
+        cables = await objects.inventory_totals(db, name="HDMI Cables")
+        rollup = await objects.object_rollup(db, "hdmi cables")
+        assert await objects.object_rollup(db, "lamp") is None
+
+    assert totals == [
+        {"name": "hdmi cable", "quantity": 3, "entries": 2},
+        {"name": "mouse", "quantity": 1, "entries": 1},
+    ]
+    assert black == [{"name": "hdmi cable", "quantity": 2, "entries": 1}]
+    assert cables == totals[:1]
+    assert rollup["images"] == 2  # noqa: PLR2004
+    assert rollup["last_seen"] == "2025-03-01"
+    assert rollup["by_color"] == [
+        {"color": "black", "quantity": 2},
+        {"color": "grey", "quantity": 1},
+    ]
+
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        listing = await client.get("/api/inventory", params={"brand": "anker"})
+        item = await client.get("/api/inventory/mouse")
+        missing = await client.get("/api/inventory/lamp")
+
+    assert listing.json()["results"][0]["name"] == "hdmi cable"
+    assert item.json()["quantity"] == 1
+    assert missing.status_code == 404  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_init_db_migrates_objects_table(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute(
+            "CREATE TABLE objects (id INTEGER PRIMARY KEY, image_id INTEGER, "
+            "name TEXT, quantity INTEGER, attributes TEXT, confidence REAL)"
+        )
+        await db.execute(
+            "INSERT INTO objects (image_id, name, quantity) "
+            "VALUES (1, 'lamp', 2)"
+        )
+        await db.commit()
+
+    await db_module.init_db()
+
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute("PRAGMA index_list(objects)")
+        indexes = {row[1] for row in await cursor.fetchall()}
+        totals = await objects.inventory_totals(db)
+    assert {"idx_objects_color", "idx_objects_brand"} <= indexes
+    assert totals == [{"name": "lamp", "quantity": 2, "entries": 1}]
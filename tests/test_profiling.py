@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from scripts import logger, profiling
+
+
+def busy_wait(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_capture_stack_includes_caller() -> None:
+    stack = profiling.capture_stack(threading.get_ident())
+
+    assert stack[-1].startswith("capture_stack (scripts/profiling.py")
+    assert any("test_capture_stack_includes_caller" in f for f in stack)
+
+
+def test_sampler_collapses_stacks() -> None:
+    profile = profiling.Profile("requested")
+    sampler = profiling.StackSampler(
+        threading.get_ident(), profile, interval_ms=1
+    )
+    sampler.start()
+    busy_wait(0.05)
+    sampler.stop()
+
+    assert profile.sample_count > 0
+    assert "busy_wait (tests/test_profiling.py" in profile.collapsed()
+    assert profile.summary()["top_frames"]
+
+
+def test_profile_requested_flags() -> None:
+    assert profiling.profile_requested({"headers": [(b"x-profile", b"1")]})
+    assert profiling.profile_requested({"query_string": b"q=a&profile=1"})
+    assert not profiling.profile_requested({"query_string": b"profile=0"})
+    assert not profiling.profile_requested({})
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor_records_blocking_call() -> None:
+    monitor = profiling.LoopMonitor(slow_ms=0, block_ms=50, interval_ms=5)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        busy_wait(0.2)  # holds the loop
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    (block,) = monitor.blocked_events()
+    assert block["duration_ms"] >= 50  # noqa: PLR2004
+    assert any("busy_wait" in frame for frame in block["stack"])
+
+
+@pytest.mark.asyncio
+async def test_slow_requests_are_captured(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow() -> dict:
+        busy_wait(0.15)
+        return {}
+
+    @app.get("/fast")
+    async def fast() -> dict:
+        return {}
+
+    store = profiling.ProfileStore()
+    monitor = profiling.LoopMonitor(slow_ms=30, block_ms=0, interval_ms=5)
+    monkeypatch.setattr(profiling, "store", store)
+    monkeypatch.setattr(profiling, "monitor", monitor)
+    app.add_middleware(
+        profiling.ProfilingMiddleware, authorize=lambda _scope: False
+    )
+
+    monitor.start()
+    try:
+        transport = ASGITransport(app=app)
+        async with AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            await client.get("/fast")
+            res = await client.get("/slow?profile=1")
+    finally:
+        await monitor.stop()
+
+    assert "x-profile-id" not in res.headers
+    (profile,) = store.list()
+    assert profile["reason"] == "slow"
+    assert profile["path"] == "/slow"
+    assert profile["samples"] > 0
+
+
+@pytest.mark.asyncio
+async def test_requested_profile_download(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("NOLOGIN", "1")
+    logger.app.dependency_overrides.clear()
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        res = await client.get("/unauthorized", headers={"X-Profile": "1"})
+        profile_id = res.headers["x-profile-id"]
+        listing = await client.get("/admin/profiles")
+        download = await client.get(f"/admin/profiles/{profile_id}")
+
+        monkeypatch.delenv("NOLOGIN")
+        denied = await client.get("/admin/profiles")
+
+    assert profile_id in [p["id"] for p in listing.json()["profiles"]]
+    assert download.status_code == 200  # noqa: PLR2004
+    assert "attachment" in download.headers["content-disposition"]
+    assert denied.status_code == 403  # noqa: PLR2004
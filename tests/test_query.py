@@ -0,0 +1,152 @@
+import re
+from pathlib import Path
+from urllib.parse import unquote_plus
+
+import aiosqlite
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from scripts import db as db_module
+from scripts import logger, query, tagindex
+from scripts.query import And, DateRange, Label, Not, Or, Tag, parse_query
+
+LIBRARY = [
+    ("a.jpg", "garage", "2025-01-10T08:00:00+00:00", ["usb cable", "usb-c"]),
+    ("b.jpg", "office", "2025-02-03T08:00:00+00:00", ["hdmi cable", "broken"]),
+    ("c.jpg", "garage", "2025-02-20T08:00:00+00:00", ["hdmi cable", "tv"]),
+    ("d.jpg", "Closet", "2025-03-15T08:00:00+00:00", ["power strip"]),
+    ("e.jpg", "", "2025-12-31T23:00:00+00:00", ["cables"]),
+]
+
+
+def test_parse_precedence_and_negation() -> None:
+    assert parse_query("cable usb OR -broken") == Or((
+        And((Tag("word", "cable"), Tag("word", "usb"))),
+        Not(Tag("word", "broken")),
+    ))
+    assert parse_query('NOT (tv OR "usb-c") AND cab*') == And((
+        Not(Or((Tag("word", "tv"), Tag("exact", "usb-c")))),
+        Tag("prefix", "cab"),
+    ))
+    assert parse_query("   ") is None
+
+
+def test_parse_fields() -> None:
+    assert parse_query('label:"Tool Shed"') == Label("tool shed")
+    assert parse_query("label:gar*") == Label("gar", prefix=True)
+    assert parse_query("tag:usb-c") == Tag("exact", "usb-c")
+    assert parse_query("date:2025-12") == DateRange("2025-12", "2026-01")
+    assert parse_query("date:2025-01..2025-02-28") == DateRange(
+        "2025-01", "2025-02-29"
+    )
+    assert parse_query("after:2025 before:2025-06-01") == And((
+        DateRange("2025", None),
+        DateRange(None, "2025-06-01"),
+    ))
+
+
+@pytest.mark.parametrize(
+    "text", ["(cable", "cable)", "NOT", "date:May", "color:red", '""']
+)
+def test_parse_errors(text: str) -> None:
+    with pytest.raises(query.QuerySyntaxError):
+        parse_query(text)
+
+
+def test_tag_matching_rules() -> None:
+    assert query.tag_matches(Tag("word", "cable"), "hdmi cable")
+    assert query.tag_matches(Tag("word", "usb"), "usb-c")
+    assert not query.tag_matches(Tag("word", "cable"), "cables")
+    assert query.tag_matches(Tag("prefix", "cab"), "cables")
+    assert query.tag_matches(Tag("prefix", "cab"), "hdmi cable")
+    assert not query.tag_matches(Tag("exact", "cable"), "hdmi cable")
+
+
+@pytest_asyncio.fixture
+async def library_db(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Path:
+    db_path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    monkeypatch.setattr(logger, "DB_PATH", db_path)
+    await db_module.init_db()
+    await db_module.add_images_with_tags(LIBRARY)
+    return db_path
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("cable", ["c.jpg", "b.jpg", "a.jpg"]),
+        ("cable NOT broken", ["c.jpg", "a.jpg"]),
+        ("cab*", ["e.jpg", "c.jpg", "b.jpg", "a.jpg"]),
+        ('"hdmi cable" OR usb', ["c.jpg", "b.jpg", "a.jpg"]),
+        ("-cable", ["e.jpg", "d.jpg"]),
+        ("label:garage", ["c.jpg", "a.jpg"]),
+        ("label:clo*", ["d.jpg"]),
+        ("date:2025-02", ["c.jpg", "b.jpg"]),
+        ("date:2025-02..2025-03", ["d.jpg", "c.jpg", "b.jpg"]),
+        ("cable before:2025-02-04", ["b.jpg", "a.jpg"]),
+        ("after:2025-12-31", ["e.jpg"]),
+        ("hdmi label:garage", ["c.jpg"]),
+    ],
+)
+async def test_sql_and_index_agree(
+    library_db: Path, text: str, expected: list[str]
+) -> None:
+    node = parse_query(text)
+    async with aiosqlite.connect(library_db) as db:
+        index = await tagindex.get_tag_index(db)
+        cursor = await db.execute("SELECT id, filename FROM images")
+        names = dict(await cursor.fetchall())
+        via_sql = await query.search_image_ids(db, node)
+        via_index = await query.search_image_ids(db, node, index)
+
+    assert [names[i] for i in via_sql] == expected
+    assert via_index == via_sql
+
+
+@pytest.mark.asyncio
+async def test_search_routes(library_db: Path) -> None:
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        page = await client.get("/search", params={"q": "cable -broken"})
+        bad = await client.get("/search", params={"q": "(cable"})
+        api = await client.get("/api/search", params={"q": "cable"})
+        api_bad = await client.get("/api/search", params={"q": "color:red"})
+
+    assert page.status_code == 200  # noqa: PLR2004
+    assert "/uploads/thumb/c.jpg" in page.text
+    assert "/uploads/thumb/b.jpg" not in page.text
+    assert "Missing closing parenthesis" in bad.text
+    body = api.json()
+    assert [r["filename"] for r in body["results"]] == [
+        "c.jpg", "b.jpg", "a.jpg"
+    ]
+    assert {"tag": "hdmi cable", "count": 2} in body["facets"]
+    assert api_bad.status_code == 400  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_refine_links_keep_or_queries_together(library_db: Path) -> None:
+    del library_db
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        page = await client.get("/search", params={"q": "power OR usb"})
+    refine = page.text.split("<h2>Refine</h2>", 1)[1]
+    links = [
+        unquote_plus(q)
+        for q in re.findall(r'href="/search\?q=([^"]+)"', refine)
+    ]
+
+    assert '(power OR usb) "usb-c"' in links
+    assert parse_query('(power OR usb) "usb-c"') == And((
+        Or((Tag("word", "power"), Tag("word", "usb"))),
+        Tag("exact", "usb-c"),
+    ))
@@ -1,5 +1,36 @@
-from scripts.reader import read_tag
+import asyncio
+import io
 
+import pytest
 
-def test_read_tag() -> None:
-    read_tag()
+from scripts.reader import LineReader, QueueReader, open_reader
+
+
+def test_reader_times_out_and_debounces() -> None:
+    reader = QueueReader(debounce=60)
+    assert reader.read(timeout=0.01) is None
+
+    for tag in ("abc", "abc", "def"):
+        reader.put(tag)
+    assert reader.read(timeout=0.1) == "abc"
+    assert reader.read(timeout=0.1) == "def"  # repeat of abc skipped
+
+
+def test_line_reader_iterates_async() -> None:
+    reader = LineReader(io.StringIO("04A1B2\n\n04C3D4\n"), debounce=0)
+
+    async def collect() -> list[str]:
+        tags = []
+        async for tag in reader:
+            tags.append(tag)
+            if len(tags) == 2:  # noqa: PLR2004
+                reader.close()
+        return tags
+
+    assert asyncio.run(collect()) == ["04A1B2", "04C3D4"]
+    assert reader.read() is None  # closed readers stop blocking
+
+
+def test_open_reader_rejects_unknown_kind() -> None:
+    with pytest.raises(ValueError, match="Unknown NFC reader"):
+        open_reader("serial")
@@ -1,10 +1,12 @@
 import os
+import sqlite3
 from datetime import UTC, datetime, timedelta
 from pathlib import Path
 from unittest.mock import ANY, AsyncMock, MagicMock, patch
 
 import pytest
 
+from scripts import db as db_module
 from scripts import rebuild
 from scripts.rebuild import should_rebuild_db
 
@@ -65,8 +67,14 @@ async def test_restore_db_uses_latest_snapshot(
 @patch("scripts.rebuild.add_tag", new_callable=AsyncMock)
 @patch("scripts.rebuild.link_image_tag", new_callable=AsyncMock)
 @patch("scripts.rebuild.init_db", new_callable=AsyncMock)
-async def test_rebuild_from_gcs_filters_by_timestamp(
-    mock_init, mock_link, mock_add_tag, mock_add_image, mock_storage_client
+@patch("scripts.rebuild.set_image_objects", new_callable=AsyncMock)
+async def test_rebuild_from_gcs_filters_by_timestamp(  # noqa: PLR0913, PLR0917
+    mock_objects,
+    mock_init,
+    mock_link,
+    mock_add_tag,
+    mock_add_image,
+    mock_storage_client,
 ) -> None:
     # Setup: blobs with timestamps
     old_blob = MagicMock()
@@ -95,6 +103,7 @@ async def test_rebuild_from_gcs_filters_by_timestamp(
     mock_add_tag.assert_any_call("tag3")
     mock_add_tag.assert_any_call("tag4")
     assert mock_link.call_count == 2  # One for each tag  # noqa: PLR2004
+    mock_objects.assert_awaited_once()
 
 
 def test_should_rebuild_db_with_force_env(tmp_path: Path,
@@ -167,7 +176,9 @@ def test_should_rebuild_db_when_no_db(
 @patch("scripts.rebuild.add_tag", new_callable=AsyncMock)
 @patch("scripts.rebuild.link_image_tag", new_callable=AsyncMock)
 @patch("scripts.rebuild.init_db", new_callable=AsyncMock)
+@patch("scripts.rebuild.set_image_objects", new_callable=AsyncMock)
 async def test_rebuild_skips_empty_summary( # noqa: PLR0913
+    mock_objects,
     mock_init,
     mock_link,
     mock_add_tag,
@@ -199,3 +210,47 @@ async def test_rebuild_skips_empty_summary( # noqa: PLR0913
     )
     mock_add_tag.assert_not_called()
     mock_link.assert_not_called()
+
+
+PRE_OBJECTS_SCHEMA = """
+CREATE TABLE images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT UNIQUE, label TEXT,
+    timestamp TEXT
+);
+CREATE TABLE tags (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE);
+CREATE TABLE image_tags (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, image_id INTEGER, tag_id INTEGER
+);
+"""
+
+
+@pytest.mark.asyncio
+@patch("scripts.rebuild.storage.Client")
+async def test_delta_rebuild_migrates_restored_snapshot(
+    mock_storage_client, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_path = tmp_path / "metadata.db"
+    with sqlite3.connect(db_path) as db:
+        db.executescript(PRE_OBJECTS_SCHEMA)
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    monkeypatch.setattr(rebuild, "DB_PATH", db_path)
+    blobs = []
+    for name in ("a", "b", "c"):
+        blob = MagicMock()
+        blob.name = f"upload/summary/{name}.jpg.summary.txt"
+        blob.updated = datetime.now(UTC)
+        blob.download_as_text.return_value = f"cable\n{name} box"
+        blobs.append(blob)
+    bucket_mock = MagicMock()
+    bucket_mock.list_blobs.return_value = blobs
+    mock_storage_client.return_value.bucket.return_value = bucket_mock
+
+    await rebuild.rebuild_db_from_gcs(
+        "my-bucket", "upload", since_timestamp="2025-01-01T00:00:00+00:00"
+    )
+
+    with sqlite3.connect(db_path) as db:
+        images = db.execute("SELECT filename FROM images").fetchall()
+        objects = db.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+    assert sorted(images) == [("a.jpg",), ("b.jpg",), ("c.jpg",)]
+    assert objects == 6  # noqa: PLR2004
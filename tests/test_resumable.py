@@ -0,0 +1,140 @@
+import asyncio
+import base64
+import hashlib
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+import aiosqlite
+import pytest
+from httpx import ASGITransport, AsyncClient
+from starlette.requests import ClientDisconnect
+
+from scripts import logger, resumable
+
+NOW = datetime(2025, 6, 1, 12, tzinfo=UTC)
+
+
+def b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+async def body(*chunks: bytes, drop: bool = False) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+    if drop:
+        raise ClientDisconnect
+
+
+@pytest.mark.asyncio
+async def test_chunks_resume_and_expire(db_path: Path, tmp_path: Path) -> None:
+    parts = tmp_path / "parts"
+    sha = ("sha256", hashlib.sha256(b"abc").digest())
+    async with aiosqlite.connect(db_path) as db:
+        session = await resumable.create_session(
+            db, 9, {"filename": "../IMG 1.heic", "label": "shed"}, parts,
+            now=NOW,
+        )
+        assert session["name"] == "IMG 1.heic"
+        assert await resumable.append_chunk(
+            db, session, 0, body(b"ab", b"c"), checksum=sha, now=NOW
+        ) == 3  # noqa: PLR2004
+
+        with pytest.raises(resumable.UploadSessionError) as bad:
+            await resumable.append_chunk(
+                db, session, 3, body(b"xyz"), checksum=sha
+            )
+        assert bad.value.status_code == 460  # noqa: PLR2004
+        with pytest.raises(resumable.UploadSessionError) as stale:
+            await resumable.append_chunk(db, session, 0, body(b"abc"))
+        assert stale.value.status_code == 409  # noqa: PLR2004
+        with pytest.raises(resumable.UploadSessionError) as too_long:
+            await resumable.append_chunk(db, session, 3, body(b"0123456"))
+        assert too_long.value.status_code == 413  # noqa: PLR2004
+
+        # A dropped connection keeps what arrived when there is no checksum
+        assert await resumable.append_chunk(
+            db, session, 3, body(b"de", drop=True), now=NOW
+        ) == 5  # noqa: PLR2004
+        session = await resumable.get_session(db, session["id"], now=NOW)
+        assert session["offset"] == 5  # noqa: PLR2004
+        part = Path(session["path"])
+        assert await asyncio.to_thread(part.read_bytes) == b"abcde"
+
+        abandoned = await resumable.create_session(
+            db, 5, {"filename": "b.jpg"}, parts, now=NOW - timedelta(days=2)
+        )
+        with pytest.raises(resumable.UploadSessionError) as expired:
+            await resumable.get_session(db, abandoned["id"], now=NOW)
+        assert expired.value.status_code == 410  # noqa: PLR2004
+        assert await resumable.collect_expired(db, now=NOW) == 1
+        assert [p.name for p in parts.iterdir()] == [f"{session['id']}.part"]
+
+    assert resumable.parse_metadata(f"filename {b64(b'a.jpg')},flag") == {
+        "filename": "a.jpg", "flag": ""
+    }
+    with pytest.raises(resumable.UploadSessionError, match="Unsupported"):
+        resumable.parse_checksum("crc32 AAAA")
+
+
+@pytest.mark.asyncio
+async def test_tus_api(db_path: Path, tmp_path: Path) -> None:
+    del db_path
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        denied = await ac.post("/api/uploads", headers={"Upload-Length": "6"})
+        logger.app.dependency_overrides[logger.get_current_user] = lambda: {
+            "email": "me@example.com"
+        }
+        try:
+            with patch("scripts.logger.UPLOAD_DIR", tmp_path):
+                options = await ac.options("/api/uploads")
+                created = await ac.post("/api/uploads", headers={
+                    "Upload-Length": "6",
+                    "Upload-Metadata": (
+                        f"filename {b64(b'photo.jpg')},label {b64(b'attic')}"
+                    ),
+                })
+                url = created.headers["location"]
+                chunk = {"Content-Type": "application/offset+octet-stream"}
+                sha1 = b64(hashlib.sha1(b"abc").digest())  # noqa: S324
+                first = await ac.patch(url, content=b"abc", headers=chunk | {
+                    "Upload-Offset": "0", "Upload-Checksum": f"sha1 {sha1}"
+                })
+                wrong_type = await ac.patch(url, content=b"def", headers={
+                    "Upload-Offset": "3"
+                })
+                head = await ac.head(url)
+                last = await ac.patch(url, content=b"def", headers=chunk | {
+                    "Upload-Offset": "3"
+                })
+                item = logger.processing_queue.get_nowait()
+                logger.processing_queue.task_done()
+
+                other = await ac.post("/api/uploads", headers={
+                    "Upload-Length": "6",
+                    "Upload-Metadata": f"filename {b64(b'x.jpg')}",
+                })
+                deleted = await ac.delete(other.headers["location"])
+                gone = await ac.head(other.headers["location"])
+        finally:
+            logger.app.dependency_overrides.clear()
+
+    assert denied.status_code == 401  # noqa: PLR2004
+    assert options.headers["tus-version"] == "1.0.0"
+    assert created.status_code == 201  # noqa: PLR2004
+    assert first.status_code == 204  # noqa: PLR2004
+    assert first.headers["upload-offset"] == "3"
+    assert wrong_type.status_code == 415  # noqa: PLR2004
+    assert head.headers["upload-offset"] == "3"
+    assert head.headers["upload-length"] == "6"
+    assert last.status_code == 204  # noqa: PLR2004
+    filename = last.headers["upload-filename"]
+    assert filename.endswith("_photo.jpg")
+    assert (tmp_path / filename).read_bytes() == b"abcdef"
+    assert item["upload"] == (tmp_path / filename, filename, "attic")
+    assert item["gcs_path"] == f"upload/{filename}"
+    assert deleted.status_code == 204  # noqa: PLR2004
+    assert gone.status_code == 404  # noqa: PLR2004
+    assert list((tmp_path / ".resumable").iterdir()) == []
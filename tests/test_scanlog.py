@@ -0,0 +1,190 @@
+import gzip
+import json
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import aiosqlite
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from scripts import db as db_module
+from scripts import logger, scanlog
+
+
+class FakeClock:
+    """Monotonic clock the test moves by setting `now`."""
+
+    def __init__(self) -> None:
+        """Start at zero."""
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Return the current fake time."""
+        return self.now
+
+
+def test_group_commit_by_size_and_time(tmp_path: Path) -> None:
+    clock = FakeClock()
+    writer = scanlog.ScanWriter(
+        tmp_path, "pi-1", max_events=3, max_delay=2, fsync=False, clock=clock
+    )
+    for i in range(4):
+        writer.append(f"tag{i}", "desk", timestamp=1_000_000 + i)
+    assert len(writer) == 1  # first three committed as one frame
+
+    clock.now = 1.5
+    writer.flush_if_due()
+    assert writer.seconds_until_flush() == pytest.approx(0.5)
+    clock.now = 2.0
+    writer.flush_if_due()
+    assert len(writer) == 0
+    assert writer.seconds_until_flush() is None
+
+    node, events, offset = scanlog.read_segment(writer.segment)
+    assert node == "pi-1"
+    assert [e.tag_id for e in events] == ["tag0", "tag1", "tag2", "tag3"]
+    assert events[0].iso_timestamp == "1970-01-01T00:00:01+00:00"
+    assert offset == writer.segment.stat().st_size
+
+
+def test_rotation_and_torn_frames(tmp_path: Path) -> None:
+    writer = scanlog.ScanWriter(
+        tmp_path, "pi/1", max_events=1, segment_bytes=64, fsync=False
+    )
+    for i in range(6):
+        writer.append(f"tag{i}", "hall")
+    writer.close()
+
+    segments = sorted(tmp_path.glob("*.seg"))
+    assert len(segments) > 1
+    assert all(s.name.startswith("pi_1-") for s in segments)
+    read = [e.tag_id for s in segments for e in scanlog.read_segment(s)[1]]
+    assert read == [f"tag{i}" for i in range(6)]
+
+    last = segments[-1]
+    _, before, end = scanlog.read_segment(last)
+    with last.open("ab") as f:  # crash in the middle of a commit
+        f.write(scanlog.encode_events(before)[:-3])
+    assert scanlog.read_segment(last) == ("pi/1", before, end)
+
+
+@pytest.mark.asyncio
+async def test_ingest_is_incremental(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    await db_module.init_db()
+    segments = tmp_path / "scans"
+    writer = scanlog.ScanWriter(segments, "pi-1", fsync=False)
+    writer.append("a", "desk", timestamp=1)
+    writer.append("b", "desk", timestamp=2)
+    writer.flush()
+
+    assert await scanlog.ingest_segments(segments, db_path) == 2  # noqa: PLR2004
+    writer.append("c", "shelf", timestamp=3)
+    writer.close()
+    assert await scanlog.ingest_segments(segments, db_path) == 1
+    assert await scanlog.ingest_segments(segments, db_path) == 0
+
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("DELETE FROM scan_segments")
+        await db.commit()
+    # Forgotten offsets only cause duplicates to be ignored
+    assert await scanlog.ingest_segments(segments, db_path) == 0
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute(
+            "SELECT node_id, tag_id, location FROM scan_events ORDER BY id"
+        )
+        rows = await cursor.fetchall()
+    assert rows == [
+        ("pi-1", "a", "desk"), ("pi-1", "b", "desk"), ("pi-1", "c", "shelf")
+    ]
+
+
+def test_decode_batch_rejects_bad_input() -> None:
+    events = [scanlog.ScanEvent("04A1", "desk", 1_500_000, "pi-1")]
+    assert scanlog.decode_batch(
+        scanlog.encode_batch("pi-1", events), "gzip"
+    ) == ("pi-1", events)
+    naive = json.dumps({"node_id": "pi-1", "events": [
+        {"tag_id": "04A1", "timestamp": "1970-01-01T00:00:01.5"}
+    ]}).encode()
+    assert scanlog.decode_batch(naive)[1] == [
+        scanlog.ScanEvent("04A1", "unknown", 1_500_000, "pi-1")
+    ]
+
+    for body, encoding, status in [
+        (b"{}", "", 400),
+        (b'{"node_id": "", "events": []}', "", 400),
+        (b"not gzip", "gzip", 400),
+        (b"{}", "br", 415),
+        (gzip.compress(b" " * (scanlog.MAX_BATCH_BYTES + 1)), "gzip", 413),
+    ]:
+        with pytest.raises(scanlog.ScanBatchError) as e:
+            scanlog.decode_batch(body, encoding)
+        assert e.value.status_code == status
+
+
+async def chunked(body: bytes) -> AsyncIterator[bytes]:
+    for i in range(0, len(body), 16):
+        yield body[i:i + 16]
+
+
+@pytest.mark.asyncio
+async def test_scans_api_is_idempotent(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    monkeypatch.setattr(logger, "DB_PATH", db_path)
+    monkeypatch.setenv("SCAN_API_TOKEN", "s3cret")
+    await db_module.init_db()
+    events = [
+        scanlog.ScanEvent(f"tag{i}", "hall", 1_000_000 * i, "pi-1")
+        for i in range(3)
+    ]
+    headers = {
+        "Authorization": "Bearer s3cret",
+        "Content-Encoding": "gzip",
+        "Idempotency-Key": "seg-1@0-100",
+    }
+    body = scanlog.encode_batch("pi-1", events)
+
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        first = await ac.post("/api/scans", content=body, headers=headers)
+        retry = await ac.post("/api/scans", content=body, headers=headers)
+        overlap = await ac.post(
+            "/api/scans",
+            content=scanlog.encode_batch("pi-1", events[1:]),
+            headers={**headers, "Idempotency-Key": "seg-1@50-150"},
+        )
+        forbidden = await ac.post(
+            "/api/scans",
+            content=body,
+            headers={**headers, "Authorization": "Bearer nope"},
+        )
+        missing_key = await ac.post(
+            "/api/scans",
+            content=body,
+            headers={"Authorization": "Bearer s3cret"},
+        )
+        with monkeypatch.context() as m:
+            m.setattr(logger, "MAX_BATCH_BYTES", len(body) - 1)
+            too_large = await ac.post(
+                "/api/scans", content=chunked(body), headers=headers
+            )
+
+    assert first.json() == {
+        "key": "seg-1@0-100", "received": 3, "added": 3, "duplicate": False
+    }
+    assert retry.json()["duplicate"] is True
+    assert retry.json()["added"] == 3  # noqa: PLR2004
+    assert overlap.json()["added"] == 0
+    assert forbidden.status_code == 403  # noqa: PLR2004
+    assert missing_key.status_code == 422  # noqa: PLR2004
+    assert too_large.status_code == 413  # noqa: PLR2004
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM scan_events")
+        assert await cursor.fetchone() == (3,)
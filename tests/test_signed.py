@@ -0,0 +1,189 @@
+import json
+import time
+from collections.abc import Iterator
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from httpx import ASGITransport, AsyncClient
+
+from scripts import logger, signed
+from scripts.fakegcs import FakeGCS, SignatureError, verify_signed_url
+
+
+@pytest.fixture(scope="module")
+def key_file(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    path = tmp_path_factory.mktemp("keys") / "service-account-key.json"
+    path.write_text(json.dumps({
+        "type": "service_account",
+        "project_id": "local",
+        "private_key_id": "1",
+        "private_key": pem.decode(),
+        "client_email": "tracker@local.iam.gserviceaccount.com",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }))
+    return path
+
+
+@pytest.fixture
+def gcs(
+    key_file: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[FakeGCS]:
+    server = FakeGCS(tmp_path / "bucket", key_file)
+    server.start()
+    monkeypatch.setattr(signed, "SERVICE_ACCOUNT_KEY", key_file)
+    monkeypatch.setattr(signed, "EMULATOR_HOST", server.url)
+    monkeypatch.setattr(signed, "_read_urls", {})
+    signed.signing_client.cache_clear()
+    yield server
+    server.stop()
+    signed.signing_client.cache_clear()
+
+
+@pytest.fixture
+def upload_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(logger, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(logger, "META_FILE", tmp_path / "metadata.json")
+    return tmp_path
+
+
+def test_fake_bucket_checks_signatures(gcs: FakeGCS) -> None:
+    url = signed.sign_url(
+        "home", "upload/a b.jpg", "PUT", seconds=60, content_type="image/jpeg"
+    )
+    assert url.startswith(f"{gcs.url}/home/upload/a%20b.jpg?")
+    wrong_type = httpx.put(url, content=b"x", headers={
+        "Content-Type": "image/png"
+    })
+    tampered = httpx.put(url.replace("a%20b", "c"), content=b"x", headers={
+        "Content-Type": "image/jpeg"
+    })
+    ok = httpx.put(url, content=b"jpeg", headers={"Content-Type": "image/jpeg"})
+    fetched = httpx.get(signed.sign_url("home", "upload/a b.jpg", seconds=60))
+
+    assert wrong_type.status_code == 403  # noqa: PLR2004
+    assert tampered.status_code == 403  # noqa: PLR2004
+    assert ok.status_code == 200  # noqa: PLR2004
+    assert fetched.content == b"jpeg"
+    assert fetched.headers["content-type"] == "image/jpeg"
+    assert signed.object_size("home", "upload/a b.jpg") == 4  # noqa: PLR2004
+    assert signed.object_size("home", "upload/missing.jpg") is None
+
+    target = url.removeprefix(gcs.url)
+    sent = {
+        "Host": gcs.url.removeprefix("http://"), "Content-Type": "image/jpeg"
+    }
+    verify_signed_url("PUT", target, sent, gcs.public_key, gcs.email)
+    with pytest.raises(SignatureError, match="expired"):
+        verify_signed_url(
+            "PUT", target, sent, gcs.public_key, gcs.email,
+            now=datetime.now(UTC) + timedelta(minutes=2),
+        )
+
+
+@pytest.mark.asyncio
+@patch("scripts.logger.process_image", new_callable=AsyncMock)
+async def test_direct_upload_flow(
+    mock_process: AsyncMock, gcs: FakeGCS, db_path: Path, upload_dir: Path
+) -> None:
+    del db_path
+    mock_process.return_value = True
+    transport = ASGITransport(app=logger.app)
+    logger.app.dependency_overrides[logger.get_current_user] = lambda: {
+        "email": "me@example.com"
+    }
+    try:
+        async with AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as ac:
+            not_image = await ac.post("/api/direct-uploads", data={
+                "filename": "notes.txt", "content_type": "text/plain"
+            })
+            created = await ac.post("/api/direct-uploads", data={
+                "filename": "shelf.jpg", "content_type": "image/jpeg",
+                "label": "garage",
+            })
+            upload = created.json()
+            early = await ac.post(upload["finalize_url"])
+            async with httpx.AsyncClient() as client:
+                put = await client.put(
+                    upload["upload_url"], content=b"\xff\xd8\xff",
+                    headers=upload["headers"],
+                )
+            done = await ac.post(upload["finalize_url"])
+            twice = await ac.post(upload["finalize_url"])
+            item = logger.processing_queue.get_nowait()
+            await logger.process_item(item)
+    finally:
+        logger.app.dependency_overrides.clear()
+
+    filename = upload["filename"]
+    assert not_image.status_code == 415  # noqa: PLR2004
+    assert created.status_code == 201  # noqa: PLR2004
+    assert filename.endswith("_shelf.jpg")
+    assert early.status_code == 409  # noqa: PLR2004
+    assert put.status_code == 200  # noqa: PLR2004
+    assert done.status_code == 202  # noqa: PLR2004
+    assert done.json()["size"] == 3  # noqa: PLR2004
+    assert twice.status_code == 409  # noqa: PLR2004
+    assert item["gcs_download"] == f"upload/{filename}"
+    assert "gcs_path" not in item
+    assert item["upload"][0] == upload_dir / filename
+    assert item["upload"][0].read_bytes() == b"\xff\xd8\xff"
+    mock_process.assert_awaited_once_with(item["upload"])
+
+
+@pytest.mark.asyncio
+async def test_uploads_redirect_to_cached_signed_url(
+    gcs: FakeGCS, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    del gcs
+    put = signed.sign_url(
+        logger.GCS_BUCKET, "upload/thumb/a.jpg.thumb.jpg", "PUT", seconds=60,
+        content_type="image/jpeg",
+    )
+    async with AsyncClient() as client:
+        await client.put(
+            put, content=b"thumb", headers={"Content-Type": "image/jpeg"}
+        )
+    monkeypatch.setattr(logger, "SERVE_MODE", "redirect")
+    transport = ASGITransport(app=logger.app)
+    logger.app.dependency_overrides[logger.get_current_user] = lambda: {
+        "email": "me@example.com"
+    }
+    try:
+        with patch.object(signed, "sign_url", wraps=signed.sign_url) as sign:
+            async with AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as ac:
+                first = await ac.get("/uploads/thumb/a.jpg.thumb.jpg")
+                again = await ac.get("/uploads/thumb/a.jpg.thumb.jpg")
+            assert sign.call_count == 1
+            # Re-signed once the cached URL is close to expiry
+            signed.read_url(
+                logger.GCS_BUCKET, "upload/thumb/a.jpg.thumb.jpg",
+                now=time.time() + signed.READ_URL_SECONDS,
+            )
+            assert sign.call_count == 2  # noqa: PLR2004
+    finally:
+        logger.app.dependency_overrides.clear()
+
+    assert first.status_code == 302  # noqa: PLR2004
+    assert again.headers["location"] == first.headers["location"]
+    max_age = signed.READ_URL_SECONDS - signed.REFRESH_SECONDS
+    assert first.headers["cache-control"] in {
+        f"private, max-age={max_age}", f"private, max-age={max_age - 1}"
+    }
+    async with AsyncClient() as client:
+        thumb = await client.get(first.headers["location"])
+    assert thumb.content == b"thumb"
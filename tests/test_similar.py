@@ -0,0 +1,167 @@
+import io
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+import pytest
+from httpx import ASGITransport, AsyncClient
+from PIL import Image, ImageDraw
+
+from scripts import logger, similar
+
+
+def scene(seed: int, size: tuple[int, int] = (640, 480)) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    image = Image.new("RGB", size, tuple(rng.integers(0, 255, 3).tolist()))
+    draw = ImageDraw.Draw(image)
+    for _ in range(8):
+        x, y = rng.integers(0, size[0] - 100, 2).tolist()
+        w, h = rng.integers(20, 200, 2).tolist()
+        draw.rectangle(
+            [x, y, x + w, y + h], fill=tuple(rng.integers(0, 255, 3).tolist())
+        )
+    return image
+
+
+def jpeg(image: Image.Image, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[similar.EmbeddingStore]:
+    monkeypatch.setattr(similar, "EMBEDDING_DIR", tmp_path / "embeddings")
+    similar.reset_store()
+    yield similar.get_store()
+    similar.reset_store()
+
+
+def test_embedding_matches_reencoded_copy() -> None:
+    original = similar.embed_image(jpeg(scene(1)))
+    copy = similar.embed_image(jpeg(scene(1).resize((320, 240)), quality=40))
+    other = similar.embed_image(jpeg(scene(2)))
+
+    assert original.shape == (similar.EMBEDDING_DIM,)
+    assert np.isclose(np.linalg.norm(original), 1.0)
+    assert original @ copy > similar.DUPLICATE_SCORE
+    assert original @ other < similar.DUPLICATE_SCORE
+
+
+def test_store_persists_and_replaces(store: similar.EmbeddingStore) -> None:
+    vectors = {
+        f"{i}.jpg": similar.embed_image(jpeg(scene(i))) for i in range(5)
+    }
+    for name, vector in vectors.items():
+        store.add(name, vector)
+    store.add("0.jpg", vectors["4.jpg"])  # re-ingested with new contents
+
+    reopened = similar.EmbeddingStore(store.directory)
+    matches = reopened.search(vectors["4.jpg"], k=2)
+
+    assert len(reopened) == len(vectors)
+    assert {name for name, _ in matches} == {"0.jpg", "4.jpg"}
+    assert reopened.search(vectors["0.jpg"], k=1)[0][0] != "0.jpg"
+    with pytest.raises(ValueError, match="Expected"):
+        store.add("bad.jpg", np.zeros(3))
+
+
+def test_ivf_agrees_with_exact_scan(
+    store: similar.EmbeddingStore, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, similar.EMBEDDING_DIM))
+    rows = centers[rng.integers(0, 20, 2000)] + 0.1 * rng.standard_normal(
+        (2000, similar.EMBEDDING_DIM)
+    )
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    for i, row in enumerate(rows):
+        store.add(f"{i}.jpg", row)
+    query = rows[7]
+    exact = store.search(query, k=5)
+
+    monkeypatch.setattr(similar, "IVF_MIN_ROWS", 1000)
+    store.search(query, k=5)  # starts training
+    store.wait_for_training()
+    store.add("late.jpg", query)  # not covered by the index yet
+
+    via_ivf = store.search(query, k=6)
+    assert store.ivf_path.exists()
+    assert {name for name, _ in via_ivf} == {name for name, _ in exact} | {
+        "late.jpg"
+    }
+    assert [score for _, score in via_ivf][1:] == pytest.approx(
+        [score for _, score in exact], abs=1e-6
+    )
+
+
+def test_failed_training_backs_off(
+    store: similar.EmbeddingStore, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    rng = np.random.default_rng(0)
+    for i in range(20):
+        store.add(f"{i}.jpg", rng.standard_normal(similar.EMBEDDING_DIM))
+    calls = []
+
+    def broken_train(matrix: np.ndarray) -> similar.IVFIndex:
+        calls.append(len(matrix))
+        raise MemoryError
+
+    monkeypatch.setattr(similar, "IVF_MIN_ROWS", 10)
+    monkeypatch.setattr(similar.IVFIndex, "train", broken_train)
+    query = rng.standard_normal(similar.EMBEDDING_DIM)
+    for _ in range(3):
+        assert len(store.search(query, k=3)) == 3  # noqa: PLR2004
+        store.wait_for_training()
+
+    assert calls == [20]
+    store._retry_at = 0.0  # noqa: SLF001  # back-off elapsed
+    store.search(query, k=3)
+    store.wait_for_training()
+    assert calls == [20, 20]
+
+
+@pytest.mark.asyncio
+async def test_similar_route(
+    store: similar.EmbeddingStore,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    for seed in range(3):
+        path = tmp_path / f"{seed}.jpg"
+        path.write_bytes(jpeg(scene(seed)))
+        await similar.add_embedding(path, path.name)
+
+    query = {"upload": ("q.jpg", jpeg(scene(1), 50), "image/jpeg")}
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        denied = await client.post("/api/similar", files=query)
+        logger.app.dependency_overrides[logger.get_current_user] = lambda: {
+            "email": "me@example.com"
+        }
+        try:
+            res = await client.post(
+                "/api/similar", params={"k": 2}, files=query
+            )
+            bad = await client.post(
+                "/api/similar",
+                files={"upload": ("q.jpg", b"nope", "image/jpeg")},
+            )
+            with monkeypatch.context() as m:
+                m.setattr(logger, "MAX_QUERY_BYTES", 10)
+                too_large = await client.post("/api/similar", files=query)
+        finally:
+            logger.app.dependency_overrides.clear()
+
+    assert denied.status_code == 401  # noqa: PLR2004
+    assert too_large.status_code == 413  # noqa: PLR2004
+    body = res.json()
+    assert body["results"][0]["filename"] == "1.jpg"
+    assert body["results"][0]["duplicate"] is True
+    assert body["results"][0]["thumb_url"] == "/uploads/thumb/1.jpg.thumb.jpg"
+    assert body["count"] == 2  # noqa: PLR2004
+    assert bad.status_code == 400  # noqa: PLR2004
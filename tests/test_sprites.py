@@ -0,0 +1,104 @@
+import json
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from PIL import Image
+
+from scripts import logger, sprites
+from scripts.thumbnails import legacy_thumb_name
+
+
+def make_thumb(directory: Path, filename: str, color: str) -> None:
+    Image.new("RGB", (320, 240), color).save(
+        directory / legacy_thumb_name(filename), "JPEG"
+    )
+
+
+def test_sheet_assignment_by_image_id() -> None:
+    assert sprites.sheet_for(1) == 0
+    assert sprites.sheet_for(sprites.SHEET_SIZE) == 0
+    assert sprites.sheet_for(sprites.SHEET_SIZE + 1) == 1
+
+
+def test_add_to_sheet_is_incremental(tmp_path: Path) -> None:
+    make_thumb(tmp_path, "a.jpg", "red")
+    make_thumb(tmp_path, "b.jpg", "blue")
+    sprite_dir = tmp_path / "sprites"
+
+    written = sprites.add_to_sheet(
+        str(sprite_dir), 0, [(0, "a.jpg", str(tmp_path / "a.jpg.thumb.jpg"))]
+    )
+    sprites.add_to_sheet(
+        str(sprite_dir), 0, [(1, "b.jpg", str(tmp_path / "b.jpg.thumb.jpg"))]
+    )
+
+    assert written == ["sheet-0.webp", "sheet-0.json"]
+    coords = json.loads((sprite_dir / "sheet-0.json").read_text())
+    assert coords["version"] == 2  # noqa: PLR2004
+    assert coords["images"]["a.jpg"] == [0, 40, 320, 240]
+    assert coords["images"]["b.jpg"] == [320, 40, 320, 240]
+
+    with Image.open(sprite_dir / "sheet-0.webp") as atlas:
+        red = atlas.getpixel((160, 160))
+        blue = atlas.getpixel((480, 160))
+    assert red[0] > 200 and red[2] < 60  # noqa: PLR2004, PT018
+    assert blue[2] > 200 and blue[0] < 60  # noqa: PLR2004, PT018
+
+
+def test_sprite_style_uses_scaled_coordinates(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    make_thumb(tmp_path, "a.jpg", "red")
+    sprites.add_to_sheet(
+        str(tmp_path), 0, [(9, "a.jpg", str(tmp_path / "a.jpg.thumb.jpg"))]
+    )
+
+    monkeypatch.setattr(sprites, "SPRITE_MODE", False)
+    assert sprites.sprite_style(10, "a.jpg", tmp_path) is None
+
+    monkeypatch.setattr(sprites, "SPRITE_MODE", True)
+    style = sprites.sprite_style(10, "a.jpg", tmp_path)
+    assert "width: 160px; height: 120px" in style
+    assert "url('/uploads/sprites/sheet-0.webp?v=1')" in style
+    assert "background-position: -160px -180px" in style
+    assert "background-size: 1280px auto" in style
+    assert sprites.sprite_style(11, "missing.jpg", tmp_path) is None
+
+
+def test_sync_sheet_maps_downloads_missing(tmp_path: Path) -> None:
+    blob = MagicMock()
+    blob.name = "upload/sprites/sheet-0.json"
+    bucket = MagicMock()
+    bucket.list_blobs.return_value = [blob]
+
+    assert sprites.sync_sheet_maps(bucket, "upload", tmp_path) == 1
+    blob.download_to_filename.assert_called_once_with(
+        str(tmp_path / "sheet-0.json")
+    )
+
+
+@pytest.mark.asyncio
+async def test_update_sprite_sheet_uploads_sheet(tmp_path: Path) -> None:
+    make_thumb(tmp_path, "a.jpg", "red")
+    uploaded = {}
+
+    def upload(bucket: str, blob: str, fh: object) -> str:
+        del bucket
+        uploaded[blob] = fh.read()
+        return blob
+
+    with (
+        patch("scripts.logger.UPLOAD_DIR", tmp_path),
+        patch("scripts.logger.SPRITE_DIR", tmp_path / "sprites"),
+        patch("scripts.logger.get_image_id", AsyncMock(return_value=1)),
+        patch("scripts.logger.upload_file_to_gcs", side_effect=upload),
+    ):
+        await logger.update_sprite_sheet("a.jpg")
+
+    prefix = f"{logger.GCS_UPLOAD_PREFIX}/sprites"
+    assert sorted(uploaded) == [
+        f"{prefix}/sheet-0.json", f"{prefix}/sheet-0.webp"
+    ]
+    assert uploaded[f"{prefix}/sheet-0.webp"][:4] == b"RIFF"
+    assert json.loads(uploaded[f"{prefix}/sheet-0.json"])["images"]["a.jpg"]
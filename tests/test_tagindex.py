@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import aiosqlite
+import pytest
+
+from scripts import db as db_module
+from scripts import tagindex
+
+
+def make_index() -> tagindex.TagIndex:
+    index = tagindex.TagIndex()
+    for image_id, ts in ((1, "2025-01-01"), (2, "2025-03-01"),
+                         (3, "2025-02-01"), (4, "2025-04-01")):
+        index.add_image(image_id, ts)
+    links = {
+        "hdmi": [1, 2, 3],
+        "cable": [1, 2, 4],
+        "power": [3, 4],
+    }
+    for tag_id, (name, ids) in enumerate(links.items(), start=1):
+        for image_id in ids:
+            index.add_link(image_id, tag_id, name)
+    return index
+
+
+def test_query_and_or_not() -> None:
+    index = make_index()
+
+    assert index.query(all_of=["hdmi", "cable"]) == [2, 1]
+    assert index.query(any_of=["hdmi", "power"]) == [4, 2, 3, 1]
+    assert index.query(all_of=["hdmi"], none_of=["power"]) == [2, 1]
+    assert index.query(all_of=["cable"], any_of=["power", "hdmi"]) == [
+        4, 2, 1
+    ]
+    assert index.query(none_of=["hdmi"]) == [4]
+    assert index.query(all_of=["hdmi", "missing"]) == []
+    assert index.query(limit=2) == [4, 2]
+
+
+def test_links_are_sorted_and_deduplicated() -> None:
+    index = make_index()
+    index.add_link(2, 3, "power")
+    index.add_link(2, 3, "power")
+
+    assert list(index.ids("power")) == [2, 3, 4]
+    assert index.tag_counts() == [("cable", 3), ("hdmi", 3), ("power", 3)]
+    assert index.tag_counts(limit=1) == [("cable", 3)]
+
+
+def test_skewed_intersection_uses_binary_search() -> None:
+    index = tagindex.TagIndex()
+    for image_id in range(1, 1001):
+        index.add_image(image_id, f"2025-01-01T00:00:{image_id:04d}")
+        index.add_link(image_id, 1, "common")
+    index.add_link(500, 2, "rare")
+
+    assert index.query(all_of=["common", "rare"]) == [500]
+
+
+@pytest.mark.asyncio
+async def test_catches_up_with_new_rows_and_reloads(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    await db_module.init_db()
+    await db_module.add_images_with_tags([
+        ("a.jpg", "", "2025-01-01", ["hdmi"]),
+        ("b.jpg", "", "2025-02-01", ["hdmi", "cable"]),
+    ])
+
+    index = await tagindex.refresh_tag_index(db_path)
+    assert len(index) == 2  # noqa: PLR2004
+    assert index.count("hdmi") == 2  # noqa: PLR2004
+
+    await db_module.add_image("c.jpg", "", "2025-03-01")
+    await db_module.add_tag("cable")
+    await db_module.link_image_tag("c.jpg", "cable")
+    async with aiosqlite.connect(db_path) as db:
+        assert await tagindex.get_tag_index(db) is index
+    assert index.query(all_of=["cable"]) == [3, 2]
+
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("DELETE FROM image_tags")
+        await db.commit()
+    await tagindex.refresh_tag_index(db_path)
+    assert index.tag_names() == []
+    assert len(index) == 3  # noqa: PLR2004
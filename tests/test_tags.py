@@ -0,0 +1,90 @@
+from collections.abc import Iterator
+from pathlib import Path
+
+import aiosqlite
+import pytest
+
+from scripts import db as db_module
+from scripts import tagindex, tags
+
+
+@pytest.fixture(autouse=True)
+def fresh_aliases() -> Iterator[None]:
+    tags.aliases.clear()
+    yield
+    tags.aliases.clear()
+
+
+@pytest.mark.parametrize(
+    ("plural", "singular"),
+    [
+        ("cables", "cable"),
+        ("batteries", "battery"),
+        ("boxes", "box"),
+        ("switches", "switch"),
+        ("caches", "cache"),
+        ("movies", "movie"),
+        ("knives", "knife"),
+        ("keys", "key"),
+        ("classes", "class"),
+        ("glasses", "glasses"),
+        ("lens", "lens"),
+        ("status", "status"),
+        ("tv", "tv"),
+        ("usb-c", "usb-c"),
+    ],
+)
+def test_singularize(plural: str, singular: str) -> None:
+    assert tags.singularize(plural) == singular
+
+
+def test_canonical_tag_normalizes_and_aliases() -> None:
+    assert tags.canonical_tag(" USB_Cables ") == "usb cable"
+    assert tags.canonical_tag("Smartphones") == "phone"
+    assert tags.canonical_tag("!!!") == ""
+
+    tags.aliases.register("usb-c cable")
+    assert tags.canonical_tag("usb c cables") == "usb-c cable"
+
+    tags.aliases.update([("telly", "television")])
+    assert tags.canonical_tag("telly") == "tv"  # chained through the seed
+
+
+@pytest.mark.asyncio
+async def test_merge_job_rewrites_links(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_path = tmp_path / "metadata.db"
+    monkeypatch.setattr(db_module, "DB_PATH", db_path)
+    await db_module.init_db()
+    await db_module.add_images_with_tags([
+        ("a.jpg", "", "2025-01-01", ["usb cables", "usb-c cable"]),
+        ("b.jpg", "", "2025-01-02", ["usb cable", "usb c cable"]),
+        ("c.jpg", "", "2025-01-03", ["usb cable", "usb cables"]),
+        ("d.jpg", "", "2025-01-04", ["usb-c cable"]),
+    ])
+    index = await tagindex.refresh_tag_index(db_path)
+
+    planned = await tags.merge_tags(db_path, dry_run=True)
+    merged = await tags.merge_tags(db_path)
+
+    assert sorted(planned) == sorted(merged) == [
+        ("usb c cable", "usb-c cable"),
+        ("usb cables", "usb cable"),
+    ]
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute(
+            "SELECT tags.name, COUNT(*) FROM image_tags "
+            "JOIN tags ON tags.id = image_tags.tag_id GROUP BY tags.name"
+        )
+        counts = dict(await cursor.fetchall())
+        cursor = await db.execute("SELECT alias, canonical FROM tag_aliases")
+        recorded = dict(await cursor.fetchall())
+        assert await tagindex.get_tag_index(db) is index
+
+    assert counts == {"usb cable": 3, "usb-c cable": 3}
+    assert recorded["usb cables"] == "usb cable"
+    assert sorted(index.tag_names()) == ["usb cable", "usb-c cable"]
+    assert index.count("usb cable") == 3  # noqa: PLR2004
+    assert tags.canonical_tag("USB C Cables") == "usb-c cable"
+    assert await tags.merge_tags(db_path) == []
@@ -0,0 +1,119 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from scripts import thumbnails
+
+
+@pytest.fixture
+def photo(tmp_path: Path) -> Path:
+    path = tmp_path / "photo.jpg"
+    Image.new("RGB", (3000, 2000), "blue").save(path, "JPEG")
+    return path
+
+
+def test_generate_renditions_writes_all_sizes(
+    photo: Path, tmp_path: Path
+) -> None:
+    written, _, widths = thumbnails.generate_renditions(
+        str(photo), str(tmp_path), "photo.jpg", ("webp",)
+    )
+
+    assert "photo.jpg.thumb.jpg" in written
+    for rendition, side in thumbnails.RENDITION_SIZES.items():
+        name = thumbnails.rendition_name("photo.jpg", rendition, "webp")
+        assert name in written
+        with Image.open(tmp_path / name) as img:
+            assert img.format == "WEBP"
+            assert max(img.size) == side
+            assert img.width == widths[rendition]
+
+    with Image.open(tmp_path / "photo.jpg.thumb.jpg") as img:
+        assert img.format == "JPEG"
+        assert max(img.size) == thumbnails.RENDITION_SIZES["grid"]
+
+
+def test_generate_renditions_respects_exif_orientation(tmp_path: Path) -> None:
+    path = tmp_path / "rotated.jpg"
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise on display
+    Image.new("RGB", (2000, 1000), "green").save(path, "JPEG", exif=exif)
+
+    thumbnails.generate_renditions(str(path), str(tmp_path), "rotated.jpg", ())
+
+    with Image.open(tmp_path / "rotated.jpg.thumb.jpg") as img:
+        assert img.height > img.width
+
+
+def test_generate_renditions_records_real_widths(tmp_path: Path) -> None:
+    path = tmp_path / "small.jpg"
+    Image.new("RGB", (400, 800), "red").save(path, "JPEG")
+
+    _, _, widths = thumbnails.generate_renditions(
+        str(path), str(tmp_path), "small.jpg", ()
+    )
+
+    assert widths == {"grid": 160, "retina": 320, "preview": 400}
+
+
+@pytest.mark.asyncio
+async def test_render_thumbnails_uses_worker_pool(
+    photo: Path, tmp_path: Path
+) -> None:
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    try:
+        result = await thumbnails.render_thumbnails(photo, "photo.jpg", out_dir)
+    finally:
+        thumbnails.shutdown_pool()
+
+    formats = result["formats"]
+    assert formats == thumbnails.available_formats()
+    assert all((out_dir / name).exists() for name in result["files"])
+    assert len(result["files"]) == (
+        len(thumbnails.RENDITION_SIZES) * len(formats) + 1
+    )
+    assert result["placeholder"].startswith("data:image/")
+
+
+def test_make_placeholder_is_tiny() -> None:
+    img = Image.linear_gradient("L").convert("RGB").resize((640, 480))
+
+    uri = thumbnails.make_placeholder(img)
+
+    assert uri.startswith("data:image/webp;base64,")
+    assert len(uri) < 400  # noqa: PLR2004
+
+
+def test_picture_sources_builds_srcset() -> None:
+    sources = thumbnails.picture_sources(
+        "a.jpg", "avif,webp", "grid:213,retina:427,preview:853"
+    )
+
+    assert [s["type"] for s in sources] == ["image/avif", "image/webp"]
+    assert sources[1]["srcset"] == (
+        "/uploads/thumb/a.jpg.grid.webp 213w, "
+        "/uploads/thumb/a.jpg.retina.webp 427w, "
+        "/uploads/thumb/a.jpg.preview.webp 853w"
+    )
+    assert thumbnails.picture_sources("a.jpg", None) == []
+
+
+def test_picture_sources_skips_renditions_capped_by_original() -> None:
+    sources = thumbnails.picture_sources(
+        "a.jpg", "webp", "grid:160,retina:300,preview:300"
+    )
+
+    assert sources[0]["srcset"] == (
+        "/uploads/thumb/a.jpg.grid.webp 160w, "
+        "/uploads/thumb/a.jpg.retina.webp 300w"
+    )
+
+
+def test_picture_sources_without_widths_offers_grid() -> None:
+    sources = thumbnails.picture_sources("a.jpg", "webp")
+
+    assert sources == [
+        {"type": "image/webp", "srcset": "/uploads/thumb/a.jpg.grid.webp"}
+    ]
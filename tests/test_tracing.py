@@ -0,0 +1,144 @@
+import asyncio
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from scripts import logger, tracing
+
+
+@pytest.fixture(autouse=True)
+def clear_traces() -> None:
+    tracing.exporter.clear()
+
+
+def test_nested_spans_share_trace() -> None:
+    with tracing.start_span("outer") as outer:
+        with tracing.start_span("inner", n=1) as inner:
+            pass
+        assert tracing.current_span() is outer
+    assert tracing.current_span() is None
+
+    assert inner.trace_id == outer.trace_id
+    assert inner.parent_span_id == outer.span_id
+    trace = tracing.exporter.get_trace(outer.trace_id)
+    assert [s["name"] for s in trace["spans"]] == ["outer", "inner"]
+    assert trace["spans"][1]["attributes"] == [
+        {"key": "n", "value": {"intValue": "1"}}
+    ]
+
+
+def test_exception_marks_span_failed() -> None:
+    msg = "bad"
+    with (
+        pytest.raises(RuntimeError),
+        tracing.start_span("boom") as span,
+    ):
+        raise RuntimeError(msg)
+
+    assert span.status == tracing.STATUS_ERROR
+    assert tracing.exporter.get_trace(span.trace_id)["error"]
+
+
+def test_traceparent_round_trip() -> None:
+    with tracing.start_span("producer") as producer:
+        traceparent = tracing.inject()
+
+    with (
+        tracing.use_traceparent(traceparent),
+        tracing.start_span("consumer") as consumer,
+    ):
+        pass
+
+    assert consumer.trace_id == producer.trace_id
+    assert consumer.parent_span_id == producer.span_id
+
+    with (
+        tracing.use_traceparent("garbage"),
+        tracing.start_span("fresh") as fresh,
+    ):
+        pass
+    assert fresh.trace_id != producer.trace_id
+
+
+def test_exporter_keeps_recent_traces_slowest_first() -> None:
+    exporter = tracing.TraceExporter(max_traces=2)
+    for name, duration_ms in (("a", 5), ("b", 50), ("c", 20)):
+        span = tracing.Span(name, name * 32, start_ns=0)
+        span.end_ns = duration_ms * 1_000_000
+        exporter.export(span)
+
+    slow = exporter.slow_traces(min_ms=10)
+
+    assert [t["root"] for t in slow] == ["b", "c"]
+    assert exporter.get_trace("a" * 32) is None
+
+
+@pytest.mark.asyncio
+@patch("scripts.logger.render_thumbnails", new_callable=AsyncMock)
+@patch("scripts.logger.set_image_renditions", new_callable=AsyncMock)
+@patch("scripts.logger.add_image", new_callable=AsyncMock)
+@patch("scripts.logger.add_tag", new_callable=AsyncMock)
+@patch("scripts.logger.link_image_tag", new_callable=AsyncMock)
+@patch("scripts.logger.analyze_image_with_openai")
+@patch("scripts.logger.upload_file_to_gcs")
+async def test_upload_trace_spans_queue_and_processing(  # noqa: PLR0913, PLR0917
+    mock_upload,
+    mock_ai,
+    mock_link,
+    mock_tag,
+    mock_add,
+    mock_renditions,
+    mock_render,
+    tmp_path: Path,
+) -> None:
+    mock_ai.return_value = {"summary": "cable\npower"}
+    mock_render.return_value = {
+        "files": [],
+        "formats": (),
+        "placeholder": "",
+        "widths": {},
+    }
+    meta_file = tmp_path / "metadata.json"
+    meta_file.write_text("[]")
+
+    transport = ASGITransport(app=logger.app)
+    logger.app.dependency_overrides[logger.get_current_user] = lambda: {
+        "email": "me@example.com"
+    }
+    with (
+        patch("scripts.logger.UPLOAD_DIR", tmp_path),
+        patch("scripts.logger.META_FILE", meta_file),
+        patch("scripts.logger.set_image_objects", new_callable=AsyncMock),
+    ):
+        async with AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            res = await client.post(
+                "/upload",
+                files={"upload": ("a.jpg", b"\xff\xd8\xff", "image/jpeg")},
+            )
+            assert res.status_code == 200  # noqa: PLR2004
+
+            worker = asyncio.create_task(logger.process_uploads())
+            await asyncio.wait_for(logger.processing_queue.join(), timeout=5)
+            worker.cancel()
+
+            listing = await client.get("/debug/traces?min_ms=0")
+            trace_id = listing.json()["traces"][0]["trace_id"]
+            detail = await client.get(f"/debug/traces/{trace_id}")
+    logger.app.dependency_overrides.clear()
+
+    trace = detail.json()
+    names = [s["name"] for s in trace["spans"]]
+    assert trace["root"] == "POST /upload"
+    for stage in (
+        "upload.save",
+        "queue.wait",
+        "process_image",
+        "vision.analyze",
+        "db.tags",
+    ):
+        assert stage in names
+    assert mock_link.await_count == 2  # noqa: PLR2004
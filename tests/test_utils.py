@@ -1,6 +1,16 @@
-from datetime import UTC, datetime
+import sys
+from datetime import UTC, datetime, timedelta, timezone
 
-from scripts.util import clean_tag_name, parse_utc_timestamp, utc_now_iso
+import pytest
+
+from scripts.util import (
+    LazyObject,
+    clean_tag_name,
+    lazy_import,
+    parse_utc_timestamp,
+    utc_iso,
+    utc_now_iso,
+)
 
 
 def test_utc_now_iso_format() -> None:
@@ -11,6 +21,11 @@ def test_utc_now_iso_format() -> None:
     assert ts.endswith("+00:00")
 
 
+def test_utc_iso_converts_and_truncates() -> None:
+    when = datetime(2025, 5, 7, 14, 0, 0, 123456, timezone(timedelta(hours=2)))
+    assert utc_iso(when) == "2025-05-07T12:00:00+00:00"
+
+
 def test_parse_utc_timestamp_aware() -> None:
     ts = "2025-05-07T12:34:56+00:00"
     dt = parse_utc_timestamp(ts)
@@ -41,3 +56,32 @@ def test_clean_tag_name_mixed_case_and_spaces() -> None:
 
 def test_clean_tag_name_hyphens_and_underscores() -> None:
     assert clean_tag_name("Wi-Fi_Adapter") == "wi-fi_adapter"
+
+
+def test_lazy_import_defers_execution() -> None:
+    sys.modules.pop("colorsys", None)
+    mod = lazy_import("colorsys")
+
+    assert type(mod).__name__ == "_LazyModule"
+    assert sys.modules["colorsys"] is mod
+    assert mod.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert lazy_import("colorsys") is mod
+
+
+def test_lazy_import_missing_module() -> None:
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import("no_such_module_here")
+
+
+def test_lazy_object_builds_once() -> None:
+    calls = []
+
+    def factory() -> dict:
+        calls.append(1)
+        return {"a": 1}
+
+    proxy = LazyObject(factory)
+    assert calls == []
+    assert proxy.get("a") == 1
+    assert proxy.copy() == {"a": 1}
+    assert len(calls) == 1
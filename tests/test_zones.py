@@ -0,0 +1,117 @@
+from datetime import UTC, datetime
+from pathlib import Path
+
+import aiosqlite
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from scripts import db as db_module
+from scripts import logger, zones
+from scripts.scanlog import ScanEvent, store_scan_events, timestamp_us
+
+NOW = datetime(2025, 4, 2, tzinfo=UTC)
+
+
+def obj(name: str, count: int, confidence: float, color: str | None = None
+        ) -> dict:
+    return {"name": name, "count": count, "color": color, "brand": None,
+            "attributes": [], "confidence": confidence}
+
+
+def scan(tag_id: str, location: str, when: str) -> ScanEvent:
+    return ScanEvent(tag_id, location, timestamp_us(when), "pi-1")
+
+
+async def stats(db_path: Path) -> dict:
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute(
+            "SELECT zone, images, objects, unknown, bare, tags FROM zone_stats"
+        )
+        return {row[0]: row[1:] for row in await cursor.fetchall()}
+
+
+@pytest_asyncio.fixture
+async def db_path(db_path: Path) -> Path:
+    await db_module.add_image("a.jpg", "garage", "2025-04-01T00:00:00+00:00")
+    await db_module.add_image("b.jpg", "garage", "2025-03-01T00:00:00+00:00")
+    await db_module.add_image("c.jpg", "", "2025-03-01T00:00:00+00:00")
+    await db_module.set_image_objects("a.jpg", [
+        obj("drill", 1, 0.9, "yellow"), obj("unknown", 2, 0.3),
+    ])
+    await db_module.set_image_objects("c.jpg", [obj("sock", 4, 0.9)])
+    async with aiosqlite.connect(db_path) as db:
+        await store_scan_events(db, [
+            scan("cat", "kitchen", "2025-04-01T10:00:00"),
+            scan("cat", "garage", "2025-04-01T11:00:00"),
+            scan("keys", "garage", "2025-04-01T12:00:00"),
+        ])
+        await db.commit()
+    return db_path
+
+
+@pytest.mark.asyncio
+async def test_stats_follow_ingest_and_scans(db_path: Path) -> None:
+    assert await stats(db_path) == {
+        "garage": (2, 3, 2, 2, 2), "kitchen": (0, 0, 0, 0, 0)
+    }
+    await db_module.set_image_objects("a.jpg", [obj("drill", 1, 0.9, "red")])
+    assert (await stats(db_path))["garage"] == (2, 1, 0, 0, 2)
+
+    # Rebuilding from scratch gives the same numbers
+    before = await stats(db_path)
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("DELETE FROM zone_stats")
+        await db.commit()
+    await db_module.init_db()
+    assert await stats(db_path) == before
+
+
+@pytest.mark.asyncio
+async def test_scores(db_path: Path) -> None:
+    async with aiosqlite.connect(db_path) as db:
+        garage, kitchen = await zones.zone_scores(db, now=NOW)
+        await zones.set_override(db, "kitchen", 10, "cat bowl spill")
+        pinned = (await zones.zone_scores(db, "kitchen", now=NOW))[0]
+        with pytest.raises(ValueError, match="between 0 and 100"):
+            await zones.set_override(db, "kitchen", 120)
+
+    assert kitchen["zone"] == "kitchen"
+    assert garage["counts"]["moves"] == 2  # cat, keys  # noqa: PLR2004
+    assert kitchen["counts"]["moves"] == 2  # cat in and out  # noqa: PLR2004
+    assert garage["penalties"]["unknown"] == pytest.approx(2 / 3, abs=1e-3)
+    assert garage["penalties"]["bare"] == pytest.approx(2 / 3, abs=1e-3)
+    assert garage["counts"]["idle_days"] == 0.5  # noqa: PLR2004
+    assert 0 < garage["score"] < kitchen["score"] < 100  # noqa: PLR2004
+    assert pinned["score"] == 10  # noqa: PLR2004
+    assert pinned["overridden"]
+    assert pinned["note"] == "cat bowl spill"
+
+    empty = zones.score_zone(
+        {"zone": "new", "images": 0, "objects": 0, "unknown": 0, "bare": 0,
+         "tags": 0, "last_access": NOW.isoformat()},
+        0,
+        NOW,
+    )
+    assert empty["score"] == 100  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_zones_api_and_page(db_path: Path) -> None:
+    transport = ASGITransport(app=logger.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        heatmap = await ac.get("/api/zones")
+        garage = await ac.get("/api/zones/garage")
+        missing = await ac.get("/api/zones/attic")
+        page = await ac.get("/zones")
+        override = await ac.put(
+            "/api/zones/garage/override", data={"score": "50"}
+        )
+
+    assert [z["zone"] for z in heatmap.json()["zones"]] == [
+        "garage", "kitchen"
+    ]
+    assert garage.json()["counts"]["tags"] == 2  # noqa: PLR2004
+    assert missing.status_code == 404  # noqa: PLR2004
+    assert "garage" in page.text
+    assert override.status_code == 403  # noqa: PLR2004